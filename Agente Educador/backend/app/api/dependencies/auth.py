@@ -9,6 +9,28 @@ from app.core.config import settings
 # Esquema de autenticación OAuth2
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="api/v1/auth/token")
 
+def decode_access_token(token: str) -> Optional[dict]:
+    """
+    Decodifica y valida un token JWT de acceso.
+    
+    Args:
+        token: Token JWT
+        
+    Returns:
+        Optional[dict]: Contenido del token, o None si es inválido, ha expirado o no tiene `sub`
+    """
+    try:
+        payload = jwt.decode(
+            token, 
+            settings.SECRET_KEY, 
+            algorithms=[settings.ALGORITHM]
+        )
+    except JWTError:
+        return None
+    if payload.get("sub") is None:
+        return None
+    return payload
+
 async def get_current_user(token: str = Depends(oauth2_scheme)):
     """
     Obtiene el usuario actual a partir del token JWT.
@@ -28,17 +50,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
         headers={"WWW-Authenticate": "Bearer"},
     )
     
-    try:
-        payload = jwt.decode(
-            token, 
-            settings.SECRET_KEY, 
-            algorithms=[settings.ALGORITHM]
-        )
-        username: str = payload.get("sub")
-        if username is None:
-            raise credentials_exception
-    except JWTError:
+    payload = decode_access_token(token)
+    if payload is None:
         raise credentials_exception
+    username: str = payload["sub"]
         
     # Aquí iría la lógica para obtener el usuario de la base de datos
     # user = await get_user(username)
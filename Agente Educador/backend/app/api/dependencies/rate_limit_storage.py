@@ -0,0 +1,271 @@
+"""
+Motores de almacenamiento para el limitador de tasa.
+
+El limitador de ventana deslizante solo necesita dos contadores por clave: el
+de la ventana fija actual y el de la anterior. Este módulo define la interfaz
+de almacenamiento de esos contadores y dos motores:
+
+- `MemoryRateLimitStorage`: contadores en la memoria del proceso.
+- `MongoRateLimitStorage`: contadores compartidos entre workers en MongoDB,
+  con incrementos agrupados localmente para limitar los viajes de red.
+"""
+import asyncio
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, List, Set, Tuple
+
+from pymongo import ASCENDING, UpdateOne
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class RateLimitStorage(ABC):
+    """Interfaz de almacenamiento de contadores por ventana fija."""
+
+    @abstractmethod
+    async def counts(self, key: str, window_index: int) -> Tuple[int, int]:
+        """
+        Obtiene los contadores de la ventana anterior y la actual.
+
+        Args:
+            key: Clave del cliente
+            window_index: Índice de la ventana fija actual
+
+        Returns:
+            Tuple[int, int]: (contador anterior, contador actual)
+        """
+
+    @abstractmethod
+    async def increment(self, key: str, window_index: int) -> None:
+        """Registra una solicitud en la ventana actual de la clave."""
+
+    @abstractmethod
+    def sweep(self, oldest_active: int) -> int:
+        """
+        Elimina el estado local de las ventanas anteriores a `oldest_active`.
+
+        Returns:
+            int: Número de claves eliminadas
+        """
+
+    async def start(self) -> None:
+        """Prepara el almacenamiento (índices, tareas en segundo plano)."""
+
+    async def stop(self) -> None:
+        """Libera los recursos del almacenamiento."""
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve métricas del almacenamiento."""
+        return {}
+
+
+class MemoryRateLimitStorage(RateLimitStorage):
+    """
+    Contadores en memoria del proceso, en orden LRU y con un máximo de claves.
+
+    Cada clave guarda `[índice de ventana, contador anterior, contador actual]`.
+    """
+
+    def __init__(self, max_keys: int = 100000):
+        self.max_keys = max_keys
+        self.counters: "OrderedDict[str, List[int]]" = OrderedDict()
+        self.evictions = 0
+        self.expired = 0
+
+    def _state(self, key: str, window_index: int) -> List[int]:
+        state = self.counters.get(key)
+        if state is None:
+            state = self.counters[key] = [window_index, 0, 0]
+            if len(self.counters) > self.max_keys:
+                self.counters.popitem(last=False)
+                self.evictions += 1
+        else:
+            self.counters.move_to_end(key)
+        if state[0] != window_index:
+            # Desplazar la ventana: la actual pasa a ser la anterior si es contigua
+            state[1] = state[2] if state[0] == window_index - 1 else 0
+            state[2] = 0
+            state[0] = window_index
+        return state
+
+    async def counts(self, key: str, window_index: int) -> Tuple[int, int]:
+        state = self._state(key, window_index)
+        return state[1], state[2]
+
+    async def increment(self, key: str, window_index: int) -> None:
+        self._state(key, window_index)[2] += 1
+
+    def sweep(self, oldest_active: int) -> int:
+        # Las claves están en orden LRU: basta recorrer hasta la primera activa
+        removed = 0
+        while self.counters:
+            key, state = next(iter(self.counters.items()))
+            if state[0] >= oldest_active:
+                break
+            del self.counters[key]
+            removed += 1
+        self.expired += removed
+        return removed
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "memory",
+            "tracked_keys": len(self.counters),
+            "max_keys": self.max_keys,
+            "evictions": self.evictions,
+            "expired": self.expired,
+        }
+
+
+class MongoRateLimitStorage(RateLimitStorage):
+    """
+    Contadores compartidos en MongoDB, un documento por clave y ventana fija.
+
+    Los incrementos se acumulan localmente y se envían cada `flush_interval`
+    segundos con un único `bulk_write` de `$inc` con upsert; a continuación se
+    releen los contadores de las claves tocadas para incorporar lo que han
+    sumado los demás workers. Entre dos envíos, cada worker decide con el
+    último valor leído más sus incrementos pendientes, por lo que el límite
+    global puede excederse como mucho en lo que los demás workers acepten
+    durante un intervalo. Un índice TTL elimina las ventanas antiguas.
+    """
+
+    def __init__(self, collection_name: str = "rate_limits", window: int = 60,
+                 flush_interval: float = 0.5):
+        """
+        Inicializa el almacenamiento.
+
+        Args:
+            collection_name: Colección de MongoDB para los contadores
+            window: Duración de la ventana fija en segundos
+            flush_interval: Segundos entre envíos de incrementos agrupados
+        """
+        self.collection_name = collection_name
+        self.window = window
+        self.flush_interval = flush_interval
+        self._collection = None
+        self._remote: Dict[Tuple[str, int], int] = {}
+        self._pending: Dict[Tuple[str, int], int] = {}
+        self._inflight: Dict[Tuple[str, int], int] = {}
+        self._touched: Set[Tuple[str, int]] = set()
+        self._task = None
+        self.flushes = 0
+        self.flush_errors = 0
+
+    def _doc_id(self, key: str, window_index: int) -> str:
+        return f"{key}|{window_index}"
+
+    def _count(self, bucket: Tuple[str, int]) -> int:
+        return (
+            self._remote.get(bucket, 0)
+            + self._inflight.get(bucket, 0)
+            + self._pending.get(bucket, 0)
+        )
+
+    async def counts(self, key: str, window_index: int) -> Tuple[int, int]:
+        previous, current = (key, window_index - 1), (key, window_index)
+        self._touched.add(previous)
+        self._touched.add(current)
+        return self._count(previous), self._count(current)
+
+    async def increment(self, key: str, window_index: int) -> None:
+        bucket = (key, window_index)
+        self._pending[bucket] = self._pending.get(bucket, 0) + 1
+
+    def sweep(self, oldest_active: int) -> int:
+        stale = [bucket for bucket in self._remote if bucket[1] < oldest_active]
+        for bucket in stale:
+            del self._remote[bucket]
+        return len(stale)
+
+    async def flush(self) -> None:
+        """Envía los incrementos pendientes y relee los contadores tocados."""
+        if self._collection is None:
+            return
+        pending, self._pending = self._pending, {}
+        touched, self._touched = self._touched, set()
+        # Mientras dura el envío, los incrementos siguen contando localmente
+        self._inflight = pending
+        written = False
+        try:
+            if pending:
+                operations = [
+                    UpdateOne(
+                        {"_id": self._doc_id(key, window_index)},
+                        {
+                            "$inc": {"count": amount},
+                            "$setOnInsert": {
+                                "key": key,
+                                "window": window_index,
+                                # Se conserva dos ventanas: la actual y la siguiente la leen
+                                "expires_at": datetime.utcfromtimestamp(
+                                    (window_index + 2) * self.window
+                                ),
+                            },
+                        },
+                        upsert=True,
+                    )
+                    for (key, window_index), amount in pending.items()
+                ]
+                await self._collection.bulk_write(operations, ordered=False)
+            written = True
+            buckets = touched | set(pending)
+            if buckets:
+                ids = {self._doc_id(*bucket): bucket for bucket in buckets}
+                fresh = dict.fromkeys(buckets, 0)
+                async for doc in self._collection.find(
+                    {"_id": {"$in": list(ids)}}, {"count": 1}
+                ):
+                    fresh[ids[doc["_id"]]] = doc["count"]
+                self._remote.update(fresh)
+            self.flushes += 1
+        except Exception as e:
+            for bucket, amount in pending.items():
+                if written:
+                    # Ya están en MongoDB: reflejarlos localmente hasta la próxima lectura
+                    self._remote[bucket] = self._remote.get(bucket, 0) + amount
+                else:
+                    # Devolverlos a la cola para reintentar en el próximo envío
+                    self._pending[bucket] = self._pending.get(bucket, 0) + amount
+            self.flush_errors += 1
+            logger.warning(f"No se pudieron sincronizar los contadores de tasa: {e}")
+        finally:
+            self._inflight = {}
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    async def start(self) -> None:
+        from app.db.mongodb import db
+
+        self._collection = await db.get_collection(self.collection_name)
+        await self._collection.create_index(
+            [("expires_at", ASCENDING)], expireAfterSeconds=0, name="expires_at_ttl"
+        )
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            "backend": "mongo",
+            "collection": self.collection_name,
+            "tracked_keys": len({key for key, _ in self._remote}),
+            "pending_increments": sum(self._pending.values()),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+        }
@@ -1,70 +1,170 @@
 from fastapi import Request, HTTPException, status
-from fastapi.concurrency import run_in_threadpool
 from functools import wraps
-from datetime import datetime, timedelta
-from typing import Dict, List, Optional, Callable, Any
+from typing import Any, Dict, NamedTuple, Optional
 import asyncio
+import time
+from app.api.dependencies.rate_limit_storage import (
+    MemoryRateLimitStorage,
+    MongoRateLimitStorage,
+    RateLimitStorage,
+)
 from app.core.config import settings
 from app.core.logging_config import get_logger
 
 logger = get_logger(__name__)
 
+
+class RateLimitResult(NamedTuple):
+    """Resultado de una comprobación de límite de tasa."""
+    limited: bool
+    limit: int
+    remaining: int
+    reset: int  # Marca de tiempo Unix en la que se libera la ventana actual
+
+
 class RateLimiter:
     """
-    Implementa un limitador de tasa simple para limitar el número de solicitudes
-    por período de tiempo.
+    Implementa un limitador de tasa con contador de ventana deslizante.
+
+    Para cada clave solo se guardan el índice de la ventana fija actual y los
+    contadores de la ventana actual y la anterior; el número de solicitudes
+    en la ventana deslizante se estima ponderando la ventana anterior por la
+    fracción que aún se solapa. La memoria por clave es constante y cada
+    comprobación es O(1).
+
+    Los contadores viven en un `RateLimitStorage` intercambiable: en memoria
+    del proceso o compartidos entre workers en MongoDB. Una tarea en segundo
+    plano elimina periódicamente el estado de las claves inactivas.
     """
-    def __init__(self, requests: int = 100, window: int = 60):
+    def __init__(
+        self,
+        requests: int = 100,
+        window: int = 60,
+        stripes: int = 64,
+        max_keys: int = 100000,
+        sweep_interval: float = 30.0,
+        storage: Optional[RateLimitStorage] = None
+    ):
         """
         Inicializa el limitador de tasa.
-        
+
         Args:
             requests: Número máximo de solicitudes permitidas
             window: Período de tiempo en segundos
+            stripes: Número de locks entre los que se reparten las claves
+            max_keys: Número máximo de claves en memoria (motor en memoria)
+            sweep_interval: Segundos entre barridos de claves inactivas
+            storage: Motor de almacenamiento (por defecto, en memoria)
         """
         self.requests = requests
         self.window = window
-        self.timestamps: Dict[str, List[datetime]] = {}
-        self.lock = asyncio.Lock()
-    
+        self.sweep_interval = sweep_interval
+        self.storage = storage or MemoryRateLimitStorage(max_keys=max_keys)
+        self.locks = [asyncio.Lock() for _ in range(stripes)]
+        self.sweeps = 0
+        self._sweeper: Optional[asyncio.Task] = None
+
+    def _lock_for(self, key: str) -> asyncio.Lock:
+        return self.locks[hash(key) % len(self.locks)]
+
+    async def _check(self, key: str, now: float) -> RateLimitResult:
+        window_index = int(now // self.window)
+        previous, current = await self.storage.counts(key, window_index)
+
+        elapsed = (now % self.window) / self.window
+        estimated = previous * (1.0 - elapsed) + current
+        reset = (window_index + 1) * self.window
+
+        if estimated >= self.requests:
+            return RateLimitResult(True, self.requests, 0, reset)
+
+        await self.storage.increment(key, window_index)
+        remaining = max(0, int(self.requests - estimated - 1))
+        return RateLimitResult(False, self.requests, remaining, reset)
+
+    async def hit(self, key: str) -> RateLimitResult:
+        """
+        Registra una solicitud para la clave y devuelve el estado del límite.
+
+        Args:
+            key: Clave única para identificar al cliente (ej: dirección IP)
+
+        Returns:
+            RateLimitResult: Si se debe limitar y los valores para los encabezados
+        """
+        async with self._lock_for(key):
+            return await self._check(key, time.time())
+
     async def is_rate_limited(self, key: str) -> bool:
         """
         Verifica si una clave ha excedido el límite de tasa.
-        
+
         Args:
             key: Clave única para identificar al cliente (ej: dirección IP)
-            
+
         Returns:
             bool: True si se debe limitar la tasa, False en caso contrario
         """
-        async with self.lock:
-            now = datetime.utcnow()
-            window_start = now - timedelta(seconds=self.window)
-            
-            # Filtrar timestamps fuera de la ventana actual
-            if key in self.timestamps:
-                self.timestamps[key] = [
-                    ts for ts in self.timestamps[key] 
-                    if ts > window_start
-                ]
-            else:
-                self.timestamps[key] = []
-            
-            # Verificar si se ha excedido el límite
-            if len(self.timestamps[key]) >= self.requests:
-                return True
-            
-            # Registrar la nueva solicitud
-            self.timestamps[key].append(now)
-            return False
+        return (await self.hit(key)).limited
+
+    def sweep(self, now: Optional[float] = None) -> int:
+        """
+        Elimina el estado de las claves que ya no influyen en la ventana deslizante.
+
+        Una clave es inactiva cuando su última ventana es anterior a la
+        ventana previa a la actual.
+
+        Args:
+            now: Marca de tiempo de referencia (por defecto, la actual)
+
+        Returns:
+            int: Número de claves eliminadas
+        """
+        now = time.time() if now is None else now
+        removed = self.storage.sweep(int(now // self.window) - 1)
+        self.sweeps += 1
+        return removed
+
+    async def _sweep_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.sweep_interval)
+            removed = self.sweep()
+            if removed:
+                logger.debug(f"Limitador de tasa: {removed} claves inactivas eliminadas")
+
+    async def start(self) -> None:
+        """Prepara el almacenamiento y lanza la limpieza de claves inactivas."""
+        await self.storage.start()
+        if self._sweeper is None:
+            self._sweeper = asyncio.create_task(self._sweep_loop())
+
+    async def stop(self) -> None:
+        """Detiene la limpieza y libera el almacenamiento."""
+        if self._sweeper is not None:
+            self._sweeper.cancel()
+            try:
+                await self._sweeper
+            except asyncio.CancelledError:
+                pass
+            self._sweeper = None
+        await self.storage.stop()
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve métricas de memoria del limitador."""
+        return {
+            "requests": self.requests,
+            "window": self.window,
+            "sweeps": self.sweeps,
+            **self.storage.stats(),
+        }
 
 def get_client_ip(request: Request) -> str:
     """
     Obtiene la dirección IP del cliente a partir de la solicitud.
-    
+
     Args:
         request: Objeto de solicitud FastAPI
-        
+
     Returns:
         str: Dirección IP del cliente
     """
@@ -72,8 +172,34 @@ def get_client_ip(request: Request) -> str:
         return request.headers["x-forwarded-for"].split(",")[0]
     return request.client.host or "unknown"
 
+def create_rate_limiter(requests: int, window: int) -> RateLimiter:
+    """
+    Crea un limitador con el motor de almacenamiento configurado.
+
+    Args:
+        requests: Número máximo de solicitudes permitidas
+        window: Período de tiempo en segundos
+
+    Returns:
+        RateLimiter: Limitador listo para usarse
+    """
+    if settings.RATE_LIMIT_BACKEND == "mongo":
+        storage: RateLimitStorage = MongoRateLimitStorage(
+            collection_name=settings.RATE_LIMIT_MONGO_COLLECTION,
+            window=window,
+            flush_interval=settings.RATE_LIMIT_FLUSH_INTERVAL
+        )
+    else:
+        storage = MemoryRateLimitStorage(max_keys=settings.RATE_LIMIT_MAX_KEYS)
+    return RateLimiter(
+        requests=requests,
+        window=window,
+        sweep_interval=settings.RATE_LIMIT_SWEEP_INTERVAL,
+        storage=storage
+    )
+
 # Instancia global del limitador de tasa
-rate_limiter = RateLimiter(
+rate_limiter = create_rate_limiter(
     requests=settings.RATE_LIMIT_REQUESTS,
     window=settings.RATE_LIMIT_WINDOW
 )
@@ -86,8 +212,9 @@ def rate_limit():
         @wraps(func)
         async def wrapper(request: Request, *args, **kwargs):
             client_ip = get_client_ip(request)
-            
-            if await rate_limiter.is_rate_limited(client_ip):
+            result = await rate_limiter.hit(client_ip)
+
+            if result.limited:
                 logger.warning(
                     f"Límite de tasa excedido para la IP {client_ip}",
                     extra={"ip": client_ip, "path": request.url.path}
@@ -101,29 +228,22 @@ def rate_limit():
                     },
                     headers={
                         "Retry-After": str(rate_limiter.window),
-                        "X-RateLimit-Limit": str(rate_limiter.requests),
+                        "X-RateLimit-Limit": str(result.limit),
                         "X-RateLimit-Remaining": "0",
-                        "X-RateLimit-Reset": str(
-                            int((datetime.utcnow() + timedelta(seconds=rate_limiter.window)).timestamp())
-                        )
+                        "X-RateLimit-Reset": str(result.reset)
                     }
                 )
-            
-            # Obtener el número de solicitudes restantes
-            remaining = rate_limiter.requests - len(rate_limiter.timestamps.get(client_ip, []))
-            
+
             # Llamar a la función original
             response = await func(request, *args, **kwargs)
-            
+
             # Agregar encabezados de tasa
             response.headers.update({
-                "X-RateLimit-Limit": str(rate_limiter.requests),
-                "X-RateLimit-Remaining": str(max(0, remaining)),
-                "X-RateLimit-Reset": str(
-                    int((datetime.utcnow() + timedelta(seconds=rate_limiter.window)).timestamp())
-                )
+                "X-RateLimit-Limit": str(result.limit),
+                "X-RateLimit-Remaining": str(result.remaining),
+                "X-RateLimit-Reset": str(result.reset)
             })
-            
+
             return response
         return wrapper
     return decorator
@@ -1,12 +1,20 @@
-from fastapi import APIRouter, Depends, Request, HTTPException, status
+from fastapi import APIRouter, Depends, Query, Request, HTTPException, WebSocket, WebSocketDisconnect, status
 from fastapi.encoders import jsonable_encoder
-from typing import List
+from fastapi.responses import StreamingResponse
+from pydantic import ValidationError
+from typing import Any, AsyncIterator, Dict, List, Optional
+import asyncio
+import json
+import time
 
-from app.models.chat_models import ChatRequest, ChatResponse, Message
+from app.models.chat_models import AgeGroup, ChatJob, ChatJobStatus, ChatRequest, ChatResponse, Message
+from app.repositories.chat_repository import ChatSessionNotFoundError
+from app.services.chat_jobs import ChatJobNotFoundError, ChatJobQueueFullError, chat_job_manager
 from app.services.chat_service import chat_service
-from app.api.dependencies.rate_limiter import rate_limit
-from app.api.dependencies.auth import get_current_user
+from app.api.dependencies.auth import decode_access_token, get_current_user
+from app.api.dependencies.rate_limiter import RateLimiter
 from app.core.logging_config import get_logger
+from config import settings
 
 router = APIRouter()
 logger = get_logger(__name__)
@@ -21,17 +29,21 @@ logger = get_logger(__name__)
     Procesa los mensajes del usuario y devuelve una respuesta del asistente
     adaptada al grupo de edad del usuario.
     
+    Para no reenviar el historial en cada turno, envía solo `message` (y el
+    `session_id` devuelto en la primera respuesta): la conversación se guarda
+    en el servidor.
+    
     Requiere autenticación JWT.
     """,
     responses={
         200: {"description": "Respuesta del chat generada exitosamente"},
         400: {"description": "Error en los datos de entrada"},
         401: {"description": "No autorizado"},
+        404: {"description": "Sesión de chat no encontrada"},
         422: {"description": "Error de validación"},
         429: {"description": "Límite de tasa excedido"},
         500: {"description": "Error interno del servidor"}
-    },
-    dependencies=[Depends(rate_limit())]
+    }
 )
 async def chat_endpoint(
     chat_request: ChatRequest,
@@ -60,7 +72,10 @@ async def chat_endpoint(
             }
         )
         
-        # Procesar el chat
+        # Recuperar el historial guardado y procesar el chat
+        chat_request = await chat_service.prepare_request(
+            chat_request, current_user.get("username", "unknown")
+        )
         response = await chat_service.process_chat(chat_request)
         
         # Registrar la respuesta
@@ -79,6 +94,9 @@ async def chat_endpoint(
         # Re-lanzar excepciones HTTP
         raise
         
+    except ChatSessionNotFoundError:
+        raise session_not_found()
+        
     except Exception as e:
         # Registrar el error
         logger.error(
@@ -99,3 +117,400 @@ async def chat_endpoint(
                 "code": "internal_server_error"
             }
         )
+
+
+def session_not_found() -> HTTPException:
+    """Error 404 para sesiones inexistentes o de otro usuario."""
+    return HTTPException(
+        status_code=status.HTTP_404_NOT_FOUND,
+        detail={
+            "status": "error",
+            "message": "No se encontró la sesión de chat.",
+            "code": "chat_session_not_found"
+        }
+    )
+
+def format_sse(event: str, data: Dict[str, Any]) -> str:
+    """
+    Da formato de Server-Sent Events a un evento.
+    
+    Args:
+        event: Nombre del evento
+        data: Datos del evento, serializados como JSON
+        
+    Returns:
+        str: Evento listo para enviarse
+    """
+    return f"event: {event}\ndata: {json.dumps(jsonable_encoder(data), ensure_ascii=False)}\n\n"
+
+@router.post(
+    "/stream",
+    summary="Chat interactivo con respuesta transmitida",
+    description="""
+    Variante de `/chat` que transmite la respuesta como Server-Sent Events.
+    
+    Emite eventos `token` con cada fragmento de texto a medida que se genera
+    y un evento final `done` con las sugerencias, el contexto actualizado y
+    los tiempos hasta el primer fragmento (`ttfb_ms`) y total (`total_ms`).
+    Si el filtro de seguridad bloquea la respuesta a mitad, se emite `reset`
+    para descartar el texto recibido y a continuación la respuesta segura.
+    
+    Requiere autenticación JWT.
+    """,
+    responses={
+        200: {"description": "Flujo de eventos de la respuesta", "content": {"text/event-stream": {}}},
+        401: {"description": "No autorizado"},
+        404: {"description": "Sesión de chat no encontrada"},
+        422: {"description": "Error de validación"},
+        429: {"description": "Límite de tasa excedido"}
+    }
+)
+async def chat_stream_endpoint(
+    chat_request: ChatRequest,
+    request: Request,
+    current_user: dict = Depends(get_current_user)
+) -> StreamingResponse:
+    """
+    Procesa un mensaje de chat y transmite la respuesta del asistente.
+    
+    Args:
+        chat_request: Datos de la solicitud de chat
+        request: Objeto de solicitud HTTP
+        current_user: Usuario autenticado
+        
+    Returns:
+        StreamingResponse: Flujo `text/event-stream`
+    """
+    logger.info(
+        "Solicitud de chat transmitido recibida",
+        extra={
+            "user_id": current_user.get("username", "unknown"),
+            "age_group": chat_request.age_group,
+            "message_count": len(chat_request.messages)
+        }
+    )
+    
+    # El historial se resuelve antes de empezar a transmitir para poder responder 404
+    try:
+        chat_request = await chat_service.prepare_request(
+            chat_request, current_user.get("username", "unknown")
+        )
+    except ChatSessionNotFoundError:
+        raise session_not_found()
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in chat_service.stream_chat(chat_request):
+                yield format_sse(event, data)
+        except Exception as e:
+            # Los encabezados ya se enviaron: el error se comunica como evento
+            logger.error(
+                "Error al transmitir la respuesta de chat",
+                exc_info=True,
+                extra={"user_id": current_user.get("username", "unknown"), "error": str(e)}
+            )
+            yield format_sse("error", {
+                "message": "Ocurrió un error al procesar tu solicitud. Por favor, inténtalo de nuevo más tarde.",
+                "code": "internal_server_error"
+            })
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+def job_response(document: Dict[str, Any]) -> ChatJob:
+    """Convierte el registro de un trabajo en la respuesta de la API."""
+    job_status = ChatJobStatus(document["status"])
+    response = None
+    if job_status == ChatJobStatus.COMPLETED:
+        result = document.get("result") or {}
+        response = ChatResponse(
+            response=document.get("output", ""),
+            context=result.get("context") or {},
+            suggestions=result.get("suggestions") or [],
+            session_id=result.get("session_id")
+        )
+    return ChatJob(
+        job_id=document["_id"],
+        status=job_status,
+        output=document.get("output", ""),
+        response=response,
+        error=document.get("error"),
+        created_at=document["created_at"],
+        updated_at=document["updated_at"]
+    )
+
+@router.post(
+    "/jobs",
+    response_model=ChatJob,
+    status_code=status.HTTP_202_ACCEPTED,
+    summary="Chat en segundo plano",
+    description="""
+    Encola la generación de la respuesta y devuelve el trabajo al instante.
+    
+    Pensado para las respuestas largas (cuentos, problemas resueltos paso a
+    paso): la conexión no queda abierta mientras se genera. El estado, el
+    texto parcial y la respuesta final se consultan en `GET /jobs/{job_id}`.
+    
+    Requiere autenticación JWT.
+    """,
+    responses={
+        202: {"description": "Trabajo encolado"},
+        401: {"description": "No autorizado"},
+        404: {"description": "Sesión de chat no encontrada"},
+        422: {"description": "Error de validación"},
+        429: {"description": "Límite de tasa excedido"},
+        503: {"description": "Cola de trabajos llena"}
+    }
+)
+async def create_chat_job(
+    chat_request: ChatRequest,
+    current_user: dict = Depends(get_current_user)
+) -> ChatJob:
+    """
+    Encola la generación de la respuesta a un mensaje de chat.
+    
+    Args:
+        chat_request: Datos de la solicitud de chat
+        current_user: Usuario autenticado
+        
+    Returns:
+        ChatJob: Trabajo encolado
+    """
+    user_id = current_user.get("username", "unknown")
+    try:
+        chat_request = await chat_service.prepare_request(chat_request, user_id)
+        document = await chat_job_manager.submit(chat_request, user_id)
+    except ChatSessionNotFoundError:
+        raise session_not_found()
+    except ChatJobQueueFullError:
+        raise HTTPException(
+            status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+            detail={
+                "status": "error",
+                "message": "Hay demasiadas respuestas en preparación. Inténtalo de nuevo en unos segundos.",
+                "code": "chat_jobs_busy"
+            },
+            headers={"Retry-After": "5"}
+        )
+    
+    logger.info("Trabajo de chat encolado", extra={"user_id": user_id, "job_id": document["_id"]})
+    return job_response(document)
+
+@router.get(
+    "/jobs/{job_id}",
+    response_model=ChatJob,
+    summary="Estado de un chat en segundo plano",
+    description="""
+    Devuelve el estado del trabajo, el texto generado hasta el momento y, al
+    terminar, la respuesta completa.
+    
+    Con `stream=true` (o `Accept: text/event-stream`) transmite el texto que
+    falta como Server-Sent Events, con los mismos eventos que `/stream`
+    (`token`, `reset` y `done`, o `error` si el trabajo falla). `offset`
+    indica cuántos caracteres del texto parcial tiene ya el cliente.
+    
+    Requiere autenticación JWT.
+    """,
+    responses={
+        200: {"description": "Estado del trabajo o flujo de eventos", "content": {"text/event-stream": {}}},
+        401: {"description": "No autorizado"},
+        404: {"description": "Trabajo no encontrado"}
+    }
+)
+async def get_chat_job(
+    job_id: str,
+    request: Request,
+    stream: bool = Query(False, description="Transmitir el texto que falta como SSE"),
+    offset: int = Query(0, ge=0, description="Caracteres del texto parcial que ya tiene el cliente"),
+    current_user: dict = Depends(get_current_user)
+):
+    """
+    Consulta un trabajo de chat o transmite el texto que falta.
+    
+    Args:
+        job_id: ID del trabajo
+        request: Objeto de solicitud HTTP
+        stream: Si se transmite el texto como Server-Sent Events
+        offset: Caracteres que el cliente ya recibió
+        current_user: Usuario autenticado
+        
+    Returns:
+        ChatJob | StreamingResponse: Estado del trabajo o flujo `text/event-stream`
+    """
+    user_id = current_user.get("username", "unknown")
+    try:
+        document = await chat_job_manager.get(job_id, user_id)
+    except ChatJobNotFoundError:
+        raise HTTPException(
+            status_code=status.HTTP_404_NOT_FOUND,
+            detail={
+                "status": "error",
+                "message": "No se encontró el trabajo de chat.",
+                "code": "chat_job_not_found"
+            }
+        )
+    
+    if not stream and "text/event-stream" not in request.headers.get("accept", ""):
+        return job_response(document)
+    
+    async def events() -> AsyncIterator[str]:
+        try:
+            async for event, data in chat_job_manager.follow(job_id, user_id, offset):
+                yield format_sse(event, data)
+        except ChatJobNotFoundError:
+            # El trabajo caducó mientras se transmitía
+            yield format_sse("error", {"message": "No se encontró el trabajo de chat.", "code": "chat_job_not_found"})
+    
+    return StreamingResponse(
+        events(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+    )
+
+
+class ChatConnection:
+    """
+    Estado de una conexión WebSocket de chat.
+    
+    El usuario se autentica una sola vez al conectar; la sesión, el grupo de
+    edad y el contexto se conservan en memoria entre turnos, y cada conexión
+    tiene su propio límite de mensajes.
+    """
+    
+    def __init__(self, user_id: str, token_expires: Optional[float], age_group: str, session_id: Optional[str]):
+        self.user_id = user_id
+        self.token_expires = token_expires
+        self.age_group = age_group
+        self.session_id = session_id
+        self.context: Dict[str, Any] = {}
+        self.limiter = RateLimiter(
+            requests=settings.CHAT_WS_RATE_LIMIT_MESSAGES,
+            window=settings.CHAT_WS_RATE_LIMIT_WINDOW,
+            stripes=1,
+            max_keys=1
+        )
+    
+    def build_request(self, frame: Dict[str, Any]) -> ChatRequest:
+        """
+        Construye la solicitud de un turno a partir de un mensaje del cliente.
+        
+        Args:
+            frame: Mensaje recibido (`message` y, opcionalmente, `age_group` y `context`)
+            
+        Returns:
+            ChatRequest: Solicitud validada con el estado de la conexión
+            
+        Raises:
+            ValidationError: Si el mensaje no es válido
+        """
+        chat_request = ChatRequest(
+            message=frame.get("message"),
+            session_id=self.session_id,
+            age_group=frame.get("age_group", self.age_group),
+            context={**self.context, **(frame.get("context") or {})}
+        )
+        self.age_group = chat_request.age_group.value
+        return chat_request
+
+
+def _ws_token(websocket: WebSocket) -> Optional[str]:
+    """Token del parámetro `token` o del encabezado `Authorization: Bearer`."""
+    token = websocket.query_params.get("token")
+    if token:
+        return token
+    authorization = websocket.headers.get("authorization", "")
+    scheme, _, credentials = authorization.partition(" ")
+    return credentials if scheme.lower() == "bearer" and credentials else None
+
+
+@router.websocket("/ws")
+async def chat_websocket(websocket: WebSocket) -> None:
+    """
+    Canal de chat por WebSocket.
+    
+    Se conecta a `/api/chat/ws?token=<JWT>` (o con `Authorization: Bearer`),
+    opcionalmente con `session_id` y `age_group`. Cada mensaje del cliente es
+    un JSON `{"message": ..., "age_group": ..., "context": {...}}` o texto
+    plano, y el servidor responde con tramas `token`, una trama `done` por
+    turno o una trama `error`. Los turnos se atienden en orden.
+    
+    Args:
+        websocket: Conexión WebSocket
+    """
+    payload = decode_access_token(_ws_token(websocket) or "")
+    if payload is None:
+        await websocket.close(code=status.WS_1008_POLICY_VIOLATION)
+        return
+    
+    connection = ChatConnection(
+        user_id=payload["sub"],
+        token_expires=payload.get("exp"),
+        age_group=websocket.query_params.get("age_group", AgeGroup.SIX_TO_EIGHT.value),
+        session_id=websocket.query_params.get("session_id")
+    )
+    await websocket.accept()
+    await websocket.send_json({"type": "ready", "session_id": connection.session_id})
+    
+    try:
+        while True:
+            try:
+                raw = await asyncio.wait_for(websocket.receive_text(), settings.CHAT_WS_IDLE_TIMEOUT_SECONDS)
+            except asyncio.TimeoutError:
+                await websocket.close(code=status.WS_1000_NORMAL_CLOSURE, reason="Conexión inactiva")
+                return
+            
+            if connection.token_expires is not None and time.time() >= connection.token_expires:
+                await websocket.close(code=status.WS_1008_POLICY_VIOLATION, reason="Token expirado")
+                return
+            
+            result = await connection.limiter.hit("ws")
+            if result.limited:
+                await websocket.send_json({
+                    "type": "error",
+                    "code": "rate_limited",
+                    "message": "Demasiados mensajes. Espera un poco antes de seguir.",
+                    "retry_after": max(1, int(result.reset - time.time()))
+                })
+                continue
+            
+            try:
+                frame = json.loads(raw) if raw.lstrip().startswith("{") else {"message": raw}
+                chat_request = connection.build_request(frame)
+                chat_request = await chat_service.prepare_request(chat_request, connection.user_id)
+            except (ValueError, TypeError, ValidationError):
+                await websocket.send_json({
+                    "type": "error",
+                    "code": "invalid_message",
+                    "message": "El mensaje no es válido."
+                })
+                continue
+            except ChatSessionNotFoundError:
+                connection.session_id = None
+                await websocket.send_json({
+                    "type": "error",
+                    "code": "chat_session_not_found",
+                    "message": "No se encontró la sesión de chat."
+                })
+                continue
+            
+            connection.session_id = chat_request.session_id
+            async for event, data in chat_service.stream_chat(chat_request):
+                if event == "done":
+                    connection.context = data["context"]
+                await websocket.send_text(json.dumps(
+                    {"type": event, **jsonable_encoder(data)}, ensure_ascii=False
+                ))
+    
+    except WebSocketDisconnect:
+        pass
+    except Exception as e:
+        logger.error(
+            "Error en el canal WebSocket de chat",
+            exc_info=True,
+            extra={"user_id": connection.user_id, "error": str(e)}
+        )
+        await websocket.close(code=status.WS_1011_INTERNAL_ERROR)
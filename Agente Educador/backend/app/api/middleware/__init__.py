@@ -0,0 +1,16 @@
+"""
+Middlewares ASGI de la API.
+"""
+from app.api.middleware.rate_limit import (
+    RateLimitMiddleware,
+    RateLimitPolicy,
+    parse_rate_limit_policies,
+    rate_limit_policies,
+)
+
+__all__ = [
+    "RateLimitMiddleware",
+    "RateLimitPolicy",
+    "parse_rate_limit_policies",
+    "rate_limit_policies",
+]
@@ -0,0 +1,142 @@
+"""
+Middleware ASGI de limitación de tasa por prefijo de ruta.
+
+Se ejecuta antes del enrutado: la solicitud se rechaza con 429 sin leer el
+cuerpo, sin validarlo con Pydantic y sin decodificar el JWT, por lo que un
+cliente abusivo apenas consume recursos.
+"""
+import json
+import time
+from typing import Any, Dict, List, NamedTuple
+
+from starlette.datastructures import MutableHeaders
+from starlette.requests import Request
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from app.api.dependencies.rate_limiter import RateLimiter, create_rate_limiter, get_client_ip
+from app.core.config import settings
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class RateLimitPolicy(NamedTuple):
+    """Límite aplicado a las rutas que empiezan por `prefix`."""
+    prefix: str
+    limiter: RateLimiter
+
+
+def parse_rate_limit_policies(spec: str) -> List[RateLimitPolicy]:
+    """
+    Construye las políticas a partir de una cadena de configuración.
+
+    El formato es `prefijo=solicitudes/ventana` separado por comas, por
+    ejemplo `/api/chat=30/60,/api/v1/auth/token=10/60`.
+
+    Args:
+        spec: Cadena de configuración
+
+    Returns:
+        List[RateLimitPolicy]: Políticas ordenadas del prefijo más largo al más corto
+
+    Raises:
+        ValueError: Si alguna entrada no tiene el formato esperado
+    """
+    policies = []
+    for entry in spec.split(","):
+        entry = entry.strip()
+        if not entry:
+            continue
+        try:
+            prefix, limit = entry.split("=", 1)
+            requests, window = limit.split("/", 1)
+            limiter = create_rate_limiter(requests=int(requests), window=int(window))
+        except ValueError:
+            raise ValueError(f"Política de límite de tasa inválida: '{entry}'")
+        policies.append(RateLimitPolicy(prefix.strip().rstrip("/") or "/", limiter))
+    return sorted(policies, key=lambda policy: len(policy.prefix), reverse=True)
+
+
+class RateLimitMiddleware:
+    """
+    Aplica a cada solicitud HTTP la política del prefijo más largo que coincida.
+
+    Las claves se guardan como `prefijo:ip`, de modo que cada política tiene
+    sus propios contadores aunque compartan almacenamiento.
+    """
+
+    def __init__(self, app: ASGIApp, policies: List[RateLimitPolicy]):
+        """
+        Inicializa el middleware.
+
+        Args:
+            app: Aplicación ASGI envuelta
+            policies: Políticas a aplicar, de la más específica a la más general
+        """
+        self.app = app
+        self.policies = policies
+
+    def _match(self, path: str):
+        for policy in self.policies:
+            if path == policy.prefix or path.startswith(policy.prefix + "/") or policy.prefix == "/":
+                return policy
+        return None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        # Las solicitudes preflight de CORS no cuentan para el límite
+        if scope["type"] != "http" or scope["method"] == "OPTIONS":
+            await self.app(scope, receive, send)
+            return
+
+        policy = self._match(scope["path"])
+        if policy is None:
+            await self.app(scope, receive, send)
+            return
+
+        client_ip = get_client_ip(Request(scope))
+        result = await policy.limiter.hit(f"{policy.prefix}:{client_ip}")
+        rate_headers = {
+            "X-RateLimit-Limit": str(result.limit),
+            "X-RateLimit-Remaining": str(result.remaining),
+            "X-RateLimit-Reset": str(result.reset),
+        }
+
+        if result.limited:
+            logger.warning(
+                f"Límite de tasa excedido para la IP {client_ip}",
+                extra={"ip": client_ip, "path": scope["path"], "policy": policy.prefix}
+            )
+            retry_after = max(1, int(result.reset - time.time()))
+            await self._reject(send, retry_after, rate_headers)
+            return
+
+        async def send_with_headers(message: Message) -> None:
+            if message["type"] == "http.response.start":
+                MutableHeaders(scope=message).update(rate_headers)
+            await send(message)
+
+        await self.app(scope, receive, send_with_headers)
+
+    @staticmethod
+    async def _reject(send: Send, retry_after: int, rate_headers: Dict[str, str]) -> None:
+        body = json.dumps({
+            "status": "error",
+            "message": "Demasiadas solicitudes. Por favor, intente de nuevo más tarde.",
+            "status_code": 429,
+            "retry_after": retry_after,
+        }).encode("utf-8")
+        headers: List[Any] = [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode("latin-1")),
+            (b"retry-after", str(retry_after).encode("latin-1")),
+        ]
+        headers.extend(
+            (name.lower().encode("latin-1"), value.encode("latin-1"))
+            for name, value in rate_headers.items()
+        )
+        await send({"type": "http.response.start", "status": 429, "headers": headers})
+        await send({"type": "http.response.body", "body": body})
+
+
+# Políticas globales definidas en la configuración
+rate_limit_policies = parse_rate_limit_policies(settings.RATE_LIMIT_POLICIES)
@@ -12,7 +12,7 @@ from typing import Any, Dict
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm, OAuth2PasswordBearer
 from jose import JWTError, jwt
-from app.core.security import verify_password
+from app.core.security import HashingPoolSaturatedError, verify_password_async
 
 from app.core.auth import (
     get_current_active_user,
@@ -20,10 +20,10 @@ from app.core.auth import (
     create_tokens,
     refresh_access_token
 )
-from ..models.user import UserResponse, UserCreate, User
-from ..models.token import Token
-from ..repositories.user_repository import UserRepository, get_user_repository
-from ..repositories.token_repository import TokenRepository, get_token_repository
+from app.models.user import UserResponse, UserCreate, User
+from app.models.token import Token
+from app.repositories.user_repository import UserRepository, get_user_repository
+from app.repositories.token_repository import TokenRepository, get_token_repository
 from config import settings
 
 logger = logging.getLogger(__name__)
@@ -118,6 +118,9 @@ async def register_user(
             logger.info(f"Registro completado para el usuario: {user_in.username}")
             return user_dict
             
+        except HashingPoolSaturatedError:
+            raise
+            
         except ValueError as ve:
             logger.error(f"Error de validación al crear el usuario: {str(ve)}")
             raise HTTPException(
@@ -143,6 +146,11 @@ async def register_user(
         logger.error(f"Error de HTTP durante el registro: {str(he)}")
         raise he
         
+    except HashingPoolSaturatedError:
+        # Se responde con 503 desde el manejador global
+        logger.warning(f"Pool de hashing saturado durante el registro de {user_in.username}")
+        raise
+        
     except Exception as e:
         # Capturar cualquier otro error inesperado
         logger.error(f"Error inesperado durante el registro: {str(e)}")
@@ -222,7 +230,7 @@ async def login_for_access_token(
         if not user:
             user = await user_repo.get_user_by_email(form_data.username)
             
-        if not user or not verify_password(form_data.password, user.hashed_password):
+        if not user or not await verify_password_async(form_data.password, user.hashed_password):
             logger.warning(f"Intento de inicio de sesión fallido para el usuario: {form_data.username}")
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
@@ -294,6 +302,10 @@ async def login_for_access_token(
     except HTTPException as he:
         # Re-lanzar las excepciones HTTP
         raise he
+    except HashingPoolSaturatedError:
+        # Se responde con 503 desde el manejador global
+        logger.warning(f"Pool de hashing saturado durante el inicio de sesión de {form_data.username}")
+        raise
     except Exception as e:
         # Log del error para depuración
         logger.error(f"Error durante el inicio de sesión: {str(e)}", exc_info=True)
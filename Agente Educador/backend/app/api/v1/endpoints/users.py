@@ -8,7 +8,7 @@ from fastapi.security import OAuth2PasswordBearer
 from app.models.user import User, UserUpdate, UserResponse
 from app.repositories.user_repository import UserRepository
 from app.core.auth import get_current_active_user, get_current_active_admin
-from app.core.security import get_password_hash
+from app.core.security import get_password_hash_async
 
 router = APIRouter()
 
@@ -36,7 +36,7 @@ async def update_user_me(
     
     # Si se está actualizando la contraseña, hashearla
     if 'password' in update_data:
-        update_data['hashed_password'] = get_password_hash(update_data.pop('password'))
+        update_data['hashed_password'] = await get_password_hash_async(update_data.pop('password'))
     
     updated_user = await user_repo.update_user(str(current_user.id), update_data)
     if not updated_user:
@@ -112,7 +112,7 @@ async def update_user(
     
     # Si se está actualizando la contraseña, hashearla
     if 'password' in update_data:
-        update_data['hashed_password'] = get_password_hash(update_data.pop('password'))
+        update_data['hashed_password'] = await get_password_hash_async(update_data.pop('password'))
     
     updated_user = await user_repo.update_user(user_id, update_data)
     return updated_user
@@ -8,13 +8,18 @@ from fastapi import Depends, HTTPException, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from jose import JWTError, jwt
 from pydantic import ValidationError
-from passlib.context import CryptContext
 import uuid
 
+from app.core.cache import principal_cache
+from app.core.security import (
+    get_password_hash,
+    get_password_hash_async,
+    verify_password,
+    verify_password_async,
+)
 from app.models.user import User, UserInDB
 from app.models.token import TokenData
 from app.repositories.user_repository import UserRepository
-from app.repositories.user_repository import UserRepository
 from app.repositories.token_repository import TokenRepository
 from config import settings
 
@@ -27,26 +32,15 @@ oauth2_scheme = OAuth2PasswordBearer(
 # Algoritmo para la firma JWT
 ALGORITHM = "HS256"
 
-# Configuración de seguridad
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
 # Configuración de seguridad JWT
 SECRET_KEY = settings.SECRET_KEY
 ACCESS_TOKEN_EXPIRE_MINUTES = settings.ACCESS_TOKEN_EXPIRE_MINUTES
 REFRESH_TOKEN_EXPIRE_DAYS = settings.REFRESH_TOKEN_EXPIRE_DAYS * 24 * 60 * 60  # Convertir a segundos
 
-# Función para verificar la contraseña
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
-
-# Función para obtener el hash de una contraseña
-def get_password_hash(password: str) -> str:
-    return pwd_context.hash(password)
-
 # Función para autenticar un usuario
 async def authenticate_user(username: str, password: str) -> Optional[User]:
     user = await UserRepository.get_user_by_username(username)
-    if not user or not verify_password(password, user.hashed_password):
+    if not user or not await verify_password_async(password, user.hashed_password):
         return None
     return user
 
@@ -250,11 +244,15 @@ async def get_current_user(
         # Crear objeto TokenData
         token_data = TokenData(username=username)
         
-        # Obtener el usuario de la base de datos
-        user = await UserRepository.get_user_by_username(username=token_data.username)
-        
+        # Consultar primero la caché en memoria y, si falla, la base de datos
+        user = principal_cache.get(token_data.username)
         if user is None:
-            raise credentials_exception
+            # Si el usuario se invalida durante la lectura, no se guarda en la caché
+            generation = principal_cache.generation()
+            user = await UserRepository.get_user_by_username(username=token_data.username)
+            if user is None:
+                raise credentials_exception
+            principal_cache.set(user, generation)
             
         return user
         
@@ -0,0 +1,107 @@
+"""
+Autómata de Aho–Corasick para buscar muchas palabras clave a la vez.
+
+El autómata se construye una sola vez y cada búsqueda recorre el texto una
+vez, con una consulta de diccionario por carácter, independientemente del
+número de palabras clave.
+"""
+from collections import deque
+from typing import Dict, Generic, Iterable, List, NamedTuple, Tuple, TypeVar
+
+V = TypeVar("V")
+
+
+class KeywordMatch(NamedTuple):
+    """Coincidencia de una palabra clave en el texto."""
+    start: int
+    keyword: str
+    value: object
+
+
+class KeywordAutomaton(Generic[V]):
+    """
+    Buscador de palabras clave basado en Aho–Corasick.
+
+    Las palabras clave solo coinciden al principio de una palabra del texto.
+    Por defecto deben coincidir con la palabra completa; si terminan en `*`
+    son raíces y coinciden con cualquier palabra que empiece por ellas
+    ("fraccion*" encuentra "fracciones"). Pueden contener espacios.
+
+    El autómata se guarda ya determinizado: para cada estado, un diccionario
+    con las transiciones que no vuelven a la raíz, de modo que la búsqueda
+    no tiene que seguir enlaces de fallo.
+    """
+
+    def __init__(self, keywords: Iterable[Tuple[str, V]]):
+        """
+        Construye el autómata.
+
+        Args:
+            keywords: Pares (palabra clave, valor asociado); las palabras clave
+                deben estar ya normalizadas igual que los textos de búsqueda
+        """
+        goto: List[Dict[str, int]] = [{}]
+        outputs: List[List[Tuple[int, str, V, bool]]] = [[]]
+        count = 0
+        for keyword, value in keywords:
+            prefix = keyword.endswith("*")
+            pattern = keyword.rstrip("*")
+            if not pattern:
+                continue
+            state = 0
+            for char in pattern:
+                next_state = goto[state].get(char)
+                if next_state is None:
+                    next_state = len(goto)
+                    goto[state][char] = next_state
+                    goto.append({})
+                    outputs.append([])
+                state = next_state
+            outputs[state].append((len(pattern), pattern, value, prefix))
+            count += 1
+
+        # Enlaces de fallo en anchura y transiciones completas por estado
+        fail = [0] * len(goto)
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [{} for _ in goto[1:]]
+        queue = deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            transitions = dict(delta[fail[state]])
+            transitions.update(goto[state])
+            delta[state] = transitions
+            outputs[state] = outputs[state] + outputs[fail[state]]
+            for char, child in goto[state].items():
+                fail[child] = delta[fail[state]].get(char, 0)
+                queue.append(child)
+
+        self._delta = delta
+        self._outputs = outputs
+        self.states = len(goto)
+        self.keywords = count
+
+    def search(self, text: str) -> List[KeywordMatch]:
+        """
+        Busca todas las palabras clave en el texto.
+
+        Args:
+            text: Texto normalizado igual que las palabras clave
+
+        Returns:
+            List[KeywordMatch]: Coincidencias en orden de aparición del final
+        """
+        delta = self._delta
+        outputs = self._outputs
+        matches: List[KeywordMatch] = []
+        state = 0
+        last = len(text) - 1
+        for end, char in enumerate(text):
+            state = delta[state].get(char, 0)
+            if outputs[state]:
+                for length, pattern, value, prefix in outputs[state]:
+                    start = end - length + 1
+                    if start > 0 and text[start - 1].isalnum():
+                        continue
+                    if not prefix and end < last and text[end + 1].isalnum():
+                        continue
+                    matches.append(KeywordMatch(start, pattern, value))
+        return matches
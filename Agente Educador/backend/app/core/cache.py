@@ -0,0 +1,248 @@
+"""
+Cachés en memoria del proceso para la API de GEMINI.
+
+Este módulo proporciona una caché acotada con expiración (TTL) y desalojo LRU,
+usada para evitar viajes repetidos a MongoDB en rutas calientes como la
+autenticación de cada solicitud.
+"""
+import time
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from config import settings
+
+
+class TTLCache:
+    """
+    Caché acotada con expiración por entrada y desalojo del elemento menos
+    usado recientemente (LRU).
+
+    No es segura entre hilos; está pensada para usarse desde el bucle de
+    eventos, donde ninguna operación cede el control a mitad de camino.
+    """
+
+    def __init__(self, max_size: int = 1024, ttl: float = 60.0, max_cost: Optional[int] = None):
+        """
+        Inicializa la caché.
+
+        Args:
+            max_size: Número máximo de entradas residentes
+            ttl: Tiempo de vida de cada entrada en segundos
+            max_cost: Coste total máximo de las entradas (p. ej. bytes); sin límite si es None
+        """
+        self.max_size = max_size
+        self.ttl = ttl
+        self.max_cost = max_cost
+        self.cost = 0
+        self._data: "OrderedDict[Hashable, Tuple[float, Any, int]]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return self.peek(key) is not None
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """
+        Obtiene un valor y lo marca como usado recientemente.
+
+        Args:
+            key: Clave a buscar
+
+        Returns:
+            El valor almacenado o None si no existe o ha expirado
+        """
+        value = self.peek(key)
+        if value is None:
+            self.misses += 1
+            return None
+        self._data.move_to_end(key)
+        self.hits += 1
+        return value
+
+    def peek(self, key: Hashable) -> Optional[Any]:
+        """Obtiene un valor sin alterar el orden LRU ni los contadores."""
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        expires_at, value, cost = entry
+        if expires_at <= time.monotonic():
+            del self._data[key]
+            self.cost -= cost
+            self.expirations += 1
+            return None
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: Optional[float] = None, cost: int = 1) -> bool:
+        """
+        Almacena un valor, desalojando las entradas más antiguas si es necesario.
+
+        Args:
+            key: Clave del valor
+            value: Valor a almacenar
+            ttl: Tiempo de vida específico para esta entrada (opcional)
+            cost: Coste de la entrada frente a `max_cost`
+
+        Returns:
+            bool: False si la entrada supera por sí sola el coste máximo y no se guarda
+        """
+        self.delete(key)
+        if self.max_cost is not None and cost > self.max_cost:
+            return False
+        expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+        self._data[key] = (expires_at, value, cost)
+        self.cost += cost
+        while len(self._data) > self.max_size or (
+            self.max_cost is not None and self.cost > self.max_cost
+        ):
+            _, (_, _, evicted_cost) = self._data.popitem(last=False)
+            self.cost -= evicted_cost
+            self.evictions += 1
+        return True
+
+    def delete(self, key: Hashable) -> bool:
+        """Elimina una entrada. Devuelve True si existía."""
+        entry = self._data.pop(key, None)
+        if entry is None:
+            return False
+        self.cost -= entry[2]
+        return True
+
+    def clear(self) -> None:
+        """Elimina todas las entradas sin reiniciar los contadores."""
+        self._data.clear()
+        self.cost = 0
+
+    def items(self) -> List[Tuple[Hashable, Any]]:
+        """Devuelve las entradas vigentes, de la menos a la más usada recientemente."""
+        now = time.monotonic()
+        return [(key, value) for key, (expires_at, value, _) in self._data.items() if expires_at > now]
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de la caché."""
+        lookups = self.hits + self.misses
+        return {
+            "size": len(self._data),
+            "max_size": self.max_size,
+            "ttl_seconds": self.ttl,
+            "cost": self.cost,
+            "max_cost": self.max_cost,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+        }
+
+
+class PrincipalCache:
+    """
+    Caché de usuarios autenticados indexada por nombre de usuario y por ID.
+
+    La usa `get_current_user` para no consultar MongoDB en cada solicitud.
+    El repositorio de usuarios la invalida en cada escritura, de modo que en
+    este proceso nunca se sirve un usuario desactualizado; en otros procesos
+    el TTL acota la ventana de inconsistencia.
+
+    Una lectura de MongoDB que empezó antes de una invalidación puede
+    terminar después: quien lee toma `generation()` antes de consultar y la
+    pasa a `set`, que descarta el usuario si se invalidó entretanto.
+    """
+
+    def __init__(self, max_size: int = 10000, ttl: float = 60.0):
+        self._cache = TTLCache(max_size=max_size, ttl=ttl)
+        # ID -> nombre de usuario, fuera del LRU para que invalidar por ID
+        # encuentre siempre la entrada aunque no se haya consultado por ID
+        self._usernames: Dict[str, str] = {}
+        # Generación de la última invalidación de cada usuario ("u:" nombre, "i:" ID);
+        # al olvidarlas, las lecturas anteriores a `_floor` se descartan todas
+        self._generation = 0
+        self._invalidated: Dict[str, int] = {}
+        self._floor = 0
+
+    def get(self, username: str) -> Optional[Any]:
+        """Obtiene el usuario cacheado para un nombre de usuario."""
+        return self._cache.get(username.lower())
+
+    def generation(self) -> int:
+        """Devuelve la generación actual; se toma antes de leer el usuario de MongoDB."""
+        return self._generation
+
+    def set(self, user: Any, generation: Optional[int] = None) -> None:
+        """
+        Almacena un usuario bajo su nombre de usuario y recuerda su ID.
+
+        Args:
+            user: Usuario leído de MongoDB
+            generation: Resultado de `generation()` antes de la lectura; si el
+                usuario se invalidó después, no se almacena
+        """
+        username = user.username.lower()
+        if generation is not None and self._changed_since(username, str(user.id), generation):
+            return
+        previous = self._usernames.get(str(user.id))
+        if previous is not None and previous != username:
+            # Cambio de nombre: la entrada antigua ya no es válida
+            self._cache.delete(previous)
+        self._cache.set(username, user)
+        self._usernames[str(user.id)] = username
+        if len(self._usernames) > 2 * self._cache.max_size:
+            self._prune()
+
+    def invalidate_username(self, username: str) -> None:
+        """Invalida un usuario a partir de su nombre de usuario."""
+        username = username.lower()
+        user = self._cache.peek(username)
+        self._cache.delete(username)
+        self._bump(f"u:{username}")
+        if user is not None:
+            self._usernames.pop(str(user.id), None)
+            self._bump(f"i:{user.id}")
+
+    def invalidate_user_id(self, user_id: str) -> None:
+        """Invalida un usuario a partir de su ID."""
+        username = self._usernames.pop(str(user_id), None)
+        self._bump(f"i:{user_id}")
+        if username is not None:
+            self._cache.delete(username)
+            self._bump(f"u:{username}")
+
+    def _bump(self, key: str) -> None:
+        self._generation += 1
+        self._invalidated[key] = self._generation
+        if len(self._invalidated) > self._cache.max_size:
+            # Olvidar las invalidaciones; las lecturas en curso se descartan
+            self._invalidated.clear()
+            self._floor = self._generation
+
+    def _changed_since(self, username: str, user_id: str, generation: int) -> bool:
+        if generation < self._floor:
+            return True
+        invalidated = max(self._invalidated.get(f"u:{username}", 0), self._invalidated.get(f"i:{user_id}", 0))
+        return invalidated > generation
+
+    def _prune(self) -> None:
+        """Olvida los IDs de los usuarios que ya desalojó o expiró la caché."""
+        self._usernames = {str(user.id): username for username, user in self._cache.items()}
+
+    def clear(self) -> None:
+        """Vacía la caché."""
+        self._cache.clear()
+        self._usernames.clear()
+        self._invalidated.clear()
+        self._floor = self._generation = self._generation + 1
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve los contadores de aciertos, fallos y desalojos."""
+        return self._cache.stats()
+
+
+# Instancia global de la caché de usuarios autenticados
+principal_cache = PrincipalCache(
+    max_size=settings.PRINCIPAL_CACHE_MAX_SIZE,
+    ttl=settings.PRINCIPAL_CACHE_TTL_SECONDS,
+)
@@ -50,6 +50,22 @@ class Settings(BaseSettings):
     # Configuración de límite de tasa (rate limiting)
     RATE_LIMIT_REQUESTS: int = int(os.getenv("RATE_LIMIT_REQUESTS", "100"))  # Número de peticiones
     RATE_LIMIT_WINDOW: int = int(os.getenv("RATE_LIMIT_WINDOW", "60"))  # Ventana de tiempo en segundos
+    RATE_LIMIT_MAX_KEYS: int = int(os.getenv("RATE_LIMIT_MAX_KEYS", "100000"))  # Clientes distintos en memoria
+    RATE_LIMIT_SWEEP_INTERVAL: float = float(os.getenv("RATE_LIMIT_SWEEP_INTERVAL", "30"))  # Segundos entre barridos
+    RATE_LIMIT_BACKEND: Literal["memory", "mongo"] = os.getenv("RATE_LIMIT_BACKEND", "memory")  # "mongo" para compartir entre workers
+    RATE_LIMIT_MONGO_COLLECTION: str = os.getenv("RATE_LIMIT_MONGO_COLLECTION", "rate_limits")
+    RATE_LIMIT_FLUSH_INTERVAL: float = float(os.getenv("RATE_LIMIT_FLUSH_INTERVAL", "0.5"))  # Segundos entre envíos a MongoDB
+    # Políticas por prefijo de ruta: "prefijo=solicitudes/ventana" separadas por comas
+    RATE_LIMIT_POLICIES: str = os.getenv(
+        "RATE_LIMIT_POLICIES",
+        f"/api/chat={RATE_LIMIT_REQUESTS}/{RATE_LIMIT_WINDOW},"
+        "/api/v1/auth/token=10/60,/api/v1/auth/register=5/60"
+    )
+    
+    # Configuración del pool de hashing de contraseñas (bcrypt)
+    PASSWORD_HASH_EXECUTOR: Literal["thread", "process"] = os.getenv("PASSWORD_HASH_EXECUTOR", "thread")
+    PASSWORD_HASH_WORKERS: int = int(os.getenv("PASSWORD_HASH_WORKERS", "4"))
+    PASSWORD_HASH_MAX_PENDING: int = int(os.getenv("PASSWORD_HASH_MAX_PENDING", "64"))  # Operaciones en cola antes de rechazar
     
     # Validación de LOG_LEVEL
     @validator('LOG_LEVEL')
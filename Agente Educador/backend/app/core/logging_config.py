@@ -67,6 +67,17 @@ def setup_logging() -> None:
                 "level": settings.LOG_LEVEL,
                 "propagate": False,
             },
+            # httpx registra cada solicitud a n8n en INFO
+            "httpx": {
+                "handlers": ["console", "file"],
+                "level": "WARNING",
+                "propagate": False,
+            },
+            "httpcore": {
+                "handlers": ["console", "file"],
+                "level": "WARNING",
+                "propagate": False,
+            },
         },
         "root": {
             "handlers": ["console", "file"],
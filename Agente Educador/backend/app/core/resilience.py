@@ -0,0 +1,548 @@
+"""
+Utilidades de resiliencia para las llamadas al upstream.
+"""
+import asyncio
+import time
+from collections import deque
+from contextlib import asynccontextmanager
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Hashable, List, Optional, Tuple, TypeVar
+
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class _Flight:
+    """Ejecución compartida en curso y las solicitudes en primer plano que la esperan."""
+
+    __slots__ = ("task", "deadline", "waiters")
+
+    def __init__(self, task: asyncio.Task, deadline: Optional[float]):
+        self.task = task
+        self.deadline = deadline
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Agrupa llamadas concurrentes idénticas en una sola.
+
+    La primera llamada con una clave (el líder) ejecuta la función; las que
+    llegan mientras está en curso (seguidoras) esperan el mismo resultado o
+    la misma excepción. La ejecución se protege con `asyncio.shield`, de modo
+    que si el cliente del líder se desconecta, las seguidoras no se cancelan.
+
+    Todas esperan como mucho hasta el plazo del líder (`timeout` segundos
+    desde que empezó); al vencer se lanza `asyncio.TimeoutError` y la
+    ejecución continúa para las que aún tengan plazo.
+
+    Las llamadas en segundo plano (`background=True`, p. ej. especulaciones)
+    no cuentan como esperas: una ejecución solo se puede cancelar mientras
+    ninguna llamada en primer plano la espera.
+    """
+
+    def __init__(self, timeout: Optional[float] = None):
+        """
+        Inicializa el agrupador.
+
+        Args:
+            timeout: Plazo máximo en segundos desde el inicio de cada ejecución
+        """
+        self.timeout = timeout
+        self._calls: Dict[Hashable, _Flight] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.timeouts = 0
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._calls
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[T]], background: bool = False) -> T:
+        """
+        Ejecuta `fn` o se une a la ejecución en curso con la misma clave.
+
+        Args:
+            key: Clave que identifica llamadas equivalentes
+            fn: Función asíncrona a ejecutar si no hay ninguna en curso
+            background: Si la llamada es de segundo plano y no impide cancelar la ejecución
+
+        Returns:
+            El resultado de la ejecución compartida
+
+        Raises:
+            asyncio.TimeoutError: Si vence el plazo del líder
+        """
+        call = self._calls.get(key)
+        if call is None:
+            deadline = time.monotonic() + self.timeout if self.timeout is not None else None
+            task = asyncio.ensure_future(fn())
+            call = self._calls[key] = _Flight(task, deadline)
+            task.add_done_callback(lambda _: self._forget(key, task))
+            self.leaders += 1
+        else:
+            self.coalesced += 1
+
+        remaining = None if call.deadline is None else max(0.0, call.deadline - time.monotonic())
+        if not background:
+            call.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(call.task), remaining)
+        except asyncio.TimeoutError:
+            self.timeouts += 1
+            raise
+        finally:
+            if not background:
+                call.waiters -= 1
+
+    def cancel(self, key: Hashable) -> bool:
+        """
+        Cancela la ejecución en curso con una clave si solo la esperan
+        llamadas en segundo plano, que reciben `asyncio.CancelledError`.
+
+        Returns:
+            bool: True si se canceló una ejecución
+        """
+        call = self._calls.get(key)
+        if call is None or call.waiters:
+            return False
+        call.task.cancel()
+        return True
+
+    def _forget(self, key: Hashable, task: asyncio.Task) -> None:
+        call = self._calls.get(key)
+        if call is not None and call.task is task:
+            del self._calls[key]
+        if not task.cancelled():
+            task.exception()  # Marcar la excepción como recuperada aunque nadie espere
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve cuántas llamadas al upstream se han ahorrado."""
+        return {
+            "in_flight": len(self._calls),
+            "upstream_calls": self.leaders,
+            "coalesced": self.coalesced,
+            "timeouts": self.timeouts,
+        }
+
+
+class LoadShedError(Exception):
+    """Se lanza cuando el limitador rechaza una solicitud para proteger el servicio."""
+
+    def __init__(self, reason: str):
+        super().__init__(f"Solicitud descartada por sobrecarga ({reason})")
+        self.reason = reason
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limitador de concurrencia adaptativo (AIMD) con cola de espera acotada.
+
+    El límite crece en uno por cada ventana de `limit` llamadas rápidas
+    (aumento aditivo) y se multiplica por `backoff` ante un error o una
+    latencia superior a `latency_threshold` (disminución multiplicativa), de
+    modo que se ajusta solo a la capacidad real del upstream.
+
+    Cuando no hay hueco, la solicitud espera en una cola FIFO de como mucho
+    `max_queue` posiciones. Se descarta de inmediato (`LoadShedError`) si la
+    cola está llena o si, con la latencia media observada, no llegaría a
+    empezar antes de su plazo.
+    """
+
+    def __init__(
+        self,
+        initial_limit: int = 16,
+        min_limit: int = 1,
+        max_limit: int = 128,
+        max_queue: int = 64,
+        latency_threshold: float = 8.0,
+        backoff: float = 0.9
+    ):
+        """
+        Inicializa el limitador.
+
+        Args:
+            initial_limit: Concurrencia inicial
+            min_limit: Concurrencia mínima
+            max_limit: Concurrencia máxima
+            max_queue: Solicitudes máximas en espera
+            latency_threshold: Latencia en segundos a partir de la cual se reduce el límite
+            backoff: Factor de reducción del límite
+        """
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.max_queue = max_queue
+        self.latency_threshold = latency_threshold
+        self.backoff = backoff
+        self._limit = float(initial_limit)
+        self._waiters: Deque[asyncio.Future] = deque()
+        self.in_flight = 0
+        self.avg_latency: Optional[float] = None
+        self.completed = 0
+        self.shed: Dict[str, int] = {"queue_full": 0, "deadline": 0, "timeout": 0}
+
+    @property
+    def limit(self) -> int:
+        return max(self.min_limit, int(self._limit))
+
+    @property
+    def queue_depth(self) -> int:
+        return len(self._waiters)
+
+    def _expected_wait(self) -> float:
+        # Antes de la primera medición no hay base para estimar la espera
+        if self.avg_latency is None:
+            return 0.0
+        return (len(self._waiters) + 1) / self.limit * self.avg_latency
+
+    def _shed(self, reason: str) -> LoadShedError:
+        self.shed[reason] += 1
+        return LoadShedError(reason)
+
+    async def acquire(self, timeout: Optional[float] = None) -> None:
+        """
+        Obtiene un hueco de ejecución, esperando en cola si es necesario.
+
+        Args:
+            timeout: Espera máxima en segundos antes de descartar la solicitud
+
+        Raises:
+            LoadShedError: Si la cola está llena o el plazo no es alcanzable
+        """
+        if self.in_flight < self.limit and not self._waiters:
+            self.in_flight += 1
+            return
+        if len(self._waiters) >= self.max_queue:
+            raise self._shed("queue_full")
+        if timeout is not None and self._expected_wait() > timeout:
+            raise self._shed("deadline")
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            await asyncio.wait_for(asyncio.shield(waiter), timeout)
+        except asyncio.TimeoutError:
+            self._abandon(waiter)
+            raise self._shed("timeout")
+        except asyncio.CancelledError:
+            self._abandon(waiter)
+            raise
+
+    def _abandon(self, waiter: asyncio.Future) -> None:
+        if waiter.done() and not waiter.cancelled():
+            # El hueco ya se había concedido: devolverlo sin medir latencia
+            self.in_flight -= 1
+            self._wake()
+        else:
+            waiter.cancel()
+            try:
+                self._waiters.remove(waiter)
+            except ValueError:
+                pass
+
+    def _wake(self) -> None:
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def release(self, latency: float, failed: bool = False) -> None:
+        """
+        Libera un hueco y ajusta el límite según el resultado.
+
+        Args:
+            latency: Duración de la llamada en segundos
+            failed: Si la llamada terminó con error
+        """
+        self.in_flight -= 1
+        self.completed += 1
+        self.avg_latency = latency if self.avg_latency is None else 0.8 * self.avg_latency + 0.2 * latency
+        if failed or latency > self.latency_threshold:
+            self._limit = max(float(self.min_limit), self._limit * self.backoff)
+        elif self.in_flight + 1 >= self.limit:
+            # Solo se amplía el límite cuando se está usando por completo
+            self._limit = min(float(self.max_limit), self._limit + 1.0 / self._limit)
+        self._wake()
+
+    @asynccontextmanager
+    async def slot(self, timeout: Optional[float] = None) -> AsyncIterator[None]:
+        """
+        Contexto que ocupa un hueco durante la llamada y mide su latencia.
+
+        Args:
+            timeout: Espera máxima en cola en segundos
+
+        Raises:
+            LoadShedError: Si la solicitud se descarta
+        """
+        await self.acquire(timeout)
+        start = time.monotonic()
+        failed = False
+        try:
+            yield
+        except Exception:
+            failed = True
+            raise
+        finally:
+            self.release(time.monotonic() - start, failed)
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el límite actual, la cola y las solicitudes descartadas."""
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "queue_depth": self.queue_depth,
+            "max_queue": self.max_queue,
+            "avg_latency_ms": round(self.avg_latency * 1000, 2) if self.avg_latency is not None else None,
+            "completed": self.completed,
+            "shed": dict(self.shed),
+            "shed_total": sum(self.shed.values()),
+        }
+
+
+class CircuitOpenError(Exception):
+    """Se lanza cuando el circuito está abierto y no se llama al upstream."""
+
+
+class _BreakerCall:
+    """Llamada en curso protegida por el circuito."""
+
+    __slots__ = ("breaker", "probe", "cycle", "start", "recorded")
+
+    def __init__(self, breaker: "CircuitBreaker", probe: bool, cycle: Optional[int] = None):
+        self.breaker = breaker
+        self.probe = probe
+        self.cycle = cycle
+        self.start = time.monotonic()
+        self.recorded = False
+
+    def restart(self) -> None:
+        """Mide la latencia desde ahora (p. ej., tras esperar turno en una cola local)."""
+        self.start = time.monotonic()
+
+    def success(self) -> None:
+        """Da la llamada por buena (p. ej., al recibir el primer fragmento)."""
+        self._record(False)
+
+    def failure(self) -> None:
+        """Da la llamada por fallida."""
+        self._record(True)
+
+    def _record(self, failed: bool) -> None:
+        if not self.recorded:
+            self.recorded = True
+            self.breaker.record(time.monotonic() - self.start, failed, self.probe, self.cycle)
+
+    def cancel(self) -> None:
+        """Termina la llamada sin resultado (cancelación o descarte ajeno al upstream)."""
+        if not self.recorded:
+            self.recorded = True
+            self.breaker.cancel(self.probe, self.cycle)
+
+
+class CircuitBreaker:
+    """
+    Cortocircuito para un upstream, con tasa de errores y latencia en ventana móvil.
+
+    - Cerrado: las llamadas pasan y su resultado se acumula en cubos de un
+      segundo durante `window` segundos. Con al menos `min_requests` llamadas,
+      se abre si la proporción de errores alcanza `failure_rate` o la de
+      llamadas más lentas que `slow_call_seconds` alcanza `slow_call_rate`.
+    - Abierto: se rechaza al instante (`CircuitOpenError`) durante
+      `open_seconds`, sin ocupar conexiones ni corrutinas.
+    - Semiabierto: pasan como mucho `half_open_probes` llamadas de prueba a
+      la vez; si ese número de pruebas sale bien se cierra, y si una falla
+      (o es lenta) se vuelve a abrir. Cada paso a semiabierto inicia un ciclo
+      nuevo y las pruebas que terminan tarde de un ciclo anterior se ignoran.
+    """
+
+    CLOSED = "closed"
+    OPEN = "open"
+    HALF_OPEN = "half_open"
+
+    def __init__(
+        self,
+        window: float = 30.0,
+        min_requests: int = 10,
+        failure_rate: float = 0.5,
+        slow_call_seconds: float = 10.0,
+        slow_call_rate: float = 0.8,
+        open_seconds: float = 15.0,
+        half_open_probes: int = 3,
+        excluded: Tuple[type, ...] = ()
+    ):
+        """
+        Inicializa el circuito.
+
+        Args:
+            window: Segundos de la ventana móvil
+            min_requests: Llamadas mínimas en la ventana para poder abrir
+            failure_rate: Proporción de errores que abre el circuito
+            slow_call_seconds: Latencia a partir de la cual una llamada es lenta
+            slow_call_rate: Proporción de llamadas lentas que abre el circuito
+            open_seconds: Segundos que permanece abierto antes de probar
+            half_open_probes: Llamadas de prueba en el estado semiabierto
+            excluded: Excepciones que no cuentan como fallo del upstream
+        """
+        self.window = window
+        self.min_requests = min_requests
+        self.failure_rate = failure_rate
+        self.slow_call_seconds = slow_call_seconds
+        self.slow_call_rate = slow_call_rate
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+        self.excluded = excluded
+        self._state = self.CLOSED
+        self._opened_at = 0.0
+        self._buckets: Deque[List[int]] = deque()  # [segundo, llamadas, errores, lentas]
+        self._probes = 0
+        self._probe_successes = 0
+        self._cycle = 0  # Ciclo semiabierto actual
+        self.opened = 0
+        self.rejected = 0
+
+    @property
+    def state(self) -> str:
+        if self._state == self.OPEN and time.monotonic() - self._opened_at >= self.open_seconds:
+            self._state = self.HALF_OPEN
+            self._cycle += 1
+            self._probes = 0
+            self._probe_successes = 0
+        return self._state
+
+    def _totals(self) -> Tuple[int, int, int]:
+        oldest = int(time.monotonic() - self.window)
+        while self._buckets and self._buckets[0][0] <= oldest:
+            self._buckets.popleft()
+        calls = sum(b[1] for b in self._buckets)
+        failures = sum(b[2] for b in self._buckets)
+        slow = sum(b[3] for b in self._buckets)
+        return calls, failures, slow
+
+    def _open(self) -> None:
+        if self._state != self.OPEN:
+            self.opened += 1
+            logger.warning("Circuito del upstream abierto: se usarán respuestas de respaldo")
+        self._state = self.OPEN
+        self._opened_at = time.monotonic()
+        self._buckets.clear()
+
+    def _close(self) -> None:
+        self._state = self.CLOSED
+        self._buckets.clear()
+        logger.info("Circuito del upstream cerrado")
+
+    def allow(self) -> bool:
+        """
+        Comprueba si se puede llamar al upstream.
+
+        Returns:
+            bool: True si la llamada es una prueba del estado semiabierto
+
+        Raises:
+            CircuitOpenError: Si el circuito está abierto o ya hay bastantes pruebas
+        """
+        state = self.state
+        if state == self.CLOSED:
+            return False
+        if state == self.HALF_OPEN and self._probes < self.half_open_probes:
+            self._probes += 1
+            return True
+        self.rejected += 1
+        raise CircuitOpenError("El upstream no está disponible")
+
+    def _release_probe(self, cycle: Optional[int]) -> bool:
+        if cycle is not None and cycle != self._cycle:
+            return False  # Prueba de un ciclo anterior: su hueco ya se repuso
+        self._probes = max(0, self._probes - 1)
+        return True
+
+    def record(self, latency: float, failed: bool, probe: bool = False, cycle: Optional[int] = None) -> None:
+        """
+        Registra el resultado de una llamada.
+
+        Args:
+            latency: Duración de la llamada en segundos
+            failed: Si la llamada falló
+            probe: Si era una prueba del estado semiabierto
+            cycle: Ciclo semiabierto en el que empezó la prueba (por defecto, el actual)
+        """
+        slow = latency >= self.slow_call_seconds
+        if probe:
+            if not self._release_probe(cycle) or self._state != self.HALF_OPEN:
+                return
+            if failed or slow:
+                self._open()
+            else:
+                self._probe_successes += 1
+                if self._probe_successes >= self.half_open_probes:
+                    self._close()
+            return
+        if self._state != self.CLOSED:
+            return  # Llamadas iniciadas antes de abrir el circuito
+
+        second = int(time.monotonic())
+        if not self._buckets or self._buckets[-1][0] != second:
+            self._buckets.append([second, 0, 0, 0])
+        bucket = self._buckets[-1]
+        bucket[1] += 1
+        bucket[2] += failed
+        bucket[3] += slow
+
+        calls, failures, slow_calls = self._totals()
+        if calls >= self.min_requests and (
+            failures / calls >= self.failure_rate or slow_calls / calls >= self.slow_call_rate
+        ):
+            self._open()
+
+    def cancel(self, probe: bool, cycle: Optional[int] = None) -> None:
+        """Libera una llamada que terminó sin resultado del upstream."""
+        if probe:
+            self._release_probe(cycle)
+
+    @asynccontextmanager
+    async def guard(self) -> AsyncIterator[_BreakerCall]:
+        """
+        Contexto que protege una llamada al upstream.
+
+        El resultado se registra al salir, salvo que se haya indicado antes
+        con `success()` (útil para medir solo hasta el primer fragmento de una
+        respuesta transmitida). Las excepciones de `excluded` y las
+        cancelaciones no cuentan como fallo.
+
+        Raises:
+            CircuitOpenError: Si el circuito no permite la llamada
+        """
+        probe = self.allow()
+        call = _BreakerCall(self, probe, self._cycle if probe else None)
+        try:
+            yield call
+        except self.excluded:
+            call.cancel()
+            raise
+        except Exception:
+            call.failure()
+            raise
+        except BaseException:
+            call.cancel()
+            raise
+        else:
+            call.success()
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del circuito y las tasas de la ventana actual."""
+        state = self.state
+        calls, failures, slow = self._totals()
+        return {
+            "state": state,
+            "window_calls": calls,
+            "failure_rate": round(failures / calls, 3) if calls else 0.0,
+            "slow_call_rate": round(slow / calls, 3) if calls else 0.0,
+            "opened": self.opened,
+            "rejected": self.rejected,
+        }
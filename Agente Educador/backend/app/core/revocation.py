@@ -0,0 +1,302 @@
+"""
+Índice en memoria de tokens revocados.
+
+Este módulo mantiene un filtro de Bloom y un conjunto exacto de revocaciones
+recientes delante de la colección `token_blacklist`, de modo que la inmensa
+mayoría de las comprobaciones (tokens que NO están revocados) se resuelven sin
+consultar MongoDB. Solo cuando el filtro indica una posible coincidencia que no
+está en el conjunto exacto se recurre a la base de datos.
+"""
+import asyncio
+import hashlib
+import math
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Any, Dict, Optional
+
+from bson import ObjectId
+
+from app.core.logging_config import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom sobre un `bytearray`.
+
+    Recibe digests ya calculados para que el llamador haga un solo hash por
+    consulta; las posiciones se derivan por doble hashing (Kirsch-Mitzenmacher).
+    """
+
+    def __init__(self, capacity: int, error_rate: float = 0.001):
+        """
+        Inicializa el filtro.
+
+        Args:
+            capacity: Número de elementos esperados
+            error_rate: Tasa de falsos positivos objetivo
+        """
+        capacity = max(1, capacity)
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.size = max(8, int(-capacity * math.log(error_rate) / (math.log(2) ** 2)))
+        self.hash_count = max(1, round(self.size / capacity * math.log(2)))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def _positions(self, digest: bytes):
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        size = self.size
+        for i in range(self.hash_count):
+            yield (h1 + i * h2) % size
+
+    def add(self, digest: bytes) -> None:
+        """Agrega un digest al filtro (los repetidos no cuentan dos veces)."""
+        bits = self.bits
+        new = False
+        for pos in self._positions(digest):
+            mask = 1 << (pos & 7)
+            if not bits[pos >> 3] & mask:
+                bits[pos >> 3] |= mask
+                new = True
+        if new:
+            self.count += 1
+
+    def __contains__(self, digest: bytes) -> bool:
+        # Bucle sin generador: es la ruta caliente de las consultas negativas
+        bits = self.bits
+        size = self.size
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:16], "little") | 1
+        for i in range(self.hash_count):
+            pos = (h1 + i * h2) % size
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+
+class RevocationIndex:
+    """
+    Índice local de revocaciones alimentado desde `token_blacklist`.
+
+    Se carga completo al iniciar la aplicación y se mantiene al día leyendo
+    periódicamente los documentos nuevos (ordenados por `_id`). Las
+    revocaciones hechas en este mismo proceso se agregan de inmediato; las de
+    otros workers aparecen como muy tarde tras `poll_interval` segundos.
+
+    Si las lecturas fallan durante más de `max_staleness` segundos, el índice
+    deja de afirmar que un token no está revocado y se consulta MongoDB.
+    """
+
+    def __init__(
+        self,
+        capacity: int = 100000,
+        error_rate: float = 0.001,
+        recent_size: int = 10000,
+        poll_interval: float = 2.0,
+        clock_skew: float = 5.0,
+        max_staleness: Optional[float] = None,
+    ):
+        """
+        Inicializa el índice.
+
+        Args:
+            capacity: Capacidad inicial del filtro de Bloom
+            error_rate: Tasa de falsos positivos del filtro
+            recent_size: Tamaño del conjunto exacto de revocaciones recientes
+            poll_interval: Segundos entre lecturas de revocaciones nuevas
+            clock_skew: Margen en segundos para tolerar relojes desfasados
+                entre los workers que generan los ObjectId
+            max_staleness: Segundos sin una lectura correcta tras los que el
+                índice deja de responder por sí solo (por defecto, tres
+                veces `poll_interval`)
+        """
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.recent_size = recent_size
+        self.poll_interval = poll_interval
+        self.clock_skew = clock_skew
+        self.max_staleness = max_staleness if max_staleness is not None else 3 * poll_interval
+        self._bloom = BloomFilter(capacity, error_rate)
+        self._recent: "OrderedDict[bytes, None]" = OrderedDict()
+        self._collection = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_seen: Optional[datetime] = None
+        # Momento (reloj monótono) de la última carga o lectura correcta
+        self._synced_at: Optional[float] = None
+        self.loaded = False
+        self.negative_hits = 0
+        self.exact_hits = 0
+        self.fallbacks = 0
+        self.stale_lookups = 0
+
+    @staticmethod
+    def _digest(token: str, token_type: str) -> bytes:
+        return hashlib.blake2b(
+            f"{token_type}:{token}".encode(), digest_size=16
+        ).digest()
+
+    def _insert(self, digest: bytes, bloom: BloomFilter = None, recent: OrderedDict = None) -> None:
+        bloom = self._bloom if bloom is None else bloom
+        recent = self._recent if recent is None else recent
+        bloom.add(digest)
+        recent[digest] = None
+        recent.move_to_end(digest)
+        while len(recent) > self.recent_size:
+            recent.popitem(last=False)
+
+    def add(self, token: str, token_type: str = "access") -> None:
+        """Registra una revocación realizada en este proceso."""
+        self._insert(self._digest(token, token_type))
+
+    def lookup(self, token: str, token_type: str = "access") -> Optional[bool]:
+        """
+        Consulta el índice local.
+
+        Args:
+            token: Token JWT a verificar
+            token_type: Tipo de token ('access' o 'refresh')
+
+        Returns:
+            False si el token seguro no está revocado, True si está en el
+            conjunto exacto de revocaciones y None si hay que consultar MongoDB
+            (también si el índice lleva demasiado tiempo sin actualizarse)
+        """
+        if not self.loaded:
+            return None
+        digest = self._digest(token, token_type)
+        if digest in self._recent:
+            self.exact_hits += 1
+            return True
+        if self.stale:
+            # Sin lecturas recientes faltarían las revocaciones de otros workers
+            self.stale_lookups += 1
+            return None
+        if digest not in self._bloom:
+            self.negative_hits += 1
+            return False
+        self.fallbacks += 1
+        return None
+
+    @property
+    def stale(self) -> bool:
+        """Si la última lectura correcta es más antigua que `max_staleness`."""
+        return self._synced_at is None or time.monotonic() - self._synced_at > self.max_staleness
+
+    def _track(self, doc: Dict[str, Any], bloom: BloomFilter = None, recent: OrderedDict = None) -> None:
+        digest = self._digest(doc["token"], doc.get("token_type", "access"))
+        self._insert(digest, bloom, recent)
+        doc_id = doc.get("_id")
+        if isinstance(doc_id, ObjectId):
+            generated = doc_id.generation_time.replace(tzinfo=None)
+            if self._last_seen is None or generated > self._last_seen:
+                self._last_seen = generated
+
+    async def load(self) -> None:
+        """
+        Reconstruye el índice completo desde la colección.
+
+        El índice nuevo se construye aparte y se sustituye al final, para que
+        las consultas concurrentes nunca vean un filtro a medio cargar.
+        """
+        synced_at = time.monotonic()
+        total = await self._collection.estimated_document_count()
+        capacity = max(self.capacity, total * 2)
+        bloom = BloomFilter(capacity, self.error_rate)
+        recent: "OrderedDict[bytes, None]" = OrderedDict()
+        cursor = self._collection.find({}, {"token": 1, "token_type": 1}).sort("_id", 1)
+        async for doc in cursor:
+            self._track(doc, bloom, recent)
+        # Conservar las revocaciones locales hechas durante la carga
+        for digest in self._recent:
+            self._insert(digest, bloom, recent)
+        self._bloom, self._recent = bloom, recent
+        self._synced_at = synced_at
+        self.loaded = True
+        logger.info(
+            "Índice de revocaciones cargado",
+            extra={"tokens": self._bloom.count, "capacity": capacity}
+        )
+
+    async def poll(self) -> int:
+        """
+        Lee las revocaciones nuevas desde la última lectura.
+
+        Returns:
+            int: Número de documentos leídos
+        """
+        query: Dict[str, Any] = {}
+        if self._last_seen is not None:
+            floor = self._last_seen - timedelta(seconds=self.clock_skew)
+            query = {"_id": {"$gt": ObjectId.from_datetime(floor)}}
+        synced_at = time.monotonic()
+        read = 0
+        cursor = self._collection.find(query, {"token": 1, "token_type": 1}).sort("_id", 1)
+        async for doc in cursor:
+            self._track(doc)
+            read += 1
+        self._synced_at = synced_at
+        if self._bloom.count > self._bloom.capacity:
+            # El filtro superó su capacidad: reconstruir con más espacio
+            await self.load()
+        return read
+
+    async def _follow(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"No se pudo actualizar el índice de revocaciones: {e}")
+
+    async def start(self, collection) -> None:
+        """
+        Carga el índice y lanza la tarea de actualización en segundo plano.
+
+        Args:
+            collection: Colección `token_blacklist` de MongoDB
+        """
+        self._collection = collection
+        await self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow())
+
+    async def stop(self) -> None:
+        """Detiene la tarea de actualización."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        self.loaded = False
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del índice."""
+        return {
+            "loaded": self.loaded,
+            "stale": self.stale,
+            "tokens": self._bloom.count,
+            "capacity": self._bloom.capacity,
+            "recent": len(self._recent),
+            "negative_hits": self.negative_hits,
+            "exact_hits": self.exact_hits,
+            "fallbacks": self.fallbacks,
+            "stale_lookups": self.stale_lookups,
+        }
+
+
+# Instancia global del índice de revocaciones
+revocation_index = RevocationIndex(
+    capacity=settings.REVOCATION_FILTER_CAPACITY,
+    error_rate=settings.REVOCATION_FILTER_ERROR_RATE,
+    recent_size=settings.REVOCATION_RECENT_SIZE,
+    poll_interval=settings.REVOCATION_POLL_SECONDS,
+)
@@ -1,8 +1,10 @@
 """
 Módulo de utilidades de seguridad para la API de GEMINI
 """
+import asyncio
+from concurrent.futures import Executor, Future, ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime, timedelta
-from typing import Any, Optional, Union
+from typing import Any, Callable, Dict, Optional, Union
 
 from jose import jwt
 from passlib.context import CryptContext
@@ -33,3 +35,114 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
 def get_password_hash(password: str) -> str:
     """Genera un hash de la contraseña"""
     return pwd_context.hash(password)
+
+
+class HashingPoolSaturatedError(RuntimeError):
+    """Se lanza cuando el pool de hashing tiene la cola llena."""
+
+
+class PasswordHasher:
+    """
+    Servicio asíncrono de hashing de contraseñas.
+
+    bcrypt consume decenas de milisegundos de CPU por operación; ejecutarlo
+    dentro de un handler asíncrono bloquea el bucle de eventos para todas las
+    demás solicitudes. Este servicio delega el trabajo a un pool de hilos o de
+    procesos y rechaza de inmediato las operaciones cuando la cola supera
+    `max_pending`, en lugar de dejar que se acumulen sin límite.
+    """
+
+    def __init__(self, executor: str = "thread", workers: int = 4, max_pending: int = 64):
+        """
+        Inicializa el servicio.
+
+        Args:
+            executor: Tipo de pool ('thread' o 'process')
+            workers: Número de workers del pool
+            max_pending: Operaciones en curso o en cola antes de rechazar
+        """
+        self.executor_type = executor
+        self.workers = workers
+        self.max_pending = max_pending
+        self._executor: Optional[Executor] = None
+        self.pending = 0
+        self.completed = 0
+        self.rejected = 0
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(
+                    max_workers=self.workers,
+                    thread_name_prefix="password-hasher"
+                )
+        return self._executor
+
+    async def _run(self, func: Callable[..., Any], *args: Any) -> Any:
+        if self.pending >= self.max_pending:
+            self.rejected += 1
+            raise HashingPoolSaturatedError(
+                "El servicio de autenticación está saturado"
+            )
+        loop = asyncio.get_running_loop()
+        future = self._get_executor().submit(func, *args)
+        self.pending += 1
+        # El worker sigue ocupado aunque se cancele quien espera: el hueco se
+        # libera cuando termina el trabajo, no cuando se abandona la espera.
+        future.add_done_callback(lambda done: self._call_in_loop(loop, self._release, done))
+        return await asyncio.wrap_future(future)
+
+    @staticmethod
+    def _call_in_loop(loop: asyncio.AbstractEventLoop, callback: Callable[..., Any], *args: Any) -> None:
+        try:
+            loop.call_soon_threadsafe(callback, *args)
+        except RuntimeError:  # Bucle ya cerrado
+            callback(*args)
+
+    def _release(self, future: Future) -> None:
+        self.pending -= 1
+        if not future.cancelled() and future.exception() is None:
+            self.completed += 1
+
+    async def hash(self, password: str) -> str:
+        """Genera el hash de una contraseña fuera del bucle de eventos."""
+        return await self._run(get_password_hash, password)
+
+    async def verify(self, plain_password: str, hashed_password: str) -> bool:
+        """Verifica una contraseña fuera del bucle de eventos."""
+        return await self._run(verify_password, plain_password, hashed_password)
+
+    def shutdown(self) -> None:
+        """Libera los workers del pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el estado del pool."""
+        return {
+            "executor": self.executor_type,
+            "workers": self.workers,
+            "max_pending": self.max_pending,
+            "pending": self.pending,
+            "completed": self.completed,
+            "rejected": self.rejected,
+        }
+
+
+# Instancia global del servicio de hashing
+password_hasher = PasswordHasher(
+    executor=settings.PASSWORD_HASH_EXECUTOR,
+    workers=settings.PASSWORD_HASH_WORKERS,
+    max_pending=settings.PASSWORD_HASH_MAX_PENDING,
+)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """Verifica si la contraseña coincide con el hash sin bloquear el bucle de eventos"""
+    return await password_hasher.verify(plain_password, hashed_password)
+
+async def get_password_hash_async(password: str) -> str:
+    """Genera un hash de la contraseña sin bloquear el bucle de eventos"""
+    return await password_hasher.hash(password)
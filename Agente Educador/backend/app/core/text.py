@@ -0,0 +1,130 @@
+"""
+Normalización de texto compartida por cachés, filtros e índices.
+"""
+import re
+import unicodedata
+from functools import lru_cache
+from typing import List
+
+_EDGE_PUNCTUATION = " \t\n¿?¡!.,;:…\"'«»()"
+_COMBINING_TILDE = "\u0303"  # Tilde combinante (la de la ñ)
+# Vocales acentuadas habituales en español: se sustituyen sin descomponer el texto
+_SPANISH_ACCENTS = dict(zip("áéíóúüàèìòùÁÉÍÓÚÜÀÈÌÒÙ", "aeiouuaeiouAEIOUUAEIOU"))
+_ACCENTED_VOWEL = re.compile("[" + "".join(_SPANISH_ACCENTS) + "]")
+_NEEDS_DECOMPOSITION = re.compile(r"[^\x00-\x7fñÑ¿¡«»…]")
+
+
+def fold_accents(text: str) -> str:
+    """
+    Elimina tildes y diéresis conservando la ñ.
+
+    "Fotosíntesis" y "fotosintesis" se igualan, pero "año" no se confunde
+    con "ano".
+
+    Args:
+        text: Texto original
+
+    Returns:
+        str: Texto sin marcas diacríticas salvo la tilde de la ñ
+    """
+    # Camino rápido: tras las vocales acentuadas solo queda ASCII, ñ o puntuación española
+    text = _ACCENTED_VOWEL.sub(lambda match: _SPANISH_ACCENTS[match.group()], text)
+    if not _NEEDS_DECOMPOSITION.search(text):
+        return text
+
+    decomposed = unicodedata.normalize("NFD", text)
+    kept = []
+    previous = ""
+    for char in decomposed:
+        if unicodedata.combining(char):
+            if char == _COMBINING_TILDE and previous in ("n", "N"):
+                kept.append(char)
+            continue
+        kept.append(char)
+        previous = char
+    return unicodedata.normalize("NFC", "".join(kept))
+
+
+def fold_text(text: str) -> str:
+    """
+    Normaliza un texto para compararlo: sin tildes, en minúsculas, con los
+    espacios colapsados y sin signos de puntuación en los extremos.
+
+    "¿Qué es la  Fotosíntesis?" y "que es la fotosintesis" producen el mismo
+    resultado.
+
+    Args:
+        text: Texto original
+
+    Returns:
+        str: Texto normalizado
+    """
+    folded = fold_accents(text).casefold()
+    return " ".join(folded.split()).strip(_EDGE_PUNCTUATION)
+
+
+_WORD = re.compile(r"\w+")
+# Palabras vacías del español y verbos habituales en las preguntas del chat:
+# no aportan nada a la búsqueda
+_STOPWORDS = frozenset("""
+    a al algo ante como con cual cuales cuando cuanto cuantos cuantas de del desde donde el ella
+    ellas ellos en entre era es esa ese eso esta este esto estos estas fue ha hay la las le les lo
+    los mas me mi muy no nos o para pero por porque que quien se sea ser si sin sobre son su sus
+    tambien te tu un una uno unos unas y ya yo
+    cuentame dime explica explicame hace hacer hacen puede puedes puedo quiero sabes saber
+""".split())
+# Sufijos derivativos en singular, de más largo a más corto
+_SPANISH_SUFFIXES = (
+    "amiento", "imiento", "acion", "ucion", "adora", "mente", "ancia", "encia",
+    "ador", "idad", "ismo", "ista", "able", "ible", "oso", "osa",
+)
+
+
+@lru_cache(maxsize=50000)
+def stem_spanish(word: str) -> str:
+    """
+    Reduce una palabra ya normalizada a su raíz aproximada.
+
+    Es un lematizador ligero: quita el plural, un sufijo derivativo y la
+    vocal final, de modo que "números", "número" y "numeración" comparten
+    raíz. No pretende dar palabras reales, solo raíces consistentes.
+
+    Args:
+        word: Palabra sin tildes y en minúsculas
+
+    Returns:
+        str: Raíz de la palabra
+    """
+    if len(word) <= 3:
+        return word
+    if word.endswith("ces"):
+        word = word[:-3] + "z"
+    elif word.endswith("es") and len(word) > 4 and word[-3] not in "aeiou":
+        word = word[:-2]
+    elif word.endswith("s"):
+        word = word[:-1]
+    for suffix in _SPANISH_SUFFIXES:
+        if word.endswith(suffix) and len(word) - len(suffix) >= 3:
+            word = word[:-len(suffix)]
+            break
+    if len(word) > 3 and word[-1] in "aeo":
+        word = word[:-1]
+    return word
+
+
+def tokenize(text: str, keep_numbers: bool = False) -> List[str]:
+    """
+    Divide un texto en raíces para búsquedas de texto completo.
+
+    Args:
+        text: Texto original
+        keep_numbers: Si se conservan los números sueltos ("2 + 3" no es "2 + 4")
+
+    Returns:
+        List[str]: Raíces de las palabras, sin palabras vacías
+    """
+    return [
+        word if word.isdigit() else stem_spanish(word)
+        for word in _WORD.findall(fold_accents(text).casefold())
+        if word not in _STOPWORDS and (keep_numbers or not word.isdigit())
+    ]
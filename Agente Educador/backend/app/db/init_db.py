@@ -81,6 +81,26 @@ async def create_indexes() -> None:
         IndexModel([("earned_at", DESCENDING)], name="earned_at_desc_index"),
     ]
     
+    # Índices para las colecciones de conversaciones
+    chat_session_indexes = [
+        IndexModel(
+            [("user_id", ASCENDING), ("updated_at", DESCENDING)],
+            name="user_updated_index"
+        ),
+    ]
+    chat_message_indexes = [
+        IndexModel(
+            [("session_id", ASCENDING), ("seq", ASCENDING)],
+            unique=True,
+            name="session_seq_unique"
+        ),
+    ]
+    chat_job_indexes = [
+        IndexModel([("user_id", ASCENDING)], name="job_user_id_index"),
+        # Los trabajos se borran solos al caducar
+        IndexModel([("expires_at", ASCENDING)], expireAfterSeconds=0, name="job_expires_at_ttl"),
+    ]
+    
     # Crear los índices en cada colección
     collections_indexes = {
         "users": user_indexes,
@@ -89,6 +109,9 @@ async def create_indexes() -> None:
         "user_progress": user_progress_indexes,
         "tokens": token_indexes,
         "rewards": reward_indexes,
+        "chat_sessions": chat_session_indexes,
+        "chat_messages": chat_message_indexes,
+        "chat_jobs": chat_job_indexes,
     }
     
     try:
@@ -20,8 +20,19 @@ from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel, Field
 
 # Configuración de la aplicación
+from app.core.auth import get_current_active_admin
 from app.core.config import settings
+from config import settings as config_settings
+from app.core.cache import principal_cache
 from app.core.logging_config import get_logger, setup_logging
+from app.core.revocation import revocation_index
+from app.core.security import HashingPoolSaturatedError, password_hasher
+from app.repositories.chat_repository import chat_repository
+from app.services.chat_jobs import chat_job_manager
+from app.services.chat_service import chat_service
+from app.services.content_index import content_index
+from app.services.n8n_client import n8n_client
+from app.services.safety_filter import safety_filter
 
 # Configuración de la base de datos
 from app.db.init_db import init_db as initialize_database
@@ -29,8 +40,9 @@ from app.db.mongodb import db
 from app.db.utils import get_database_stats
 
 # Routers de la API
+from app.api.dependencies.rate_limiter import rate_limiter
+from app.api.middleware import RateLimitMiddleware, rate_limit_policies
 from app.api.endpoints import chat as chat_router
-from app.api.v1.endpoints import auth as auth_router
 from app.api.v1 import api_router as v1_router
 
 # Configuración de logging
@@ -85,6 +97,10 @@ if hasattr(settings, 'CORS_ORIGINS') and settings.CORS_ORIGINS:
 seen = set()
 origins = [x for x in origins if not (x in seen or seen.add(x))]
 
+# Limitación de tasa antes del enrutado; se registra primero para que las
+# respuestas 429 también pasen por CORS y por el registro de solicitudes
+app.add_middleware(RateLimitMiddleware, policies=rate_limit_policies)
+
 app.add_middleware(
     CORSMiddleware,
     allow_origins=origins,
@@ -104,7 +120,7 @@ except Exception as e:
 
 # Incluir routers
 app.include_router(chat_router.router, prefix="/api/chat", tags=["chat"])
-app.include_router(auth_router.router, prefix="/api/v1/auth", tags=["auth"])
+# `v1_router` ya incluye la autenticación en /api/v1/auth (los límites de RATE_LIMIT_POLICIES dependen de ello)
 app.include_router(v1_router)
 
 # Middleware para logging de solicitudes y respuestas
@@ -188,6 +204,12 @@ async def startup_db_client():
     try:
         logger.info("Iniciando la aplicación...")
         
+        # Cliente HTTP compartido con el webhook de n8n (no depende de MongoDB)
+        await n8n_client.start()
+        
+        # Recarga automática de la lista de bloqueo del filtro de seguridad
+        await safety_filter.start()
+
         # Conectar a MongoDB
         await db.connect_db()
         logger.info("Conexión a MongoDB establecida correctamente")
@@ -196,6 +218,31 @@ async def startup_db_client():
         await initialize_database()
         logger.info("Base de datos inicializada correctamente")
         
+        # Preparar el almacenamiento de los limitadores de tasa y su limpieza periódica
+        await rate_limiter.start()
+        for policy in rate_limit_policies:
+            await policy.limiter.start()
+        
+        # Historial de conversaciones con escritura agrupada
+        await chat_repository.start()
+        
+        # Workers de las generaciones de chat en segundo plano
+        await chat_job_manager.start(
+            await db.get_collection(config_settings.MONGO_CHAT_JOBS_COLLECTION)
+        )
+        
+        # Cargar el índice de tokens revocados
+        await revocation_index.start(
+            await db.get_collection(config_settings.MONGO_TOKENS_COLLECTION)
+        )
+        logger.info("Índice de tokens revocados cargado", extra={"revocation": revocation_index.stats()})
+        
+        # Índice de búsqueda de módulos y actividades para el chat
+        await content_index.start(
+            await db.get_collection("modules"),
+            await db.get_collection("activities")
+        )
+        
         # Verificar el estado de la base de datos
         stats = await get_database_stats()
         logger.info("Estadísticas de la base de datos", extra={"stats": stats})
@@ -219,6 +266,35 @@ async def shutdown_event():
     try:
         logger.info("Cerrando la aplicación...")
         
+        # Detener los limitadores de tasa y enviar sus contadores pendientes
+        await rate_limiter.stop()
+        for policy in rate_limit_policies:
+            await policy.limiter.stop()
+        
+        # Detener la actualización del índice de tokens revocados
+        await revocation_index.stop()
+        
+        # Detener la actualización del índice de contenido
+        await content_index.stop()
+        
+        # Detener los trabajos de chat antes de guardar los mensajes pendientes
+        await chat_job_manager.stop()
+        
+        # Guardar los mensajes de chat pendientes
+        await chat_repository.stop()
+        
+        # Cancelar las respuestas especulativas antes de cerrar el cliente de n8n
+        await chat_service.close()
+        
+        # Cerrar las conexiones con n8n
+        await n8n_client.close()
+        
+        # Detener la recarga de la lista de bloqueo
+        await safety_filter.stop()
+        
+        # Liberar el pool de hashing de contraseñas
+        password_hasher.shutdown()
+        
         # Cerrar la conexión a MongoDB
         if db.is_connected:
             await db.close()
@@ -277,6 +353,40 @@ async def http_exception_handler(request: Request, exc: HTTPException):
         headers=headers
     )
 
+@app.exception_handler(HashingPoolSaturatedError)
+async def hashing_saturated_handler(request: Request, exc: HashingPoolSaturatedError):
+    """
+    Responde 503 cuando el pool de hashing de contraseñas está saturado.
+    
+    Args:
+        request: Objeto de solicitud FastAPI
+        exc: Excepción lanzada por el servicio de hashing
+        
+    Returns:
+        JSONResponse: Respuesta JSON indicando que se reintente más tarde
+    """
+    request_id = request.headers.get('x-request-id', 'unknown')
+    
+    logger.warning(
+        "Pool de hashing saturado, solicitud rechazada",
+        extra={
+            "request_id": request_id,
+            "path": request.url.path,
+            "hasher": password_hasher.stats(),
+        },
+    )
+    
+    return JSONResponse(
+        status_code=status.HTTP_503_SERVICE_UNAVAILABLE,
+        content={
+            "status": "error",
+            "message": "El servicio está muy ocupado. Por favor, inténtalo de nuevo en unos segundos.",
+            "status_code": status.HTTP_503_SERVICE_UNAVAILABLE,
+            "request_id": request_id,
+        },
+        headers={"X-Request-ID": request_id, "Retry-After": "1"}
+    )
+
 @app.exception_handler(RequestValidationError)
 async def validation_exception_handler(request: Request, exc: RequestValidationError):
     """
@@ -578,6 +688,35 @@ async def health_check():
         }
     }
 
+# Ruta de métricas internas
+@app.get("/metrics", include_in_schema=False, dependencies=[Depends(get_current_active_admin)])
+async def metrics():
+    """
+    Expone contadores internos del proceso (cachés, limitadores, etc.).
+    
+    Solo para administradores.
+    
+    Returns:
+        Dict: Métricas del worker actual
+    """
+    return {
+        "pid": os.getpid(),
+        "timestamp": datetime.utcnow().isoformat(),
+        "principal_cache": principal_cache.stats(),
+        "password_hasher": password_hasher.stats(),
+        "revocation_index": revocation_index.stats(),
+        "chat": chat_service.stats(),
+        "chat_history": chat_repository.stats(),
+        "chat_jobs": chat_job_manager.stats(),
+        "n8n": n8n_client.stats(),
+        "safety_filter": safety_filter.stats(),
+        "content_index": content_index.stats(),
+        "rate_limiter": rate_limiter.stats(),
+        "rate_limit_policies": {
+            policy.prefix: policy.limiter.stats() for policy in rate_limit_policies
+        },
+    }
+
 # Ruta raíz
 @app.get("/")
 async def root():
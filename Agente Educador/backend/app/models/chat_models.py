@@ -1,7 +1,7 @@
 from datetime import datetime
 from enum import Enum
 from typing import List, Optional
-from pydantic import BaseModel, Field, validator
+from pydantic import BaseModel, Field, PrivateAttr, root_validator, validator
 
 class AgeGroup(str, Enum):
     """Grupos de edad soportados por la aplicación."""
@@ -15,11 +15,19 @@ class MessageRole(str, Enum):
     ASSISTANT = "assistant"
     SYSTEM = "system"
 
+class ChatJobStatus(str, Enum):
+    """Estados de un trabajo de chat en segundo plano."""
+    QUEUED = "queued"
+    RUNNING = "running"
+    COMPLETED = "completed"
+    FAILED = "failed"
+
 class Message(BaseModel):
     """Modelo para los mensajes del chat."""
     role: MessageRole = Field(..., description="Rol del emisor del mensaje")
     content: str = Field(..., min_length=1, max_length=2000, description="Contenido del mensaje")
     timestamp: datetime = Field(default_factory=datetime.utcnow, description="Marca de tiempo del mensaje")
+    blocked: bool = Field(False, description="Bloqueado por el filtro de seguridad; no se envía a n8n")
 
     @validator('content')
     def validate_content_length(cls, v):
@@ -32,25 +40,44 @@ class Message(BaseModel):
 class ChatRequest(BaseModel):
     """Modelo para la solicitud de chat."""
     messages: List[Message] = Field(
-        ..., 
-        min_items=1,
+        default_factory=list,
         max_items=100,
-        description="Historial de mensajes de la conversación"
+        description=(
+            "Historial de mensajes de la conversación; con `session_id`, "
+            "solo los mensajes nuevos"
+        )
     )
     age_group: AgeGroup = Field(..., description="Grupo de edad del usuario")
     context: Optional[dict] = Field(
         default_factory=dict, 
         description="Contexto adicional de la conversación"
     )
+    session_id: Optional[str] = Field(
+        None,
+        description="Sesión guardada en el servidor; el historial no se reenvía"
+    )
+    message: Optional[str] = Field(
+        None,
+        min_length=1,
+        max_length=2000,
+        description="Nuevo mensaje del usuario (alternativa a `messages`)"
+    )
+    # Mensajes al final de `messages` que aún no están guardados en la sesión
+    # (la sugerencia de una respuesta especulativa)
+    _unsaved: int = PrivateAttr(default=0)
 
     @validator('messages')
     def validate_messages(cls, v):
-        if not v:
-            raise ValueError("Debe haber al menos un mensaje en la conversación")
         if len(v) > 100:
             raise ValueError("No se pueden procesar más de 100 mensajes a la vez")
         return v
 
+    @root_validator(skip_on_failure=True)
+    def validate_has_message(cls, values):
+        if not values.get('messages') and not values.get('message'):
+            raise ValueError("Debe haber al menos un mensaje en la conversación")
+        return values
+
 class ChatResponse(BaseModel):
     """Modelo para la respuesta del chat."""
     response: str = Field(..., description="Respuesta del asistente")
@@ -63,9 +90,27 @@ class ChatResponse(BaseModel):
         max_items=5,
         description="Sugerencias para el usuario (máx. 5)"
     )
+    session_id: Optional[str] = Field(
+        None,
+        description="Sesión en la que se guardó la conversación"
+    )
     
     @validator('suggestions')
     def validate_suggestions(cls, v):
         if len(v) > 5:
             raise ValueError("No se pueden devolver más de 5 sugerencias")
         return v
+
+
+class ChatJob(BaseModel):
+    """Modelo para el estado de un trabajo de chat en segundo plano."""
+    job_id: str = Field(..., description="Identificador del trabajo")
+    status: ChatJobStatus = Field(..., description="Estado del trabajo")
+    output: str = Field("", description="Texto generado hasta el momento")
+    response: Optional[ChatResponse] = Field(
+        None,
+        description="Respuesta completa, cuando el trabajo ha terminado"
+    )
+    error: Optional[str] = Field(None, description="Motivo del fallo, si lo hay")
+    created_at: datetime = Field(..., description="Fecha de creación")
+    updated_at: datetime = Field(..., description="Fecha de la última actualización")
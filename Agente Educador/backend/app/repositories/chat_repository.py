@@ -0,0 +1,397 @@
+"""
+Repositorio de sesiones y mensajes de chat en MongoDB.
+
+Sigue la forma de las tablas `chat_sessions` y `chat_messages` de la
+migración de Supabase. Los mensajes se numeran por sesión (`seq`) y se
+guardan en lotes con `insert_many`; las lecturas del historial se sirven
+desde una caché acotada con los últimos mensajes de cada sesión.
+"""
+import asyncio
+import uuid
+from collections import deque
+from datetime import datetime
+from typing import Any, Deque, Dict, List, Optional
+
+from pymongo import ASCENDING, DESCENDING, UpdateOne
+from pymongo.errors import BulkWriteError
+
+from app.core.cache import TTLCache
+from app.core.logging_config import get_logger
+from app.db.mongodb import db
+from app.models.chat_models import Message
+from config import settings
+
+logger = get_logger(__name__)
+
+
+
+def _to_message(doc: Dict[str, Any]) -> Message:
+    """Convierte un documento de `chat_messages` en mensaje."""
+    return Message(
+        role=doc["role"],
+        content=doc["content"],
+        timestamp=doc["created_at"],
+        blocked=doc.get("metadata", {}).get("blocked", False)
+    )
+
+class ChatSessionNotFoundError(LookupError):
+    """Se lanza cuando la sesión no existe o pertenece a otro usuario."""
+
+
+class _SessionTail:
+    """Sesión en caché con sus últimos mensajes y el siguiente `seq`."""
+
+    __slots__ = ("session", "messages", "next_seq")
+
+    def __init__(self, session: Dict[str, Any], messages: List[Message], next_seq: int, size: int):
+        self.session = session
+        self.messages: Deque[Message] = deque(messages, maxlen=size)
+        self.next_seq = next_seq
+
+
+class ChatRepository:
+    """
+    Almacén de conversaciones con escritura agrupada y caché de cola.
+
+    Es una instancia compartida: la caché y la cola de escritura viven en el
+    proceso. Cada worker asigna el `seq` de las sesiones que tiene en caché,
+    por lo que una misma sesión debe atenderla un solo cliente a la vez; un
+    conflicto en el índice único `(session_id, seq)` invalida la caché de la
+    sesión para que la siguiente lectura parta de MongoDB.
+    """
+
+    def __init__(
+        self,
+        sessions_collection: str = "chat_sessions",
+        messages_collection: str = "chat_messages",
+        tail_size: int = 20,
+        cache_sessions: int = 5000,
+        cache_ttl: float = 1800.0,
+        flush_interval: float = 0.2,
+        batch_size: int = 500
+    ):
+        """
+        Inicializa el repositorio (las colecciones se obtienen en `start`).
+
+        Args:
+            sessions_collection: Colección de sesiones
+            messages_collection: Colección de mensajes
+            tail_size: Mensajes recientes por sesión que se guardan en caché
+            cache_sessions: Sesiones máximas en caché
+            cache_ttl: Segundos que una sesión inactiva permanece en caché
+            flush_interval: Segundos entre escrituras agrupadas
+            batch_size: Mensajes máximos por `insert_many`
+        """
+        self.sessions_collection_name = sessions_collection
+        self.messages_collection_name = messages_collection
+        self.tail_size = tail_size
+        self.flush_interval = flush_interval
+        self.batch_size = batch_size
+        self.sessions = None
+        self.messages = None
+        self._tails = TTLCache(max_size=cache_sessions, ttl=cache_ttl)
+        self._pending: List[Dict[str, Any]] = []
+        self._retried: set = set()
+        self._touched: Dict[str, datetime] = {}
+        self._summaries: Dict[str, Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+        self.flushes = 0
+        self.flush_errors = 0
+        self.conflicts = 0
+
+    async def start(self) -> None:
+        """Obtiene las colecciones y lanza la escritura periódica."""
+        self.sessions = await db.get_collection(self.sessions_collection_name)
+        self.messages = await db.get_collection(self.messages_collection_name)
+        if self._task is None:
+            self._task = asyncio.create_task(self._flush_loop())
+
+    async def stop(self) -> None:
+        """Detiene la escritura periódica y guarda los mensajes pendientes."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        while (self._pending or self._summaries) and await self.flush():
+            pass
+
+    async def create_session(
+        self,
+        user_id: str,
+        age_group: str,
+        title: str,
+        module: Optional[str] = None
+    ) -> Dict[str, Any]:
+        """
+        Crea una sesión de chat.
+
+        Args:
+            user_id: Usuario propietario
+            age_group: Grupo de edad de la conversación
+            title: Título de la sesión
+            module: Módulo educativo asociado, si existe
+
+        Returns:
+            Dict[str, Any]: Documento de la sesión creada
+        """
+        now = datetime.utcnow()
+        session = {
+            "_id": str(uuid.uuid4()),
+            "user_id": user_id,
+            "title": title[:100],
+            "module": module,
+            "age_group": age_group,
+            "is_active": True,
+            "message_count": 0,
+            "created_at": now,
+            "updated_at": now,
+        }
+        await self.sessions.insert_one(session)
+        self._tails.set(session["_id"], _SessionTail(session, [], 0, self.tail_size))
+        return session
+
+    async def _load_tail(self, session_id: str) -> Optional[_SessionTail]:
+        tail = self._tails.get(session_id)
+        if tail is not None:
+            return tail
+
+        session = await self.sessions.find_one({"_id": session_id})
+        if session is None:
+            return None
+        docs = await self.messages.find(
+            {"session_id": session_id}
+        ).sort("seq", DESCENDING).limit(self.tail_size).to_list(length=self.tail_size)
+        docs.reverse()
+
+        # Los mensajes aún sin escribir también forman parte del historial
+        written = {doc["seq"] for doc in docs}
+        docs.extend(
+            doc for doc in self._pending
+            if doc["session_id"] == session_id and doc["seq"] not in written
+        )
+        next_seq = docs[-1]["seq"] + 1 if docs else 0
+        messages = [_to_message(doc) for doc in docs]
+        tail = _SessionTail(session, messages, next_seq, self.tail_size)
+        self._tails.set(session_id, tail)
+        return tail
+
+    async def get_session(self, session_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        Obtiene una sesión comprobando que pertenece al usuario.
+
+        Raises:
+            ChatSessionNotFoundError: Si no existe o es de otro usuario
+        """
+        tail = await self._load_tail(session_id)
+        if tail is None or tail.session.get("user_id") != user_id:
+            raise ChatSessionNotFoundError(session_id)
+        return tail.session
+
+    async def get_history(self, session_id: str, user_id: str) -> List[Message]:
+        """
+        Devuelve los últimos mensajes de la sesión, del más antiguo al más reciente.
+
+        Args:
+            session_id: ID de la sesión
+            user_id: Usuario que la solicita
+
+        Returns:
+            List[Message]: Hasta `tail_size` mensajes
+
+        Raises:
+            ChatSessionNotFoundError: Si no existe o es de otro usuario
+        """
+        await self.get_session(session_id, user_id)
+        return list(self._tails.peek(session_id).messages)
+
+    async def get_messages(self, session_id: str, start: int, end: int) -> List[Message]:
+        """
+        Lee de MongoDB los mensajes con `seq` entre `start` (incluido) y `end`.
+
+        Sirve para recuperar turnos que ya salieron de la cola en caché; los
+        mensajes aún sin escribir también se incluyen.
+
+        Args:
+            session_id: ID de la sesión
+            start: Primer `seq`
+            end: `seq` siguiente al último
+
+        Returns:
+            List[Message]: Mensajes en orden cronológico
+        """
+        docs = await self.messages.find(
+            {"session_id": session_id, "seq": {"$gte": start, "$lt": end}}
+        ).sort("seq", ASCENDING).to_list(length=end - start)
+        written = {doc["seq"] for doc in docs}
+        docs.extend(
+            doc for doc in self._pending
+            if doc["session_id"] == session_id and start <= doc["seq"] < end and doc["seq"] not in written
+        )
+        docs.sort(key=lambda doc: doc["seq"])
+        return [_to_message(doc) for doc in docs]
+
+    async def append_messages(self, session_id: str, messages: List[Message]) -> None:
+        """
+        Añade mensajes a la sesión; se escriben en el siguiente lote.
+
+        Args:
+            session_id: ID de la sesión
+            messages: Mensajes en orden cronológico
+        """
+        tail = await self._load_tail(session_id)
+        if tail is None:
+            raise ChatSessionNotFoundError(session_id)
+        for message in messages:
+            self._pending.append({
+                "session_id": session_id,
+                "seq": tail.next_seq,
+                "role": message.role.value,
+                "content": message.content,
+                "metadata": {"blocked": True} if message.blocked else {},
+                "created_at": message.timestamp,
+            })
+            tail.next_seq += 1
+            tail.messages.append(message)
+        tail.session["message_count"] = tail.next_seq
+        tail.session["updated_at"] = self._touched[session_id] = datetime.utcnow()
+        if len(self._pending) >= self.batch_size:
+            asyncio.ensure_future(self.flush())
+
+    def cached_session(self, session_id: str) -> Optional[Dict[str, Any]]:
+        """Devuelve la sesión si está en caché, sin consultar MongoDB."""
+        tail = self._tails.peek(session_id)
+        return tail.session if tail is not None else None
+
+    def cached_history(self, session_id: str) -> Optional[List[Message]]:
+        """Devuelve los últimos mensajes de la sesión si está en caché, sin consultar MongoDB."""
+        tail = self._tails.peek(session_id)
+        return list(tail.messages) if tail is not None else None
+
+    def set_summary(self, session_id: str, summary: str, covered: int) -> None:
+        """
+        Guarda el resumen de los mensajes anteriores a `covered`; se escribe en el siguiente lote.
+
+        Args:
+            session_id: ID de la sesión
+            summary: Resumen de la conversación
+            covered: Posición (`seq`) del primer mensaje que no cubre el resumen
+        """
+        tail = self._tails.peek(session_id)
+        if tail is None or covered <= tail.session.get("summary_covered", 0):
+            return
+        fields = {"summary": summary, "summary_covered": covered}
+        tail.session.update(fields)
+        self._summaries[session_id] = fields
+
+    async def flush(self) -> bool:
+        """
+        Escribe un lote de mensajes pendientes y actualiza sus sesiones.
+
+        Returns:
+            bool: True si el lote se escribió (o no había nada pendiente)
+        """
+        if (not self._pending and not self._summaries) or self.messages is None:
+            return True
+        batch, self._pending = self._pending[:self.batch_size], self._pending[self.batch_size:]
+        touched, self._touched = self._touched, {}
+        summaries, self._summaries = self._summaries, {}
+        try:
+            if batch:
+                try:
+                    await self.messages.insert_many(batch, ordered=False)
+                except BulkWriteError as e:
+                    self._requeue_failed(batch, e.details.get("writeErrors", []))
+                self._retried.difference_update((doc["session_id"], doc["seq"]) for doc in batch)
+            updates = [
+                UpdateOne(
+                    {"_id": session_id},
+                    {"$set": {"updated_at": updated_at},
+                     "$max": {"message_count": self._message_count(session_id)}}
+                )
+                for session_id, updated_at in touched.items()
+            ]
+            # Un resumen más antiguo nunca sustituye a uno más reciente
+            updates.extend(
+                UpdateOne(
+                    {"_id": session_id, "summary_covered": {"$not": {"$gte": fields["summary_covered"]}}},
+                    {"$set": fields}
+                )
+                for session_id, fields in summaries.items()
+            )
+            if updates:
+                await self.sessions.bulk_write(updates, ordered=False)
+            self.flushes += 1
+            return True
+        except Exception as e:
+            # Sin respuesta de MongoDB: reintentar el lote completo en el siguiente ciclo
+            self._retried.update((doc["session_id"], doc["seq"]) for doc in batch)
+            self._pending[:0] = batch
+            for session_id, updated_at in touched.items():
+                self._touched.setdefault(session_id, updated_at)
+            for session_id, fields in summaries.items():
+                self._summaries.setdefault(session_id, fields)
+            self.flush_errors += 1
+            logger.warning(f"No se pudieron guardar los mensajes de chat: {e}")
+            return False
+        finally:
+            for doc in batch:
+                doc.pop("_id", None)  # insert_many añade el _id al documento
+
+    def _requeue_failed(self, batch: List[Dict[str, Any]], errors: List[Dict[str, Any]]) -> None:
+        failed = []
+        for error in errors:
+            doc = batch[error["index"]]
+            key = (doc["session_id"], doc["seq"])
+            if error.get("code") != 11000:
+                failed.append(doc)
+            elif key not in self._retried:
+                # Otro proceso usó el mismo seq: recargar la sesión desde MongoDB
+                self.conflicts += 1
+                self._tails.delete(doc["session_id"])
+                logger.error(
+                    "Conflicto de secuencia en la sesión de chat",
+                    extra={"session_id": doc["session_id"], "seq": doc["seq"]}
+                )
+            # Un duplicado de un lote reintentado ya estaba escrito
+        self._pending[:0] = failed
+
+    def _message_count(self, session_id: str) -> int:
+        tail = self._tails.peek(session_id)
+        return tail.next_seq if tail is not None else 0
+
+    async def _flush_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve métricas de la caché y de la cola de escritura."""
+        return {
+            "cached_sessions": len(self._tails),
+            "pending_messages": len(self._pending),
+            "pending_summaries": len(self._summaries),
+            "flushes": self.flushes,
+            "flush_errors": self.flush_errors,
+            "conflicts": self.conflicts,
+            "cache": self._tails.stats(),
+        }
+
+
+# Instancia global del repositorio de chat
+chat_repository = ChatRepository(
+    sessions_collection=settings.MONGO_CHAT_SESSIONS_COLLECTION,
+    messages_collection=settings.MONGO_CHAT_MESSAGES_COLLECTION,
+    tail_size=settings.CHAT_HISTORY_TAIL_SIZE,
+    cache_sessions=settings.CHAT_HISTORY_CACHE_SESSIONS,
+    cache_ttl=settings.CHAT_HISTORY_CACHE_TTL_SECONDS,
+    flush_interval=settings.CHAT_HISTORY_FLUSH_INTERVAL,
+    batch_size=settings.CHAT_HISTORY_BATCH_SIZE
+)
+
+
+async def get_chat_repository() -> ChatRepository:
+    """Obtiene el repositorio de chat para inyección de dependencias"""
+    return chat_repository
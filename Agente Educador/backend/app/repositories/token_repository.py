@@ -10,6 +10,7 @@ from pymongo import IndexModel, ASCENDING
 from app.models.token import TokenBlacklistInDB, TokenBlacklistCreate, Token
 from app.models.user import User
 from config import get_settings
+from app.core.revocation import revocation_index
 from app.core.security import create_access_token
 from app.db.mongodb import db
 
@@ -68,6 +69,7 @@ class TokenRepository:
         )
         
         result = await self.collection.insert_one(token_data.dict(by_alias=True))
+        revocation_index.add(token, token_type)
         return TokenBlacklistInDB(
             **{**token_data.dict(), "_id": str(result.inserted_id)}
         )
@@ -83,11 +85,19 @@ class TokenRepository:
         Returns:
             bool: True si el token está revocado, False en caso contrario
         """
+        # Consultar primero el índice en memoria; solo las posibles
+        # coincidencias del filtro de Bloom llegan a MongoDB
+        revoked = revocation_index.lookup(token, token_type)
+        if revoked is not None:
+            return revoked
+        
         # Buscar el token en la lista negra
         token_data = await self.collection.find_one({
             "token": token,
             "token_type": token_type
         })
+        if token_data is not None:
+            revocation_index.add(token, token_type)
         return token_data is not None
     
     async def revoke_all_user_tokens(
@@ -7,7 +7,12 @@ from typing import Optional
 
 from bson import ObjectId
 
-from app.core.security import get_password_hash, verify_password
+from app.core.cache import principal_cache
+from app.core.security import (
+    HashingPoolSaturatedError,
+    get_password_hash_async,
+    verify_password_async,
+)
 from app.db.mongodb import db
 from app.models.user import UserCreate, UserInDB, UserUpdate
 
@@ -53,7 +58,7 @@ class UserRepository:
             user_dict = user.dict(exclude={"password"})
             user_dict["username"] = user_dict["username"].lower()
             user_dict["email"] = user_dict["email"].lower()
-            user_dict["hashed_password"] = get_password_hash(user.password)
+            user_dict["hashed_password"] = await get_password_hash_async(user.password)
             user_dict["created_at"] = datetime.utcnow()
             user_dict["updated_at"] = user_dict["created_at"]
             
@@ -86,6 +91,8 @@ class UserRepository:
                 # Asegurarse de que el mensaje de error sea serializable
                 raise ValueError(str(e)) from e
                 
+        except HashingPoolSaturatedError:
+            raise
         except Exception as e:
             error_msg = f"Error en create_user: {str(e)}"
             logger.error(error_msg)
@@ -166,7 +173,7 @@ class UserRepository:
         
         # Si se está actualizando la contraseña, hashearla
         if "password" in update_data:
-            update_data["hashed_password"] = get_password_hash(update_data.pop("password"))
+            update_data["hashed_password"] = await get_password_hash_async(update_data.pop("password"))
             
         # Actualizar la fecha de modificación
         update_data["updated_at"] = datetime.utcnow()
@@ -179,6 +186,9 @@ class UserRepository:
         
         if result.modified_count == 0:
             return None
+        
+        # Invalidar la caché de usuarios autenticados una vez escrito el cambio
+        principal_cache.invalidate_user_id(user_id)
             
         # Obtener el usuario actualizado
         updated_user = await collection.find_one({"_id": ObjectId(user_id)})
@@ -196,6 +206,7 @@ class UserRepository:
             
         collection = await cls.get_collection()
         result = await collection.delete_one({"_id": ObjectId(user_id)})
+        principal_cache.invalidate_user_id(user_id)
         return result.deleted_count > 0
     
     @classmethod
@@ -205,7 +216,7 @@ class UserRepository:
         if not user:
             return None
             
-        if not verify_password(password, user.hashed_password):
+        if not await verify_password_async(password, user.hashed_password):
             return None
             
         return user
@@ -221,6 +232,7 @@ class UserRepository:
             {"_id": ObjectId(user_id)},
             {"$set": {"last_login": datetime.utcnow()}}
         )
+        principal_cache.invalidate_user_id(user_id)
 
 # Función para obtener una instancia del repositorio de usuarios
 async def get_user_repository() -> UserRepository:
@@ -0,0 +1,338 @@
+"""
+Generaciones de chat en segundo plano.
+
+Algunas actividades (los cuentos del Narrador Histórico, los problemas de
+matemáticas resueltos paso a paso) tardan en generarse. En lugar de mantener
+abierta la conexión HTTP, el cliente encola la generación y recibe un
+identificador de trabajo al instante; un grupo de workers del proceso la
+ejecuta y el cliente consulta después su estado, el texto parcial o un flujo
+SSE con los fragmentos que faltan.
+
+El registro del trabajo se guarda en MongoDB (estado, texto parcial y
+resultado), de modo que cualquier worker de la API puede responder a la
+consulta; los fragmentos se siguen en vivo desde el proceso que ejecuta el
+trabajo y, desde los demás, consultando el registro periódicamente.
+"""
+import asyncio
+import time
+import uuid
+from datetime import datetime, timedelta
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+
+from app.core.cache import TTLCache
+from app.core.logging_config import get_logger
+from app.models.chat_models import ChatJobStatus, ChatRequest
+from app.services.chat_service import ChatService, chat_service
+from config import settings
+
+logger = get_logger(__name__)
+
+
+class ChatJobNotFoundError(LookupError):
+    """Se lanza cuando el trabajo no existe o pertenece a otro usuario."""
+
+
+class ChatJobQueueFullError(Exception):
+    """Se lanza cuando la cola de trabajos está llena."""
+
+
+class _Job:
+    """Estado en memoria de un trabajo que ejecuta este proceso."""
+
+    __slots__ = (
+        "id", "user_id", "request", "status", "output", "resets", "result",
+        "error", "created_at", "updated_at", "changed"
+    )
+
+    def __init__(self, job_id: str, user_id: str, request: ChatRequest):
+        self.id = job_id
+        self.user_id = user_id
+        self.request = request
+        self.status = ChatJobStatus.QUEUED
+        self.output = ""
+        self.resets = 0
+        self.result: Optional[Dict[str, Any]] = None
+        self.error: Optional[str] = None
+        self.created_at = self.updated_at = datetime.utcnow()
+        self.changed = asyncio.Event()
+
+    def notify(self) -> None:
+        """Despierta a los clientes que siguen el trabajo."""
+        self.updated_at = datetime.utcnow()
+        self.changed.set()
+        self.changed = asyncio.Event()
+
+    def document(self) -> Dict[str, Any]:
+        """Registro del trabajo tal como se guarda en MongoDB."""
+        return {
+            "_id": self.id,
+            "user_id": self.user_id,
+            "session_id": self.request.session_id,
+            "status": self.status.value,
+            "output": self.output,
+            "resets": self.resets,
+            "result": self.result,
+            "error": self.error,
+            "created_at": self.created_at,
+            "updated_at": self.updated_at,
+        }
+
+
+class ChatJobManager:
+    """
+    Cola de generaciones con un grupo de workers de asyncio.
+
+    La cola está acotada: si se llena, `submit` lanza `ChatJobQueueFullError`
+    en lugar de aceptar trabajos que tardarían demasiado en empezar. El texto
+    parcial se guarda en MongoDB como mucho cada `save_interval` segundos, y
+    los registros caducan `ttl` segundos después de su última actualización
+    (índice TTL sobre `expires_at`).
+    """
+
+    def __init__(
+        self,
+        service: Optional[ChatService] = None,
+        workers: int = 4,
+        max_queue: int = 200,
+        ttl: float = 3600.0,
+        save_interval: float = 1.0,
+        poll_interval: float = 1.0
+    ):
+        """
+        Inicializa la cola (la colección se recibe en `start`).
+
+        Args:
+            service: Servicio de chat que genera las respuestas (por defecto, la instancia global)
+            workers: Trabajos que se ejecutan a la vez
+            max_queue: Trabajos en espera como máximo
+            ttl: Segundos que se conserva un trabajo tras su última actualización
+            save_interval: Segundos mínimos entre escrituras del texto parcial
+            poll_interval: Segundos entre consultas al seguir un trabajo de otro proceso
+        """
+        self.service = service or chat_service
+        self.workers = workers
+        self.ttl = ttl
+        self.save_interval = save_interval
+        self.poll_interval = poll_interval
+        self.collection = None
+        self._queue: asyncio.Queue = asyncio.Queue(maxsize=max_queue)
+        # Plazas de la cola apartadas por `submit` mientras guarda el registro
+        self._reserved = 0
+        self._jobs = TTLCache(max_size=max(1000, max_queue * 10), ttl=ttl)
+        self._tasks: List[asyncio.Task] = []
+        self.submitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.running = 0
+        self.save_errors = 0
+
+    async def start(self, collection=None) -> None:
+        """
+        Lanza los workers.
+
+        Args:
+            collection: Colección `chat_jobs` de MongoDB; sin ella, los
+                trabajos solo se consultan desde este proceso
+        """
+        self.collection = collection
+        if not self._tasks:
+            self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+
+    async def stop(self) -> None:
+        """Detiene los workers y marca como fallidos los trabajos sin terminar."""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        while not self._queue.empty():
+            await self._fail(self._queue.get_nowait(), "Trabajo interrumpido por el cierre del servidor")
+
+    async def submit(self, chat_request: ChatRequest, user_id: str) -> Dict[str, Any]:
+        """
+        Encola la generación de la respuesta a una solicitud ya preparada.
+
+        Args:
+            chat_request: Solicitud con el historial completo (ver `ChatService.prepare_request`)
+            user_id: Usuario propietario del trabajo
+
+        Returns:
+            Dict[str, Any]: Registro del trabajo creado
+
+        Raises:
+            ChatJobQueueFullError: Si la cola está llena
+        """
+        if 0 < self._queue.maxsize <= self._queue.qsize() + self._reserved:
+            self.rejected += 1
+            raise ChatJobQueueFullError("Cola de trabajos de chat llena")
+        job = _Job(str(uuid.uuid4()), user_id, chat_request)
+        self._jobs.set(job.id, job)
+        # La plaza se aparta antes de esperar a MongoDB para que otro `submit`
+        # concurrente no la ocupe y `put_nowait` no falle con el registro ya creado
+        self._reserved += 1
+        try:
+            await self._save(job, insert=True)
+        finally:
+            self._reserved -= 1
+        self._queue.put_nowait(job)
+        self.submitted += 1
+        return job.document()
+
+    async def get(self, job_id: str, user_id: str) -> Dict[str, Any]:
+        """
+        Obtiene el registro actual de un trabajo comprobando que pertenece al usuario.
+
+        Raises:
+            ChatJobNotFoundError: Si no existe o es de otro usuario
+        """
+        job = self._jobs.get(job_id)
+        if job is not None:
+            document = job.document()
+        elif self.collection is not None:
+            document = await self.collection.find_one({"_id": job_id})
+        else:
+            document = None
+        if document is None or document.get("user_id") != user_id:
+            raise ChatJobNotFoundError(job_id)
+        return document
+
+    async def follow(self, job_id: str, user_id: str, offset: int = 0) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
+        """
+        Sigue un trabajo entregando el texto que falta por fragmentos.
+
+        Emite `("token", {"text": ...})` con el texto nuevo a partir de
+        `offset`, `("reset", {})` si el filtro de seguridad descartó el texto
+        ya generado y, al terminar, `("done", {...})` con el resultado o
+        `("error", {...})` si el trabajo falló.
+
+        Args:
+            job_id: ID del trabajo
+            user_id: Usuario que lo consulta
+            offset: Caracteres del texto parcial que el cliente ya tiene
+
+        Raises:
+            ChatJobNotFoundError: Si no existe o es de otro usuario
+        """
+        position = max(0, offset)
+        resets = None
+        while True:
+            # El aviso se toma antes de leer el registro para no perder ningún cambio
+            job = self._jobs.peek(job_id)
+            changed = job.changed if job is not None else None
+            document = await self.get(job_id, user_id)
+            if resets is None:
+                resets = document.get("resets", 0)
+            elif document.get("resets", 0) != resets:
+                resets = document.get("resets", 0)
+                position = 0
+                yield "reset", {}
+            output = document.get("output", "")
+            if len(output) > position:
+                yield "token", {"text": output[position:]}
+                position = len(output)
+
+            status = ChatJobStatus(document["status"])
+            if status == ChatJobStatus.COMPLETED:
+                yield "done", {"job_id": job_id, **(document.get("result") or {})}
+                return
+            if status == ChatJobStatus.FAILED:
+                yield "error", {
+                    "job_id": job_id,
+                    "message": document.get("error") or "No se pudo generar la respuesta.",
+                    "code": "chat_job_failed",
+                }
+                return
+
+            if changed is not None:
+                # Trabajo de este proceso: esperar al siguiente fragmento
+                await changed.wait()
+            else:
+                await asyncio.sleep(self.poll_interval)
+
+    async def _worker(self) -> None:
+        while True:
+            job = await self._queue.get()
+            try:
+                await self._run(job)
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job: _Job) -> None:
+        self.running += 1
+        job.status = ChatJobStatus.RUNNING
+        job.notify()
+        await self._save(job)
+        saved = time.monotonic()
+        try:
+            async for event, data in self.service.stream_chat(job.request):
+                if event == "token":
+                    job.output += data["text"]
+                elif event == "reset":
+                    job.output = ""
+                    job.resets += 1
+                elif event == "done":
+                    job.result = {key: data[key] for key in ("suggestions", "context", "session_id", "complete")}
+                    job.output = job.output.strip()
+                job.notify()
+                if event != "done" and time.monotonic() - saved >= self.save_interval:
+                    await self._save(job)
+                    saved = time.monotonic()
+        except asyncio.CancelledError:
+            await self._fail(job, "Trabajo interrumpido por el cierre del servidor")
+            raise
+        except Exception as e:
+            logger.error("Error en un trabajo de chat", exc_info=True, extra={"job_id": job.id, "error": str(e)})
+            await self._fail(job, "No se pudo generar la respuesta. Por favor, inténtalo de nuevo más tarde.")
+        else:
+            job.status = ChatJobStatus.COMPLETED
+            job.notify()
+            self.completed += 1
+            await self._save(job)
+        finally:
+            self.running -= 1
+
+    async def _fail(self, job: _Job, reason: str) -> None:
+        job.status = ChatJobStatus.FAILED
+        job.error = reason
+        job.notify()
+        self.failed += 1
+        await self._save(job)
+
+    async def _save(self, job: _Job, insert: bool = False) -> None:
+        """Guarda el registro del trabajo; un fallo no interrumpe la generación."""
+        if self.collection is None:
+            return
+        document = job.document()
+        document["expires_at"] = job.updated_at + timedelta(seconds=self.ttl)
+        try:
+            if insert:
+                await self.collection.insert_one(document)
+            else:
+                del document["_id"]
+                await self.collection.update_one({"_id": job.id}, {"$set": document})
+        except Exception as e:
+            self.save_errors += 1
+            logger.warning(f"No se pudo guardar el trabajo de chat {job.id}: {e}")
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el tamaño de la cola y los trabajos terminados."""
+        return {
+            "workers": len(self._tasks),
+            "queued": self._queue.qsize(),
+            "running": self.running,
+            "submitted": self.submitted,
+            "rejected": self.rejected,
+            "completed": self.completed,
+            "failed": self.failed,
+            "save_errors": self.save_errors,
+        }
+
+
+# Instancia global de la cola de trabajos de chat
+chat_job_manager = ChatJobManager(
+    workers=settings.CHAT_JOBS_WORKERS,
+    max_queue=settings.CHAT_JOBS_MAX_QUEUE,
+    ttl=settings.CHAT_JOBS_TTL_SECONDS,
+    save_interval=settings.CHAT_JOBS_SAVE_INTERVAL,
+    poll_interval=settings.CHAT_JOBS_POLL_INTERVAL
+)
@@ -1,19 +1,283 @@
-from typing import Dict, List, Optional
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+import asyncio
+import hashlib
 import json
 import random
+import time
 from datetime import datetime
 from app.models.chat_models import ChatRequest, ChatResponse, Message, MessageRole
+from app.core.cache import TTLCache
 from app.core.logging_config import get_logger
+from app.core.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    LoadShedError,
+    SingleFlight,
+)
+from app.core.text import fold_text
+from app.repositories.chat_repository import ChatRepository, chat_repository
+from app.services.content_index import PASSAGE_MAX_CHARS, ContentIndex, content_index
+from app.services.history_compactor import HistoryCompactor
+from app.services.n8n_client import N8NClient, N8NError, n8n_client
+from app.services.persona_router import PersonaRouter, persona_router
+from app.services.safety_filter import SafetyFilter, SafetyVerdict, StreamGuard, safety_filter
+from app.services.semantic_cache import SemanticCache
+from app.services.speculation import Speculator
+from config import settings
 
 logger = get_logger(__name__)
 
+ResponseKey = Tuple[str, str, str, str]
+
+
+class _CachedAnswer:
+    """Respuesta en caché con su número de aciertos."""
+
+    __slots__ = ("text", "hits")
+
+    def __init__(self, text: str):
+        self.text = text
+        self.hits = 0
+
+
+class ResponseCache:
+    """
+    Caché de respuestas del asistente para preguntas repetidas.
+    
+    La clave es el último mensaje normalizado (sin tildes, en minúsculas y
+    con los espacios colapsados), el grupo de edad, la persona y una huella
+    del historial anterior, de modo que un "¿y por qué?" solo reutiliza la
+    respuesta de la misma conversación. Las entradas expiran por TTL, se
+    desalojan por LRU y su tamaño total en bytes está acotado por `max_bytes`.
+    Cada entrada cuenta sus aciertos. Con `semantic`, las preguntas sin
+    historial y sin coincidencia exacta se buscan también por similitud.
+    """
+    
+    # Coste aproximado de la clave, la tupla y los objetos de cada entrada
+    ENTRY_OVERHEAD = 256
+    
+    def __init__(
+        self,
+        max_entries: int = 10000,
+        ttl: float = 3600.0,
+        max_bytes: int = 32 * 1024 * 1024,
+        semantic: Optional[SemanticCache] = None
+    ):
+        """
+        Inicializa la caché.
+        
+        Args:
+            max_entries: Número máximo de respuestas guardadas
+            ttl: Segundos de vida de cada respuesta
+            max_bytes: Memoria máxima aproximada de las respuestas
+            semantic: Caché por similitud consultada cuando no hay coincidencia exacta
+        """
+        self._cache = TTLCache(max_size=max_entries, ttl=ttl, max_cost=max_bytes)
+        self.semantic = semantic
+    
+    @staticmethod
+    def key(message: str, age_group: str, persona: str, history: str = "") -> ResponseKey:
+        """
+        Construye la clave de caché de una pregunta.
+        
+        Args:
+            message: Último mensaje del usuario
+            age_group: Grupo de edad
+            persona: Persona del asistente
+            history: Huella del historial anterior (ver `fingerprint`)
+            
+        Returns:
+            ResponseKey: Clave normalizada
+        """
+        return fold_text(message), str(getattr(age_group, "value", age_group)), persona, history
+    
+    @staticmethod
+    def fingerprint(messages: List[Message], summary: str = "") -> str:
+        """
+        Huella del historial que acompaña a una pregunta.
+        
+        Args:
+            messages: Mensajes anteriores a la pregunta
+            summary: Resumen guardado de los turnos más antiguos
+            
+        Returns:
+            str: Cadena vacía si no hay historial; si no, un hash de los mensajes y el resumen
+        """
+        if not messages and not summary:
+            return ""
+        digest = hashlib.blake2b(summary.encode("utf-8"), digest_size=16)
+        for message in messages:
+            digest.update(f"\x1e{message.role.value}\x1f{message.content}".encode("utf-8"))
+        return digest.hexdigest()
+    
+    def get(self, key: ResponseKey) -> Optional[str]:
+        """Obtiene una respuesta guardada (exacta o parecida) y cuenta el acierto."""
+        entry = self._cache.get(key)
+        if entry is None:
+            # La similitud solo tiene sentido para preguntas sin historial
+            if self.semantic is None or key[3]:
+                return None
+            match = self.semantic.get(*key[:3])
+            return match.text if match is not None else None
+        entry.hits += 1
+        return entry.text
+    
+    def __contains__(self, key: ResponseKey) -> bool:
+        """Indica si hay una respuesta exacta para la clave, sin contar un acierto."""
+        return key in self._cache
+    
+    def set(self, key: ResponseKey, text: str) -> None:
+        """Guarda una respuesta generada por el upstream."""
+        cost = len(text.encode("utf-8")) + len(key[0].encode("utf-8")) + self.ENTRY_OVERHEAD
+        self._cache.set(key, _CachedAnswer(text), cost=cost)
+        if self.semantic is not None and not key[3]:
+            self.semantic.set(*key[:3], text)
+    
+    def top(self, n: int = 10) -> List[Dict[str, Any]]:
+        """
+        Devuelve las preguntas con más aciertos.
+        
+        Args:
+            n: Número de preguntas
+            
+        Returns:
+            List[Dict[str, Any]]: Pregunta, grupo de edad, persona y aciertos
+        """
+        entries = sorted(self._cache.items(), key=lambda item: item[1].hits, reverse=True)[:n]
+        return [
+            {"message": key[0], "age_group": key[1], "persona": key[2], "hits": entry.hits}
+            for key, entry in entries
+        ]
+    
+    def clear(self) -> None:
+        """Elimina todas las respuestas guardadas."""
+        self._cache.clear()
+        if self.semantic is not None:
+            self.semantic.clear()
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve métricas de la caché.
+        
+        No incluye las preguntas (ver `top`): las métricas no deben exponer
+        lo que escriben los niños.
+        """
+        return {
+            **self._cache.stats(),
+            "semantic": self.semantic.stats() if self.semantic is not None else None,
+        }
+
+
 class ChatService:
     """
     Servicio para manejar la lógica del chat.
     """
     
-    def __init__(self):
-        # Ejemplo de respuestas por grupo de edad
+    def __init__(
+        self,
+        n8n: Optional[N8NClient] = None,
+        history: Optional[ChatRepository] = None,
+        response_cache: Optional[ResponseCache] = None,
+        limiter: Optional[AdaptiveConcurrencyLimiter] = None,
+        breaker: Optional[CircuitBreaker] = None,
+        router: Optional[PersonaRouter] = None,
+        safety: Optional[SafetyFilter] = None,
+        content: Optional[ContentIndex] = None,
+        speculator: Optional[Speculator] = None,
+        compactor: Optional[HistoryCompactor] = None
+    ):
+        """
+        Inicializa el servicio.
+        
+        Args:
+            n8n: Cliente del webhook de n8n (por defecto, la instancia global)
+            history: Repositorio de conversaciones (por defecto, la instancia global)
+            response_cache: Caché de respuestas (por defecto, una nueva según la configuración)
+            limiter: Limitador de generaciones simultáneas (por defecto, uno nuevo según la configuración)
+            breaker: Cortocircuito del upstream (por defecto, uno nuevo según la configuración)
+            router: Enrutador de roles de CORTANA (por defecto, la instancia global)
+            safety: Filtro de seguridad infantil (por defecto, la instancia global)
+            content: Índice de módulos y actividades (por defecto, la instancia global)
+            speculator: Planificador de respuestas especulativas para las sugerencias
+                (por defecto, uno nuevo según la configuración)
+            compactor: Compactador del historial enviado a n8n (por defecto, uno nuevo
+                según la configuración)
+        """
+        self.n8n = n8n or n8n_client
+        self.router = router or persona_router
+        self.safety = safety or safety_filter
+        self.content = content or content_index
+        self.history = history or chat_repository
+        if response_cache is None and settings.CHAT_CACHE_ENABLED:
+            semantic = None
+            if settings.CHAT_SEMANTIC_CACHE_ENABLED:
+                semantic = SemanticCache(
+                    threshold=settings.CHAT_SEMANTIC_CACHE_THRESHOLD,
+                    capacity=settings.CHAT_SEMANTIC_CACHE_CAPACITY,
+                    dim=settings.CHAT_SEMANTIC_CACHE_DIM,
+                    ttl=settings.CHAT_CACHE_TTL_SECONDS
+                )
+            response_cache = ResponseCache(
+                max_entries=settings.CHAT_CACHE_MAX_ENTRIES,
+                ttl=settings.CHAT_CACHE_TTL_SECONDS,
+                max_bytes=settings.CHAT_CACHE_MAX_BYTES,
+                semantic=semantic
+            )
+        self.response_cache = response_cache
+        
+        # Agrupa las preguntas idénticas que están a la espera del upstream
+        self.inflight = SingleFlight(timeout=settings.CHAT_COALESCE_TIMEOUT_SECONDS)
+        
+        # Acota las generaciones simultáneas y descarta las que no caben en la cola
+        self.limiter = limiter or AdaptiveConcurrencyLimiter(
+            initial_limit=settings.CHAT_CONCURRENCY_INITIAL,
+            min_limit=settings.CHAT_CONCURRENCY_MIN,
+            max_limit=settings.CHAT_CONCURRENCY_MAX,
+            max_queue=settings.CHAT_QUEUE_MAX,
+            latency_threshold=settings.CHAT_LATENCY_THRESHOLD_SECONDS
+        )
+        self.queue_timeout = settings.CHAT_QUEUE_TIMEOUT_SECONDS
+        
+        # Con n8n caído o atascado se responde al instante con las respuestas de respaldo
+        self.breaker = breaker or CircuitBreaker(
+            window=settings.CHAT_BREAKER_WINDOW_SECONDS,
+            min_requests=settings.CHAT_BREAKER_MIN_REQUESTS,
+            failure_rate=settings.CHAT_BREAKER_FAILURE_RATE,
+            slow_call_seconds=settings.CHAT_BREAKER_SLOW_CALL_SECONDS,
+            slow_call_rate=settings.CHAT_BREAKER_SLOW_CALL_RATE,
+            open_seconds=settings.CHAT_BREAKER_OPEN_SECONDS,
+            half_open_probes=settings.CHAT_BREAKER_HALF_OPEN_PROBES,
+            excluded=(LoadShedError,)
+        )
+        
+        # Respuestas especulativas de las sugerencias, solo con capacidad de sobra
+        if speculator is None:
+            speculator = Speculator(
+                budget=settings.CHAT_SPECULATION_BUDGET,
+                max_in_flight=settings.CHAT_SPECULATION_MAX_IN_FLIGHT,
+                max_per_response=settings.CHAT_SPECULATION_MAX_PER_RESPONSE,
+                ttl=settings.CHAT_CACHE_TTL_SECONDS,
+                enabled=settings.CHAT_SPECULATION_ENABLED
+            )
+        self.speculator = speculator
+        # Al cancelar una especulación se cancela también su llamada compartida,
+        # salvo que una solicitud real ya la esté esperando
+        self.speculator.on_cancel = self.inflight.cancel
+        self.speculation_max_load = settings.CHAT_SPECULATION_MAX_LOAD
+        
+        # La cola reciente va tal cual a n8n; lo anterior, como resumen guardado en la sesión
+        self.compactor = compactor or HistoryCompactor(
+            budgets={
+                "3-5": settings.CHAT_CONTEXT_TOKENS_3_5,
+                "6-8": settings.CHAT_CONTEXT_TOKENS_6_8,
+                "9-12": settings.CHAT_CONTEXT_TOKENS_9_12,
+            },
+            summary_max_chars=settings.CHAT_CONTEXT_SUMMARY_MAX_CHARS,
+            enabled=settings.CHAT_CONTEXT_COMPACTION_ENABLED
+        )
+        
+        # Respuestas de respaldo por grupo de edad
         self.age_group_responses = {
             "3-5": [
                 "¡Hola pequeñín! ¿En qué puedo ayudarte hoy?",
@@ -32,12 +296,132 @@ class ChatService:
             ]
         }
         
+        # Respuestas cuando el servicio está saturado, por grupo de edad
+        self.busy_responses = {
+            "3-5": "¡Uy, hay muchos amiguitos hablando conmigo a la vez! Espera un momentito y vuelve a preguntarme.",
+            "6-8": "¡Cuántas preguntas a la vez! Estoy un poco ocupado; inténtalo otra vez en unos segundos.",
+            "9-12": "Ahora mismo estoy atendiendo muchas preguntas. Vuelve a intentarlo en unos segundos, por favor.",
+        }
+        
+        # Respuestas a mensajes bloqueados por el filtro de seguridad, por grupo de edad
+        self.safe_responses = {
+            "3-5": "Mmm, de eso no puedo hablar. ¿Jugamos a adivinar animales o colores?",
+            "6-8": "De eso no puedo hablar contigo. ¿Qué tal si aprendemos algo divertido de ciencias o de animales?",
+            "9-12": "Ese tema no es adecuado para esta conversación. Si te preocupa algo, habla con un adulto de confianza. ¿Seguimos con tus estudios?",
+        }
+        
+        # Respuesta cuando el mensaje habla de hacerse daño
+        self.help_response = (
+            "Siento que te sientas así. Es muy importante que se lo cuentes ahora mismo "
+            "a un adulto de confianza, como tu mamá, tu papá o tu maestro. No estás solo."
+        )
+        
         # Sugerencias de temas por grupo de edad
         self.suggestions = {
             "3-5": ["Colores", "Animales", "Números", "Letras", "Formas"],
             "6-8": ["Matemáticas", "Ciencias", "Historia", "Geografía", "Arte"],
             "9-12": ["Álgebra", "Biología", "Física", "Literatura", "Programación"]
         }
+        
+        # Mensajes asignados a cada rol
+        self.routed: Dict[str, int] = {}
+        
+        # Mensajes del usuario y respuestas del upstream bloqueados por el filtro
+        self.blocked_inbound = 0
+        self.blocked_outbound = 0
+        
+        # Métricas de las respuestas transmitidas
+        self.streams = 0
+        self.stream_ttfb_total = 0.0
+        self.stream_latency_total = 0.0
+    
+    async def prepare_request(self, chat_request: ChatRequest, user_id: str) -> ChatRequest:
+        """
+        Completa la solicitud con el historial guardado en el servidor.
+        
+        Si la solicitud trae `session_id` o `message`, los mensajes recibidos
+        se consideran nuevos: se guardan en la sesión (que se crea si no se
+        indicó ninguna) y se anteponen los últimos mensajes guardados. Sin
+        ninguno de los dos campos, la solicitud se usa tal cual, con el
+        historial completo enviado por el cliente. En ambos casos los mensajes
+        recibidos pasan antes por el filtro de seguridad (ver `_mark_blocked`).
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
+            user_id: Usuario autenticado
+            
+        Returns:
+            ChatRequest: Solicitud con el historial completo y `session_id`
+            
+        Raises:
+            ChatSessionNotFoundError: Si la sesión no existe o es de otro usuario
+        """
+        if chat_request.session_id is None and chat_request.message is None:
+            self._mark_blocked(chat_request.messages)
+            return chat_request
+        
+        new_messages = list(chat_request.messages)
+        if chat_request.message:
+            new_messages.append(Message(role=MessageRole.USER, content=chat_request.message))
+        # Antes de guardarlos: un mensaje bloqueado se guarda marcado y no vuelve a n8n
+        self._mark_blocked(new_messages)
+        
+        if chat_request.session_id:
+            history = await self.history.get_history(chat_request.session_id, user_id)
+        else:
+            title = new_messages[-1]
+            session = await self.history.create_session(
+                user_id=user_id,
+                age_group=chat_request.age_group.value,
+                title="Nueva conversación" if title.blocked else title.content
+            )
+            chat_request.session_id = session["_id"]
+            history = []
+        
+        await self.history.append_messages(chat_request.session_id, new_messages)
+        chat_request.messages = (history + new_messages)[-100:]
+        await self._backfill_summary(chat_request)
+        return chat_request
+    
+    async def _backfill_summary(self, chat_request: ChatRequest) -> None:
+        """
+        Resume los mensajes que ya no están en el historial recibido ni en el resumen.
+        
+        La cola en caché guarda como mucho `tail_size` mensajes; si el resumen
+        de la sesión no llega hasta ella (la sesión se recargó o se perdió la
+        escritura del resumen), los mensajes intermedios se leen de MongoDB y
+        se añaden al resumen antes de compactar. Si no se pueden leer, la
+        compactación registra el hueco y sigue adelante.
+        """
+        if not self.compactor.enabled:
+            return
+        session = self.history.cached_session(chat_request.session_id)
+        if session is None:
+            return
+        covered = session.get("summary_covered", 0)
+        offset = self._history_offset(chat_request, session)
+        if covered >= offset:
+            return
+        try:
+            missing = await self.history.get_messages(chat_request.session_id, covered, offset)
+        except Exception as e:
+            logger.warning(f"No se pudo leer el historial sin resumir: {e}")
+            return
+        summary = self.compactor.extend(session.get("summary", ""), missing)
+        self.history.set_summary(chat_request.session_id, summary, offset)
+    
+    @staticmethod
+    def _history_offset(chat_request: ChatRequest, session: Dict[str, Any]) -> int:
+        """Posición absoluta en la sesión del primer mensaje de la solicitud."""
+        return session["message_count"] + chat_request._unsaved - len(chat_request.messages)
+    
+    async def _save_reply(self, chat_request: ChatRequest, text: str) -> None:
+        """Guarda la respuesta del asistente si la conversación tiene sesión."""
+        if chat_request.session_id:
+            await self.history.append_messages(
+                chat_request.session_id,
+                [Message(role=MessageRole.ASSISTANT, content=text[:2000])]
+            )
     
     async def process_chat(self, chat_request: ChatRequest) -> ChatResponse:
         """
@@ -53,21 +437,32 @@ class ChatService:
             # Obtener el último mensaje del usuario
             last_message = chat_request.messages[-1].content if chat_request.messages else ""
             
-            # Generar una respuesta basada en el grupo de edad
-            response_text = self._generate_response(chat_request.age_group, last_message)
+            # Elegir el rol de CORTANA que atiende el mensaje
+            self._route(chat_request, last_message)
+            
+            # Los mensajes bloqueados por el filtro de seguridad no llegan a n8n
+            response_text = self._screen_input(chat_request, last_message)
+            if response_text is None:
+                # Generar una respuesta con n8n (o de respaldo si no está disponible)
+                response_text = await self._generate_response(chat_request, last_message)
             
             # Generar sugerencias
             suggestions = self._get_suggestions(chat_request.age_group)
             
-            # Actualizar el contexto (ejemplo simple)
-            context = chat_request.context or {}
-            context["last_interaction"] = datetime.utcnow().isoformat()
-            context["message_count"] = context.get("message_count", 0) + 1
+            # Actualizar el contexto
+            context = self._update_context(chat_request)
+            
+            # Guardar la respuesta en la sesión
+            await self._save_reply(chat_request, response_text)
+            
+            # Adelantar en segundo plano las respuestas de las sugerencias
+            await self._speculate(chat_request, response_text, suggestions)
             
             return ChatResponse(
                 response=response_text,
                 context=context,
-                suggestions=suggestions
+                suggestions=suggestions,
+                session_id=chat_request.session_id
             )
             
         except Exception as e:
@@ -76,24 +471,509 @@ class ChatService:
             return ChatResponse(
                 response="¡Vaya! Algo salió mal. Por favor, inténtalo de nuevo más tarde.",
                 context=chat_request.context or {},
-                suggestions=self._get_suggestions(chat_request.age_group)
+                suggestions=self._get_suggestions(chat_request.age_group),
+                session_id=chat_request.session_id
             )
     
-    def _generate_response(self, age_group: str, message: str) -> str:
+    async def stream_chat(self, chat_request: ChatRequest) -> AsyncIterator[Tuple[str, Dict[str, Any]]]:
         """
-        Genera una respuesta basada en el grupo de edad y el mensaje.
+        Procesa un mensaje de chat entregando la respuesta por fragmentos.
+        
+        Emite eventos `("token", {"text": ...})` a medida que n8n genera el
+        texto y un evento final `("done", {...})` con las sugerencias, el
+        contexto actualizado y los tiempos hasta el primer fragmento (`ttfb_ms`)
+        y total (`total_ms`). La respuesta completa se guarda en la sesión,
+        si la hay. Si n8n falla antes de enviar nada se emite una
+        respuesta de respaldo, también si el circuito está abierto (o un aviso
+        de saturación si el limitador
+        descarta la solicitud); si falla a mitad, el evento final lleva
+        `complete` a False.
+        
+        Los mensajes bloqueados por el filtro de seguridad reciben la respuesta
+        segura sin llamar a n8n. El texto de n8n se entrega por palabras ya
+        revisadas; si el filtro lo bloquea a mitad, se emite `("reset", {})`
+        para que el cliente descarte lo recibido y después la respuesta de
+        respaldo, que es la única que se guarda.
         
         Args:
-            age_group: Grupo de edad del usuario
+            chat_request: Datos de la solicitud de chat
+            
+        Yields:
+            Tuple[str, Dict[str, Any]]: Nombre del evento y sus datos
+        """
+        start = time.perf_counter()
+        ttfb: Optional[float] = None
+        complete = True
+        shed = False
+        parts: List[str] = []
+        last_message = chat_request.messages[-1].content if chat_request.messages else ""
+        self._route(chat_request, last_message)
+        safe_response = self._screen_input(chat_request, last_message)
+        cache_key = self._cache_key(chat_request, last_message)
+        cached = self._cached_response(cache_key) if safe_response is None else safe_response
+        
+        if cached is not None:
+            ttfb = time.perf_counter() - start
+            parts.append(cached)
+            yield "token", {"text": cached}
+        else:
+            # Una especulación en curso de esta pregunta ya no sirve: se transmite de nuevo
+            if cache_key is not None:
+                self.speculator.cancel(cache_key)
+            self._make_room()
+            guard = self.safety.guard()
+            try:
+                async with self.breaker.guard() as call, self.limiter.slot(self.queue_timeout):
+                    # La espera en la cola del limitador no cuenta como lentitud del upstream
+                    call.restart()
+                    chunks = self.n8n.stream(self._build_payload(chat_request, last_message, stream=True))
+                    async for text in self._screen_stream(chunks, guard):
+                        if ttfb is None:
+                            ttfb = time.perf_counter() - start
+                            call.success()  # El circuito mide hasta el primer fragmento
+                        parts.append(text)
+                        yield "token", {"text": text}
+            except CircuitOpenError:
+                logger.debug("Circuito abierto: usando respuesta de respaldo")
+            except LoadShedError as e:
+                shed = True
+                logger.warning(f"Solicitud de chat descartada por sobrecarga: {e.reason}")
+            except N8NError as e:
+                if ttfb is None:
+                    logger.warning(f"Usando respuesta de respaldo: {e}")
+                else:
+                    complete = False
+                    logger.warning(f"Respuesta de n8n interrumpida: {e}")
+            
+            if guard.verdict.blocked:
+                self._record_blocked_output(chat_request, guard.verdict)
+                if parts:
+                    yield "reset", {}
+                parts.clear()
+                ttfb = None
+            
+            # Solo se guardan respuestas completas del upstream
+            if ttfb is not None and complete and cache_key is not None and self.response_cache is not None:
+                self.response_cache.set(cache_key, "".join(parts).strip())
+        
+        if ttfb is None:
+            # Sin texto del upstream: entregar la respuesta de respaldo completa
+            ttfb = time.perf_counter() - start
+            if shed:
+                parts.append(self._busy_response(chat_request.age_group))
+            else:
+                parts.append(self._fallback_response(chat_request.age_group))
+            yield "token", {"text": parts[-1]}
+        
+        total = time.perf_counter() - start
+        await self._save_reply(chat_request, "".join(parts).strip())
+        self.streams += 1
+        self.stream_ttfb_total += ttfb
+        self.stream_latency_total += total
+        logger.info(
+            "Respuesta de chat transmitida",
+            extra={"ttfb_ms": round(ttfb * 1000, 2), "total_ms": round(total * 1000, 2), "complete": complete}
+        )
+        suggestions = self._get_suggestions(chat_request.age_group)
+        context = self._update_context(chat_request)
+        await self._speculate(chat_request, "".join(parts).strip(), suggestions)
+        yield "done", {
+            "suggestions": suggestions,
+            "context": context,
+            "session_id": chat_request.session_id,
+            "complete": complete,
+            "ttfb_ms": round(ttfb * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+        }
+    
+    def _route(self, chat_request: ChatRequest, message: str) -> None:
+        """
+        Asigna el rol de CORTANA del mensaje y guarda la decisión en el contexto.
+        
+        El contexto recibe `persona` (que se mantiene en los turnos sin
+        palabras clave) y `routing`, con el motivo, las palabras clave y la
+        latencia de la decisión en microsegundos.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
+            message: Último mensaje del usuario
+        """
+        context = chat_request.context if chat_request.context is not None else {}
+        decision = self.router.route(message, previous=context.get("persona"))
+        context["persona"] = decision.persona.id
+        context["routing"] = decision.as_context()
+        chat_request.context = context
+        self.routed[decision.persona.id] = self.routed.get(decision.persona.id, 0) + 1
+    
+    def _mark_blocked(self, messages: List[Message]) -> None:
+        """
+        Marca los mensajes recibidos que el filtro de seguridad bloquea.
+        
+        Los marcados se guardan en la sesión, pero no se envían a n8n ni entran
+        en el resumen; el último, si está bloqueado, lo responde `_screen_input`.
+        """
+        for message in messages:
+            if not message.blocked and self.safety.check(message.content).blocked:
+                message.blocked = True
+    
+    def _screen_input(self, chat_request: ChatRequest, message: str) -> Optional[str]:
+        """
+        Revisa el mensaje del usuario con el filtro de seguridad.
+        
+        El contexto recibe `safety` con las categorías si el mensaje se bloquea.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat (ya enrutada)
+            message: Último mensaje del usuario
+            
+        Returns:
+            Optional[str]: Respuesta segura si el mensaje está bloqueado, o None
+        """
+        verdict = self.safety.check(message)
+        context = chat_request.context
+        if not verdict.blocked:
+            context.pop("safety", None)
+            return None
+        self.blocked_inbound += 1
+        context["safety"] = {"blocked": "input", "categories": list(verdict.categories)}
+        logger.warning("Mensaje bloqueado por el filtro de seguridad", extra={"categories": list(verdict.categories)})
+        if "autolesion" in verdict.categories:
+            return self.help_response
+        return self.safe_responses.get(chat_request.age_group, self.safe_responses["9-12"])
+    
+    def _record_blocked_output(self, chat_request: Optional[ChatRequest], verdict: SafetyVerdict) -> None:
+        """Cuenta una respuesta de n8n bloqueada y la anota en el contexto, si lo hay."""
+        self.blocked_outbound += 1
+        if chat_request is not None and chat_request.context is not None:
+            chat_request.context["safety"] = {"blocked": "output", "categories": list(verdict.categories)}
+        logger.warning(
+            "Respuesta de n8n bloqueada por el filtro de seguridad",
+            extra={"categories": list(verdict.categories)}
+        )
+    
+    @staticmethod
+    async def _screen_stream(chunks: AsyncIterator[str], guard: StreamGuard) -> AsyncIterator[str]:
+        """Entrega el texto transmitido ya revisado y corta el upstream si se bloquea."""
+        try:
+            async for chunk in chunks:
+                text = guard.feed(chunk)
+                if text is None:
+                    return
+                if text:
+                    yield text
+            text = guard.flush()
+            if text:
+                yield text
+        finally:
+            await chunks.aclose()
+    
+    def _update_context(self, chat_request: ChatRequest) -> Dict[str, Any]:
+        """
+        Actualiza el contexto de la conversación tras una interacción.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
+            
+        Returns:
+            Dict[str, Any]: Contexto actualizado
+        """
+        context = chat_request.context or {}
+        context["last_interaction"] = datetime.utcnow().isoformat()
+        context["message_count"] = context.get("message_count", 0) + 1
+        return context
+    
+    def _compact_history(self, chat_request: ChatRequest) -> List[Message]:
+        """
+        Recorta el historial al presupuesto de tokens del grupo de edad.
+        
+        Los turnos que salen de la cola se añaden al resumen de la sesión, que
+        se guarda en ella (y en MongoDB en el siguiente lote) para que el
+        siguiente turno solo resuma lo nuevo. Sin sesión en caché, el resumen
+        se calcula a partir del historial recibido.
+        
+        Los mensajes bloqueados por el filtro de seguridad se quedan fuera de
+        la cola y del resumen. Las solicitudes especulativas no modifican el
+        resumen guardado: la clave de su respuesta se calculó con él y la
+        solicitud real debe encontrarla.
+        
+        Returns:
+            List[Message]: Resumen como mensaje de sistema, si lo hay, y la cola reciente
+        """
+        session = self.history.cached_session(chat_request.session_id) if chat_request.session_id else None
+        if session is not None:
+            # Antes de guardar la respuesta, el último mensaje es el último de la sesión
+            compacted = self.compactor.compact(
+                chat_request.messages,
+                chat_request.age_group.value,
+                summary=session.get("summary", ""),
+                covered=session.get("summary_covered", 0),
+                offset=self._history_offset(chat_request, session)
+            )
+            if compacted.updated and not chat_request._unsaved:
+                self.history.set_summary(chat_request.session_id, compacted.summary, compacted.covered)
+        else:
+            compacted = self.compactor.compact(chat_request.messages, chat_request.age_group.value)
+        
+        messages = [message for message in compacted.messages if not message.blocked]
+        if not compacted.summary:
+            return messages
+        summary = Message(
+            role=MessageRole.SYSTEM,
+            content=f"Resumen de la conversación anterior:\n{compacted.summary}"
+        )
+        return [summary] + messages
+    
+    def _build_payload(self, chat_request: ChatRequest, message: str, stream: bool = False) -> Dict[str, Any]:
+        """
+        Construye el cuerpo de la solicitud al webhook de n8n.
+        
+        `messages` lleva la cola reciente del historial y un resumen de lo
+        anterior, y `passages` los módulos y actividades más relevantes para el
+        mensaje, buscados en el índice en memoria, para fundamentar la respuesta.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
+            message: Último mensaje del usuario
+            stream: Si se pide a n8n que transmita la respuesta por fragmentos
+            
+        Returns:
+            Dict[str, Any]: Cuerpo JSON para n8n
+        """
+        persona = self.router.get(self._persona(chat_request)) or self.router.default
+        return {
+            "message": message,
+            "persona": {
+                "id": persona.id,
+                "name": persona.name,
+                "prompt": persona.render_prompt(chat_request.age_group.value),
+            },
+            "messages": [
+                {"role": m.role.value, "content": m.content}
+                for m in self._compact_history(chat_request)
+            ],
+            "metadata": {
+                "ageGroup": chat_request.age_group.value,
+                "timestamp": datetime.utcnow().isoformat(),
+            },
+            "context": chat_request.context or {},
+            "passages": [
+                {
+                    "source": result.passage.kind,
+                    "id": result.passage.id,
+                    "slug": result.passage.slug,
+                    "title": result.passage.title,
+                    "text": result.passage.text[:PASSAGE_MAX_CHARS],
+                    "score": round(result.score, 3),
+                }
+                for result in self.content.search(message, chat_request.age_group.value)
+            ],
+            "stream": stream,
+        }
+    
+    async def _generate_response(self, chat_request: ChatRequest, message: str) -> str:
+        """
+        Genera una respuesta llamando al flujo de n8n.
+        
+        Las preguntas repetidas se sirven desde la caché de respuestas sin
+        llamar a n8n, y las idénticas que llegan a la vez esperan una única
+        llamada compartida. Si n8n no responde, la respuesta no tiene texto o el
+        filtro de seguridad la bloquea, se usa
+        una respuesta de respaldo del grupo de edad (que no se guarda), también
+        al instante mientras el circuito del upstream está abierto; si el
+        limitador descarta la solicitud, se pide amablemente volver a intentarlo.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
             message: Último mensaje del usuario
             
         Returns:
             str: Respuesta generada
         """
-        # Lógica simple de respuesta basada en el grupo de edad
+        cache_key = self._cache_key(chat_request, message)
+        cached = self._cached_response(cache_key)
+        if cached is not None:
+            return cached
+        
+        # Si la pregunta se está especulando, esta solicitud se une a esa llamada
+        if cache_key is not None and cache_key in self.speculator:
+            self.speculator.claim(cache_key)
+        else:
+            self._make_room()
+        
+        try:
+            if cache_key is None:
+                text = await self._request_upstream(chat_request, message, None)
+            else:
+                # Las preguntas idénticas en curso comparten una sola llamada
+                text = await self.inflight.do(
+                    cache_key, lambda: self._request_upstream(chat_request, message, cache_key)
+                )
+            if text:
+                return text
+        except CircuitOpenError:
+            logger.debug("Circuito abierto: usando respuesta de respaldo")
+        except LoadShedError as e:
+            logger.warning(f"Solicitud de chat descartada por sobrecarga: {e.reason}")
+            return self._busy_response(chat_request.age_group)
+        except N8NError as e:
+            logger.warning(f"Usando respuesta de respaldo: {e}")
+        except asyncio.TimeoutError:
+            logger.warning("Usando respuesta de respaldo: venció el plazo de la llamada compartida")
+        return self._fallback_response(chat_request.age_group)
+    
+    async def _request_upstream(
+        self,
+        chat_request: ChatRequest,
+        message: str,
+        cache_key: Optional[ResponseKey]
+    ) -> Optional[str]:
+        """
+        Pide la respuesta a n8n, tras el cortocircuito y el limitador de
+        concurrencia, la revisa con el filtro de seguridad y la guarda en la caché.
+        
+        Args:
+            chat_request: Datos de la solicitud de chat
+            message: Último mensaje del usuario
+            cache_key: Clave de la caché de respuestas, si existe
+            
+        Returns:
+            Optional[str]: Texto de la respuesta o None si n8n no devolvió texto
+            o el filtro de seguridad lo bloqueó
+            
+        Raises:
+            CircuitOpenError: Si el circuito del upstream está abierto
+            LoadShedError: Si el limitador descarta la solicitud
+        """
+        async with self.breaker.guard() as call, self.limiter.slot(self.queue_timeout):
+            # La espera en la cola del limitador no cuenta como lentitud del upstream
+            call.restart()
+            data = await self.n8n.post(self._build_payload(chat_request, message))
+        text = N8NClient.extract_text(data)
+        if not text or not text.strip():
+            logger.warning("n8n devolvió una respuesta sin texto", extra={"keys": list(data)})
+            return None
+        text = text.strip()
+        verdict = self.safety.check(text)
+        if verdict.blocked:
+            # La llamada puede ser compartida: el contexto de esta solicitud no se anota
+            self._record_blocked_output(None, verdict)
+            return None
+        if cache_key is not None and self.response_cache is not None:
+            self.response_cache.set(cache_key, text)
+        return text
+    
+    def _persona(self, chat_request: ChatRequest) -> str:
+        """Rol de CORTANA asignado a la conversación."""
+        return str((chat_request.context or {}).get("persona", self.router.default.id))
+    
+    def _cache_key(self, chat_request: ChatRequest, message: str) -> Optional[ResponseKey]:
+        """
+        Clave de la pregunta para la caché y el agrupamiento, o None si no hay mensaje.
+        
+        Incluye la huella del historial anterior y del resumen de la sesión,
+        para que dos conversaciones distintas nunca compartan respuesta.
+        """
+        if not message:
+            return None
+        session = self.history.cached_session(chat_request.session_id) if chat_request.session_id else None
+        history = ResponseCache.fingerprint(
+            chat_request.messages[:-1],
+            session.get("summary", "") if session is not None else ""
+        )
+        return ResponseCache.key(message, chat_request.age_group, self._persona(chat_request), history)
+    
+    def _cached_response(self, cache_key: Optional[ResponseKey]) -> Optional[str]:
+        """Respuesta guardada para la clave, si la caché está activa."""
+        if cache_key is None or self.response_cache is None:
+            return None
+        text = self.response_cache.get(cache_key)
+        if text is not None:
+            self.speculator.claim(cache_key)
+        return text
+    
+    def _make_room(self) -> None:
+        """Cancela las especulaciones si el tráfico real ya no tiene hueco libre."""
+        if len(self.speculator) and self.limiter.in_flight >= self.limiter.limit:
+            self.speculator.cancel_all()
+    
+    async def _speculate(self, chat_request: ChatRequest, reply: str, suggestions: List[str]) -> None:
+        """
+        Lanza en segundo plano la generación de las respuestas de las sugerencias.
+        
+        Cada sugerencia se trata como el siguiente mensaje de la conversación
+        (con su propio rol) y su respuesta se guarda en la caché, de modo que
+        si el niño la pulsa se responde al instante. Con sesión, la solicitud
+        se arma como lo hará `prepare_request` (cola guardada, incluida la
+        respuesta, y resumen completado) para que la clave coincida. No se
+        especula con el circuito no cerrado ni con el limitador por encima de
+        `speculation_max_load`.
+        
+        Args:
+            chat_request: Solicitud ya respondida
+            reply: Respuesta entregada
+            suggestions: Sugerencias devueltas con la respuesta
+        """
+        speculator = self.speculator
+        if not speculator.enabled or self.response_cache is None or not reply:
+            return
+        speculator.credit()
+        candidates = suggestions[:speculator.max_per_response]
+        if (
+            self.breaker.state != CircuitBreaker.CLOSED
+            or self.limiter.queue_depth
+            or self.limiter.in_flight >= self.limiter.limit * self.speculation_max_load
+        ):
+            speculator.skip("load", len(candidates))
+            return
+        
+        context = {k: v for k, v in (chat_request.context or {}).items() if k != "safety"}
+        history = self.history.cached_history(chat_request.session_id) if chat_request.session_id else None
+        if history is None:
+            history = chat_request.messages + [Message(role=MessageRole.ASSISTANT, content=reply[:2000])]
+        requests = []
+        for suggestion in candidates:
+            decision = self.router.route(suggestion, previous=context.get("persona"))
+            request = ChatRequest(
+                messages=(history + [Message(role=MessageRole.USER, content=suggestion)])[-100:],
+                age_group=chat_request.age_group,
+                context={**context, "persona": decision.persona.id, "routing": decision.as_context()},
+                session_id=chat_request.session_id
+            )
+            request._unsaved = 1
+            requests.append((request, suggestion))
+        if requests and chat_request.session_id:
+            # El siguiente mensaje, sea cual sea, completará igual el resumen
+            await self._backfill_summary(requests[0][0])
+        for request, suggestion in requests:
+            key = self._cache_key(request, suggestion)
+            # Una pregunta que ya se está generando para una solicitud real no se especula
+            if key is None or key in self.response_cache or key in self.inflight:
+                continue
+            speculator.schedule(key, lambda r=request, m=suggestion, k=key: self.inflight.do(
+                k, lambda: self._request_upstream(r, m, k), background=True
+            ))
+    
+    async def close(self) -> None:
+        """Cancela las respuestas especulativas en curso."""
+        await self.speculator.close()
+    
+    def _fallback_response(self, age_group: str) -> str:
+        """
+        Devuelve una respuesta de respaldo basada en el grupo de edad.
+        
+        Args:
+            age_group: Grupo de edad del usuario
+            
+        Returns:
+            str: Respuesta de respaldo
+        """
         responses = self.age_group_responses.get(age_group, ["Hola, ¿en qué puedo ayudarte?"])
         return random.choice(responses)
     
+    def _busy_response(self, age_group: str) -> str:
+        """Mensaje para pedir que se repita la pregunta cuando el servicio está saturado."""
+        return self.busy_responses.get(age_group, "Estoy muy ocupado ahora mismo. Inténtalo de nuevo en unos segundos.")
+    
     def _get_suggestions(self, age_group: str) -> List[str]:
         """
         Obtiene sugerencias de temas basadas en el grupo de edad.
@@ -105,6 +985,28 @@ class ChatService:
             List[str]: Lista de sugerencias
         """
         return self.suggestions.get(age_group, ["Aprender", "Jugar", "Explorar"])
+    
+    def stats(self) -> Dict[str, Any]:
+        """
+        Devuelve métricas del servicio de chat.
+        
+        Returns:
+            Dict[str, Any]: Tiempos medios de transmisión, estado de la caché y de la concurrencia
+        """
+        streams = self.streams or 1
+        return {
+            "streams": self.streams,
+            "avg_stream_ttfb_ms": round(self.stream_ttfb_total / streams * 1000, 2),
+            "avg_stream_total_ms": round(self.stream_latency_total / streams * 1000, 2),
+            "response_cache": self.response_cache.stats() if self.response_cache else None,
+            "coalescing": self.inflight.stats(),
+            "concurrency": self.limiter.stats(),
+            "circuit_breaker": self.breaker.stats(),
+            "personas": dict(self.routed),
+            "safety": {"blocked_inbound": self.blocked_inbound, "blocked_outbound": self.blocked_outbound},
+            "speculation": self.speculator.stats(),
+            "history_compaction": self.compactor.stats(),
+        }
 
 # Instancia global del servicio de chat
 chat_service = ChatService()
@@ -0,0 +1,405 @@
+"""
+Índice de búsqueda en memoria sobre los módulos y actividades educativas.
+
+Los títulos y descripciones se guardan en un índice invertido con
+puntuación BM25, de modo que el chat obtiene los pasajes relevantes para
+cada mensaje sin consultar MongoDB. Las palabras se comparan sin tildes y
+reducidas a su raíz (`app.core.text.tokenize`). El índice se carga completo
+al iniciar la aplicación y se actualiza de forma incremental leyendo los
+documentos con `updated_at` reciente.
+"""
+import asyncio
+import heapq
+import math
+import time
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.core.logging_config import get_logger
+from app.core.text import tokenize
+from config import settings
+
+logger = get_logger(__name__)
+
+# Peso de cada campo, en la misma proporción que el índice de texto de `modules`
+TITLE_WEIGHT = 2.0
+BODY_WEIGHT = 1.0
+# Longitud máxima del texto de un pasaje enviado al modelo
+PASSAGE_MAX_CHARS = 400
+
+
+class Passage(NamedTuple):
+    """Fragmento de contenido indexado."""
+    id: str
+    kind: str  # "module" o "activity"
+    title: str
+    text: str
+    slug: Optional[str] = None
+    module_id: Optional[str] = None
+    age_groups: Tuple[str, ...] = ()
+
+
+class SearchResult(NamedTuple):
+    """Pasaje encontrado con su puntuación."""
+    passage: Passage
+    score: float
+
+
+class BM25Index:
+    """
+    Índice invertido con puntuación BM25.
+
+    Cada término guarda su frecuencia ponderada por documento, por lo que
+    agregar o quitar un documento solo toca sus propios términos. La búsqueda
+    recorre únicamente las listas de los términos de la consulta.
+    """
+
+    def __init__(self, k1: float = 1.2, b: float = 0.75):
+        """
+        Inicializa el índice.
+
+        Args:
+            k1: Saturación de la frecuencia de los términos
+            b: Peso de la normalización por longitud del documento
+        """
+        self.k1 = k1
+        self.b = b
+        self._postings: Dict[str, Dict[str, float]] = {}
+        self._doc_terms: Dict[str, Dict[str, float]] = {}
+        self._lengths: Dict[str, float] = {}
+        self._total_length = 0.0
+
+    def __len__(self) -> int:
+        return len(self._lengths)
+
+    def __contains__(self, doc_id: str) -> bool:
+        return doc_id in self._lengths
+
+    @property
+    def terms(self) -> int:
+        """Número de términos distintos indexados."""
+        return len(self._postings)
+
+    def add(self, doc_id: str, fields: Iterable[Tuple[str, float]]) -> None:
+        """
+        Agrega o sustituye un documento.
+
+        Args:
+            doc_id: Identificador del documento
+            fields: Pares (texto, peso) de los campos del documento
+        """
+        self.remove(doc_id)
+        frequencies: Dict[str, float] = {}
+        for text, weight in fields:
+            for term in tokenize(text or ""):
+                frequencies[term] = frequencies.get(term, 0.0) + weight
+        length = sum(frequencies.values())
+        for term, frequency in frequencies.items():
+            self._postings.setdefault(term, {})[doc_id] = frequency
+        self._doc_terms[doc_id] = frequencies
+        self._lengths[doc_id] = length
+        self._total_length += length
+
+    def remove(self, doc_id: str) -> bool:
+        """
+        Quita un documento.
+
+        Returns:
+            bool: True si el documento estaba indexado
+        """
+        frequencies = self._doc_terms.pop(doc_id, None)
+        if frequencies is None:
+            return False
+        for term in frequencies:
+            postings = self._postings[term]
+            del postings[doc_id]
+            if not postings:
+                del self._postings[term]
+        self._total_length -= self._lengths.pop(doc_id)
+        return True
+
+    def search(self, query: str, k: int, allowed=None) -> List[Tuple[float, str]]:
+        """
+        Busca los documentos más relevantes para una consulta.
+
+        Args:
+            query: Texto de la consulta
+            k: Número máximo de resultados
+            allowed: Función opcional que indica si un documento puede devolverse
+
+        Returns:
+            List[Tuple[float, str]]: Pares (puntuación, id) de mayor a menor
+        """
+        count = len(self._lengths)
+        if not count or k <= 0:
+            return []
+        average = self._total_length / count or 1.0
+        k1, b = self.k1, self.b
+        lengths = self._lengths
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for doc_id, frequency in postings.items():
+                norm = k1 * (1 - b + b * lengths[doc_id] / average)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * frequency * (k1 + 1) / (frequency + norm)
+        if allowed is not None:
+            scores = {doc_id: score for doc_id, score in scores.items() if allowed(doc_id)}
+        return heapq.nlargest(k, ((score, doc_id) for doc_id, score in scores.items()))
+
+
+class ContentIndex:
+    """
+    Índice de búsqueda de `modules` y `activities` para el chat.
+
+    Se carga completo al iniciar y se mantiene al día leyendo periódicamente
+    los documentos modificados (por `updated_at`); los que pasan a
+    `is_active: False` se retiran. Los borrados físicos se recogen en la
+    reconstrucción completa que se hace cada `rebuild_interval` segundos. Las
+    actividades sin grupos de edad propios heredan los de su módulo, y las de
+    un módulo que no está indexado (inactivo o aún no leído) no se devuelven.
+    """
+
+    def __init__(
+        self,
+        top_k: int = 3,
+        min_score: float = 0.5,
+        poll_interval: float = 10.0,
+        rebuild_interval: float = 600.0,
+        clock_skew: float = 5.0,
+        enabled: bool = True
+    ):
+        """
+        Inicializa el índice.
+
+        Args:
+            top_k: Pasajes devueltos por defecto en cada búsqueda
+            min_score: Puntuación BM25 mínima de un pasaje
+            poll_interval: Segundos entre lecturas de contenido modificado
+            rebuild_interval: Segundos entre reconstrucciones completas
+            clock_skew: Margen en segundos para tolerar relojes desfasados
+            enabled: Si es False, las búsquedas no devuelven nada
+        """
+        self.top_k = top_k
+        self.min_score = min_score
+        self.poll_interval = poll_interval
+        self.rebuild_interval = rebuild_interval
+        self.clock_skew = clock_skew
+        self.enabled = enabled
+        self._index = BM25Index()
+        self._passages: Dict[str, Passage] = {}
+        self._module_ages: Dict[str, Tuple[str, ...]] = {}
+        self._modules = None
+        self._activities = None
+        self._task: Optional[asyncio.Task] = None
+        self._last_seen: Optional[datetime] = None
+        self._loaded_at = 0.0
+        self.loaded = False
+        self.updates = 0
+        self.searches = 0
+        self.search_time_total = 0.0
+
+    @staticmethod
+    def _key(kind: str, doc_id: Any) -> str:
+        return f"{kind}:{doc_id}"
+
+    def _visible(self, passage: Passage, age_group: Optional[str]) -> bool:
+        if passage.module_id is not None and passage.module_id not in self._module_ages:
+            return False  # Su módulo está inactivo o todavía no se ha leído
+        if age_group is None:
+            return True
+        ages = passage.age_groups or (self._module_ages[passage.module_id] if passage.module_id else ())
+        return not ages or age_group in ages
+
+    def _track(self, doc: Dict[str, Any]) -> None:
+        updated = doc.get("updated_at")
+        if isinstance(updated, datetime) and (self._last_seen is None or updated > self._last_seen):
+            self._last_seen = updated
+
+    def _add(self, passage: Passage, body: str) -> None:
+        key = self._key(passage.kind, passage.id)
+        self._index.add(key, [(passage.title, TITLE_WEIGHT), (body, BODY_WEIGHT)])
+        self._passages[key] = passage
+
+    def _remove(self, kind: str, doc_id: str) -> bool:
+        key = self._key(kind, doc_id)
+        self._passages.pop(key, None)
+        if kind == "module":
+            self._module_ages.pop(doc_id, None)
+        return self._index.remove(key)
+
+    def upsert_module(self, doc: Dict[str, Any]) -> None:
+        """
+        Indexa un módulo nuevo o modificado (o lo retira si no está activo).
+
+        Args:
+            doc: Documento de la colección `modules`
+        """
+        doc_id = str(doc["_id"])
+        self._track(doc)
+        if not doc.get("is_active", True):
+            self._remove("module", doc_id)
+            return
+        ages = tuple(doc.get("target_age_groups") or ())
+        self._module_ages[doc_id] = ages
+        description = doc.get("description") or ""
+        self._add(Passage(doc_id, "module", doc.get("title") or "", description, doc.get("slug"), None, ages),
+                  description)
+        self.updates += 1
+
+    def upsert_activity(self, doc: Dict[str, Any]) -> None:
+        """
+        Indexa una actividad nueva o modificada (o la retira si no está activa).
+
+        Args:
+            doc: Documento de la colección `activities`
+        """
+        doc_id = str(doc["_id"])
+        self._track(doc)
+        if not doc.get("is_active", True):
+            self._remove("activity", doc_id)
+            return
+        body = " ".join(
+            value for value in (doc.get("description"), doc.get("instructions"), doc.get("content"))
+            if isinstance(value, str)
+        )
+        module_id = str(doc["module_id"]) if doc.get("module_id") is not None else None
+        self._add(Passage(doc_id, "activity", doc.get("title") or "", body, doc.get("slug"), module_id,
+                          tuple(doc.get("target_age_groups") or ())),
+                  body)
+        self.updates += 1
+
+    def remove_module(self, doc_id: Any) -> bool:
+        """Retira un módulo borrado en este proceso."""
+        return self._remove("module", str(doc_id))
+
+    def remove_activity(self, doc_id: Any) -> bool:
+        """Retira una actividad borrada en este proceso."""
+        return self._remove("activity", str(doc_id))
+
+    def search(self, query: str, age_group: Optional[str] = None, k: Optional[int] = None) -> List[SearchResult]:
+        """
+        Busca los pasajes más relevantes para un mensaje.
+
+        Args:
+            query: Mensaje del usuario
+            age_group: Grupo de edad del usuario; se excluye el contenido de otros grupos
+            k: Número máximo de pasajes (por defecto, `top_k`)
+
+        Returns:
+            List[SearchResult]: Pasajes de mayor a menor puntuación
+        """
+        if not self.enabled or not query:
+            return []
+        start = time.perf_counter()
+        passages = self._passages
+        hits = self._index.search(
+            query, self.top_k if k is None else k, lambda key: self._visible(passages[key], age_group)
+        )
+        results = [SearchResult(self._passages[key], score) for score, key in hits if score >= self.min_score]
+        self.searches += 1
+        self.search_time_total += time.perf_counter() - start
+        return results
+
+    async def load(self) -> None:
+        """
+        Reconstruye el índice completo desde las colecciones.
+
+        El índice nuevo se construye aparte y se sustituye al final, para que
+        las búsquedas concurrentes nunca vean un índice a medio cargar.
+        """
+        fresh = ContentIndex(enabled=self.enabled)
+        if self._modules is not None:
+            async for doc in self._modules.find({"is_active": {"$ne": False}}):
+                fresh.upsert_module(doc)
+        if self._activities is not None:
+            async for doc in self._activities.find({"is_active": {"$ne": False}}):
+                fresh.upsert_activity(doc)
+        self._index, self._passages, self._module_ages = fresh._index, fresh._passages, fresh._module_ages
+        if fresh._last_seen is not None and (self._last_seen is None or fresh._last_seen > self._last_seen):
+            self._last_seen = fresh._last_seen
+        self._loaded_at = time.monotonic()
+        self.loaded = True
+        logger.info(
+            "Índice de contenido cargado",
+            extra={"passages": len(self._passages), "terms": self._index.terms}
+        )
+
+    async def poll(self) -> int:
+        """
+        Lee los módulos y actividades modificados desde la última lectura.
+
+        Returns:
+            int: Número de documentos leídos
+        """
+        query: Dict[str, Any] = {}
+        if self._last_seen is not None:
+            query = {"updated_at": {"$gt": self._last_seen - timedelta(seconds=self.clock_skew)}}
+        read = 0
+        for collection, upsert in ((self._modules, self.upsert_module), (self._activities, self.upsert_activity)):
+            if collection is None:
+                continue
+            async for doc in collection.find(query):
+                upsert(doc)
+                read += 1
+        return read
+
+    async def _follow(self) -> None:
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                if time.monotonic() - self._loaded_at >= self.rebuild_interval:
+                    await self.load()
+                else:
+                    await self.poll()
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                logger.warning(f"No se pudo actualizar el índice de contenido: {e}")
+
+    async def start(self, modules, activities=None) -> None:
+        """
+        Carga el índice y lanza la tarea de actualización en segundo plano.
+
+        Args:
+            modules: Colección `modules` de MongoDB
+            activities: Colección `activities` de MongoDB
+        """
+        self._modules, self._activities = modules, activities
+        await self.load()
+        if self._task is None:
+            self._task = asyncio.create_task(self._follow())
+
+    async def stop(self) -> None:
+        """Detiene la tarea de actualización."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el tamaño del índice y el tiempo medio de búsqueda."""
+        return {
+            "enabled": self.enabled,
+            "loaded": self.loaded,
+            "passages": len(self._passages),
+            "terms": self._index.terms,
+            "updates": self.updates,
+            "searches": self.searches,
+            "avg_search_us": round(self.search_time_total / self.searches * 1e6, 2) if self.searches else 0.0,
+        }
+
+
+# Instancia global del índice de contenido
+content_index = ContentIndex(
+    top_k=settings.CONTENT_INDEX_TOP_K,
+    min_score=settings.CONTENT_INDEX_MIN_SCORE,
+    poll_interval=settings.CONTENT_INDEX_POLL_SECONDS,
+    rebuild_interval=settings.CONTENT_INDEX_REBUILD_SECONDS,
+    enabled=settings.CONTENT_INDEX_ENABLED
+)
@@ -0,0 +1,166 @@
+"""
+Compactación del historial de chat enviado al upstream.
+
+El historial de una conversación puede llegar a 100 mensajes, pero n8n solo
+necesita los últimos turnos tal cual y una idea de lo anterior. El
+compactador conserva la cola reciente dentro de un presupuesto de tokens por
+grupo de edad y sustituye los turnos anteriores por un resumen acumulado,
+de modo que el tamaño de la solicitud no crece con la conversación.
+
+El resumen es extractivo (la primera frase de cada turno, sin llamar a
+ningún modelo) y se actualiza de forma incremental: solo se añaden los
+turnos que acaban de salir de la cola, y cuando supera su tamaño máximo se
+descartan las líneas más antiguas.
+"""
+import re
+from typing import Dict, List, NamedTuple, Sequence
+
+from app.core.logging_config import get_logger
+from app.models.chat_models import Message, MessageRole
+
+logger = get_logger(__name__)
+
+# Tokens fijos por mensaje (rol y separadores)
+MESSAGE_OVERHEAD_TOKENS = 4
+# Longitud máxima de cada línea del resumen
+SUMMARY_LINE_CHARS = 120
+
+_SENTENCE_END = re.compile(r"(?<=[.!?…])\s")
+
+
+def estimate_tokens(text: str) -> int:
+    """Estimación barata de los tokens de un mensaje (unos 4 caracteres por token)."""
+    return len(text) // 4 + MESSAGE_OVERHEAD_TOKENS
+
+
+def summarize_turns(summary: str, messages: Sequence[Message], max_chars: int) -> str:
+    """
+    Añade turnos al resumen de la conversación.
+
+    Args:
+        summary: Resumen anterior (una línea por turno)
+        messages: Turnos que acaban de salir de la cola, en orden (los
+            bloqueados por el filtro de seguridad no entran)
+        max_chars: Tamaño máximo del resumen; se descartan las líneas más antiguas
+
+    Returns:
+        str: Resumen actualizado
+    """
+    lines = summary.splitlines() if summary else []
+    for message in messages:
+        if message.role == MessageRole.SYSTEM or message.blocked:
+            continue
+        text = " ".join(message.content.split())
+        sentence = _SENTENCE_END.split(text, 1)[0]
+        if len(sentence) > SUMMARY_LINE_CHARS:
+            sentence = sentence[:SUMMARY_LINE_CHARS - 1].rstrip() + "…"
+        speaker = "Niño" if message.role == MessageRole.USER else "CORTANA"
+        lines.append(f"- {speaker}: {sentence}")
+    while lines and sum(len(line) + 1 for line in lines) > max_chars:
+        lines.pop(0)
+    return "\n".join(lines)
+
+
+class CompactedHistory(NamedTuple):
+    """Historial listo para el upstream."""
+    messages: List[Message]  # Cola reciente, tal cual
+    summary: str  # Resumen de todo lo anterior a la cola
+    covered: int  # Posición absoluta del primer mensaje de la cola
+    updated: bool  # Si el resumen cambió respecto al guardado
+
+
+class HistoryCompactor:
+    """
+    Recorta el historial a un presupuesto de tokens por grupo de edad.
+
+    Las posiciones son absolutas dentro de la conversación (el `seq` de los
+    mensajes guardados), de modo que un resumen guardado en la sesión indica
+    hasta dónde llega (`covered`) y solo hay que resumir los turnos nuevos.
+    """
+
+    def __init__(self, budgets: Dict[str, int], summary_max_chars: int = 1500, enabled: bool = True):
+        """
+        Inicializa el compactador.
+
+        Args:
+            budgets: Tokens de la cola reciente por grupo de edad
+            summary_max_chars: Tamaño máximo del resumen
+            enabled: Si es False, el historial se envía completo
+        """
+        self.budgets = budgets
+        self.summary_max_chars = summary_max_chars
+        self.enabled = enabled
+        self.compactions = 0
+        self.summarized_messages = 0
+        self.gaps = 0
+        self.lost_messages = 0
+
+    def extend(self, summary: str, messages: Sequence[Message]) -> str:
+        """Añade al resumen turnos que no llegaron en el historial (p. ej., leídos de MongoDB)."""
+        self.summarized_messages += len(messages)
+        return summarize_turns(summary, messages, self.summary_max_chars)
+
+    def compact(
+        self,
+        messages: List[Message],
+        age_group: str,
+        summary: str = "",
+        covered: int = 0,
+        offset: int = 0
+    ) -> CompactedHistory:
+        """
+        Separa la cola reciente y resume lo anterior.
+
+        Si el resumen guardado no llega hasta el principio de `messages`, los
+        mensajes intermedios ya no se pueden resumir: se registra el hueco y
+        el resumen avanza igualmente (ver `ChatService._backfill_summary`,
+        que lo evita leyéndolos de MongoDB).
+
+        Args:
+            messages: Historial en orden cronológico
+            age_group: Grupo de edad de la conversación
+            summary: Resumen guardado
+            covered: Posición absoluta hasta la que llega el resumen guardado
+            offset: Posición absoluta del primer mensaje de `messages`
+
+        Returns:
+            CompactedHistory: Cola reciente y resumen actualizado
+        """
+        if not self.enabled:
+            return CompactedHistory(messages, "", offset, False)
+        budget = self.budgets.get(age_group, max(self.budgets.values(), default=0))
+        cut = len(messages)
+        used = 0
+        # El último mensaje se conserva siempre, aunque no quepa
+        while cut > 0:
+            cost = estimate_tokens(messages[cut - 1].content)
+            if cut < len(messages) and used + cost > budget:
+                break
+            used += cost
+            cut -= 1
+
+        start = offset + cut
+        gap = max(0, offset - covered)
+        if gap:
+            self.gaps += 1
+            self.lost_messages += gap
+            logger.warning("Mensajes fuera del resumen y de la cola del historial", extra={"missing": gap})
+        pending = messages[max(0, covered - offset):cut]
+        if not pending:
+            # El resumen guardado ya cubre todo lo que queda fuera de la cola
+            return CompactedHistory(messages[cut:], summary, start, bool(gap))
+        summary = summarize_turns(summary, pending, self.summary_max_chars)
+        self.compactions += 1
+        self.summarized_messages += len(pending)
+        return CompactedHistory(messages[cut:], summary, start, True)
+
+    def stats(self) -> Dict[str, object]:
+        """Devuelve los presupuestos y los mensajes resumidos."""
+        return {
+            "enabled": self.enabled,
+            "budgets": dict(self.budgets),
+            "compactions": self.compactions,
+            "summarized_messages": self.summarized_messages,
+            "gaps": self.gaps,
+            "lost_messages": self.lost_messages,
+        }
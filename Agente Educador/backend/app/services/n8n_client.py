@@ -0,0 +1,485 @@
+"""
+Cliente HTTP del webhook de n8n que genera las respuestas del chat.
+
+Se usa un único `httpx.AsyncClient` compartido por toda la aplicación, creado
+en el arranque y cerrado al apagar: las conexiones se reutilizan con
+keep-alive en lugar de abrir una conexión TCP por mensaje.
+"""
+import asyncio
+import json
+import random
+import time
+from collections import deque
+from typing import Any, AsyncIterator, Awaitable, Callable, Deque, Dict, Optional, Tuple, TypeVar
+
+import httpx
+
+from app.core.logging_config import get_logger
+from config import settings
+
+logger = get_logger(__name__)
+
+T = TypeVar("T")
+
+
+class N8NError(Exception):
+    """Se lanza cuando el webhook de n8n no devuelve una respuesta utilizable."""
+
+
+class N8NClient:
+    """
+    Cliente asíncrono con pool de conexiones para el webhook de n8n.
+
+    - Pool y keep-alive: `max_connections` conexiones como máximo, de las que
+      `max_keepalive` se mantienen abiertas hasta `keepalive_expiry` segundos.
+    - Tiempos de espera por fase (conexión, escritura, lectura y espera de
+      una conexión libre del pool).
+    - Reintentos acotados con backoff exponencial y jitter completo, solo
+      ante errores en los que la solicitud no llegó a procesarse (fallo de
+      conexión o del pool) o el upstream indica saturación (429, 502-504).
+      Un timeout de lectura no se reintenta: n8n puede seguir generando la
+      respuesta y reintentar duplicaría la carga.
+    - Un semáforo limita las solicitudes simultáneas al upstream.
+    - Cobertura (hedging) opcional: si no llega respuesta (o, en streaming,
+      el primer fragmento) en el percentil `hedge_percentile` de las
+      latencias recientes, se lanza un duplicado, se usa el primero que
+      responda y se cancela el otro. Un presupuesto tipo cubo de fichas
+      limita los duplicados a la fracción `hedge_budget` del tráfico.
+    """
+
+    RETRYABLE_STATUS = frozenset({429, 502, 503, 504})
+    # Un RemoteProtocolError no se reintenta: la conexión puede cortarse
+    # después de que n8n haya procesado el POST y repetirlo lo duplicaría.
+    RETRYABLE_ERRORS = (httpx.ConnectError, httpx.ConnectTimeout, httpx.PoolTimeout)
+    STREAM_ACCEPT = "text/event-stream, application/x-ndjson, application/json"
+    TEXT_FIELDS = ("content", "text", "response", "reply", "output")
+    HEDGE_BURST = 10.0  # Duplicados que se pueden acumular tras un periodo tranquilo
+
+    def __init__(
+        self,
+        url: str,
+        api_key: str = "",
+        max_connections: int = 100,
+        max_keepalive: int = 20,
+        keepalive_expiry: float = 30.0,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 20.0,
+        write_timeout: float = 5.0,
+        pool_timeout: float = 2.0,
+        max_retries: int = 2,
+        retry_backoff: float = 0.2,
+        max_concurrency: int = 64,
+        hedge_enabled: bool = False,
+        hedge_percentile: float = 95.0,
+        hedge_budget: float = 0.05,
+        hedge_min_samples: int = 20,
+        hedge_min_delay: float = 0.1,
+        hedge_samples: int = 200,
+        transport: Optional[httpx.AsyncBaseTransport] = None
+    ):
+        """
+        Inicializa el cliente (la conexión se crea en `start`).
+
+        Args:
+            url: URL del webhook de n8n
+            api_key: Clave enviada en el encabezado `X-N8N-API-KEY`, si existe
+            max_connections: Conexiones simultáneas máximas del pool
+            max_keepalive: Conexiones inactivas que se mantienen abiertas
+            keepalive_expiry: Segundos que se conserva una conexión inactiva
+            connect_timeout: Tiempo máximo para establecer la conexión
+            read_timeout: Tiempo máximo de espera de la respuesta
+            write_timeout: Tiempo máximo para enviar la solicitud
+            pool_timeout: Tiempo máximo de espera de una conexión libre
+            max_retries: Reintentos tras el primer intento
+            retry_backoff: Base en segundos del backoff exponencial
+            max_concurrency: Solicitudes simultáneas máximas al upstream
+            hedge_enabled: Si se lanzan solicitudes duplicadas ante respuestas lentas
+            hedge_percentile: Percentil de la latencia reciente tras el que se duplica
+            hedge_budget: Fracción máxima de solicitudes que pueden duplicarse
+            hedge_min_samples: Latencias necesarias antes de empezar a duplicar
+            hedge_min_delay: Espera mínima en segundos antes de duplicar
+            hedge_samples: Latencias recientes que se conservan
+            transport: Transporte alternativo (pruebas y benchmarks)
+        """
+        self.url = url
+        self.api_key = api_key
+        self.limits = httpx.Limits(
+            max_connections=max_connections,
+            max_keepalive_connections=max_keepalive,
+            keepalive_expiry=keepalive_expiry
+        )
+        self.timeout = httpx.Timeout(
+            connect=connect_timeout,
+            read=read_timeout,
+            write=write_timeout,
+            pool=pool_timeout
+        )
+        self.max_retries = max_retries
+        self.retry_backoff = retry_backoff
+        self.max_concurrency = max_concurrency
+        self.transport = transport
+        self._client: Optional[httpx.AsyncClient] = None
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self.in_flight = 0
+        self.requests = 0
+        self.retries = 0
+        self.failures = 0
+        self.total_latency = 0.0
+        self.hedge_enabled = hedge_enabled
+        self.hedge_percentile = hedge_percentile
+        self.hedge_budget = hedge_budget
+        self.hedge_min_samples = hedge_min_samples
+        self.hedge_min_delay = hedge_min_delay
+        # Latencias de los intentos correctos: respuesta completa o primer fragmento
+        self._samples: Dict[str, Deque[float]] = {
+            "post": deque(maxlen=hedge_samples),
+            "stream": deque(maxlen=hedge_samples),
+        }
+        self._hedge_tokens = 0.0
+        self.hedge_eligible = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+
+    @property
+    def started(self) -> bool:
+        return self._client is not None
+
+    async def start(self) -> None:
+        """Crea el cliente HTTP compartido."""
+        if self._client is None:
+            headers = {"X-N8N-API-KEY": self.api_key} if self.api_key else {}
+            self._client = httpx.AsyncClient(
+                limits=self.limits,
+                timeout=self.timeout,
+                headers=headers,
+                transport=self.transport
+            )
+
+    async def close(self) -> None:
+        """Cierra el cliente HTTP y sus conexiones."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def _backoff(self, attempt: int) -> float:
+        # Jitter completo: evita que los reintentos de muchos clientes coincidan
+        return random.uniform(0, self.retry_backoff * (2 ** attempt))
+
+    async def post(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        """
+        Envía un mensaje al webhook y devuelve el JSON de respuesta.
+
+        Args:
+            payload: Cuerpo JSON de la solicitud
+
+        Returns:
+            Dict[str, Any]: Respuesta decodificada del webhook
+
+        Raises:
+            N8NError: Si el cliente no está iniciado o se agotan los reintentos
+        """
+        if self._client is None:
+            raise N8NError("El cliente de n8n no está iniciado")
+        if not self.hedge_enabled:
+            return await self._post_once(payload)
+        return await self._hedged("post", lambda: self._post_once(payload))
+
+    async def _post_once(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            start = time.perf_counter()
+            try:
+                data = await self._post_with_retries(payload)
+                self._samples["post"].append(time.perf_counter() - start)
+                return data
+            except N8NError:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.total_latency += time.perf_counter() - start
+
+    async def _post_with_retries(self, payload: Dict[str, Any]) -> Dict[str, Any]:
+        for attempt in range(self.max_retries + 1):
+            last_attempt = attempt == self.max_retries
+            try:
+                response = await self._client.post(self.url, json=payload)
+            except self.RETRYABLE_ERRORS as e:
+                if last_attempt:
+                    raise N8NError(f"No se pudo contactar con n8n: {e!r}") from e
+            except httpx.HTTPError as e:
+                raise N8NError(f"Error de comunicación con n8n: {e!r}") from e
+            else:
+                if response.status_code in self.RETRYABLE_STATUS and not last_attempt:
+                    logger.debug(f"n8n respondió {response.status_code}, reintentando")
+                elif response.is_success:
+                    try:
+                        return response.json()
+                    except ValueError as e:
+                        raise N8NError("n8n devolvió una respuesta que no es JSON") from e
+                else:
+                    raise N8NError(f"n8n respondió con el estado {response.status_code}")
+
+            self.retries += 1
+            await asyncio.sleep(self._backoff(attempt))
+
+        raise N8NError("Reintentos agotados")  # pragma: no cover
+
+    def _hedge_delay(self, kind: str) -> Optional[float]:
+        """Espera antes de duplicar, o None si aún no hay latencias suficientes."""
+        samples = self._samples[kind]
+        if len(samples) < self.hedge_min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.hedge_percentile / 100))
+        return max(self.hedge_min_delay, ordered[index])
+
+    async def _hedged(
+        self,
+        kind: str,
+        attempt: Callable[[], Awaitable[T]],
+        discard: Optional[Callable[[T], Awaitable[None]]] = None
+    ) -> T:
+        """
+        Ejecuta `attempt` y, si tarda más que el percentil configurado, un duplicado.
+
+        Args:
+            kind: Tipo de latencia que se usa para decidir ("post" o "stream")
+            attempt: Función que realiza un intento completo
+            discard: Libera el resultado del intento perdedor, si terminó
+
+        Returns:
+            El resultado del primer intento correcto
+        """
+        self.hedge_eligible += 1
+        self._hedge_tokens = min(self.HEDGE_BURST, self._hedge_tokens + self.hedge_budget)
+        delay = self._hedge_delay(kind)
+        primary = asyncio.ensure_future(attempt())
+        tasks = {primary}
+        try:
+            if delay is not None:
+                done, _ = await asyncio.wait(tasks, timeout=delay)
+                if not done and self._hedge_tokens >= 1:
+                    self._hedge_tokens -= 1
+                    self.hedges += 1
+                    tasks.add(asyncio.ensure_future(attempt()))
+
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                succeeded = [task for task in done if task.exception() is None]
+                if not succeeded:
+                    error = next(iter(done)).exception()
+                    continue  # Esperar al otro intento, si queda
+                winner = primary if primary in succeeded else succeeded[0]
+                if winner is not primary:
+                    self.hedge_wins += 1
+                for other in succeeded:
+                    if other is not winner and discard is not None:
+                        await discard(other.result())
+                return winner.result()
+            raise error
+        finally:
+            for task in tasks | {primary}:
+                if not task.done():
+                    task.cancel()
+
+    @classmethod
+    def extract_text(cls, data: Any) -> Optional[str]:
+        """
+        Obtiene el texto de un objeto devuelto por n8n.
+
+        Args:
+            data: Objeto JSON decodificado
+
+        Returns:
+            Optional[str]: Texto encontrado o None
+        """
+        if isinstance(data, dict):
+            for field in cls.TEXT_FIELDS:
+                value = data.get(field)
+                if isinstance(value, str):
+                    return value
+        return None
+
+    @classmethod
+    def _parse_line(cls, line: str, content_type: str) -> Optional[str]:
+        if "event-stream" in content_type:
+            if not line.startswith("data:"):
+                return None
+            line = line[5:].strip()
+            if line == "[DONE]":
+                return None
+        elif not line.strip():
+            return None
+        try:
+            data = json.loads(line)
+        except ValueError:
+            return line
+        if isinstance(data, dict) and data.get("type") in ("begin", "end"):
+            return None  # Marcas de inicio y fin de los flujos de n8n
+        return cls.extract_text(data)
+
+    async def stream(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        """
+        Envía un mensaje al webhook y devuelve el texto a medida que llega.
+
+        Acepta respuestas SSE (`data: ...`), JSON por líneas (el formato de
+        streaming de n8n) o un único JSON, que se entrega como un solo
+        fragmento. Solo se reintenta mientras no se haya recibido nada, y la
+        cobertura, si está activa, se decide con el primer fragmento.
+
+        Args:
+            payload: Cuerpo JSON de la solicitud
+
+        Yields:
+            str: Fragmentos de texto de la respuesta
+
+        Raises:
+            N8NError: Si el cliente no está iniciado o el upstream falla
+        """
+        if self._client is None:
+            raise N8NError("El cliente de n8n no está iniciado")
+        if not self.hedge_enabled:
+            chunks = self._stream_once(payload)
+            try:
+                async for chunk in chunks:
+                    yield chunk
+            finally:
+                await chunks.aclose()  # Libera el semáforo y la conexión aunque se abandone
+            return
+
+        chunks, first = await self._hedged(
+            "stream", lambda: self._open_stream(payload), discard=lambda opened: opened[0].aclose()
+        )
+        try:
+            if first is not None:
+                yield first
+                async for chunk in chunks:
+                    yield chunk
+        finally:
+            await chunks.aclose()
+
+    async def _open_stream(self, payload: Dict[str, Any]) -> Tuple[AsyncIterator[str], Optional[str]]:
+        """Inicia una respuesta transmitida y espera su primer fragmento."""
+        chunks = self._stream_once(payload)
+        try:
+            return chunks, await chunks.__anext__()
+        except StopAsyncIteration:
+            return chunks, None
+        except BaseException:
+            await chunks.aclose()
+            raise
+
+    async def _stream_once(self, payload: Dict[str, Any]) -> AsyncIterator[str]:
+        async with self._semaphore:
+            self.in_flight += 1
+            self.requests += 1
+            start = time.perf_counter()
+            try:
+                for attempt in range(self.max_retries + 1):
+                    last_attempt = attempt == self.max_retries
+                    request = self._client.build_request(
+                        "POST", self.url, json=payload, headers={"Accept": self.STREAM_ACCEPT}
+                    )
+                    try:
+                        response = await self._client.send(request, stream=True)
+                    except self.RETRYABLE_ERRORS as e:
+                        if last_attempt:
+                            raise N8NError(f"No se pudo contactar con n8n: {e!r}") from e
+                    except httpx.HTTPError as e:
+                        raise N8NError(f"Error de comunicación con n8n: {e!r}") from e
+                    else:
+                        try:
+                            if response.status_code in self.RETRYABLE_STATUS and not last_attempt:
+                                logger.debug(f"n8n respondió {response.status_code}, reintentando")
+                            elif not response.is_success:
+                                raise N8NError(f"n8n respondió con el estado {response.status_code}")
+                            else:
+                                first = True
+                                async for chunk in self._iter_text(response):
+                                    if first:
+                                        first = False
+                                        self._samples["stream"].append(time.perf_counter() - start)
+                                    yield chunk
+                                return
+                        finally:
+                            await response.aclose()
+
+                    self.retries += 1
+                    await asyncio.sleep(self._backoff(attempt))
+            except N8NError:
+                self.failures += 1
+                raise
+            finally:
+                self.in_flight -= 1
+                self.total_latency += time.perf_counter() - start
+
+    async def _iter_text(self, response: httpx.Response) -> AsyncIterator[str]:
+        content_type = response.headers.get("content-type", "")
+        try:
+            if content_type.startswith("application/json"):
+                text = self.extract_text(json.loads(await response.aread()))
+                if text:
+                    yield text
+                return
+            async for line in response.aiter_lines():
+                text = self._parse_line(line, content_type)
+                if text:
+                    yield text
+        except httpx.HTTPError as e:
+            raise N8NError(f"Se interrumpió la respuesta de n8n: {e!r}") from e
+        except ValueError as e:
+            raise N8NError("n8n devolvió una respuesta que no es JSON") from e
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve métricas de uso del cliente."""
+        return {
+            "started": self.started,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "requests": self.requests,
+            "retries": self.retries,
+            "failures": self.failures,
+            "avg_latency_ms": round(self.total_latency / self.requests * 1000, 2) if self.requests else 0.0,
+            "hedging": self.hedge_stats(),
+        }
+
+    def hedge_stats(self) -> Dict[str, Any]:
+        """Devuelve la tasa de duplicados y cuántos respondieron antes que el original."""
+        delays = {kind: self._hedge_delay(kind) for kind in self._samples}
+        return {
+            "enabled": self.hedge_enabled,
+            "eligible": self.hedge_eligible,
+            "hedges": self.hedges,
+            "wins": self.hedge_wins,
+            "hedge_rate": round(self.hedges / self.hedge_eligible, 4) if self.hedge_eligible else 0.0,
+            "win_rate": round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            "delay_ms": {
+                kind: round(delay * 1000, 2) if delay is not None else None
+                for kind, delay in delays.items()
+            },
+        }
+
+
+# Instancia global del cliente de n8n
+n8n_client = N8NClient(
+    url=settings.N8N_WEBHOOK_URL,
+    api_key=settings.N8N_API_KEY,
+    max_connections=settings.N8N_MAX_CONNECTIONS,
+    max_keepalive=settings.N8N_MAX_KEEPALIVE,
+    keepalive_expiry=settings.N8N_KEEPALIVE_EXPIRY,
+    connect_timeout=settings.N8N_CONNECT_TIMEOUT,
+    read_timeout=settings.N8N_READ_TIMEOUT,
+    write_timeout=settings.N8N_WRITE_TIMEOUT,
+    pool_timeout=settings.N8N_POOL_TIMEOUT,
+    max_retries=settings.N8N_MAX_RETRIES,
+    retry_backoff=settings.N8N_RETRY_BACKOFF,
+    max_concurrency=settings.N8N_MAX_CONCURRENCY,
+    hedge_enabled=settings.N8N_HEDGE_ENABLED,
+    hedge_percentile=settings.N8N_HEDGE_PERCENTILE,
+    hedge_budget=settings.N8N_HEDGE_BUDGET,
+    hedge_min_samples=settings.N8N_HEDGE_MIN_SAMPLES,
+    hedge_min_delay=settings.N8N_HEDGE_MIN_DELAY
+)
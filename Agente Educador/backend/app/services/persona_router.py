@@ -0,0 +1,263 @@
+"""
+Enrutado de mensajes a los roles de CORTANA.
+
+Cada rol descrito en CORTANA.md (Mentor Matemático, Narrador Histórico,
+Doctor Imaginario...) tiene palabras clave y una plantilla de instrucciones
+para n8n. Las palabras clave de todos los roles se compilan una sola vez en
+un autómata de Aho–Corasick, de modo que clasificar un mensaje cuesta un
+recorrido del texto normalizado.
+"""
+import time
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.core.automaton import KeywordAutomaton
+from app.core.text import fold_text
+
+
+class Persona(NamedTuple):
+    """Rol del asistente con sus palabras clave y su plantilla de instrucciones."""
+    id: str
+    name: str
+    prompt: str
+    keywords: Tuple[str, ...]
+
+    def render_prompt(self, age_group: str) -> str:
+        """Instrucciones del rol para un grupo de edad."""
+        return self.prompt.format(age_group=age_group)
+
+
+class RoutingDecision(NamedTuple):
+    """Resultado de enrutar un mensaje."""
+    persona: Persona
+    reason: str  # "keywords", "previous" o "default"
+    keywords: Tuple[str, ...]
+    latency_us: float
+
+    def as_context(self) -> Dict[str, object]:
+        """Datos de la decisión para el contexto de la conversación."""
+        return {
+            "persona": self.persona.id,
+            "reason": self.reason,
+            "keywords": list(self.keywords),
+            "latency_us": round(self.latency_us, 2),
+        }
+
+
+DEFAULT_PERSONA = Persona(
+    id="cortana",
+    name="CORTANA",
+    prompt=(
+        "Eres CORTANA, una asistente educativa para niños de {age_group} años. "
+        "Responde con cariño, frases cortas y ejemplos cercanos."
+    ),
+    keywords=()
+)
+
+# Roles de CORTANA.md. Las palabras clave se normalizan como los mensajes
+# (sin tildes salvo la ñ y en minúsculas); las que terminan en `*` son raíces.
+PERSONAS: Tuple[Persona, ...] = (
+    Persona(
+        id="mentor_matematico",
+        name="Mentor Matemático",
+        prompt=(
+            "Eres el Mentor Matemático de CORTANA. Haz las matemáticas divertidas para niños "
+            "de {age_group} años: usa juegos de lógica, retos numéricos y ejemplos de la vida diaria."
+        ),
+        keywords=(
+            "matematica*", "numero*", "suma*", "sumar", "resta*", "restar", "multiplic*",
+            "dividir", "division*", "fraccion*", "decimal*", "geometri*", "algebra", "ecuacion*",
+            "calculo*", "calcular", "porcentaje*", "triangulo*", "cuadrado*", "circulo*",
+            "tabla de multiplicar", "tablas de multiplicar", "cuanto es", "cuantos son",
+            "par", "impar", "mitad", "doble",
+        )
+    ),
+    Persona(
+        id="narrador_historico",
+        name="Narrador Histórico",
+        prompt=(
+            "Eres el Narrador Histórico de CORTANA. Cuenta la historia a niños de {age_group} años "
+            "como un relato emocionante, con personajes y viajes en el tiempo."
+        ),
+        keywords=(
+            "historia", "historic*", "prehistori*", "antigu*", "guerra*", "imperio*", "rey", "reyes",
+            "reina*", "faraon*", "egipt*", "roma", "romano*", "grecia", "griego*", "edad media",
+            "castillo*", "caballero*", "colon", "independencia", "civilizacion*", "azteca*",
+            "maya*", "inca*", "piramide*", "vikingo*", "conquista*", "revolucion*",
+        )
+    ),
+    Persona(
+        id="doctor_imaginario",
+        name="Doctor Imaginario",
+        prompt=(
+            "Eres el Doctor Imaginario de CORTANA. Enseña hábitos saludables a niños de "
+            "{age_group} años jugando a la consulta médica; ante algo serio, pide avisar a un adulto."
+        ),
+        keywords=(
+            "doctor*", "doctora*", "medic*", "salud*", "enferm*", "duele", "dolor*", "herida*",
+            "vacuna*", "hueso*", "corazon*", "diente*", "higiene", "lavar las manos",
+            "lavarse las manos", "primeros auxilios", "comer sano", "alimentacion", "vitamina*",
+            "fiebre", "resfriado*", "gripe", "tos", "cuerpo humano", "dormir",
+        )
+    ),
+    Persona(
+        id="cientifico_curioso",
+        name="Científico Curioso",
+        prompt=(
+            "Eres el Científico Curioso de CORTANA. Despierta la curiosidad de niños de "
+            "{age_group} años con experimentos seguros, preguntas y observación de la naturaleza."
+        ),
+        keywords=(
+            "ciencia*", "cientific*", "experiment*", "planeta*", "estrella*", "espacio", "universo",
+            "luna", "sol", "volcan*", "dinosaurio*", "animal*", "planta*", "fotosintesis", "atomo*",
+            "quimic*", "fisica", "biologi*", "iman*", "electricidad", "magnet*", "clima", "lluvia",
+            "arcoiris", "mariposa*", "insecto*", "oceano*", "agua", "gravedad", "tierra",
+        )
+    ),
+    Persona(
+        id="coach_deportivo",
+        name="Coach Deportivo",
+        prompt=(
+            "Eres el Coach Deportivo de CORTANA. Anima a niños de {age_group} años a moverse, "
+            "explica reglas de deportes y propone ejercicios seguros y en equipo."
+        ),
+        keywords=(
+            "deporte*", "deportiv*", "futbol", "baloncesto", "basquet*", "natacion", "nadar",
+            "correr", "ejercicio*", "gimnasia", "balon*", "pelota*", "olimpi*", "entrenar",
+            "entrenamiento*", "saltar", "bicicleta*", "yoga", "tenis", "equipo deportivo",
+        )
+    ),
+    Persona(
+        id="arquitecto_de_juegos",
+        name="Arquitecto de Juegos",
+        prompt=(
+            "Eres el Arquitecto de Juegos de CORTANA. Propón a niños de {age_group} años "
+            "acertijos, rompecabezas y retos de memoria, y ayúdales a diseñar sus propios juegos."
+        ),
+        keywords=(
+            "juego de mesa", "juegos de mesa", "acertijo*", "adivinanza*", "rompecabezas",
+            "puzzle*", "memoria", "sudoku*", "crucigrama*", "laberinto*", "domino", "ajedrez",
+            "trivia", "reto*", "desafio*",
+        )
+    ),
+    Persona(
+        id="guia_espiritual",
+        name="Guía Espiritual Infantil",
+        prompt=(
+            "Eres la Guía Espiritual Infantil de CORTANA. Acompaña a niños de {age_group} años "
+            "a reconocer sus emociones y a cultivar valores como la gratitud y el respeto."
+        ),
+        keywords=(
+            "valores", "gratitud", "agradec*", "emocion*", "triste*", "miedo*", "enojad*",
+            "enfadad*", "feliz", "amistad", "respeto", "honest*", "bondad", "compartir",
+            "moraleja*", "sentimiento*", "me siento", "perdon*", "solidari*", "empatia",
+            "preocupad*", "nervios*",
+        )
+    ),
+    Persona(
+        id="guardian_digital",
+        name="Guardián de Seguridad Digital",
+        prompt=(
+            "Eres el Guardián de Seguridad Digital de CORTANA. Enseña a niños de {age_group} años "
+            "a navegar seguros por internet, proteger sus datos y pedir ayuda a un adulto."
+        ),
+        keywords=(
+            "internet", "contraseña*", "password*", "redes sociales", "red social", "ciberacoso",
+            "ciberseguridad", "privacidad", "virus informatico", "hacker*", "en linea", "online",
+            "desconocido*", "datos personales", "correo electronico", "youtube", "tiktok",
+            "instagram", "whatsapp", "seguridad digital", "pantalla*",
+        )
+    ),
+    Persona(
+        id="explorador_de_videojuegos",
+        name="Explorador de Videojuegos",
+        prompt=(
+            "Eres el Explorador de Videojuegos de CORTANA. Recomienda a niños de {age_group} años "
+            "juegos educativos y convierte lo que juegan en retos de aprendizaje."
+        ),
+        keywords=(
+            "videojuego*", "minecraft", "roblox", "fortnite", "nintendo", "consola*",
+            "playstation", "xbox", "mario", "pokemon", "zelda", "gamer*",
+        )
+    ),
+    Persona(
+        id="moderador_de_roles",
+        name="Moderador de Roles",
+        prompt=(
+            "Eres el Moderador de Roles de CORTANA. Organiza con niños de {age_group} años "
+            "juegos de rol y simulaciones de profesiones en las que aprendan colaborando."
+        ),
+        keywords=(
+            "juego de rol", "juegos de rol", "jugar a ser", "profesion*", "bombero*", "policia*",
+            "veterinari*", "cocinero*", "chef", "astronauta*", "simula*", "imagina que",
+            "hagamos de cuenta",
+        )
+    ),
+)
+
+
+class PersonaRouter:
+    """
+    Asigna a cada mensaje el rol de CORTANA que mejor le corresponde.
+
+    Gana el rol con más palabras clave encontradas (las frases de varias
+    palabras cuentan por cada palabra); los empates se resuelven por el orden
+    de los roles. Si no hay ninguna, se mantiene el rol anterior de la
+    conversación o, sin él, el rol general.
+    """
+
+    def __init__(self, personas: Iterable[Persona] = PERSONAS, default: Persona = DEFAULT_PERSONA):
+        """
+        Compila las palabras clave de todos los roles.
+
+        Args:
+            personas: Roles disponibles, en orden de prioridad
+            default: Rol cuando no hay coincidencias ni rol anterior
+        """
+        self.personas = tuple(personas)
+        self.default = default
+        self._by_id = {persona.id: persona for persona in (default,) + self.personas}
+        self._automaton = KeywordAutomaton(
+            (fold_text(keyword), rank)
+            for rank, persona in enumerate(self.personas)
+            for keyword in persona.keywords
+        )
+
+    def get(self, persona_id: Optional[str]) -> Optional[Persona]:
+        """Rol con el identificador indicado, si existe."""
+        return self._by_id.get(persona_id) if persona_id else None
+
+    def route(self, message: str, previous: Optional[str] = None) -> RoutingDecision:
+        """
+        Elige el rol para un mensaje.
+
+        Args:
+            message: Mensaje del usuario
+            previous: Rol asignado en el turno anterior, si lo hubo
+
+        Returns:
+            RoutingDecision: Rol elegido, motivo, palabras clave y latencia
+        """
+        start = time.perf_counter()
+        matches = self._automaton.search(fold_text(message))
+        if matches:
+            scores: List[int] = [0] * len(self.personas)
+            for match in matches:
+                scores[match.value] += match.keyword.count(" ") + 1
+            best = max(range(len(scores)), key=lambda rank: (scores[rank], -rank))
+            persona = self.personas[best]
+            keywords = tuple(dict.fromkeys(m.keyword for m in matches if m.value == best))
+            reason = "keywords"
+        else:
+            persona = self.get(previous) or self.default
+            keywords = ()
+            reason = "previous" if persona is not self.default else "default"
+        return RoutingDecision(persona, reason, keywords, (time.perf_counter() - start) * 1e6)
+
+    def stats(self) -> Dict[str, int]:
+        """Tamaño del autómata compilado."""
+        return {"personas": len(self.personas), "keywords": self._automaton.keywords,
+                "states": self._automaton.states}
+
+
+# Instancia global: el autómata se compila una sola vez al arrancar
+persona_router = PersonaRouter()
@@ -0,0 +1,292 @@
+"""
+Filtro de seguridad infantil para los mensajes del chat.
+
+Todas las expresiones de la lista de bloqueo se compilan en un único
+autómata de Aho–Corasick, de modo que revisar un mensaje cuesta un recorrido
+del texto normalizado sea cual sea el tamaño de la lista. La normalización
+elimina tildes (salvo la ñ), deshace el leetspeak (`m4t4r`, `put@`), los
+separadores dentro de las palabras (`p.u.t.a`) y las letras repetidas
+(`idiotaaa`). La lista se recarga sola cuando cambia el archivo.
+"""
+import asyncio
+import os
+import re
+from typing import Dict, Iterable, List, NamedTuple, Optional, Tuple
+
+from app.core.automaton import KeywordAutomaton
+from app.core.logging_config import get_logger
+from app.core.text import fold_text
+from config import settings
+
+logger = get_logger(__name__)
+
+_LEETSPEAK = {"0": "o", "1": "i", "3": "e", "4": "a", "5": "s", "7": "t", "@": "a", "$": "s"}
+_LEET_CHAR = re.compile("[" + re.escape("".join(_LEETSPEAK)) + "]")
+_SEPARATOR = re.compile(r"(?<=\w)[._\-*](?=\w)")
+_REPEATED = re.compile(r"(\w)\1+")
+
+
+def normalize(text: str) -> str:
+    """
+    Normaliza un texto para compararlo con la lista de bloqueo.
+
+    Args:
+        text: Texto original
+
+    Returns:
+        str: Texto sin tildes, en minúsculas, sin leetspeak, sin separadores
+        dentro de las palabras y sin letras repetidas
+    """
+    text = fold_text(text)
+    text = _LEET_CHAR.sub(lambda match: _LEETSPEAK[match.group()], text)
+    text = _SEPARATOR.sub("", text)
+    return _REPEATED.sub(r"\1", text)
+
+
+class SafetyVerdict(NamedTuple):
+    """Resultado de revisar un texto."""
+    blocked: bool
+    categories: Tuple[str, ...] = ()
+    terms: Tuple[str, ...] = ()
+
+
+CLEAN = SafetyVerdict(False)
+
+
+def parse_blocklist(lines: Iterable[str]) -> Dict[str, List[str]]:
+    """
+    Lee una lista de bloqueo con secciones `[categoría]`.
+
+    Args:
+        lines: Líneas del archivo; se ignoran las vacías y los comentarios (`#`)
+
+    Returns:
+        Dict[str, List[str]]: Expresiones por categoría
+
+    Raises:
+        ValueError: Si hay expresiones antes de la primera categoría
+    """
+    terms: Dict[str, List[str]] = {}
+    category: Optional[str] = None
+    for number, raw in enumerate(lines, 1):
+        line = raw.strip()
+        if not line or line.startswith("#"):
+            continue
+        if line.startswith("[") and line.endswith("]"):
+            category = line[1:-1].strip()
+            terms.setdefault(category, [])
+        elif category is None:
+            raise ValueError(f"Línea {number}: expresión fuera de una [categoría]")
+        else:
+            terms[category].append(line)
+    return terms
+
+
+class StreamGuard:
+    """
+    Revisa una respuesta transmitida antes de entregarla.
+
+    El texto solo se libera por palabras completas y cada tramo se revisa
+    junto con el final del texto ya liberado, para detectar expresiones de
+    varias palabras que quedan partidas entre fragmentos.
+    """
+
+    def __init__(self, safety: "SafetyFilter"):
+        self.safety = safety
+        self.pending = ""
+        self.tail = ""
+        self.verdict = CLEAN
+
+    def _release(self, text: str) -> Optional[str]:
+        verdict = self.safety.check(self.tail + text)
+        if verdict.blocked:
+            self.verdict = verdict
+            return None
+        tail = self.tail + text
+        if len(tail) > 2 * self.safety.max_term_length:
+            # Conservar solo palabras completas para no crear falsos inicios de palabra
+            tail = tail[-2 * self.safety.max_term_length:]
+            space = tail.find(" ")
+            tail = tail[space + 1:] if space >= 0 else ""
+        self.tail = tail
+        return text
+
+    def feed(self, chunk: str) -> Optional[str]:
+        """
+        Añade un fragmento y devuelve el texto que ya se puede entregar.
+
+        Returns:
+            Optional[str]: Texto revisado (puede estar vacío), o None si está bloqueado
+        """
+        if self.verdict.blocked:
+            return None
+        self.pending += chunk
+        cut = max(self.pending.rfind(" "), self.pending.rfind("\n"))
+        if cut < 0:
+            return ""
+        ready, self.pending = self.pending[:cut + 1], self.pending[cut + 1:]
+        return self._release(ready)
+
+    def flush(self) -> Optional[str]:
+        """Revisa y devuelve el texto pendiente al terminar, o None si está bloqueado."""
+        if self.verdict.blocked:
+            return None
+        ready, self.pending = self.pending, ""
+        return self._release(ready) if ready else ""
+
+
+class SafetyFilter:
+    """
+    Filtro de contenido basado en una lista de bloqueo configurable.
+
+    La lista se lee de `path` (o se indica con `set_terms`) y se compila en un
+    autómata que se sustituye de una vez, de modo que una recarga nunca deja
+    a medias una revisión en curso. `start` lanza una tarea que recarga el
+    archivo cuando cambia su fecha de modificación; si la nueva lista no es
+    válida se conserva la anterior.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        terms: Optional[Dict[str, Iterable[str]]] = None,
+        reload_interval: float = 5.0,
+        enabled: bool = True
+    ):
+        """
+        Inicializa el filtro.
+
+        Args:
+            path: Archivo de la lista de bloqueo
+            terms: Expresiones por categoría (alternativa a `path`)
+            reload_interval: Segundos entre comprobaciones de cambios del archivo
+            enabled: Si es False, todos los textos se dan por buenos
+        """
+        self.path = path
+        self.reload_interval = reload_interval
+        self.enabled = enabled
+        self._automaton: KeywordAutomaton = KeywordAutomaton([])
+        self._mtime: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+        self.terms = 0
+        self.categories: Tuple[str, ...] = ()
+        self.max_term_length = 0
+        self.reloads = 0
+        self.reload_errors = 0
+        self.checks = 0
+        self.blocked = 0
+        if terms is not None:
+            self.set_terms(terms)
+        elif path is not None:
+            self.load()
+
+    def set_terms(self, terms: Dict[str, Iterable[str]]) -> None:
+        """
+        Compila y activa una nueva lista de bloqueo.
+
+        Args:
+            terms: Expresiones por categoría
+        """
+        entries = []
+        for category, expressions in terms.items():
+            for expression in expressions:
+                stem = expression.endswith("*")
+                pattern = normalize(expression.rstrip("*"))
+                if pattern:
+                    entries.append((pattern + ("*" if stem else ""), category))
+        automaton = KeywordAutomaton(entries)
+        # Sustitución atómica: las revisiones en curso terminan con el autómata anterior
+        self._automaton = automaton
+        self.terms = automaton.keywords
+        self.categories = tuple(terms)
+        self.max_term_length = max((len(pattern) for pattern, _ in entries), default=0) + 1
+        self.reloads += 1
+
+    def load(self) -> bool:
+        """
+        Vuelve a leer el archivo si ha cambiado.
+
+        Returns:
+            bool: True si se cargó una nueva lista
+        """
+        try:
+            mtime = os.stat(self.path).st_mtime
+            if mtime == self._mtime:
+                return False
+            with open(self.path, encoding="utf-8") as f:
+                terms = parse_blocklist(f)
+        except (OSError, ValueError) as e:
+            self.reload_errors += 1
+            logger.error(f"No se pudo cargar la lista de bloqueo {self.path}: {e}")
+            return False
+        self.set_terms(terms)
+        self._mtime = mtime
+        logger.info("Lista de bloqueo cargada", extra={"path": self.path, "terms": self.terms})
+        return True
+
+    def check(self, text: str) -> SafetyVerdict:
+        """
+        Revisa un texto.
+
+        Args:
+            text: Mensaje del usuario o respuesta del asistente
+
+        Returns:
+            SafetyVerdict: Si está bloqueado y por qué categorías y expresiones
+        """
+        if not self.enabled or not text:
+            return CLEAN
+        self.checks += 1
+        matches = self._automaton.search(normalize(text))
+        if not matches:
+            return CLEAN
+        self.blocked += 1
+        return SafetyVerdict(
+            True,
+            tuple(dict.fromkeys(match.value for match in matches)),
+            tuple(dict.fromkeys(match.keyword for match in matches))
+        )
+
+    def guard(self) -> StreamGuard:
+        """Crea un revisor para una respuesta transmitida."""
+        return StreamGuard(self)
+
+    async def _watch_loop(self) -> None:
+        while True:
+            await asyncio.sleep(self.reload_interval)
+            self.load()
+
+    async def start(self) -> None:
+        """Lanza la recarga automática de la lista si se lee de un archivo."""
+        if self.path is not None and self._task is None:
+            self._task = asyncio.create_task(self._watch_loop())
+
+    async def stop(self) -> None:
+        """Detiene la recarga automática."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+
+    def stats(self) -> Dict[str, object]:
+        """Devuelve el tamaño de la lista y los textos revisados y bloqueados."""
+        return {
+            "enabled": self.enabled,
+            "terms": self.terms,
+            "categories": list(self.categories),
+            "reloads": self.reloads,
+            "reload_errors": self.reload_errors,
+            "checks": self.checks,
+            "blocked": self.blocked,
+        }
+
+
+# Instancia global del filtro de seguridad
+safety_filter = SafetyFilter(
+    path=settings.SAFETY_BLOCKLIST_PATH,
+    reload_interval=settings.SAFETY_RELOAD_INTERVAL_SECONDS,
+    enabled=settings.SAFETY_FILTER_ENABLED
+)
@@ -0,0 +1,263 @@
+"""
+Caché semántica de respuestas del chat.
+
+Complementa a la caché exacta de `ResponseCache`: "qué es fotosíntesis" y
+"explícame la fotosíntesis" no comparten clave, pero sí casi el mismo
+vector. Los vectores se calculan en local, sin ningún modelo de red,
+repartiendo con una función hash los n-gramas de caracteres de las raíces
+del mensaje en un número fijo de dimensiones. Cada grupo de edad y persona
+guarda sus vectores en una matriz contigua de NumPy, y la búsqueda es un
+único producto matriz-vector.
+
+Las negaciones, comparativos, operadores y números cambian la respuesta
+aunque apenas muevan el vector ("2 + 3" frente a "2 - 3", "es seguro" frente
+a "no es seguro"): forman la firma del mensaje y solo se reutilizan
+respuestas con la misma firma.
+"""
+import re
+import time
+import zlib
+from typing import Any, Dict, List, NamedTuple, Optional, Tuple
+
+import numpy as np
+
+from app.core.text import fold_accents, tokenize
+
+PartitionKey = Tuple[str, str]
+
+# Peso de la raíz completa frente a cada uno de sus trigramas
+WORD_WEIGHT = 2.0
+# Peso de cada operador o negación: basta uno para separar dos preguntas
+MARKER_WEIGHT = 4.0
+
+_MARKER_TOKEN = re.compile(r"\d+(?:[.,]\d+)?|[+\-*/×÷=<>^%]|\w+")
+# Palabras y signos que invierten o cambian la pregunta, con su forma canónica
+_MARKERS = {
+    "no": "no", "ni": "no", "nunca": "no", "jamas": "no", "tampoco": "no", "nada": "no", "nadie": "no",
+    "sin": "sin",
+    "mas": "+", "sumado": "+", "menos": "-", "restado": "-",
+    "por": "*", "veces": "*", "multiplicado": "*", "x": "*", "×": "*",
+    "entre": "/", "dividido": "/", "÷": "/",
+    "mayor": ">", "menor": "<", "mejor": "mejor", "peor": "peor", "igual": "=",
+    "+": "+", "-": "-", "*": "*", "/": "/", "=": "=", "<": "<", ">": ">", "^": "^", "%": "%",
+}
+
+
+def signature(text: str) -> Tuple[str, ...]:
+    """
+    Extrae en orden los números, operadores y negaciones de un mensaje.
+
+    "¿Cuánto es 2 + 3?" da ("2", "+", "3") y "cuanto es 2 por 3" da
+    ("2", "*", "3"); dos mensajes con firmas distintas nunca comparten
+    respuesta.
+
+    Args:
+        text: Mensaje del usuario
+
+    Returns:
+        Tuple[str, ...]: Marcadores canónicos del mensaje
+    """
+    markers = []
+    for token in _MARKER_TOKEN.findall(fold_accents(text).casefold()):
+        if token[0].isdigit():
+            markers.append(token.replace(",", "."))
+        elif token in _MARKERS:
+            markers.append(_MARKERS[token])
+    return tuple(markers)
+
+
+def _signature_hash(markers: Tuple[str, ...]) -> int:
+    return zlib.crc32("\x1f".join(markers).encode("utf-8"))
+
+
+def embed(text: str, dim: int = 512) -> Optional[np.ndarray]:
+    """
+    Calcula el vector normalizado de un mensaje.
+
+    Cada raíz aporta su propio rasgo y los trigramas de caracteres de
+    `<raíz>`, de modo que las variantes de una palabra quedan cerca. Los
+    marcadores de `signature` (números, operadores y negaciones) se añaden
+    como rasgos propios aunque sean palabras vacías.
+
+    Args:
+        text: Mensaje del usuario
+        dim: Dimensiones del vector
+
+    Returns:
+        Optional[np.ndarray]: Vector `float32` de norma 1, o None si el
+        mensaje no tiene palabras con contenido
+    """
+    indices: List[int] = []
+    weights: List[float] = []
+    features = []
+    for token in tokenize(text, keep_numbers=True):
+        features.append((token, WORD_WEIGHT))
+        if not token.isdigit():
+            padded = f"<{token}>"
+            features.extend((padded[i:i + 3], 1.0) for i in range(len(padded) - 2))
+    # Los números ya están entre las raíces; el resto de marcadores son palabras vacías o signos
+    features.extend((f"#{marker}", MARKER_WEIGHT) for marker in signature(text) if not marker[0].isdigit())
+    for feature, weight in features:
+            # crc32 es estable entre procesos, a diferencia de hash()
+            digest = zlib.crc32(feature.encode("utf-8"))
+            indices.append(digest % dim)
+            weights.append(weight if digest & 0x80000000 else -weight)
+    if not indices:
+        return None
+    vector = np.bincount(indices, weights=weights, minlength=dim).astype(np.float32)
+    norm = float(np.linalg.norm(vector))
+    if norm == 0.0:
+        return None
+    return vector / norm
+
+
+class SemanticMatch(NamedTuple):
+    """Respuesta encontrada y su similitud con la pregunta."""
+    text: str
+    similarity: float
+
+
+class _Partition:
+    """Vectores y respuestas de un grupo de edad y persona."""
+
+    __slots__ = ("vectors", "signatures", "texts", "created", "used", "size")
+
+    def __init__(self, capacity: int, dim: int):
+        self.vectors = np.zeros((capacity, dim), dtype=np.float32)
+        self.signatures = np.zeros(capacity, dtype=np.int64)
+        self.texts: List[Optional[str]] = [None] * capacity
+        self.created = np.zeros(capacity, dtype=np.float64)
+        self.used = np.zeros(capacity, dtype=np.float64)
+        self.size = 0
+
+
+class SemanticCache:
+    """
+    Caché de respuestas por similitud de coseno.
+
+    Cada partición tiene como mucho `capacity` respuestas; al llenarse se
+    sustituye la menos usada recientemente. Las respuestas caducan tras
+    `ttl` segundos. Solo se devuelve una respuesta si su similitud con la
+    pregunta alcanza `threshold` y su firma (ver `signature`) es la misma.
+    """
+
+    def __init__(self, threshold: float = 0.9, capacity: int = 2000, dim: int = 512, ttl: float = 3600.0):
+        """
+        Inicializa la caché.
+
+        Args:
+            threshold: Similitud de coseno mínima para reutilizar una respuesta
+            capacity: Respuestas por grupo de edad y persona
+            dim: Dimensiones de los vectores
+            ttl: Segundos de vida de cada respuesta
+        """
+        self.threshold = threshold
+        self.capacity = capacity
+        self.dim = dim
+        self.ttl = ttl
+        self._partitions: Dict[PartitionKey, _Partition] = {}
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.similarity_total = 0.0
+        self.lookup_time_total = 0.0
+
+    def get(self, message: str, age_group: str, persona: str) -> Optional[SemanticMatch]:
+        """
+        Busca la respuesta guardada más parecida a una pregunta.
+
+        Args:
+            message: Último mensaje del usuario
+            age_group: Grupo de edad
+            persona: Persona del asistente
+
+        Returns:
+            Optional[SemanticMatch]: Respuesta y similitud, o None si ninguna
+            alcanza el umbral
+        """
+        partition = self._partitions.get((age_group, persona))
+        if partition is None or not partition.size:
+            self.misses += 1
+            return None
+        start = time.perf_counter()
+        vector = embed(message, self.dim)
+        match = None
+        if vector is not None:
+            size = partition.size
+            similarities = partition.vectors[:size] @ vector
+            now = time.monotonic()
+            similarities[partition.created[:size] <= now - self.ttl] = -1.0
+            similarities[partition.signatures[:size] != _signature_hash(signature(message))] = -1.0
+            best = int(np.argmax(similarities))
+            similarity = float(similarities[best])
+            if similarity >= self.threshold:
+                partition.used[best] = now
+                match = SemanticMatch(partition.texts[best], similarity)
+        self.lookup_time_total += time.perf_counter() - start
+        if match is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self.similarity_total += match.similarity
+        return match
+
+    def set(self, message: str, age_group: str, persona: str, text: str) -> None:
+        """
+        Guarda una respuesta generada por el upstream.
+
+        Si ya hay una pregunta casi idéntica se sustituye su respuesta en lugar
+        de ocupar otra fila.
+
+        Args:
+            message: Último mensaje del usuario
+            age_group: Grupo de edad
+            persona: Persona del asistente
+            text: Respuesta del asistente
+        """
+        vector = embed(message, self.dim)
+        if vector is None:
+            return
+        key = (age_group, persona)
+        partition = self._partitions.get(key)
+        if partition is None:
+            partition = self._partitions[key] = _Partition(self.capacity, self.dim)
+        now = time.monotonic()
+        size = partition.size
+        markers = _signature_hash(signature(message))
+        slot = None
+        if size:
+            similarities = partition.vectors[:size] @ vector
+            similarities[partition.signatures[:size] != markers] = -1.0
+            best = int(np.argmax(similarities))
+            if similarities[best] >= 0.999:
+                slot = best
+        if slot is None and size < self.capacity:
+            slot = size
+            partition.size += 1
+        elif slot is None:
+            # Las caducadas tienen `used` antiguo y salen primero
+            slot = int(np.argmin(partition.used))
+            self.evictions += 1
+        partition.vectors[slot] = vector
+        partition.signatures[slot] = markers
+        partition.texts[slot] = text
+        partition.created[slot] = partition.used[slot] = now
+
+    def clear(self) -> None:
+        """Elimina todas las respuestas guardadas."""
+        self._partitions.clear()
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve el tamaño, los aciertos y la similitud media de los aciertos."""
+        lookups = self.hits + self.misses
+        return {
+            "size": sum(partition.size for partition in self._partitions.values()),
+            "partitions": len(self._partitions),
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / lookups, 4) if lookups else 0.0,
+            "evictions": self.evictions,
+            "avg_hit_similarity": round(self.similarity_total / self.hits, 4) if self.hits else 0.0,
+            "avg_lookup_us": round(self.lookup_time_total / lookups * 1e6, 2) if lookups else 0.0,
+        }
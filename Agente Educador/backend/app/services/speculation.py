@@ -0,0 +1,181 @@
+"""
+Generación especulativa de respuestas para las sugerencias del chat.
+
+Tras cada respuesta, el chat puede pedir en segundo plano las respuestas de
+las sugerencias que acaba de devolver, de modo que cuando el niño pulsa una
+ya está en la caché. Las especulaciones son trabajo de baja prioridad: tienen
+un presupuesto global, un máximo de tareas simultáneas y se cancelan en
+cuanto el tráfico real necesita la capacidad del upstream.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, Dict, Hashable, Optional
+
+from app.core.cache import TTLCache
+from app.core.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+
+class Speculator:
+    """
+    Planificador de generaciones especulativas.
+
+    El presupuesto es un cubo de fichas: cada respuesta real aporta `budget`
+    fichas (hasta `BURST`) y cada especulación consume una, de modo que a la
+    larga no hay más de `budget` especulaciones por respuesta real. Una
+    especulación que termina deja su clave en `_warmed` durante `ttl`
+    segundos; si después llega una solicitud real con esa clave se cuenta
+    como acierto.
+    """
+
+    BURST = 20.0  # Especulaciones que se pueden acumular tras un periodo tranquilo
+
+    def __init__(
+        self,
+        budget: float = 1.0,
+        max_in_flight: int = 4,
+        max_per_response: int = 3,
+        ttl: float = 3600.0,
+        on_cancel: Optional[Callable[[Hashable], Any]] = None,
+        enabled: bool = False
+    ):
+        """
+        Inicializa el planificador.
+
+        Args:
+            budget: Especulaciones permitidas por cada respuesta real
+            max_in_flight: Especulaciones simultáneas como máximo
+            max_per_response: Sugerencias que se especulan por respuesta
+            ttl: Segundos durante los que se cuenta el acierto de una especulación
+            on_cancel: Función que cancela el trabajo compartido de una clave
+            enabled: Si es False no se especula nada
+        """
+        self.budget = budget
+        self.max_in_flight = max_in_flight
+        self.max_per_response = max_per_response
+        self.on_cancel = on_cancel
+        self.enabled = enabled
+        self._tokens = min(self.BURST, budget)
+        self._tasks: Dict[Hashable, asyncio.Task] = {}
+        self._warmed = TTLCache(max_size=10000, ttl=ttl)
+        self.scheduled = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.skipped = {"budget": 0, "in_flight": 0, "load": 0}
+        self.hits = 0
+
+    def __len__(self) -> int:
+        return len(self._tasks)
+
+    def __contains__(self, key: Hashable) -> bool:
+        return key in self._tasks
+
+    def credit(self) -> None:
+        """Suma al presupuesto la parte de una respuesta real."""
+        self._tokens = min(self.BURST, self._tokens + self.budget)
+
+    def skip(self, reason: str, count: int = 1) -> None:
+        """Cuenta especulaciones descartadas antes de intentarlas."""
+        self.skipped[reason] += count
+
+    def schedule(self, key: Hashable, factory: Callable[[], Awaitable[Any]]) -> bool:
+        """
+        Lanza una especulación si hay presupuesto y hueco.
+
+        Args:
+            key: Clave de caché de la respuesta que se calienta
+            factory: Función asíncrona que genera y guarda la respuesta; su
+                resultado se considera correcto si no es None
+
+        Returns:
+            bool: True si la especulación se lanzó
+        """
+        if not self.enabled or key in self._tasks or key in self._warmed:
+            return False
+        if len(self._tasks) >= self.max_in_flight:
+            self.skipped["in_flight"] += 1
+            return False
+        if self._tokens < 1:
+            self.skipped["budget"] += 1
+            return False
+        self._tokens -= 1
+        self.scheduled += 1
+        task = asyncio.ensure_future(factory())
+        self._tasks[key] = task
+        task.add_done_callback(lambda done: self._finish(key, done))
+        return True
+
+    def _finish(self, key: Hashable, task: asyncio.Task) -> None:
+        # Las especulaciones reclamadas ya contaron su acierto
+        claimed = self._tasks.get(key) is not task
+        if not claimed:
+            del self._tasks[key]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is not None or task.result() is None:
+            self.failed += 1
+            if error is not None:
+                logger.debug(f"Especulación fallida: {error}")
+            return
+        self.completed += 1
+        if not claimed:
+            self._warmed.set(key, True)
+
+    def claim(self, key: Hashable) -> bool:
+        """
+        Registra que una solicitud real usa la respuesta de una especulación.
+
+        Una especulación en curso reclamada deja de poder cancelarse, porque
+        ya hay una solicitud real esperándola.
+
+        Returns:
+            bool: True si la clave se había especulado (acierto)
+        """
+        if key in self._tasks:
+            del self._tasks[key]
+        elif not self._warmed.delete(key):
+            return False
+        self.hits += 1
+        return True
+
+    def cancel(self, key: Hashable) -> bool:
+        """Cancela la especulación en curso de una clave."""
+        task = self._tasks.pop(key, None)
+        if task is None:
+            return False
+        task.cancel()
+        if self.on_cancel is not None:
+            self.on_cancel(key)
+        self.cancelled += 1
+        return True
+
+    def cancel_all(self) -> int:
+        """
+        Cancela todas las especulaciones en curso para liberar el upstream.
+
+        Returns:
+            int: Número de especulaciones canceladas
+        """
+        return sum(self.cancel(key) for key in list(self._tasks))
+
+    async def close(self) -> None:
+        """Cancela las especulaciones y espera a que terminen."""
+        tasks = list(self._tasks.values())
+        self.cancel_all()
+        await asyncio.gather(*tasks, return_exceptions=True)
+
+    def stats(self) -> Dict[str, Any]:
+        """Devuelve las especulaciones lanzadas, descartadas y acertadas."""
+        return {
+            "enabled": self.enabled,
+            "in_flight": len(self._tasks),
+            "scheduled": self.scheduled,
+            "completed": self.completed,
+            "failed": self.failed,
+            "cancelled": self.cancelled,
+            "skipped": dict(self.skipped),
+            "hits": self.hits,
+            "hit_rate": round(self.hits / self.completed, 4) if self.completed else 0.0,
+        }
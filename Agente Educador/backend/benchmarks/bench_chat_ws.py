@@ -0,0 +1,166 @@
+"""
+Benchmark del canal WebSocket del chat frente a `POST /api/chat/chat`.
+
+Ejecuta la aplicación completa en el mismo proceso (un solo worker), con el
+webhook simulado conectado por `httpx.ASGITransport` y sin retardo, de modo
+que el resultado mide el coste del backend por turno: middlewares, JWT,
+validación y servicio de chat en HTTP, frente a una sola autenticación por
+conexión en WebSocket. El historial se guarda en colecciones en memoria, la
+caché de respuestas y los límites de tasa se desactivan y los logs se
+limitan a WARNING en ambas variantes.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_chat_ws --conversations 32 --turns 50
+"""
+import os
+
+# Antes de importar la aplicación: sin caché de respuestas ni límites de tasa
+os.environ.setdefault("CHAT_CACHE_ENABLED", "False")
+os.environ.setdefault("RATE_LIMIT_POLICIES", "/api/chat=100000000/60")
+os.environ.setdefault("CHAT_WS_RATE_LIMIT_MESSAGES", "100000000")
+os.environ.setdefault("CHAT_CONCURRENCY_INITIAL", "1024")
+os.environ.setdefault("CHAT_CONCURRENCY_MAX", "1024")
+
+import argparse
+import asyncio
+import json
+import logging
+import statistics
+import time
+from typing import Any, Callable, Dict, List
+
+import httpx
+
+from app.api.dependencies.auth import create_access_token
+from app.main import app
+from app.repositories.chat_repository import ChatRepository
+from app.services.chat_service import chat_service
+from app.services.n8n_client import N8NClient
+from benchmarks.memory_db import MemoryCollection
+from benchmarks.stub_n8n import create_app
+
+
+class ASGIWebSocket:
+    """Cliente WebSocket que habla ASGI directamente con la aplicación."""
+
+    def __init__(self, path: str, query: str):
+        self.scope = {
+            "type": "websocket",
+            "asgi": {"version": "3.0"},
+            "scheme": "ws",
+            "http_version": "1.1",
+            "path": path,
+            "raw_path": path.encode(),
+            "root_path": "",
+            "query_string": query.encode(),
+            "headers": [(b"host", b"bench")],
+            "client": ("127.0.0.1", 50000),
+            "server": ("bench", 80),
+            "subprotocols": [],
+        }
+        self.inbox: asyncio.Queue = asyncio.Queue()
+        self.outbox: asyncio.Queue = asyncio.Queue()
+        self.task = None
+
+    async def connect(self) -> Dict[str, Any]:
+        self.task = asyncio.create_task(app(self.scope, self.inbox.get, self.outbox.put))
+        await self.inbox.put({"type": "websocket.connect"})
+        accept = await self.outbox.get()
+        assert accept["type"] == "websocket.accept", accept
+        return await self.receive_json()
+
+    async def send_json(self, data: Dict[str, Any]) -> None:
+        await self.inbox.put({"type": "websocket.receive", "text": json.dumps(data)})
+
+    async def receive_json(self) -> Dict[str, Any]:
+        message = await self.outbox.get()
+        assert message["type"] == "websocket.send", message
+        return json.loads(message["text"])
+
+    async def close(self) -> None:
+        await self.inbox.put({"type": "websocket.disconnect", "code": 1000})
+        await self.task
+
+
+async def run_conversations(turn: Callable, conversations: int, turns: int) -> List[float]:
+    """Ejecuta `conversations` conversaciones en paralelo y devuelve latencias por turno en ms."""
+    latencies: List[float] = []
+    await asyncio.gather(*(turn(i, turns, latencies) for i in range(conversations)))
+    return latencies
+
+
+async def http_conversation(client: httpx.AsyncClient, headers: Dict[str, str]):
+    async def turn(index: int, turns: int, latencies: List[float]) -> None:
+        session_id = None
+        for n in range(turns):
+            body = {"message": f"Pregunta {index}-{n}", "age_group": "6-8", "session_id": session_id}
+            start = time.perf_counter()
+            response = await client.post("/api/chat/chat", json=body, headers=headers)
+            latencies.append((time.perf_counter() - start) * 1000)
+            assert response.status_code == 200, response.text
+            session_id = response.json()["session_id"]
+    return turn
+
+
+async def ws_conversation(token: str):
+    async def turn(index: int, turns: int, latencies: List[float]) -> None:
+        ws = ASGIWebSocket("/api/chat/ws", f"token={token}&age_group=6-8")
+        await ws.connect()
+        try:
+            for n in range(turns):
+                start = time.perf_counter()
+                await ws.send_json({"message": f"Pregunta {index}-{n}"})
+                while (await ws.receive_json())["type"] not in ("done", "error"):
+                    pass
+                latencies.append((time.perf_counter() - start) * 1000)
+        finally:
+            await ws.close()
+    return turn
+
+
+def report(name: str, latencies: List[float], elapsed: float) -> None:
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<12} {len(latencies) / elapsed:9.1f} mensajes/s  media {statistics.mean(latencies):7.2f} ms  "
+        f"p50 {p50:7.2f} ms  p99 {p99:7.2f} ms"
+    )
+
+
+async def run(args) -> None:
+    n8n = N8NClient(url="http://n8n.bench/webhook/gemini", transport=httpx.ASGITransport(app=create_app()),
+                    max_concurrency=args.conversations)
+    await n8n.start()
+    history = ChatRepository()
+    history.sessions, history.messages = MemoryCollection(), MemoryCollection()
+    chat_service.n8n, chat_service.history = n8n, history
+
+    token = create_access_token({"sub": "bench"})
+    client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench")
+    variants = [
+        ("HTTP", await http_conversation(client, {"Authorization": f"Bearer {token}"})),
+        ("WebSocket", await ws_conversation(token)),
+    ]
+    try:
+        for name, turn in variants:
+            await run_conversations(turn, args.conversations, 2)  # Calentamiento
+            start = time.perf_counter()
+            latencies = await run_conversations(turn, args.conversations, args.turns)
+            report(name, latencies, time.perf_counter() - start)
+    finally:
+        await client.aclose()
+        await n8n.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--conversations", type=int, default=32, help="Conversaciones en paralelo")
+    parser.add_argument("--turns", type=int, default=50, help="Mensajes por conversación")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+    asyncio.run(run(args))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Benchmark del cliente de n8n contra el webhook simulado.
+
+Arranca `benchmarks.stub_n8n` en un subproceso de uvicorn y mide la latencia
+de `N8NClient.post` con el pool compartido (keep-alive) frente a abrir un
+cliente nuevo por solicitud, que era lo habitual sin cliente compartido. La
+sobrecarga es la latencia medida menos el retardo fijo del stub.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_n8n_client --requests 2000 --concurrency 32 --delay-ms 20
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+from typing import List
+
+import httpx
+
+from app.services.n8n_client import N8NClient
+
+PAYLOAD = {
+    "message": "¿Por qué el cielo es azul?",
+    "messages": [{"role": "user", "content": "¿Por qué el cielo es azul?"}],
+    "metadata": {"ageGroup": "6-8"},
+    "context": {},
+}
+
+
+async def wait_until_ready(url: str, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient() as client:
+        while True:
+            try:
+                await client.post(url, json=PAYLOAD)
+                return
+            except httpx.TransportError:
+                if time.monotonic() > deadline:
+                    raise
+                await asyncio.sleep(0.1)
+
+
+async def measure(call, requests: int, concurrency: int) -> List[float]:
+    """Lanza `requests` llamadas con `concurrency` en paralelo y devuelve latencias en ms."""
+    latencies: List[float] = []
+    queue = iter(range(requests))
+
+    async def worker() -> None:
+        for _ in queue:
+            start = time.perf_counter()
+            await call()
+            latencies.append((time.perf_counter() - start) * 1000)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    return latencies
+
+
+def report(name: str, latencies: List[float], delay_ms: float) -> None:
+    latencies.sort()
+    p50 = latencies[len(latencies) // 2]
+    p99 = latencies[int(len(latencies) * 0.99) - 1]
+    print(
+        f"{name:<28} media {statistics.mean(latencies):7.2f} ms  p50 {p50:7.2f} ms  "
+        f"p99 {p99:7.2f} ms  sobrecarga p50 {p50 - delay_ms:6.2f} ms"
+    )
+
+
+async def run(url: str, args) -> None:
+    await wait_until_ready(url)
+
+    pooled = N8NClient(url=url, max_concurrency=args.concurrency, max_retries=0)
+    await pooled.start()
+    try:
+        latencies = await measure(lambda: pooled.post(PAYLOAD), args.requests, args.concurrency)
+    finally:
+        await pooled.close()
+    report("Cliente compartido", latencies, args.delay_ms)
+
+    async def fresh_client_call():
+        async with httpx.AsyncClient() as client:
+            response = await client.post(url, json=PAYLOAD)
+            return response.json()
+
+    latencies = await measure(fresh_client_call, args.requests, args.concurrency)
+    report("Cliente por solicitud", latencies, args.delay_ms)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=2000, help="Solicitudes por variante")
+    parser.add_argument("--concurrency", type=int, default=32, help="Solicitudes en paralelo")
+    parser.add_argument("--delay-ms", type=float, default=20.0, help="Retardo fijo del stub")
+    parser.add_argument("--port", type=int, default=5679, help="Puerto del stub")
+    args = parser.parse_args()
+
+    env = dict(os.environ, STUB_N8N_DELAY_MS=str(args.delay_ms))
+    stub = subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "benchmarks.stub_n8n:app",
+         "--port", str(args.port), "--log-level", "warning"],
+        env=env
+    )
+    try:
+        asyncio.run(run(f"http://127.0.0.1:{args.port}/webhook/gemini", args))
+    finally:
+        stub.terminate()
+        stub.wait()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,79 @@
+"""
+Micro-benchmark del limitador de tasa.
+
+Mide el coste por comprobación de `RateLimiter.hit` con muchas claves
+distintas y lo compara con la implementación anterior basada en listas de
+marcas de tiempo por clave.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_rate_limiter --keys 10000 --checks 200000
+"""
+import argparse
+import asyncio
+import random
+import time
+from datetime import datetime, timedelta
+from typing import Dict, List
+
+from app.api.dependencies.rate_limiter import RateLimiter
+
+
+class LegacyRateLimiter:
+    """Copia de la implementación anterior, solo como referencia."""
+
+    def __init__(self, requests: int = 100, window: int = 60):
+        self.requests = requests
+        self.window = window
+        self.timestamps: Dict[str, List[datetime]] = {}
+        self.lock = asyncio.Lock()
+
+    async def is_rate_limited(self, key: str) -> bool:
+        async with self.lock:
+            now = datetime.utcnow()
+            window_start = now - timedelta(seconds=self.window)
+            if key in self.timestamps:
+                self.timestamps[key] = [ts for ts in self.timestamps[key] if ts > window_start]
+            else:
+                self.timestamps[key] = []
+            if len(self.timestamps[key]) >= self.requests:
+                return True
+            self.timestamps[key].append(now)
+            return False
+
+
+async def run(limiter, keys: List[str], checks: int) -> float:
+    """Ejecuta las comprobaciones y devuelve el coste medio en microsegundos."""
+    check = limiter.is_rate_limited
+    # Calentar: cada clave con el estado lleno de la ventana
+    for key in keys:
+        for _ in range(limiter.requests):
+            await check(key)
+    sample = [random.choice(keys) for _ in range(checks)]
+    start = time.perf_counter()
+    for key in sample:
+        await check(key)
+    return (time.perf_counter() - start) / checks * 1e6
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--keys", type=int, default=10000, help="Claves distintas")
+    parser.add_argument("--checks", type=int, default=200000, help="Comprobaciones medidas")
+    parser.add_argument("--requests", type=int, default=100, help="Límite por ventana")
+    parser.add_argument("--legacy", action="store_true", help="Medir también la implementación anterior")
+    args = parser.parse_args()
+
+    random.seed(42)
+    keys = [f"10.{i // 65536}.{(i // 256) % 256}.{i % 256}" for i in range(args.keys)]
+
+    current = asyncio.run(run(RateLimiter(requests=args.requests, window=60), keys, args.checks))
+    print(f"RateLimiter (ventana deslizante): {current:.2f} µs/comprobación con {args.keys} claves")
+
+    if args.legacy:
+        legacy = asyncio.run(run(LegacyRateLimiter(requests=args.requests, window=60), keys, args.checks))
+        print(f"Implementación anterior (listas):  {legacy:.2f} µs/comprobación con {args.keys} claves")
+        print(f"Mejora: x{legacy / current:.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+"""
+Benchmark del filtro de seguridad infantil sobre 100.000 mensajes.
+
+Compara el autómata de `SafetyFilter` con dos alternativas sobre el mismo
+texto normalizado: una expresión regular por término (coste proporcional al
+tamaño de la lista) y una única alternancia de `re`. Se mide con la lista por
+defecto y con la lista ampliada con términos sintéticos, para mostrar que el
+coste del autómata no depende del número de términos. Los mensajes son
+preguntas infantiles generadas con una semilla fija; un 2 % lleva un término
+bloqueado escrito con leetspeak, tildes o letras repetidas.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.bench_safety_filter --messages 100000
+"""
+import argparse
+import logging
+import random
+import re
+import string
+import time
+from typing import Callable, Dict, List
+
+from app.services.safety_filter import SafetyFilter, normalize, parse_blocklist
+from config import settings
+
+WORDS = (
+    "cuánto es la suma de tres y cuatro por qué el cielo es azul cómo viven los dinosaurios "
+    "quiero aprender las tablas de multiplicar cuéntame una historia de castillos y caballeros "
+    "qué comen los delfines en el océano me ayudas con los deberes de ciencias naturales "
+    "cuál es el planeta más grande del sistema solar dónde está la capital de Francia"
+).split()
+DISGUISES = ("1d10t4", "idiotaaa", "ESTÚPIDO", "p.u.t.a", "dr0g4s", "m4t4r")
+
+
+def make_messages(count: int, seed: int) -> List[str]:
+    """Genera mensajes deterministas; uno de cada cincuenta contiene un término bloqueado."""
+    rng = random.Random(seed)
+    messages = []
+    for i in range(count):
+        words = rng.choices(WORDS, k=rng.randint(4, 20))
+        if i % 50 == 0:
+            words.insert(rng.randrange(len(words)), rng.choice(DISGUISES))
+        messages.append(" ".join(words).capitalize() + "?")
+    return messages
+
+
+def synthetic_terms(terms: Dict[str, List[str]], factor: int, seed: int) -> Dict[str, List[str]]:
+    """Amplía la lista con `factor` veces su tamaño en términos aleatorios."""
+    rng = random.Random(seed)
+    size = sum(len(expressions) for expressions in terms.values())
+    extra = ["".join(rng.choices(string.ascii_lowercase, k=rng.randint(5, 10))) for _ in range(size * factor)]
+    return {**terms, "sinteticos": extra}
+
+
+def regex_checkers(terms: Dict[str, List[str]]) -> Dict[str, Callable[[str], bool]]:
+    """Alternativas con `re` que aplican las mismas reglas de límite de palabra."""
+    patterns = []
+    for expressions in terms.values():
+        for expression in expressions:
+            pattern = re.escape(normalize(expression.rstrip("*")))
+            patterns.append(r"\b" + pattern + ("" if expression.endswith("*") else r"\b"))
+    compiled = [re.compile(pattern) for pattern in patterns]
+    alternation = re.compile("|".join(patterns))
+
+    def per_term(text: str) -> bool:
+        normalized = normalize(text)
+        return any(regex.search(normalized) for regex in compiled)
+
+    def single(text: str) -> bool:
+        return alternation.search(normalize(text)) is not None
+
+    return {"re por término": per_term, "re alternancia": single}
+
+
+def measure(name: str, check: Callable[[str], bool], messages: List[str]) -> None:
+    start = time.perf_counter()
+    blocked = sum(1 for message in messages if check(message))
+    elapsed = time.perf_counter() - start
+    print(
+        f"  {name:<16} {len(messages) / elapsed:10.0f} mensajes/s  "
+        f"{elapsed / len(messages) * 1e6:6.2f} µs/mensaje  bloqueados {blocked}"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--messages", type=int, default=100_000, help="Mensajes a revisar")
+    parser.add_argument("--factor", type=int, default=50, help="Ampliación sintética de la lista")
+    parser.add_argument("--seed", type=int, default=7, help="Semilla de los mensajes")
+    args = parser.parse_args()
+    logging.disable(logging.INFO)
+
+    with open(settings.SAFETY_BLOCKLIST_PATH, encoding="utf-8") as f:
+        terms = parse_blocklist(f)
+    messages = make_messages(args.messages, args.seed)
+    for label, variant in (("lista por defecto", terms), (f"lista x{args.factor + 1}", synthetic_terms(terms, args.factor, args.seed))):
+        safety = SafetyFilter(terms=variant)
+        print(f"{label}: {safety.terms} términos, {args.messages} mensajes")
+        measure("autómata", lambda text: safety.check(text).blocked, messages)
+        for name, check in regex_checkers(variant).items():
+            measure(name, check, messages)
+
+
+if __name__ == "__main__":
+    main()
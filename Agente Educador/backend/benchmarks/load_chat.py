@@ -0,0 +1,420 @@
+"""
+Prueba de carga de extremo a extremo del chat.
+
+Ejecuta la aplicación completa en el mismo proceso, con el webhook simulado
+(`benchmarks.stub_n8n`) como upstream y el historial en colecciones en
+memoria, y la somete a un escenario descrito en un fichero JSON
+(`benchmarks/scenarios/`): grupos de alumnos virtuales que llegan de golpe o
+poco a poco, conversan varios turnos con pausas entre mensajes y usan
+`POST /api/chat/chat` o `POST /api/chat/stream`.
+
+El informe JSON recoge, por grupo, la latencia (p50/p95/p99 e histograma),
+el tiempo hasta el primer fragmento en streaming, el rendimiento y los
+errores, además del retraso del bucle de eventos y las métricas del servicio
+de chat. Dos informes se comparan con `compare` para ver si un cambio empeoró
+algo.
+
+Uso (desde el directorio backend):
+    python -m benchmarks.load_chat run classroom_burst --out base.json
+    python -m benchmarks.load_chat run long_sessions --speed 10 --socket
+    python -m benchmarks.load_chat compare base.json nuevo.json
+
+Sin `--socket` las solicitudes llegan a la aplicación por ASGI sin red; con
+`--socket` se sirve con uvicorn en un puerto local y se usa HTTP real.
+`--speed` divide las pausas y las llegadas (no la latencia del upstream) y
+`--scale` multiplica el número de alumnos.
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import logging
+import math
+import os
+import platform
+import random
+import socket
+import subprocess
+import sys
+import time
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+import httpx
+
+from benchmarks.memory_db import MemoryCollection
+from benchmarks.stub_n8n import Latency, StubTransport, create_app
+
+SCENARIOS_DIR = Path(__file__).parent / "scenarios"
+
+# Límites superiores (ms) de los cubos del histograma de latencias
+HISTOGRAM_BOUNDS = (1, 2, 5, 10, 20, 50, 100, 200, 500, 1000, 2000, 5000, 10000, 20000, 60000)
+
+# Métricas que `compare` considera peores si suben
+COMPARED = ("latency_ms.p50", "latency_ms.p95", "latency_ms.p99", "ttfb_ms.p50", "ttfb_ms.p99", "error_rate")
+
+# Sin límites de tasa: todos los alumnos virtuales llegan desde la misma IP
+DEFAULT_ENV = {
+    "RATE_LIMIT_POLICIES": "/api/chat=100000000/60",
+    "CHAT_WS_RATE_LIMIT_MESSAGES": "100000000",
+}
+
+
+def load_scenario(name: str) -> Dict[str, Any]:
+    """Lee un escenario por ruta o por nombre dentro de `benchmarks/scenarios`."""
+    path = Path(name)
+    if not path.exists():
+        path = SCENARIOS_DIR / f"{name}.json"
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def percentile(values: List[float], p: float) -> float:
+    """Percentil por rango más cercano de una lista ordenada."""
+    if not values:
+        return 0.0
+    return values[min(len(values) - 1, max(0, math.ceil(p / 100 * len(values)) - 1))]
+
+
+def summarize(values: List[float]) -> Dict[str, Any]:
+    """Percentiles, media, máximo e histograma de una serie de milisegundos."""
+    values = sorted(values)
+    counts = [0] * (len(HISTOGRAM_BOUNDS) + 1)
+    for value in values:
+        counts[bisect.bisect_left(HISTOGRAM_BOUNDS, value)] += 1
+    labels = [f"<={bound}" for bound in HISTOGRAM_BOUNDS] + [f">{HISTOGRAM_BOUNDS[-1]}"]
+    return {
+        "count": len(values),
+        "mean": round(sum(values) / len(values), 2) if values else 0.0,
+        "p50": round(percentile(values, 50), 2),
+        "p95": round(percentile(values, 95), 2),
+        "p99": round(percentile(values, 99), 2),
+        "max": round(values[-1], 2) if values else 0.0,
+        "histogram": {label: count for label, count in zip(labels, counts) if count},
+    }
+
+
+class GroupStats:
+    """Resultados de un grupo de alumnos virtuales."""
+
+    def __init__(self):
+        self.latencies: List[float] = []
+        self.ttfbs: List[float] = []
+        self.errors: Dict[str, int] = {}
+        self.incomplete = 0
+
+    def error(self, kind: str) -> None:
+        self.errors[kind] = self.errors.get(kind, 0) + 1
+
+    def report(self, elapsed: float) -> Dict[str, Any]:
+        requests = len(self.latencies) + sum(self.errors.values())
+        failed = sum(self.errors.values())
+        return {
+            "requests": requests,
+            "throughput_rps": round(requests / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(failed / requests, 4) if requests else 0.0,
+            "errors": dict(self.errors),
+            "incomplete": self.incomplete,
+            "latency_ms": summarize(self.latencies),
+            "ttfb_ms": summarize(self.ttfbs) if self.ttfbs else None,
+        }
+
+
+class LoopLagMonitor:
+    """Mide cuánto se retrasa el bucle de eventos respecto a un temporizador."""
+
+    def __init__(self, interval: float = 0.01):
+        self.interval = interval
+        self.samples: List[float] = []
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def _run(self) -> None:
+        while True:
+            start = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            self.samples.append(max(0.0, time.perf_counter() - start - self.interval) * 1000)
+
+    async def stop(self) -> Dict[str, Any]:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+        summary = summarize(self.samples)
+        del summary["histogram"]
+        return summary
+
+
+def arrivals(group: Dict[str, Any], users: int, rng: random.Random, speed: float) -> List[float]:
+    """Segundos desde el inicio en los que llega cada alumno del grupo."""
+    if group.get("arrival", "burst") == "poisson":
+        offsets, now = [], 0.0
+        for _ in range(users):
+            now += rng.expovariate(group["rate"])
+            offsets.append(now / speed)
+        return offsets
+    ramp = group.get("ramp_seconds", 0.0)
+    return sorted(rng.uniform(0, ramp) / speed for _ in range(users))
+
+
+async def chat_turn(client: httpx.AsyncClient, body: Dict[str, Any], headers: Dict[str, str],
+                    stats: GroupStats) -> Optional[str]:
+    """Un turno por `POST /api/chat/chat`; devuelve el `session_id`."""
+    start = time.perf_counter()
+    response = await client.post("/api/chat/chat", json=body, headers=headers)
+    if response.status_code != 200:
+        stats.error(f"http_{response.status_code}")
+        return body.get("session_id")
+    stats.latencies.append((time.perf_counter() - start) * 1000)
+    return response.json().get("session_id")
+
+
+async def stream_turn(client: httpx.AsyncClient, body: Dict[str, Any], headers: Dict[str, str],
+                      stats: GroupStats) -> Optional[str]:
+    """Un turno por `POST /api/chat/stream`; devuelve el `session_id`."""
+    start = time.perf_counter()
+    ttfb = None
+    event = None
+    async with client.stream("POST", "/api/chat/stream", json=body, headers=headers) as response:
+        if response.status_code != 200:
+            stats.error(f"http_{response.status_code}")
+            return body.get("session_id")
+        async for line in response.aiter_lines():
+            if line.startswith("event: "):
+                event = line[7:]
+                if event == "token" and ttfb is None:
+                    ttfb = (time.perf_counter() - start) * 1000
+            elif line.startswith("data: ") and event in ("done", "error"):
+                data = json.loads(line[6:])
+                if event == "error":
+                    stats.error("stream_error")
+                    return body.get("session_id")
+                stats.latencies.append((time.perf_counter() - start) * 1000)
+                stats.ttfbs.append(ttfb if ttfb is not None else stats.latencies[-1])
+                if not data.get("complete", True):
+                    stats.incomplete += 1
+                return data.get("session_id")
+    stats.error("stream_truncated")
+    return body.get("session_id")
+
+
+async def student(client: httpx.AsyncClient, group: Dict[str, Any], user: int, delay: float,
+                  token: str, rng: random.Random, speed: float, stats: GroupStats) -> None:
+    """Un alumno virtual: llega, conversa `turns` turnos y se va."""
+    await asyncio.sleep(delay)
+    headers = {"Authorization": f"Bearer {token}"}
+    think = Latency.parse(group.get("think", 0))
+    turn = stream_turn if group.get("endpoint", "chat") == "stream" else chat_turn
+    session_id = None
+    for n in range(group.get("turns", 1)):
+        question = rng.choice(group["questions"]).format(user=user, turn=n)
+        body = {"message": question, "age_group": group.get("age_group", "6-8"), "session_id": session_id}
+        try:
+            session_id = await turn(client, body, headers, stats)
+        except httpx.HTTPError as e:
+            stats.error(f"exception_{type(e).__name__}")
+        await asyncio.sleep(think.sample(rng) / 1000 / speed)
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def build_info() -> Dict[str, Any]:
+    """Versión del código y del entorno con la que se generó el informe."""
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5
+        ).stdout.strip() or None
+    except (OSError, subprocess.SubprocessError):
+        commit = None
+    return {"commit": commit, "python": platform.python_version(), "platform": platform.platform()}
+
+
+async def run_scenario(scenario: Dict[str, Any], speed: float = 1.0, scale: float = 1.0,
+                       use_socket: bool = False) -> Dict[str, Any]:
+    """
+    Ejecuta un escenario contra la aplicación y devuelve el informe.
+
+    La aplicación se importa aquí para que las variables `env` del escenario
+    se apliquen antes de leer la configuración; si ya estaba importada, se
+    usa con la configuración que tenga.
+    """
+    for key, value in {**DEFAULT_ENV, **scenario.get("env", {})}.items():
+        os.environ.setdefault(key, str(value))
+    from app.api.dependencies.auth import create_access_token
+    from app.main import app
+    from app.repositories.chat_repository import ChatRepository
+    from app.services.chat_service import chat_service
+    from app.services.n8n_client import N8NClient
+
+    seed = scenario.get("seed", 0)
+    stub = create_app(seed=seed, **scenario.get("stub", {}))
+    n8n = N8NClient(url="http://n8n.load/webhook/gemini", transport=StubTransport(stub))
+    history = ChatRepository()
+    history.sessions, history.messages = MemoryCollection(), MemoryCollection()
+    previous = chat_service.n8n, chat_service.history
+    chat_service.n8n, chat_service.history = n8n, history
+
+    server = server_task = None
+    if use_socket:
+        import uvicorn
+        port = free_port()
+        server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, lifespan="off",
+                                               log_level="warning", access_log=False))
+        server_task = asyncio.create_task(server.serve())
+        while not server.started:
+            await asyncio.sleep(0.01)
+        client = httpx.AsyncClient(base_url=f"http://127.0.0.1:{port}", timeout=120,
+                                   limits=httpx.Limits(max_connections=None, max_keepalive_connections=None))
+    else:
+        client = httpx.AsyncClient(transport=StubTransport(app), base_url="http://load", timeout=120)
+
+    groups = {group["name"]: GroupStats() for group in scenario["groups"]}
+    monitor = LoopLagMonitor()
+    await n8n.start()
+    monitor.start()
+    start = time.perf_counter()
+    try:
+        students = []
+        for index, group in enumerate(scenario["groups"]):
+            rng = random.Random(f"{seed}:{group['name']}")
+            users = max(1, round(group["users"] * scale))
+            for user, delay in enumerate(arrivals(group, users, rng, speed)):
+                token = create_access_token({"sub": f"alumno-{index}-{user}"})
+                students.append(student(
+                    client, group, user, delay, token, random.Random(f"{seed}:{group['name']}:{user}"),
+                    speed, groups[group["name"]]
+                ))
+        await asyncio.gather(*students)
+        elapsed = time.perf_counter() - start
+    finally:
+        loop_lag = await monitor.stop()
+        upstream = n8n.stats()
+        await client.aclose()
+        if server is not None:
+            server.should_exit = True
+            await server_task
+        await n8n.close()
+        chat_service.n8n, chat_service.history = previous
+
+    total = GroupStats()
+    for stats in groups.values():
+        total.latencies += stats.latencies
+        total.ttfbs += stats.ttfbs
+        total.incomplete += stats.incomplete
+        for kind, count in stats.errors.items():
+            total.errors[kind] = total.errors.get(kind, 0) + count
+    return {
+        "scenario": scenario["name"],
+        "timestamp": datetime.utcnow().isoformat(),
+        "build": build_info(),
+        "options": {"speed": speed, "scale": scale, "transport": "socket" if use_socket else "asgi"},
+        "upstream": {**stub.state.config, "calls": stub.state.calls, "errors": stub.state.errors,
+                     "aborts": stub.state.aborts},
+        "duration_s": round(elapsed, 3),
+        "total": total.report(elapsed),
+        "groups": {name: stats.report(elapsed) for name, stats in groups.items()},
+        "event_loop_lag_ms": loop_lag,
+        "server": {"chat": chat_service.stats(), "n8n": upstream},
+    }
+
+
+def _metric(section: Dict[str, Any], path: str) -> Optional[float]:
+    value: Any = section
+    for key in path.split("."):
+        if not isinstance(value, dict) or value.get(key) is None:
+            return None
+        value = value[key]
+    return value
+
+
+def compare(base: Dict[str, Any], new: Dict[str, Any], threshold: float = 10.0) -> Tuple[List[str], bool]:
+    """
+    Compara dos informes del mismo escenario.
+
+    Args:
+        base: Informe de referencia
+        new: Informe del cambio
+        threshold: Porcentaje de empeoramiento a partir del cual se marca una regresión
+
+    Returns:
+        Tuple[List[str], bool]: Líneas de la comparación y si hay alguna regresión
+    """
+    lines = [f"{base['scenario']}: {base['build'].get('commit')} -> {new['build'].get('commit')}"]
+    regressed = False
+    sections = [("total", base["total"], new["total"])] + [
+        (name, stats, new["groups"][name]) for name, stats in base["groups"].items() if name in new["groups"]
+    ]
+    for name, old_section, new_section in sections:
+        rows = [(path, _metric(old_section, path), _metric(new_section, path)) for path in COMPARED]
+        rows.append(("throughput_rps", old_section["throughput_rps"], new_section["throughput_rps"]))
+        for path, old, value in rows:
+            if old is None or value is None:
+                continue
+            change = (value - old) / old * 100 if old else (0.0 if value == old else math.inf)
+            worse = -change if path == "throughput_rps" else change
+            # Las diferencias de menos de 1 ms o de una décima de punto son ruido
+            noise = abs(value - old) < (0.001 if path == "error_rate" else 1.0)
+            flag = ""
+            if worse > threshold and not noise:
+                flag = "  <- regresión"
+                regressed = True
+            lines.append(f"  {name:<12} {path:<16} {old:>10.2f} -> {value:>10.2f}  ({change:+.1f}%){flag}")
+    for name in ("p99", "max"):
+        old, value = base["event_loop_lag_ms"][name], new["event_loop_lag_ms"][name]
+        lines.append(f"  {'event_loop':<12} {'lag_ms.' + name:<16} {old:>10.2f} -> {value:>10.2f}")
+    return lines, regressed
+
+
+def print_summary(report: Dict[str, Any]) -> None:
+    print(f"{report['scenario']} ({report['options']['transport']}): {report['duration_s']} s")
+    for name, stats in [("total", report["total"])] + list(report["groups"].items()):
+        latency = stats["latency_ms"]
+        ttfb = stats["ttfb_ms"]
+        print(
+            f"  {name:<12} {stats['requests']:6d} solicitudes  {stats['throughput_rps']:8.2f}/s  "
+            f"errores {stats['error_rate']:7.2%}  p50 {latency['p50']:8.2f} ms  p95 {latency['p95']:8.2f} ms  "
+            f"p99 {latency['p99']:8.2f} ms" + (f"  ttfb p50 {ttfb['p50']:8.2f} ms" if ttfb else "")
+        )
+    lag = report["event_loop_lag_ms"]
+    print(f"  bucle de eventos: retraso p99 {lag['p99']:.2f} ms, máximo {lag['max']:.2f} ms")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    commands = parser.add_subparsers(dest="command", required=True)
+    run = commands.add_parser("run", help="Ejecuta un escenario")
+    run.add_argument("scenario", help="Nombre de `benchmarks/scenarios` o ruta a un JSON")
+    run.add_argument("--out", help="Fichero donde guardar el informe JSON")
+    run.add_argument("--speed", type=float, default=1.0, help="Divide las pausas y las llegadas")
+    run.add_argument("--scale", type=float, default=1.0, help="Multiplica el número de alumnos")
+    run.add_argument("--socket", action="store_true", help="Servir con uvicorn y usar HTTP real")
+    diff = commands.add_parser("compare", help="Compara dos informes")
+    diff.add_argument("base")
+    diff.add_argument("new")
+    diff.add_argument("--threshold", type=float, default=10.0, help="Porcentaje que se considera regresión")
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.base, encoding="utf-8") as f:
+            base = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        lines, regressed = compare(base, new, args.threshold)
+        print("\n".join(lines))
+        sys.exit(1 if regressed else 0)
+
+    logging.disable(logging.WARNING)
+    report = asyncio.run(run_scenario(load_scenario(args.scenario), args.speed, args.scale, args.socket))
+    print_summary(report)
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2, ensure_ascii=False, default=str)
+
+
+if __name__ == "__main__":
+    main()
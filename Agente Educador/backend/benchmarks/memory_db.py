@@ -0,0 +1,50 @@
+"""
+Colecciones de MongoDB en memoria para los benchmarks.
+
+Implementan lo mínimo de una colección de Motor que usa `ChatRepository`,
+de modo que la aplicación completa se puede medir sin servidor de MongoDB.
+"""
+from typing import Any, Dict, List
+
+
+class MemoryCursor:
+    def __init__(self, docs: List[Dict[str, Any]]):
+        self.docs = docs
+
+    def sort(self, key: str, direction: int) -> "MemoryCursor":
+        self.docs = sorted(self.docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n: int) -> "MemoryCursor":
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None) -> List[Dict[str, Any]]:
+        return self.docs
+
+
+class MemoryCollection:
+    """Lo mínimo de una colección de Motor que usa `ChatRepository`."""
+
+    def __init__(self):
+        self.docs: List[Dict[str, Any]] = []
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        self.docs.extend(dict(d) for d in docs)
+
+    async def find_one(self, query):
+        return next((d for d in self.docs if d["_id"] == query["_id"]), None)
+
+    def find(self, query):
+        seq = query.get("seq", {})
+        return MemoryCursor([
+            d for d in self.docs
+            if d["session_id"] == query["session_id"]
+            and seq.get("$gte", d["seq"]) <= d["seq"] < seq.get("$lt", d["seq"] + 1)
+        ])
+
+    async def bulk_write(self, operations, ordered=True):
+        pass
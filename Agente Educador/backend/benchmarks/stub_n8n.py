@@ -0,0 +1,306 @@
+"""
+Webhook de n8n simulado para pruebas y benchmarks.
+
+Responde como el flujo real (`{"response": ...}`, o JSON por líneas en modo
+streaming) con un comportamiento configurable y reproducible, de modo que se
+puedan ajustar los tiempos de espera, la cobertura y la concurrencia del
+chat contra un upstream conocido:
+
+- latencia hasta la respuesta con una distribución fija, lognormal o bimodal
+  (`Latency.parse("lognormal:80,0.5")`);
+- cadencia de los fragmentos en streaming y palabras por fragmento;
+- tamaño de la respuesta en palabras;
+- fracción de respuestas con error HTTP y de flujos que se cortan a mitad.
+
+Los sorteos son deterministas: cada solicitud usa un generador sembrado con
+la semilla, el mensaje y el número de veces que se ha visto ese mensaje, así
+que la misma carga produce las mismas latencias y errores en cada ejecución
+aunque las solicitudes lleguen en otro orden.
+
+Uso (desde el directorio backend):
+    STUB_N8N_LATENCY=lognormal:80,0.5 STUB_N8N_ERROR_RATE=0.01 \\
+        uvicorn benchmarks.stub_n8n:app --port 5678
+
+y arrancar el backend con N8N_WEBHOOK_URL=http://localhost:5678/webhook/gemini.
+Sin red, `StubTransport(app)` conecta un `N8NClient` con el stub dentro del
+proceso conservando la cadencia del streaming.
+"""
+import asyncio
+import json
+import math
+import os
+import random
+from collections import Counter
+from typing import Any, Dict, Optional, Union
+
+import httpx
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+# Palabras de relleno para las respuestas de un tamaño dado
+_FILLER = (
+    "las plantas usan la luz del sol para fabricar su alimento y crecer "
+    "los planetas giran alrededor del sol en caminos llamados órbitas "
+    "el agua de los ríos llega al mar y vuelve a las nubes"
+).split()
+
+
+class Latency:
+    """
+    Distribución de latencias en milisegundos.
+
+    Formatos de `parse`:
+        - `50` o `fixed:50`: siempre 50 ms
+        - `lognormal:80,0.5`: mediana de 80 ms y sigma 0.5 (cola larga)
+        - `bimodal:40,1500,0.1`: 40 ms, o 1500 ms con probabilidad 0.1
+    """
+
+    KINDS = ("fixed", "lognormal", "bimodal")
+
+    def __init__(self, kind: str = "fixed", *params: float):
+        if kind not in self.KINDS:
+            raise ValueError(f"Distribución de latencia desconocida: {kind}")
+        expected = {"fixed": 1, "lognormal": 2, "bimodal": 3}[kind]
+        if len(params) != expected:
+            raise ValueError(f"La distribución {kind} necesita {expected} parámetros")
+        self.kind = kind
+        self.params = params
+
+    @classmethod
+    def parse(cls, spec: Union[str, float, "Latency", None]) -> "Latency":
+        """Crea la distribución a partir de su especificación."""
+        if isinstance(spec, Latency):
+            return spec
+        if spec is None or spec == "":
+            return cls("fixed", 0.0)
+        if isinstance(spec, (int, float)):
+            return cls("fixed", float(spec))
+        kind, _, params = spec.partition(":")
+        if not params:
+            kind, params = "fixed", kind
+        return cls(kind.strip(), *(float(p) for p in params.split(",")))
+
+    def sample(self, rng: random.Random) -> float:
+        """Sortea una latencia en milisegundos."""
+        if self.kind == "fixed":
+            return self.params[0]
+        if self.kind == "lognormal":
+            median, sigma = self.params
+            return rng.lognormvariate(math.log(median), sigma) if median > 0 else 0.0
+        fast, slow, p_slow = self.params
+        return slow if rng.random() < p_slow else fast
+
+    def __repr__(self) -> str:
+        return f"{self.kind}:{','.join(f'{p:g}' for p in self.params)}"
+
+
+def create_app(
+    delay_ms: float = 0.0,
+    chunk_delay_ms: float = 0.0,
+    latency: Union[str, float, Latency, None] = None,
+    chunk_latency: Union[str, float, Latency, None] = None,
+    chunk_words: int = 1,
+    response_words: Optional[int] = None,
+    error_rate: float = 0.0,
+    error_status: int = 500,
+    stream_error_rate: float = 0.0,
+    seed: int = 0
+) -> Starlette:
+    """
+    Crea la aplicación del webhook simulado.
+
+    Si la solicitud lleva `"stream": true`, la respuesta se transmite como
+    JSON por líneas, igual que un flujo de n8n en streaming. La respuesta es
+    `[<grupo de edad>] Respuesta a: <mensaje>`, completada con palabras de
+    relleno hasta `response_words` si se indica.
+
+    Args:
+        delay_ms: Milisegundos de espera antes de cada respuesta (si no hay `latency`)
+        chunk_delay_ms: Milisegundos entre fragmentos (si no hay `chunk_latency`)
+        latency: Distribución de la espera antes de responder
+        chunk_latency: Distribución de la espera entre fragmentos
+        chunk_words: Palabras por fragmento en modo streaming
+        response_words: Palabras de la respuesta, como mínimo
+        error_rate: Fracción de solicitudes que responden con `error_status`
+        error_status: Estado HTTP de los errores (503 o 429 se reintentan)
+        stream_error_rate: Fracción de flujos que se cortan tras la mitad de los fragmentos
+        seed: Semilla de los sorteos
+
+    Returns:
+        Starlette: Aplicación ASGI; `app.state` cuenta las llamadas (`calls`),
+            los errores (`errors`) y los flujos cortados (`aborts`)
+    """
+    latency = Latency.parse(latency if latency is not None else delay_ms)
+    chunk_latency = Latency.parse(chunk_latency if chunk_latency is not None else chunk_delay_ms)
+    seen: Counter = Counter()
+
+    async def webhook(request: Request) -> JSONResponse:
+        payload = await request.json()
+        state = request.app.state
+        state.calls += 1
+        message = payload.get("message", "")
+        rng = random.Random(f"{seed}:{message}:{seen[message]}")
+        seen[message] += 1
+
+        wait = latency.sample(rng)
+        if wait:
+            await asyncio.sleep(wait / 1000)
+        if rng.random() < error_rate:
+            state.errors += 1
+            return JSONResponse({"message": "Error simulado del stub"}, status_code=error_status)
+
+        age_group = payload.get("metadata", {}).get("ageGroup", "")
+        words = f"[{age_group}] Respuesta a: {message}".split(" ")
+        if response_words is not None and len(words) < response_words:
+            start = rng.randrange(len(_FILLER))
+            words += [_FILLER[(start + i) % len(_FILLER)] for i in range(response_words - len(words))]
+        if not payload.get("stream"):
+            return JSONResponse({"response": " ".join(words)})
+
+        pieces = [" ".join(words[i:i + chunk_words]) + " " for i in range(0, len(words), chunk_words)]
+        abort_after = len(pieces) // 2 if rng.random() < stream_error_rate else None
+        delays = [chunk_latency.sample(rng) for _ in pieces]
+
+        async def chunks():
+            # Formato de streaming de n8n: un objeto JSON por línea
+            for i, (piece, pause) in enumerate(zip(pieces, delays)):
+                if i == abort_after:
+                    state.aborts += 1
+                    raise ConnectionResetError("Flujo cortado por el stub")
+                yield json.dumps({"type": "item", "content": piece}) + "\n"
+                if pause:
+                    await asyncio.sleep(pause / 1000)
+            yield json.dumps({"type": "end"}) + "\n"
+
+        return StreamingResponse(chunks(), media_type="application/x-ndjson")
+
+    app = Starlette(routes=[Route("/webhook/{name}", webhook, methods=["POST"])])
+    app.state.calls = 0
+    app.state.errors = 0
+    app.state.aborts = 0
+    app.state.config = {
+        "latency": repr(latency),
+        "chunk_latency": repr(chunk_latency),
+        "chunk_words": chunk_words,
+        "response_words": response_words,
+        "error_rate": error_rate,
+        "error_status": error_status,
+        "stream_error_rate": stream_error_rate,
+        "seed": seed,
+    }
+    return app
+
+
+class _QueueStream(httpx.AsyncByteStream):
+    """Cuerpo de la respuesta que se entrega a medida que la aplicación lo envía."""
+
+    def __init__(self, queue: asyncio.Queue, task: asyncio.Task):
+        self._queue = queue
+        self._task = task
+
+    async def __aiter__(self):
+        while True:
+            item = await self._queue.get()
+            if item is None:
+                return
+            if isinstance(item, BaseException):
+                # Lo mismo que ve el cliente cuando se corta la conexión
+                raise httpx.ReadError(f"Conexión cortada: {item}") from item
+            yield item
+
+    async def aclose(self) -> None:
+        self._task.cancel()
+        await asyncio.gather(self._task, return_exceptions=True)
+
+
+class StubTransport(httpx.AsyncBaseTransport):
+    """
+    Transporte de httpx que llama a una aplicación ASGI dentro del proceso.
+
+    A diferencia de `httpx.ASGITransport`, que espera a que termine el cuerpo
+    completo, entrega cada fragmento en cuanto la aplicación lo envía, y un
+    flujo que se corta a mitad llega como `httpx.ReadError`, igual que sobre
+    un socket real.
+    """
+
+    def __init__(self, app: Any):
+        self.app = app
+
+    async def handle_async_request(self, request: httpx.Request) -> httpx.Response:
+        body = await request.aread()
+        scope = {
+            "type": "http",
+            "asgi": {"version": "3.0"},
+            "http_version": "1.1",
+            "method": request.method,
+            "scheme": request.url.scheme,
+            "path": request.url.path,
+            "raw_path": request.url.raw_path.split(b"?")[0],
+            "query_string": request.url.query,
+            "root_path": "",
+            "headers": [(key.lower(), value) for key, value in request.headers.raw],
+            "server": (request.url.host, request.url.port or 80),
+            "client": ("127.0.0.1", 0),
+        }
+        queue: asyncio.Queue = asyncio.Queue()
+        started = asyncio.get_running_loop().create_future()
+        received = False
+
+        async def receive() -> Dict[str, Any]:
+            nonlocal received
+            if not received:
+                received = True
+                return {"type": "http.request", "body": body, "more_body": False}
+            # El cliente no se desconecta: esperar hasta que se cancele la tarea
+            await asyncio.Event().wait()
+
+        async def send(message: Dict[str, Any]) -> None:
+            if message["type"] == "http.response.start":
+                started.set_result(message)
+            elif message["type"] == "http.response.body":
+                if message.get("body"):
+                    queue.put_nowait(message["body"])
+                if not message.get("more_body", False):
+                    queue.put_nowait(None)
+
+        async def run() -> None:
+            try:
+                await self.app(scope, receive, send)
+            except Exception as e:
+                if started.done():
+                    queue.put_nowait(e)
+                else:
+                    started.set_exception(e)
+
+        task = asyncio.create_task(run())
+        try:
+            start = await started
+        except Exception as e:
+            raise httpx.RemoteProtocolError(f"Conexión cortada: {e}", request=request) from e
+        return httpx.Response(
+            status_code=start["status"],
+            headers=start.get("headers", []),
+            stream=_QueueStream(queue, task),
+            request=request
+        )
+
+
+def from_env(environ: Optional[Dict[str, str]] = None) -> Starlette:
+    """Crea el stub con la configuración de las variables `STUB_N8N_*`."""
+    env = os.environ if environ is None else environ
+    response_words = env.get("STUB_N8N_RESPONSE_WORDS")
+    return create_app(
+        latency=env.get("STUB_N8N_LATENCY") or float(env.get("STUB_N8N_DELAY_MS", "0")),
+        chunk_latency=env.get("STUB_N8N_CHUNK_LATENCY") or float(env.get("STUB_N8N_CHUNK_DELAY_MS", "0")),
+        chunk_words=int(env.get("STUB_N8N_CHUNK_WORDS", "1")),
+        response_words=int(response_words) if response_words else None,
+        error_rate=float(env.get("STUB_N8N_ERROR_RATE", "0")),
+        error_status=int(env.get("STUB_N8N_ERROR_STATUS", "500")),
+        stream_error_rate=float(env.get("STUB_N8N_STREAM_ERROR_RATE", "0")),
+        seed=int(env.get("STUB_N8N_SEED", "0"))
+    )
+
+
+app = from_env()
@@ -37,7 +37,98 @@ class Settings(BaseSettings):
     
     # Configuración de la colección de tokens en MongoDB
     MONGO_TOKENS_COLLECTION: str = "token_blacklist"
-    
+
+    # Configuración del historial de conversaciones
+    MONGO_CHAT_SESSIONS_COLLECTION: str = "chat_sessions"
+    MONGO_CHAT_MESSAGES_COLLECTION: str = "chat_messages"
+    MONGO_CHAT_JOBS_COLLECTION: str = "chat_jobs"
+    CHAT_HISTORY_TAIL_SIZE: int = int(os.getenv("CHAT_HISTORY_TAIL_SIZE", "40"))  # Mensajes por sesión en caché
+    CHAT_HISTORY_CACHE_SESSIONS: int = int(os.getenv("CHAT_HISTORY_CACHE_SESSIONS", "5000"))
+    CHAT_HISTORY_CACHE_TTL_SECONDS: float = float(os.getenv("CHAT_HISTORY_CACHE_TTL_SECONDS", "1800"))
+    CHAT_HISTORY_FLUSH_INTERVAL: float = float(os.getenv("CHAT_HISTORY_FLUSH_INTERVAL", "0.2"))  # Segundos entre escrituras
+    CHAT_HISTORY_BATCH_SIZE: int = int(os.getenv("CHAT_HISTORY_BATCH_SIZE", "500"))
+
+    # Compactación del historial enviado a n8n: tokens de la cola reciente por grupo de edad
+    CHAT_CONTEXT_COMPACTION_ENABLED: bool = os.getenv("CHAT_CONTEXT_COMPACTION_ENABLED", "True").lower() in ("true", "1", "t")
+    CHAT_CONTEXT_TOKENS_3_5: int = int(os.getenv("CHAT_CONTEXT_TOKENS_3_5", "300"))
+    CHAT_CONTEXT_TOKENS_6_8: int = int(os.getenv("CHAT_CONTEXT_TOKENS_6_8", "600"))
+    CHAT_CONTEXT_TOKENS_9_12: int = int(os.getenv("CHAT_CONTEXT_TOKENS_9_12", "1000"))
+    CHAT_CONTEXT_SUMMARY_MAX_CHARS: int = int(os.getenv("CHAT_CONTEXT_SUMMARY_MAX_CHARS", "1500"))
+
+    # Configuración de la caché de respuestas del chat
+    CHAT_CACHE_ENABLED: bool = os.getenv("CHAT_CACHE_ENABLED", "True").lower() in ("true", "1", "t")
+    CHAT_CACHE_MAX_ENTRIES: int = int(os.getenv("CHAT_CACHE_MAX_ENTRIES", "10000"))
+    CHAT_CACHE_TTL_SECONDS: float = float(os.getenv("CHAT_CACHE_TTL_SECONDS", "3600"))
+    CHAT_CACHE_MAX_BYTES: int = int(os.getenv("CHAT_CACHE_MAX_BYTES", str(32 * 1024 * 1024)))
+    # Caché semántica: reutiliza respuestas de preguntas parecidas (vectores locales, sin red); opcional
+    CHAT_SEMANTIC_CACHE_ENABLED: bool = os.getenv("CHAT_SEMANTIC_CACHE_ENABLED", "False").lower() in ("true", "1", "t")
+    CHAT_SEMANTIC_CACHE_THRESHOLD: float = float(os.getenv("CHAT_SEMANTIC_CACHE_THRESHOLD", "0.9"))
+    CHAT_SEMANTIC_CACHE_CAPACITY: int = int(os.getenv("CHAT_SEMANTIC_CACHE_CAPACITY", "2000"))  # Por grupo de edad y persona
+    CHAT_SEMANTIC_CACHE_DIM: int = int(os.getenv("CHAT_SEMANTIC_CACHE_DIM", "512"))
+    # Plazo máximo de espera de las preguntas idénticas agrupadas en una sola llamada
+    CHAT_COALESCE_TIMEOUT_SECONDS: float = float(os.getenv("CHAT_COALESCE_TIMEOUT_SECONDS", "25"))
+
+    # Limitador adaptativo de generaciones simultáneas y descarte por sobrecarga
+    CHAT_CONCURRENCY_INITIAL: int = int(os.getenv("CHAT_CONCURRENCY_INITIAL", "16"))
+    CHAT_CONCURRENCY_MIN: int = int(os.getenv("CHAT_CONCURRENCY_MIN", "2"))
+    CHAT_CONCURRENCY_MAX: int = int(os.getenv("CHAT_CONCURRENCY_MAX", "64"))
+    CHAT_QUEUE_MAX: int = int(os.getenv("CHAT_QUEUE_MAX", "128"))  # Solicitudes en espera antes de descartar
+    CHAT_QUEUE_TIMEOUT_SECONDS: float = float(os.getenv("CHAT_QUEUE_TIMEOUT_SECONDS", "5"))
+    CHAT_LATENCY_THRESHOLD_SECONDS: float = float(os.getenv("CHAT_LATENCY_THRESHOLD_SECONDS", "8"))
+
+    # Cortocircuito del upstream: sirve las respuestas de respaldo mientras n8n no está sano
+    CHAT_BREAKER_WINDOW_SECONDS: float = float(os.getenv("CHAT_BREAKER_WINDOW_SECONDS", "30"))
+    CHAT_BREAKER_MIN_REQUESTS: int = int(os.getenv("CHAT_BREAKER_MIN_REQUESTS", "10"))
+    CHAT_BREAKER_FAILURE_RATE: float = float(os.getenv("CHAT_BREAKER_FAILURE_RATE", "0.5"))
+    CHAT_BREAKER_SLOW_CALL_SECONDS: float = float(os.getenv("CHAT_BREAKER_SLOW_CALL_SECONDS", "10"))
+    CHAT_BREAKER_SLOW_CALL_RATE: float = float(os.getenv("CHAT_BREAKER_SLOW_CALL_RATE", "0.8"))
+    CHAT_BREAKER_OPEN_SECONDS: float = float(os.getenv("CHAT_BREAKER_OPEN_SECONDS", "15"))
+    CHAT_BREAKER_HALF_OPEN_PROBES: int = int(os.getenv("CHAT_BREAKER_HALF_OPEN_PROBES", "3"))
+
+    # Respuestas especulativas de las sugerencias devueltas (opcional)
+    CHAT_SPECULATION_ENABLED: bool = os.getenv("CHAT_SPECULATION_ENABLED", "False").lower() in ("true", "1", "t")
+    CHAT_SPECULATION_BUDGET: float = float(os.getenv("CHAT_SPECULATION_BUDGET", "1.0"))  # Especulaciones por respuesta real
+    CHAT_SPECULATION_MAX_IN_FLIGHT: int = int(os.getenv("CHAT_SPECULATION_MAX_IN_FLIGHT", "4"))
+    CHAT_SPECULATION_MAX_PER_RESPONSE: int = int(os.getenv("CHAT_SPECULATION_MAX_PER_RESPONSE", "3"))
+    CHAT_SPECULATION_MAX_LOAD: float = float(os.getenv("CHAT_SPECULATION_MAX_LOAD", "0.5"))  # Fracción del límite de concurrencia
+
+    # Generaciones en segundo plano (`/api/chat/jobs`)
+    CHAT_JOBS_WORKERS: int = int(os.getenv("CHAT_JOBS_WORKERS", "4"))  # Trabajos simultáneos por proceso
+    CHAT_JOBS_MAX_QUEUE: int = int(os.getenv("CHAT_JOBS_MAX_QUEUE", "200"))
+    CHAT_JOBS_TTL_SECONDS: float = float(os.getenv("CHAT_JOBS_TTL_SECONDS", "3600"))
+    CHAT_JOBS_SAVE_INTERVAL: float = float(os.getenv("CHAT_JOBS_SAVE_INTERVAL", "1.0"))  # Segundos entre escrituras del texto parcial
+    CHAT_JOBS_POLL_INTERVAL: float = float(os.getenv("CHAT_JOBS_POLL_INTERVAL", "1.0"))
+
+    # Canal WebSocket del chat: límite de mensajes por conexión y cierre por inactividad
+    CHAT_WS_RATE_LIMIT_MESSAGES: int = int(os.getenv("CHAT_WS_RATE_LIMIT_MESSAGES", "30"))
+    CHAT_WS_RATE_LIMIT_WINDOW: int = int(os.getenv("CHAT_WS_RATE_LIMIT_WINDOW", "60"))
+    CHAT_WS_IDLE_TIMEOUT_SECONDS: float = float(os.getenv("CHAT_WS_IDLE_TIMEOUT_SECONDS", "300"))
+
+    # Filtro de seguridad infantil de mensajes y respuestas (la lista se recarga sola al cambiar)
+    SAFETY_FILTER_ENABLED: bool = os.getenv("SAFETY_FILTER_ENABLED", "True").lower() in ("true", "1", "t")
+    SAFETY_BLOCKLIST_PATH: str = os.getenv(
+        "SAFETY_BLOCKLIST_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "app", "data", "safety_blocklist.txt")
+    )
+    SAFETY_RELOAD_INTERVAL_SECONDS: float = float(os.getenv("SAFETY_RELOAD_INTERVAL_SECONDS", "5"))
+
+    # Índice BM25 en memoria de módulos y actividades para fundamentar las respuestas del chat
+    CONTENT_INDEX_ENABLED: bool = os.getenv("CONTENT_INDEX_ENABLED", "True").lower() in ("true", "1", "t")
+    CONTENT_INDEX_TOP_K: int = int(os.getenv("CONTENT_INDEX_TOP_K", "3"))
+    CONTENT_INDEX_MIN_SCORE: float = float(os.getenv("CONTENT_INDEX_MIN_SCORE", "0.5"))
+    CONTENT_INDEX_POLL_SECONDS: float = float(os.getenv("CONTENT_INDEX_POLL_SECONDS", "10"))
+    CONTENT_INDEX_REBUILD_SECONDS: float = float(os.getenv("CONTENT_INDEX_REBUILD_SECONDS", "600"))
+
+    # Configuración de la caché de usuarios autenticados
+    PRINCIPAL_CACHE_MAX_SIZE: int = int(os.getenv("PRINCIPAL_CACHE_MAX_SIZE", "10000"))
+    PRINCIPAL_CACHE_TTL_SECONDS: float = float(os.getenv("PRINCIPAL_CACHE_TTL_SECONDS", "60"))
+
+    # Configuración del índice en memoria de tokens revocados
+    REVOCATION_FILTER_CAPACITY: int = int(os.getenv("REVOCATION_FILTER_CAPACITY", "100000"))
+    REVOCATION_FILTER_ERROR_RATE: float = float(os.getenv("REVOCATION_FILTER_ERROR_RATE", "0.001"))
+    REVOCATION_RECENT_SIZE: int = int(os.getenv("REVOCATION_RECENT_SIZE", "10000"))
+    REVOCATION_POLL_SECONDS: float = float(os.getenv("REVOCATION_POLL_SECONDS", "2"))
+
     # Configuración de la base de datos
     MONGODB_URL: str = "mongodb://localhost:27017"
     DB_NAME: str = "gemini_educacion"
@@ -48,6 +139,22 @@ class Settings(BaseSettings):
     # Configuración de n8n para el chatbot
     N8N_WEBHOOK_URL: str = os.getenv("N8N_WEBHOOK_URL", "http://localhost:5678/webhook/gemini")
     N8N_API_KEY: str = os.getenv("N8N_API_KEY", "")
+    N8N_MAX_CONNECTIONS: int = int(os.getenv("N8N_MAX_CONNECTIONS", "100"))
+    N8N_MAX_KEEPALIVE: int = int(os.getenv("N8N_MAX_KEEPALIVE", "20"))
+    N8N_KEEPALIVE_EXPIRY: float = float(os.getenv("N8N_KEEPALIVE_EXPIRY", "30"))
+    N8N_CONNECT_TIMEOUT: float = float(os.getenv("N8N_CONNECT_TIMEOUT", "2"))
+    N8N_READ_TIMEOUT: float = float(os.getenv("N8N_READ_TIMEOUT", "20"))
+    N8N_WRITE_TIMEOUT: float = float(os.getenv("N8N_WRITE_TIMEOUT", "5"))
+    N8N_POOL_TIMEOUT: float = float(os.getenv("N8N_POOL_TIMEOUT", "2"))
+    N8N_MAX_RETRIES: int = int(os.getenv("N8N_MAX_RETRIES", "2"))
+    N8N_RETRY_BACKOFF: float = float(os.getenv("N8N_RETRY_BACKOFF", "0.2"))  # Base en segundos
+    N8N_MAX_CONCURRENCY: int = int(os.getenv("N8N_MAX_CONCURRENCY", "64"))
+    # Cobertura (hedging): duplicar las solicitudes que tardan más que el percentil reciente
+    N8N_HEDGE_ENABLED: bool = os.getenv("N8N_HEDGE_ENABLED", "False").lower() in ("true", "1", "t")
+    N8N_HEDGE_PERCENTILE: float = float(os.getenv("N8N_HEDGE_PERCENTILE", "95"))
+    N8N_HEDGE_BUDGET: float = float(os.getenv("N8N_HEDGE_BUDGET", "0.05"))  # Fracción máxima de duplicados
+    N8N_HEDGE_MIN_SAMPLES: int = int(os.getenv("N8N_HEDGE_MIN_SAMPLES", "20"))
+    N8N_HEDGE_MIN_DELAY: float = float(os.getenv("N8N_HEDGE_MIN_DELAY", "0.1"))
     
     # Configuración de correo electrónico
     SMTP_TLS: bool = os.getenv("SMTP_TLS", "True").lower() in ("true", "1", "t")
@@ -7,7 +7,7 @@ logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
 async def test_auth():
-    url = "http://localhost:8000/api/v1/auth/auth/token"
+    url = "http://localhost:8000/api/v1/auth/token"
     data = {
         "grant_type": "password",
         "username": "admin",
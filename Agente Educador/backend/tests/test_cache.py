@@ -0,0 +1,120 @@
+"""
+Pruebas para las cachés en memoria del proceso.
+"""
+import time
+
+from app.core.cache import PrincipalCache, TTLCache
+from app.models.user import UserInDB
+
+
+def make_user(username: str = "nino1", user_id: str = "507f1f77bcf86cd799439011") -> UserInDB:
+    """Crea un usuario de prueba sin tocar la base de datos."""
+    return UserInDB(
+        _id=user_id,
+        username=username,
+        email=f"{username}@example.com",
+        hashed_password="hash",
+    )
+
+
+def test_ttl_cache_lru_eviction():
+    """El elemento menos usado recientemente se desaloja primero."""
+    cache = TTLCache(max_size=2, ttl=60)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+    assert cache.stats()["evictions"] == 1
+
+
+def test_ttl_cache_expiration():
+    """Las entradas expiradas cuentan como fallo."""
+    cache = TTLCache(max_size=10, ttl=0.01)
+    cache.set("a", 1)
+    time.sleep(0.02)
+
+    assert cache.get("a") is None
+    stats = cache.stats()
+    assert stats["misses"] == 1
+    assert stats["expirations"] == 1
+
+
+def test_principal_cache_invalidation_by_id():
+    """Invalidar por ID elimina también la entrada por nombre de usuario."""
+    cache = PrincipalCache(max_size=10, ttl=60)
+    user = make_user()
+    cache.set(user)
+    assert cache.get("NINO1") is user
+
+    cache.invalidate_user_id(user.id)
+
+    assert cache.get("nino1") is None
+    stats = cache.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 1
+
+
+def test_ttl_cache_cost_budget():
+    """El coste total se mantiene bajo el máximo desalojando por LRU."""
+    cache = TTLCache(max_size=100, ttl=60, max_cost=10)
+    cache.set("a", 1, cost=4)
+    cache.set("b", 2, cost=4)
+    cache.get("a")
+    cache.set("c", 3, cost=4)
+
+    assert cache.get("b") is None
+    assert cache.cost == 8
+    assert cache.set("enorme", 4, cost=11) is False
+    assert "enorme" not in cache
+
+
+def test_principal_cache_invalidation_by_id_under_pressure():
+    """Invalidar por ID funciona aunque la caché esté llena y el usuario no se haya consultado por ID."""
+    cache = PrincipalCache(max_size=3, ttl=60)
+    user = make_user()
+    cache.set(user)
+    for i in range(2):
+        cache.set(make_user(f"otro{i}", f"507f1f77bcf86cd79943902{i}"))
+        assert cache.get("nino1") is user
+
+    cache.invalidate_user_id(user.id)
+    assert cache.get("nino1") is None
+
+    for i in range(10):
+        cache.set(make_user(f"relleno{i}", f"507f1f77bcf86cd79943903{i}"))
+    assert len(cache._usernames) <= 6
+
+
+def test_principal_cache_skips_reads_that_raced_an_invalidation():
+    """Un usuario leído antes de invalidarlo no vuelve a la caché."""
+    cache = PrincipalCache(max_size=2, ttl=60)
+    user = make_user()
+    before = cache.generation()
+    cache.invalidate_user_id(user.id)  # Se desactiva mientras se lee
+    cache.set(user, before)
+    assert cache.get("nino1") is None
+
+    cache.set(user, cache.generation())
+    assert cache.get("nino1") is user
+
+    # Con muchas invalidaciones se olvidan y las lecturas antiguas se descartan
+    stale = cache.generation()
+    for i in range(5):
+        cache.invalidate_user_id(f"507f1f77bcf86cd79943904{i}")
+    cache.invalidate_username("nino1")
+    cache.set(make_user("otro"), stale)
+    assert cache.get("otro") is None and len(cache._invalidated) <= 2
+
+
+def test_principal_cache_rename_drops_old_username():
+    """Si cambia el nombre de usuario, la entrada antigua deja de autenticar."""
+    cache = PrincipalCache(max_size=10, ttl=60)
+    cache.set(make_user("nino1"))
+    cache.set(make_user("ninonuevo"))
+
+    assert cache.get("nino1") is None
+    assert cache.get("ninonuevo") is not None
@@ -0,0 +1,195 @@
+"""
+Pruebas para las generaciones de chat en segundo plano.
+"""
+import asyncio
+
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+from app.api.dependencies.auth import get_current_user
+from app.api.endpoints import chat as chat_endpoints
+from app.models.chat_models import ChatJobStatus, ChatRequest
+from app.services.chat_jobs import ChatJobManager, ChatJobNotFoundError, ChatJobQueueFullError
+from app.services.chat_service import ChatService, chat_service
+from app.services.n8n_client import N8NClient
+from benchmarks.stub_n8n import create_app
+from tests.test_chat_repository import make_repository
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+class FakeJobs:
+    """Colección `chat_jobs` en memoria."""
+
+    def __init__(self):
+        self.docs = {}
+        self.updates = 0
+
+    async def insert_one(self, doc):
+        self.docs[doc["_id"]] = dict(doc)
+
+    async def update_one(self, query, update):
+        self.updates += 1
+        self.docs[query["_id"]].update(update["$set"])
+
+    async def find_one(self, query):
+        doc = self.docs.get(query["_id"])
+        return dict(doc) if doc is not None else None
+
+
+@pytest.fixture
+def make_service(n8n_client):
+    """Servicio de chat con el historial en memoria."""
+
+    async def make(chunk_delay_ms=0.0):
+        return ChatService(n8n=await n8n_client(create_app(chunk_delay_ms=chunk_delay_ms)), history=make_repository())
+
+    return make
+
+
+async def collect(events):
+    return [(event, data) async for event, data in events]
+
+
+@pytest.mark.asyncio
+async def test_job_streams_remaining_chunks_and_persists_result(make_service, ask):
+    """El trabajo se sigue en vivo desde un offset y su resultado queda guardado."""
+    jobs = FakeJobs()
+    manager = ChatJobManager(service=await make_service(chunk_delay_ms=5), workers=1, save_interval=0.0)
+    await manager.start(jobs)
+    try:
+        job = await manager.submit(ask("¿Qué es un volcán?"), "ana")
+        assert job["status"] == "queued"
+        with pytest.raises(ChatJobNotFoundError):
+            await manager.get(job["_id"], "luis")
+
+        while len((await manager.get(job["_id"], "ana"))["output"]) < 5:
+            await asyncio.sleep(0.005)
+        events = await collect(manager.follow(job["_id"], "ana", offset=5))
+    finally:
+        await manager.stop()
+
+    text = "[6-8] Respuesta a: ¿Qué es un volcán?"
+    assert "".join(data["text"] for event, data in events if event == "token") == text[5:]
+    assert events[-1][0] == "done" and events[-1][1]["suggestions"]
+    stored = jobs.docs[job["_id"]]
+    assert (stored["status"], stored["output"]) == ("completed", text)
+    assert jobs.updates > 2  # Texto parcial guardado durante la generación
+    assert manager.stats()["completed"] == 1
+
+
+@pytest.mark.asyncio
+async def test_job_of_another_process_is_followed_from_mongo(make_service, ask):
+    """Otro proceso sigue el trabajo consultando el registro guardado."""
+    service = await make_service(chunk_delay_ms=5)
+    jobs = FakeJobs()
+    runner = ChatJobManager(service=service, workers=1, save_interval=0.0)
+    reader = ChatJobManager(service=service, poll_interval=0.01)
+    reader.collection = jobs
+    await runner.start(jobs)
+    try:
+        job = await runner.submit(ask("Cuéntame un cuento"), "ana")
+        events = await collect(reader.follow(job["_id"], "ana"))
+    finally:
+        await runner.stop()
+
+    assert "".join(data["text"] for event, data in events if event == "token") == \
+        "[6-8] Respuesta a: Cuéntame un cuento"
+    assert events[-1][0] == "done"
+
+
+@pytest.mark.asyncio
+async def test_full_queue_rejects_and_stop_fails_pending_jobs(make_service, ask):
+    """Con la cola llena se rechazan trabajos; al cerrar, los pendientes se marcan como fallidos."""
+    manager = ChatJobManager(service=await make_service(), max_queue=1)
+    job = await manager.submit(ask("Hola"), "ana")
+    with pytest.raises(ChatJobQueueFullError):
+        await manager.submit(ask("Hola otra vez"), "ana")
+
+    await manager.stop()
+    stored = await manager.get(job["_id"], "ana")
+    assert stored["status"] == ChatJobStatus.FAILED.value
+    events = await collect(manager.follow(job["_id"], "ana"))
+    assert [event for event, _ in events] == ["error"]
+    assert manager.stats()["rejected"] == 1
+
+
+@pytest.mark.asyncio
+async def test_concurrent_submits_do_not_overfill_queue(make_service, ask):
+    """Los envíos simultáneos respetan la cola aunque guardar el registro tarde."""
+    jobs = FakeJobs()
+    insert_one = jobs.insert_one
+
+    async def slow_insert_one(doc):
+        await asyncio.sleep(0.01)
+        await insert_one(doc)
+
+    jobs.insert_one = slow_insert_one
+    manager = ChatJobManager(service=await make_service(), max_queue=1)
+    manager.collection = jobs
+    results = await asyncio.gather(
+        *(manager.submit(ask(f"Pregunta {i}"), "ana") for i in range(3)), return_exceptions=True
+    )
+
+    assert sum(isinstance(result, dict) for result in results) == 1
+    assert sum(isinstance(result, ChatJobQueueFullError) for result in results) == 2
+    assert len(jobs.docs) == 1 and manager.stats()["queued"] == 1
+    assert manager.stats()["rejected"] == 2
+
+
+async def test_job_endpoints(monkeypatch, make_service):
+    """`POST /jobs` responde al instante y `GET /jobs/{id}` devuelve el estado o el flujo SSE."""
+    service = await make_service()
+    for name in ("n8n", "history", "response_cache"):
+        monkeypatch.setattr(chat_service, name, getattr(service, name))
+    manager = ChatJobManager(service=chat_service, workers=1)
+    monkeypatch.setattr(chat_endpoints, "chat_job_manager", manager)
+
+    app = FastAPI(on_startup=[manager.start], on_shutdown=[manager.stop])
+    app.include_router(chat_endpoints.router, prefix="/api/chat")
+    app.dependency_overrides[get_current_user] = lambda: {"username": "ana"}
+    with TestClient(app) as client:
+        created = client.post("/api/chat/jobs", json={"message": "¿Qué es la luna?", "age_group": "9-12"})
+        assert created.status_code == 202
+        job_id = created.json()["job_id"]
+
+        streamed = client.get(f"/api/chat/jobs/{job_id}", params={"stream": "true"})
+        assert streamed.headers["content-type"].startswith("text/event-stream")
+        assert "event: done" in streamed.text
+
+        final = client.get(f"/api/chat/jobs/{job_id}").json()
+        assert final["status"] == "completed"
+        assert final["response"]["response"] == "[9-12] Respuesta a: ¿Qué es la luna?"
+        assert final["response"]["session_id"]
+
+        assert client.get("/api/chat/jobs/no-existe").status_code == 404
@@ -0,0 +1,138 @@
+"""
+Pruebas para el historial de conversaciones guardado en el servidor.
+"""
+import pytest
+
+from app.models.chat_models import ChatRequest
+from app.repositories.chat_repository import ChatRepository, ChatSessionNotFoundError
+from app.services.chat_service import ChatService
+from app.services.n8n_client import N8NClient
+
+
+class FakeCursor:
+    """Cursor mínimo con sort/limit/to_list."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, key, direction):
+        self.docs = sorted(self.docs, key=lambda d: d[key], reverse=direction < 0)
+        return self
+
+    def limit(self, n):
+        self.docs = self.docs[:n]
+        return self
+
+    async def to_list(self, length=None):
+        return list(self.docs)
+
+
+class FakeCollection:
+    """Colección en memoria que solo implementa lo que usa el repositorio."""
+
+    def __init__(self):
+        self.docs = []
+        self.insert_many_calls = 0
+        self.fail = False
+
+    async def insert_one(self, doc):
+        self.docs.append(dict(doc))
+
+    async def insert_many(self, docs, ordered=True):
+        if self.fail:
+            raise ConnectionError("MongoDB no disponible")
+        self.insert_many_calls += 1
+        self.docs.extend(dict(d) for d in docs)
+
+    async def find_one(self, query):
+        return next((d for d in self.docs if d["_id"] == query["_id"]), None)
+
+    def find(self, query):
+        seq = query.get("seq", {})
+        return FakeCursor([
+            d for d in self.docs
+            if d["session_id"] == query["session_id"]
+            and seq.get("$gte", d["seq"]) <= d["seq"] < seq.get("$lt", d["seq"] + 1)
+        ])
+
+    async def bulk_write(self, operations, ordered=True):
+        pass
+
+
+def make_repository(tail_size=10):
+    repository = ChatRepository(tail_size=tail_size)
+    repository.sessions, repository.messages = FakeCollection(), FakeCollection()
+    return repository
+
+
+def make_service(repository):
+    # Cliente sin iniciar: se usan respuestas de respaldo
+    return ChatService(n8n=N8NClient(url="http://n8n.test/webhook"), history=repository)
+
+
+@pytest.mark.asyncio
+async def test_session_keeps_history_between_turns():
+    """El cliente envía solo el mensaje nuevo y el servidor aporta el historial."""
+    repository = make_repository()
+    service = make_service(repository)
+
+    first = await service.process_chat(await service.prepare_request(
+        ChatRequest(message="Hola", age_group="6-8"), "ana"
+    ))
+    assert first.session_id
+
+    request = await service.prepare_request(
+        ChatRequest(session_id=first.session_id, message="¿Qué es la luna?", age_group="6-8"), "ana"
+    )
+    assert [m.content for m in request.messages][::2] == ["Hola", "¿Qué es la luna?"]
+    await service.process_chat(request)
+
+    # Los mensajes se escriben en un solo lote con su número de secuencia
+    assert repository.messages.docs == []
+    await repository.flush()
+    assert repository.messages.insert_many_calls == 1
+    assert [d["seq"] for d in repository.messages.docs] == [0, 1, 2, 3]
+
+    # Tras vaciar la caché, el historial se recupera de MongoDB
+    repository._tails.clear()
+    history = await repository.get_history(first.session_id, "ana")
+    assert [m.role.value for m in history] == ["user", "assistant", "user", "assistant"]
+
+
+@pytest.mark.asyncio
+async def test_session_of_another_user_is_not_found():
+    """Una sesión solo es accesible para su propietario."""
+    repository = make_repository()
+    session = await repository.create_session("ana", "6-8", "Hola")
+
+    with pytest.raises(ChatSessionNotFoundError):
+        await repository.get_history(session["_id"], "luis")
+    with pytest.raises(ChatSessionNotFoundError):
+        await repository.get_history("no-existe", "ana")
+
+
+@pytest.mark.asyncio
+async def test_failed_flush_keeps_messages_and_tail_is_bounded():
+    """Un fallo de escritura no pierde mensajes y la caché guarda solo la cola."""
+    repository = make_repository(tail_size=3)
+    service = make_service(repository)
+    request = await service.prepare_request(ChatRequest(message="uno", age_group="3-5"), "ana")
+    await service.process_chat(request)
+    for text in ("dos", "tres"):
+        await service.process_chat(await service.prepare_request(
+            ChatRequest(session_id=request.session_id, message=text, age_group="3-5"), "ana"
+        ))
+
+    repository.messages.fail = True
+    assert await repository.flush() is False
+    assert repository.stats()["pending_messages"] == 6
+
+    # Los mensajes pendientes forman parte del historial aunque se recargue la sesión
+    repository._tails.clear()
+    history = await repository.get_history(request.session_id, "ana")
+    assert [m.content for m in history][1] == "tres"
+    assert len(history) == 3
+
+    repository.messages.fail = False
+    assert await repository.flush() is True
+    assert [d["seq"] for d in repository.messages.docs] == list(range(6))
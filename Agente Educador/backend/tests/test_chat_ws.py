@@ -0,0 +1,103 @@
+"""
+Pruebas para el canal WebSocket del chat.
+"""
+import httpx
+import pytest
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+from starlette.websockets import WebSocketDisconnect
+
+from app.api.dependencies.auth import create_access_token
+from app.api.endpoints import chat as chat_endpoints
+from app.services.chat_service import chat_service
+from app.services.n8n_client import N8NClient
+from benchmarks.stub_n8n import create_app
+from config import settings
+from tests.test_chat_repository import make_repository
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+async def client(monkeypatch, n8n_client):
+    monkeypatch.setattr(chat_service, "n8n", await n8n_client())
+    monkeypatch.setattr(chat_service, "history", make_repository())
+    monkeypatch.setattr(chat_service, "response_cache", None)
+    app = FastAPI()
+    app.include_router(chat_endpoints.router, prefix="/api/chat")
+    with TestClient(app) as test_client:
+        yield test_client
+
+
+def receive_turn(ws):
+    """Recibe las tramas de un turno hasta la trama final o de error."""
+    frames = []
+    while not frames or frames[-1]["type"] not in ("done", "error"):
+        frames.append(ws.receive_json())
+    return frames
+
+
+def test_rejects_connection_without_valid_token(client):
+    """Sin token válido la conexión se cierra antes de aceptarse."""
+    for url in ("/api/chat/ws", "/api/chat/ws?token=no-es-un-jwt"):
+        with pytest.raises(WebSocketDisconnect) as exc:
+            with client.websocket_connect(url):
+                pass
+        assert exc.value.code == 1008
+
+
+def test_streams_turns_and_keeps_session_state(client):
+    """Se autentica una vez y la sesión y el contexto se conservan entre turnos."""
+    token = create_access_token({"sub": "ana"})
+    with client.websocket_connect(f"/api/chat/ws?token={token}&age_group=9-12") as ws:
+        assert ws.receive_json() == {"type": "ready", "session_id": None}
+
+        ws.send_json({"message": "¿Qué es un volcán?"})
+        first = receive_turn(ws)
+        text = "".join(frame["text"] for frame in first if frame["type"] == "token")
+        assert text.strip() == "[9-12] Respuesta a: ¿Qué es un volcán?"
+        done = first[-1]
+        assert done["type"] == "done" and done["session_id"]
+
+        ws.send_text("¿Y un géiser?")  # Texto plano: mismo grupo de edad y sesión
+        second = receive_turn(ws)
+        assert second[-1]["session_id"] == done["session_id"]
+        assert second[-1]["context"]["message_count"] == 2
+
+        ws.send_json({"message": ""})
+        assert receive_turn(ws)[-1]["code"] == "invalid_message"
+
+    history = chat_service.history._tails.peek(done["session_id"]).messages
+    assert [m.content for m in history][::2] == ["¿Qué es un volcán?", "¿Y un géiser?"]
+
+
+def test_applies_per_connection_rate_limit(client, monkeypatch):
+    """Cada conexión tiene su propio límite de mensajes."""
+    monkeypatch.setattr(settings, "CHAT_WS_RATE_LIMIT_MESSAGES", 1)
+    token = create_access_token({"sub": "ana"})
+    for _ in range(2):
+        with client.websocket_connect(f"/api/chat/ws?token={token}") as ws:
+            ws.receive_json()
+            ws.send_text("Hola")
+            assert receive_turn(ws)[-1]["type"] == "done"
+            ws.send_text("Hola otra vez")
+            error = receive_turn(ws)[-1]
+            assert error["code"] == "rate_limited" and error["retry_after"] >= 1
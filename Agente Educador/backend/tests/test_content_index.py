@@ -0,0 +1,148 @@
+"""
+Pruebas para el índice BM25 de módulos y actividades del chat.
+"""
+import sys
+import timeit
+from datetime import datetime
+
+import pytest
+from bson import ObjectId
+
+from app.core.text import fold_text, stem_spanish, tokenize
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService
+from app.services.content_index import BM25Index, ContentIndex
+from app.services.n8n_client import N8NClient
+
+
+class FakeCursor:
+    """Cursor asíncrono mínimo sobre una lista de documentos."""
+
+    def __init__(self, docs):
+        self._iter = iter(docs)
+
+    def __aiter__(self):
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Colección en memoria que solo implementa lo que usa el índice."""
+
+    def __init__(self, docs=()):
+        self.docs = list(docs)
+
+    def find(self, query):
+        floor = query.get("updated_at", {}).get("$gt")
+        active_only = "is_active" in query
+        return FakeCursor([
+            d for d in self.docs
+            if (floor is None or d["updated_at"] > floor) and not (active_only and d.get("is_active") is False)
+        ])
+
+
+def module(title, description, ages=("3-5", "6-8", "9-12"), updated_at=None, **extra):
+    return {"_id": ObjectId(), "title": title, "description": description, "slug": fold_text(title).replace(" ", "-"),
+            "target_age_groups": list(ages), "is_active": True,
+            "updated_at": updated_at or datetime(2026, 1, 1), **extra}
+
+
+def seed_modules():
+    return [
+        module("Matemáticas Básicas", "Aprende a sumar, restar y contar números de manera divertida."),
+        module("Historia Universal", "Descubre los eventos más importantes de la historia.", ages=("6-8", "9-12")),
+        module("Ciencias Naturales", "Explora la fotosíntesis de las plantas y los animales del océano."),
+    ]
+
+
+def test_tokenize_folds_accents_stems_and_drops_stopwords():
+    """Las variantes de una palabra comparten raíz; las palabras vacías se descartan."""
+    assert tokenize("¿Qué es la Fotosíntesis?") == tokenize("fotosintesis")
+    assert stem_spanish("numeros") == stem_spanish("numero") == stem_spanish("numeracion")
+    assert stem_spanish("animales") == stem_spanish("animal")
+    assert tokenize("de la y en 2024") == []
+
+
+def test_bm25_ranks_and_updates_incrementally():
+    """El título pesa más que la descripción; quitar un documento retira sus términos."""
+    index = BM25Index()
+    index.add("a", [("Los planetas", 2.0), ("El sistema solar y sus lunas", 1.0)])
+    index.add("b", [("Las plantas", 2.0), ("Los planetas que vemos de noche", 1.0)])
+
+    assert [doc_id for _, doc_id in index.search("planeta", 2)] == ["a", "b"]
+    index.add("a", [("Los volcanes", 2.0), ("", 1.0)])
+    assert [doc_id for _, doc_id in index.search("planetas", 2)] == ["b"]
+    assert index.remove("b") and not index.remove("b")
+    assert index.search("planetas", 2) == [] and index.terms == 1
+
+
+@pytest.mark.asyncio
+async def test_loads_polls_and_filters_by_age_group():
+    """Carga al iniciar, recoge los cambios por `updated_at` y respeta los grupos de edad."""
+    seeded = seed_modules()
+    modules = FakeCollection(seeded)
+    activities = FakeCollection([{
+        "_id": ObjectId(), "module_id": seeded[1]["_id"], "title": "Los dinosaurios",
+        "description": "Conoce los dinosaurios que vivieron hace millones de años.",
+        "updated_at": datetime(2026, 1, 1),
+    }])
+    index = ContentIndex(min_score=0.0, clock_skew=0)
+    await index.start(modules, activities)
+    try:
+        assert index.search("¿cómo se hace la fotosíntesis?")[0].passage.slug == "ciencias-naturales"
+        # La actividad hereda los grupos de edad de su módulo
+        assert index.search("dinosaurios", "9-12")[0].passage.kind == "activity"
+        assert index.search("dinosaurios", "3-5") == []
+
+        later = datetime(2026, 1, 2)
+        seeded[0].update(description="Aprende las fracciones y los decimales.", updated_at=later)
+        seeded[2].update(is_active=False, updated_at=later)
+        assert await index.poll() == 2
+        assert index.search("fracciones")[0].passage.slug == "matematicas-basicas"
+        assert index.search("fotosintesis") == []
+        assert index.stats()["passages"] == 3
+    finally:
+        await index.stop()
+
+
+def test_activities_of_an_unindexed_module_are_hidden():
+    """Las actividades de un módulo inactivo o aún no leído no se devuelven a ningún grupo."""
+    history = module("Historia Universal", "Los grandes imperios.", ages=("9-12",))
+    index = ContentIndex(min_score=0.0)
+    index.upsert_activity({"_id": ObjectId(), "module_id": history["_id"], "title": "Los dinosaurios",
+                           "description": "Conoce los dinosaurios."})
+    assert index.search("dinosaurios") == index.search("dinosaurios", "3-5") == []
+
+    index.upsert_module(history)
+    assert index.search("dinosaurios", "9-12")[0].passage.kind == "activity"
+    assert index.search("dinosaurios", "3-5") == []
+
+    index.upsert_module({**history, "is_active": False})
+    assert index.search("dinosaurios") == index.search("dinosaurios", "3-5") == []
+    index.upsert_module(history)
+    assert index.search("dinosaurios", "9-12")[0].passage.kind == "activity"
+
+
+@pytest.mark.asyncio
+async def test_chat_payload_includes_passages_and_search_is_fast():
+    """n8n recibe los pasajes relevantes; cada búsqueda cuesta bastante menos de 1 ms."""
+    index = ContentIndex()
+    for i in range(500):
+        index.upsert_module(module(f"Módulo {i}", f"Tema número {i} sobre colores, formas y letras."))
+    index.upsert_module(module("El Sistema Solar", "Los planetas giran alrededor del Sol."))
+    service = ChatService(n8n=N8NClient(url="http://n8n.test/webhook"), content=index)  # Cliente sin iniciar
+    request = ChatRequest(messages=[{"role": "user", "content": "¿Cuántos planetas hay?"}], age_group="6-8")
+
+    payload = service._build_payload(request, "¿Cuántos planetas hay?")
+
+    assert [p["slug"] for p in payload["passages"]] == ["el-sistema-solar"]
+    assert payload["passages"][0]["source"] == "module"
+    best = min(timeit.repeat(lambda: index.search("¿Cuántos planetas giran alrededor del Sol?"), number=200, repeat=5)) / 200
+    # La medición de cobertura ralentiza cada línea de Python
+    assert best < (200e-6 if sys.gettrace() is None else 600e-6)
+
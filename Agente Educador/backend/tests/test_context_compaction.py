@@ -0,0 +1,158 @@
+"""
+Pruebas para la compactación del historial enviado a n8n.
+"""
+import json
+
+import httpx
+import pytest
+
+from app.models.chat_models import ChatRequest, Message
+from app.services.chat_service import ChatService, ResponseCache
+from app.services.history_compactor import HistoryCompactor, estimate_tokens
+from app.services.n8n_client import N8NClient
+from benchmarks.stub_n8n import create_app
+from tests.test_chat_repository import make_repository
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+def turns(count):
+    return [
+        Message(role="user" if i % 2 == 0 else "assistant", content=f"Mensaje número {i}. Con más detalle.")
+        for i in range(count)
+    ]
+
+
+def test_recent_tail_fits_budget_and_older_turns_are_summarized():
+    """La cola cabe en el presupuesto del grupo de edad y lo anterior se resume."""
+    compactor = HistoryCompactor(budgets={"3-5": 40, "9-12": 100})
+    messages = turns(20)
+
+    small = compactor.compact(messages, "3-5")
+    large = compactor.compact(messages, "9-12")
+    assert 0 < len(small.messages) < len(large.messages) < 20
+    assert sum(estimate_tokens(m.content) for m in large.messages) <= 100
+    assert large.messages[-1].content == messages[-1].content
+    assert small.summary.splitlines()[0] == "- Niño: Mensaje número 0."
+    assert small.covered == 20 - len(small.messages)
+
+    # El último mensaje se envía siempre, aunque supere el presupuesto
+    huge = [Message(role="user", content="a" * 1000)]
+    assert compactor.compact(huge, "3-5").messages == huge
+
+
+def test_summary_is_incremental_and_bounded():
+    """Solo se resumen los turnos nuevos y el resumen descarta las líneas más antiguas."""
+    compactor = HistoryCompactor(budgets={"6-8": 40}, summary_max_chars=120)
+    first = compactor.compact(turns(10), "6-8")
+
+    # Dos turnos más, vistos desde la sesión: el historial empieza en la posición 2
+    second = compactor.compact(turns(12)[2:], "6-8", first.summary, first.covered, offset=2)
+    assert second.updated and second.covered == first.covered + 2
+    assert compactor.summarized_messages == first.covered + 2
+    assert len(second.summary) <= 120
+    assert second.summary.splitlines()[-1].endswith(f": Mensaje número {second.covered - 1}.")
+
+    unchanged = compactor.compact(turns(12)[2:], "6-8", second.summary, second.covered, offset=2)
+    assert not unchanged.updated and unchanged.summary == second.summary
+
+
+def test_gap_before_history_is_recorded_and_skipped():
+    """Si el resumen no llega al principio del historial, se registra el hueco y el resumen avanza."""
+    compactor = HistoryCompactor(budgets={"6-8": 1000})
+    compacted = compactor.compact(turns(10)[4:], "6-8", "- Niño: Mensaje número 0.", covered=1, offset=4)
+
+    assert compacted.updated and compacted.covered == 4
+    assert len(compacted.messages) == 6
+    assert compactor.stats()["gaps"] == 1 and compactor.stats()["lost_messages"] == 3
+
+
+@pytest.mark.asyncio
+async def test_upstream_payload_stays_flat_as_session_grows(chat_service_factory):
+    """El cuerpo enviado a n8n no crece con la conversación y el resumen se guarda en la sesión."""
+    sizes = []
+
+    def handler(request):
+        payload = json.loads(request.content)
+        sizes.append(len(payload["messages"]))
+        return httpx.Response(200, json={"response": f"Respuesta larga sobre {payload['message']}. " * 3})
+
+    repository = make_repository(tail_size=40)
+    writes = []
+
+    async def bulk_write(operations, ordered=True):
+        writes.extend(op._doc["$set"] for op in operations if "summary" in op._doc["$set"])
+
+    repository.sessions.bulk_write = bulk_write
+    service = await chat_service_factory(
+        transport=httpx.MockTransport(handler), history=repository,
+        response_cache=ResponseCache(max_entries=10), compactor=HistoryCompactor(budgets={"6-8": 120})
+    )
+    session_id = None
+    for i in range(15):
+        request = await service.prepare_request(
+            ChatRequest(session_id=session_id, message=f"Pregunta {i} sobre planetas", age_group="6-8"), "ana"
+        )
+        session_id = request.session_id
+        await service.process_chat(request)
+
+    assert max(sizes[5:]) - min(sizes[5:]) <= 1
+    session = repository.cached_session(session_id)
+    assert session["summary"].startswith("- Niño: Pregunta 0 sobre planetas")
+    assert session["summary_covered"] > 20
+
+    await repository.flush()
+    assert writes[-1] == {"summary": session["summary"], "summary_covered": session["summary_covered"]}
+    assert repository.stats()["pending_summaries"] == 0
+
+
+@pytest.mark.asyncio
+async def test_turns_dropped_from_cached_tail_are_summarized_from_mongo(chat_service_factory):
+    """Los turnos que salen de la cola en caché sin resumir se leen de MongoDB y entran en el resumen."""
+    transport = httpx.MockTransport(lambda request: httpx.Response(200, json={"response": "Vale."}))
+    repository = make_repository(tail_size=4)
+    compactor = HistoryCompactor(budgets={"6-8": 1000})
+    service = await chat_service_factory(transport=transport, history=repository, compactor=compactor)
+    service.response_cache = None
+    session_id = None
+    for i in range(5):
+        request = await service.prepare_request(
+            ChatRequest(session_id=session_id, message=f"Pregunta {i} sobre ríos", age_group="6-8"), "ana"
+        )
+        session_id = request.session_id
+        await service.process_chat(request)
+
+    session = repository.cached_session(session_id)
+    assert session["summary"].startswith("- Niño: Pregunta 0 sobre ríos")
+    # Antes del último turno la cola tenía los mensajes 4-7; 0-3 salen del resumen
+    assert session["summary_covered"] == 4
+    assert "Pregunta 1 sobre ríos" in session["summary"]
+    assert compactor.stats()["gaps"] == 0
@@ -0,0 +1,85 @@
+"""
+Pruebas para la prueba de carga de extremo a extremo del chat.
+"""
+import copy
+
+import pytest
+
+from benchmarks.load_chat import compare, load_scenario, percentile, run_scenario, summarize
+
+SCENARIO = {
+    "name": "mini",
+    "seed": 1,
+    "stub": {"latency": "fixed:5", "chunk_latency": "fixed:1", "response_words": 6},
+    "groups": [
+        {"name": "chat", "users": 3, "turns": 2, "arrival": "burst", "ramp_seconds": 0.1,
+         "think": "fixed:10", "endpoint": "chat", "age_group": "6-8",
+         "questions": ["Pregunta {user}-{turn} sobre los volcanes"]},
+        {"name": "stream", "users": 2, "turns": 2, "arrival": "poisson", "rate": 20,
+         "think": "fixed:10", "endpoint": "stream", "age_group": "9-12",
+         "questions": ["Pregunta {user}-{turn} sobre los planetas"]},
+    ],
+}
+
+
+def test_percentiles_and_histogram():
+    """Percentil por rango más cercano e histograma con cubos 1-2-5."""
+    values = list(range(1, 101))
+    assert (percentile(values, 50), percentile(values, 95), percentile(values, 99)) == (50, 95, 99)
+    summary = summarize([0.5, 3, 3, 700])
+    assert summary["histogram"] == {"<=1": 1, "<=5": 2, "<=1000": 1}
+    assert (summary["p50"], summary["max"]) == (3, 700)
+    assert summarize([])["count"] == 0
+
+
+def test_bundled_scenarios_load():
+    """Los escenarios incluidos tienen grupos con preguntas."""
+    for name in ("classroom_burst", "steady_trickle", "long_sessions"):
+        scenario = load_scenario(name)
+        assert scenario["name"] == name
+        assert all(group["questions"] and group["users"] > 0 for group in scenario["groups"])
+
+
+@pytest.mark.asyncio
+async def test_scenario_report():
+    """Un escenario pequeño recorre la aplicación completa y genera el informe."""
+    report = await run_scenario(SCENARIO, speed=10)
+
+    assert report["total"]["requests"] == 10
+    assert report["total"]["error_rate"] == 0.0
+    assert report["groups"]["chat"]["requests"] == 6
+    assert report["groups"]["chat"]["ttfb_ms"] is None
+    stream = report["groups"]["stream"]
+    assert stream["requests"] == 4 and stream["ttfb_ms"]["count"] == 4
+    assert stream["ttfb_ms"]["p50"] <= stream["latency_ms"]["p50"]
+    latency = report["total"]["latency_ms"]
+    assert latency["p50"] <= latency["p95"] <= latency["p99"] <= latency["max"]
+    assert sum(latency["histogram"].values()) == 10
+    assert {"p99", "max"} <= set(report["event_loop_lag_ms"])
+    assert report["upstream"]["calls"] >= 1
+    assert "chat" in report["server"] and "n8n" in report["server"]
+
+
+def test_compare_flags_regressions():
+    """`compare` marca las métricas que empeoran por encima del umbral."""
+    base = {
+        "scenario": "mini",
+        "build": {"commit": "aaa"},
+        "total": {"throughput_rps": 10.0, "error_rate": 0.0,
+                  "latency_ms": {"p50": 100.0, "p95": 200.0, "p99": 300.0}, "ttfb_ms": None},
+        "groups": {},
+        "event_loop_lag_ms": {"p99": 1.0, "max": 2.0},
+    }
+    same = copy.deepcopy(base)
+    same["total"]["latency_ms"]["p95"] = 205.0
+    assert compare(base, same)[1] is False
+
+    worse = copy.deepcopy(base)
+    worse["total"]["latency_ms"]["p95"] = 260.0
+    lines, regressed = compare(base, worse)
+    assert regressed
+    assert any("latency_ms.p95" in line and "regresión" in line for line in lines)
+
+    slower = copy.deepcopy(base)
+    slower["total"]["throughput_rps"] = 5.0
+    assert compare(base, slower)[1] is True
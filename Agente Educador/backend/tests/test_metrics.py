@@ -0,0 +1,30 @@
+"""
+Pruebas para la ruta de métricas internas.
+"""
+import json
+
+from fastapi.testclient import TestClient
+
+from app.core.auth import get_current_active_admin
+from app.main import app
+from app.services.n8n_client import n8n_client
+from app.services.safety_filter import safety_filter
+
+
+def test_metrics_require_admin_and_hide_urls():
+    """Sin administrador no hay métricas; con él, no aparecen URL ni rutas de ficheros."""
+    client = TestClient(app)
+    assert client.get("/metrics").status_code == 401
+
+    app.dependency_overrides[get_current_active_admin] = lambda: None
+    try:
+        response = client.get("/metrics")
+    finally:
+        app.dependency_overrides.pop(get_current_active_admin)
+
+    assert response.status_code == 200
+    body = json.dumps(response.json())
+    assert n8n_client.url not in body
+    assert "url" not in response.json()["n8n"] and "path" not in response.json()["safety_filter"]
+    if safety_filter.path:
+        assert safety_filter.path not in body
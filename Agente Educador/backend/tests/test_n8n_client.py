@@ -0,0 +1,217 @@
+"""
+Pruebas para el cliente de n8n y su uso desde ChatService.
+"""
+import asyncio
+import time
+
+import httpx
+import pytest
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Route
+
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService
+from app.services.n8n_client import N8NClient, N8NError
+from benchmarks.stub_n8n import create_app
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+@pytest.mark.asyncio
+async def test_chat_service_uses_webhook_response(n8n_client, ask):
+    """ChatService devuelve el texto generado por el webhook."""
+    stub = create_app()
+    client = await n8n_client(stub)
+    response = await ChatService(n8n=client).process_chat(ask("¿Qué es un volcán?"))
+
+    assert response.response == "[6-8] Respuesta a: ¿Qué es un volcán?"
+    assert stub.state.calls == 1
+    assert client.stats()["requests"] == 1
+
+
+@pytest.mark.asyncio
+async def test_retries_transient_errors_then_gives_up(n8n_client):
+    """Los 503 se reintentan hasta agotar los intentos; los 400 no."""
+    statuses = iter([503, 200, 503, 503, 503, 400])
+    seen = []
+
+    def handler(request):
+        status = next(statuses)
+        seen.append(status)
+        return httpx.Response(status, json={"response": "hola"})
+
+    client = await n8n_client(transport=httpx.MockTransport(handler), max_retries=2, retry_backoff=0)
+    assert await client.post({}) == {"response": "hola"}
+    with pytest.raises(N8NError):
+        await client.post({})
+    with pytest.raises(N8NError):
+        await client.post({})
+
+    assert seen == [503, 200, 503, 503, 503, 400]
+    assert client.stats()["retries"] == 3
+    assert client.stats()["failures"] == 2
+
+
+@pytest.mark.asyncio
+async def test_chat_service_falls_back_when_upstream_unavailable(ask):
+    """Sin n8n disponible se usa una respuesta de respaldo del grupo de edad."""
+    service = ChatService(n8n=N8NClient(url=WEBHOOK_URL))  # Cliente sin iniciar
+
+    response = await service.process_chat(ask("¿Qué es un volcán?"))
+
+    assert response.response in service.age_group_responses["6-8"]
+
+
+@pytest.mark.asyncio
+async def test_stream_chat_emits_tokens_then_done(chat_service_factory, ask):
+    """La respuesta transmitida llega por fragmentos y termina con un evento final."""
+    service = await chat_service_factory()
+    events = [event async for event in service.stream_chat(ask("¿Qué es un volcán?"))]
+
+    names = [name for name, _ in events]
+    assert names[-1] == "done" and set(names[:-1]) == {"token"}
+    assert len(names) > 2
+    text = "".join(data["text"] for name, data in events if name == "token")
+    assert text.strip() == "[6-8] Respuesta a: ¿Qué es un volcán?"
+    done = events[-1][1]
+    assert done["complete"] is True
+    assert done["suggestions"] and done["context"]["message_count"] == 1
+    assert 0 <= done["ttfb_ms"] <= done["total_ms"]
+
+
+@pytest.mark.asyncio
+async def test_stream_parses_server_sent_events(n8n_client):
+    """Un upstream SSE se traduce a fragmentos de texto."""
+    body = b'data: {"content": "Hola "}\n\ndata: {"content": "mundo"}\n\ndata: [DONE]\n\n'
+    client = await n8n_client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={"content-type": "text/event-stream"})
+    ))
+    chunks = [chunk async for chunk in client.stream({})]
+
+    assert chunks == ["Hola ", "mundo"]
+
+
+@pytest.mark.asyncio
+async def test_abandoned_stream_releases_its_slot(n8n_client):
+    """Cerrar un flujo a medias libera al momento la conexión y el semáforo."""
+    body = b'{"content": "Hola "}\n{"content": "mundo"}\n'
+    client = await n8n_client(transport=httpx.MockTransport(
+        lambda request: httpx.Response(200, content=body, headers={"content-type": "application/x-ndjson"})
+    ), max_concurrency=1)
+    stream = client.stream({})
+
+    assert await stream.__anext__() == "Hola "
+    await stream.aclose()
+
+    assert client.stats()["in_flight"] == 0
+    assert not client._semaphore.locked()
+
+
+@pytest.mark.asyncio
+async def test_cut_connection_is_not_replayed(n8n_client):
+    """Un corte de protocolo puede llegar con el POST ya procesado: no se repite."""
+    calls = []
+
+    def handler(request):
+        calls.append(request)
+        raise httpx.RemoteProtocolError("Server disconnected without sending a response.")
+
+    client = await n8n_client(transport=httpx.MockTransport(handler), max_retries=2, retry_backoff=0)
+    with pytest.raises(N8NError):
+        await client.post({})
+    with pytest.raises(N8NError):
+        [chunk async for chunk in client.stream({})]
+
+    assert len(calls) == 2
+    assert client.stats()["retries"] == 0
+
+
+def slow_first_call_app(delay=0.5):
+    """Webhook cuya primera llamada se atasca y las demás responden al momento."""
+    async def webhook(request):
+        request.app.state.calls += 1
+        if request.app.state.calls == 1:
+            await asyncio.sleep(delay)
+        payload = await request.json()
+        if payload.get("stream"):
+            return StreamingResponse(
+                iter([f'{{"content": "llamada {request.app.state.calls}"}}\n']),
+                media_type="application/x-ndjson"
+            )
+        return JSONResponse({"response": f"llamada {request.app.state.calls}"})
+
+    app = Starlette(routes=[Route("/webhook/{name}", webhook, methods=["POST"])])
+    app.state.calls = 0
+    return app
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("mode", ["post", "stream"])
+async def test_hedged_request_beats_slow_upstream(mode, n8n_client):
+    """Pasado el percentil de latencia se lanza un duplicado y gana el más rápido."""
+    client = await n8n_client(slow_first_call_app(), hedge_enabled=True, hedge_budget=1.0,
+                              hedge_min_samples=5, hedge_min_delay=0.02)
+    client._samples[mode].extend([0.005] * 5)
+    start = time.perf_counter()
+    if mode == "post":
+        text = N8NClient.extract_text(await client.post({}))
+    else:
+        text = "".join([chunk async for chunk in client.stream({"stream": True})])
+    elapsed = time.perf_counter() - start
+
+    assert text == "llamada 2"
+    assert elapsed < 0.3
+    stats = client.stats()["hedging"]
+    assert stats["hedges"] == 1 and stats["wins"] == 1 and stats["win_rate"] == 1.0
+
+
+@pytest.mark.asyncio
+async def test_hedging_respects_budget(n8n_client):
+    """Sin presupuesto disponible no se duplica aunque la respuesta sea lenta."""
+    app = slow_first_call_app(delay=0.1)
+    client = await n8n_client(app, hedge_enabled=True, hedge_budget=0.1, hedge_min_samples=5,
+                              hedge_min_delay=0.02)
+    client._samples["post"].extend([0.005] * 5)
+    assert N8NClient.extract_text(await client.post({})) == "llamada 1"
+
+    assert app.state.calls == 1
+    assert client.hedge_stats()["hedges"] == 0
@@ -0,0 +1,65 @@
+"""
+Pruebas para el middleware ASGI de limitación de tasa.
+"""
+import httpx
+import pytest
+
+from app.api.middleware.rate_limit import RateLimitMiddleware, parse_rate_limit_policies, rate_limit_policies
+
+
+def make_app(calls):
+    """Aplicación ASGI mínima que registra cada solicitud que le llega."""
+    async def app(scope, receive, send):
+        calls.append(scope["path"])
+        await receive()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+    return app
+
+
+def test_parse_policies_orders_by_specificity():
+    """El prefijo más largo se evalúa primero y las entradas inválidas fallan."""
+    policies = parse_rate_limit_policies("/api=100/60, /api/chat/=2/30")
+
+    assert [p.prefix for p in policies] == ["/api/chat", "/api"]
+    assert (policies[0].limiter.requests, policies[0].limiter.window) == (2, 30)
+    with pytest.raises(ValueError):
+        parse_rate_limit_policies("/api/chat=muchas")
+
+
+@pytest.mark.asyncio
+async def test_rejects_before_reaching_the_app():
+    """Al superar el límite se responde 429 sin llamar a la aplicación."""
+    calls = []
+    policies = parse_rate_limit_policies("/api/chat=2/60")
+    app = RateLimitMiddleware(make_app(calls), policies=policies)
+    transport = httpx.ASGITransport(app=app)
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        responses = [
+            await client.post("/api/chat/chat", content=b"x" * 1000) for _ in range(3)
+        ]
+        other = await client.get("/api/v1/health")
+
+    assert [r.status_code for r in responses] == [200, 200, 429]
+    assert responses[0].headers["X-RateLimit-Remaining"] == "1"
+    assert responses[2].json()["status_code"] == 429
+    assert int(responses[2].headers["Retry-After"]) >= 1
+    assert calls == ["/api/chat/chat", "/api/chat/chat", "/api/v1/health"]
+    assert "X-RateLimit-Limit" not in other.headers
+
+
+@pytest.mark.asyncio
+async def test_auth_limits_cannot_be_bypassed_through_another_path():
+    """Login y registro solo se sirven en las rutas con límite propio."""
+    from app.main import app
+
+    assert {"/api/v1/auth/token", "/api/v1/auth/register"} <= {policy.prefix for policy in rate_limit_policies}
+    transport = httpx.ASGITransport(app=RateLimitMiddleware(app, policies=rate_limit_policies))
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        served = await client.post("/api/v1/auth/register", json={})
+        duplicated = [
+            await client.post(f"/api/v1/auth/auth/{name}", json={}) for name in ("token", "register")
+        ]
+    assert served.status_code == 422 and "X-RateLimit-Limit" in served.headers
+    assert [response.status_code for response in duplicated] == [404, 404]
@@ -0,0 +1,134 @@
+"""
+Pruebas para el limitador de tasa de ventana deslizante.
+"""
+import pytest
+
+from app.api.dependencies.rate_limit_storage import MongoRateLimitStorage
+from app.api.dependencies.rate_limiter import RateLimiter
+
+
+@pytest.mark.asyncio
+async def test_limits_after_max_requests():
+    """Se permite exactamente el número configurado de solicitudes por ventana."""
+    limiter = RateLimiter(requests=3, window=60)
+    now = 120.0  # Inicio exacto de una ventana
+
+    results = [await limiter._check("1.2.3.4", now) for _ in range(4)]
+
+    assert [r.limited for r in results] == [False, False, False, True]
+    assert [r.remaining for r in results] == [2, 1, 0, 0]
+    assert results[0].reset == 180
+
+
+@pytest.mark.asyncio
+async def test_previous_window_is_weighted():
+    """La ventana anterior cuenta en proporción a lo que aún se solapa."""
+    limiter = RateLimiter(requests=10, window=60)
+    for _ in range(10):
+        await limiter._check("ip", 60.0)
+
+    # A mitad de la ventana siguiente, la anterior pesa 5 solicitudes
+    allowed = 0
+    while not (await limiter._check("ip", 150.0)).limited:
+        allowed += 1
+    assert allowed == 5
+
+    # Dos ventanas después ya no queda rastro
+    assert not (await limiter._check("ip", 250.0)).limited
+
+
+@pytest.mark.asyncio
+async def test_state_per_key_is_constant():
+    """El estado de cada clave no crece con el número de solicitudes."""
+    limiter = RateLimiter(requests=1000, window=60)
+    for _ in range(500):
+        await limiter._check("ip", 61.0)
+    assert limiter.storage.counters["ip"] == [1, 0, 500]
+
+
+@pytest.mark.asyncio
+async def test_is_rate_limited_keys_are_independent():
+    """Cada clave tiene su propio contador."""
+    limiter = RateLimiter(requests=1, window=60)
+
+    assert not await limiter.is_rate_limited("a")
+    assert await limiter.is_rate_limited("a")
+    assert not await limiter.is_rate_limited("b")
+
+
+@pytest.mark.asyncio
+async def test_sweep_removes_idle_keys():
+    """El barrido elimina solo las claves sin actividad reciente."""
+    limiter = RateLimiter(requests=10, window=60)
+    await limiter._check("inactiva", 0.0)
+    await limiter._check("anterior", 70.0)
+    await limiter._check("actual", 130.0)
+
+    assert limiter.sweep(now=130.0) == 1
+    assert list(limiter.storage.counters) == ["anterior", "actual"]
+    assert limiter.stats()["expired"] == 1
+
+
+@pytest.mark.asyncio
+async def test_max_keys_evicts_least_recently_used():
+    """Al superar el máximo de claves se desaloja la menos usada."""
+    limiter = RateLimiter(requests=10, window=60, max_keys=2)
+    await limiter._check("a", 0.0)
+    await limiter._check("b", 0.0)
+    await limiter._check("a", 1.0)
+    await limiter._check("c", 2.0)
+
+    assert list(limiter.storage.counters) == ["a", "c"]
+    assert limiter.stats()["evictions"] == 1
+
+
+class FakeBulkCollection:
+    """Colección en memoria que solo implementa lo que usa el almacenamiento."""
+
+    def __init__(self):
+        self.counts = {}
+
+    async def bulk_write(self, operations, ordered=True):
+        for op in operations:
+            doc_id = op._filter["_id"]
+            self.counts[doc_id] = self.counts.get(doc_id, 0) + op._doc["$inc"]["count"]
+
+    def find(self, query, projection=None):
+        ids = query["_id"]["$in"]
+        docs = [{"_id": i, "count": self.counts[i]} for i in ids if i in self.counts]
+
+        async def cursor():
+            for doc in docs:
+                yield doc
+        return cursor()
+
+
+@pytest.mark.asyncio
+async def test_mongo_storage_shares_counts_between_workers():
+    """Dos workers sobre la misma colección ven los incrementos del otro tras un envío."""
+    collection = FakeBulkCollection()
+    workers = []
+    for _ in range(2):
+        storage = MongoRateLimitStorage(window=60)
+        storage._collection = collection
+        workers.append(RateLimiter(requests=4, window=60, storage=storage))
+
+    first, second = workers
+    await first._check("ip", 120.0)
+    await first._check("ip", 120.0)
+    assert await first.storage.counts("ip", 2) == (0, 2)  # Pendientes locales
+
+    await second._check("ip", 120.0)
+    await second.storage.flush()
+    await first.storage.flush()
+
+    assert collection.counts == {"ip|2": 3}
+    assert await first.storage.counts("ip", 2) == (0, 3)
+    assert (await first._check("ip", 120.0)).remaining == 0
+    assert (await first._check("ip", 120.0)).limited
+
+    # El segundo worker aún no ha releído: decide con su último valor conocido
+    assert (await second._check("ip", 120.0)).remaining == 2
+    await first.storage.flush()
+    await second.storage.flush()
+    assert (await second._check("ip", 120.0)).limited
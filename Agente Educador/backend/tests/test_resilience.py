@@ -0,0 +1,310 @@
+"""
+Pruebas para las utilidades de resiliencia frente al upstream.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.resilience import (
+    AdaptiveConcurrencyLimiter,
+    CircuitBreaker,
+    CircuitOpenError,
+    LoadShedError,
+    SingleFlight,
+)
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService
+from app.services.n8n_client import N8NClient
+from benchmarks.stub_n8n import create_app
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+@pytest.mark.asyncio
+async def test_single_flight_shares_one_call():
+    """Las llamadas concurrentes con la misma clave ejecutan la función una vez."""
+    flight = SingleFlight(timeout=1)
+    calls = []
+
+    async def work():
+        calls.append(1)
+        await asyncio.sleep(0.01)
+        return "resultado"
+
+    results = await asyncio.gather(*(flight.do("k", work) for _ in range(10)))
+
+    assert results == ["resultado"] * 10
+    assert len(calls) == 1
+    assert flight.stats() == {"in_flight": 0, "upstream_calls": 1, "coalesced": 9, "timeouts": 0}
+
+    # Terminada la llamada, la siguiente vuelve a ejecutar la función
+    await flight.do("k", work)
+    assert len(calls) == 2
+
+
+@pytest.mark.asyncio
+async def test_single_flight_propagates_errors_and_deadline():
+    """Los errores llegan a todos y nadie espera más que el plazo del líder."""
+    flight = SingleFlight(timeout=0.05)
+
+    async def fail():
+        await asyncio.sleep(0.01)
+        raise ValueError("upstream caído")
+
+    results = await asyncio.gather(*(flight.do("error", fail) for _ in range(3)), return_exceptions=True)
+    assert all(isinstance(r, ValueError) for r in results)
+
+    async def slow():
+        await asyncio.sleep(0.2)
+
+    with pytest.raises(asyncio.TimeoutError):
+        await asyncio.gather(flight.do("lenta", slow), flight.do("lenta", slow))
+    assert flight.stats()["timeouts"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_identical_chat_requests_reach_upstream_once(chat_service_factory, ask):
+    """Una clase que pulsa la misma sugerencia genera una sola llamada a n8n."""
+    stub = create_app(delay_ms=30)
+    service = await chat_service_factory(stub)
+    service.response_cache = None  # Solo el agrupamiento, sin caché
+    responses = await asyncio.gather(*(service.process_chat(ask("Animales", "3-5")) for _ in range(20)))
+
+    assert {r.response for r in responses} == {"[3-5] Respuesta a: Animales"}
+    assert stub.state.calls == 1
+    assert service.stats()["coalescing"]["coalesced"] == 19
+
+
+@pytest.mark.asyncio
+async def test_limiter_queues_and_sheds_when_full():
+    """Sobre el límite se espera en cola; con la cola llena se descarta al instante."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_queue=2)
+    release = asyncio.Event()
+    running = []
+
+    async def work():
+        async with limiter.slot(timeout=1):
+            running.append(1)
+            await release.wait()
+
+    tasks = [asyncio.ensure_future(work()) for _ in range(4)]
+    await asyncio.sleep(0.01)
+    assert limiter.stats()["in_flight"] == 2
+    assert limiter.stats()["queue_depth"] == 2
+
+    with pytest.raises(LoadShedError) as exc:
+        await limiter.acquire(timeout=1)
+    assert exc.value.reason == "queue_full"
+
+    release.set()
+    await asyncio.gather(*tasks)
+    stats = limiter.stats()
+    assert len(running) == 4
+    assert stats["in_flight"] == 0 and stats["queue_depth"] == 0
+    assert stats["shed"]["queue_full"] == 1
+
+
+@pytest.mark.asyncio
+async def test_limiter_adapts_limit_and_sheds_unreachable_deadlines():
+    """El límite baja ante errores o lentitud y crece con llamadas rápidas a plena carga."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4, min_limit=1, latency_threshold=0.5, backoff=0.5)
+    await limiter.acquire()
+    limiter.release(0.01, failed=True)
+    assert limiter.limit == 2
+    await limiter.acquire()
+    limiter.release(1.0)
+    assert limiter.limit == 1
+    await limiter.acquire()
+    limiter.release(0.01)
+    assert limiter.limit == 2  # Aumento aditivo: 1 + 1/1
+
+    # Con el límite ocupado y una latencia media alta, el plazo no se alcanza
+    await limiter.acquire()
+    await limiter.acquire()
+    limiter.avg_latency = 10.0
+    with pytest.raises(LoadShedError) as exc:
+        await limiter.acquire(timeout=1)
+    assert exc.value.reason == "deadline"
+
+    # Sin estimación que lo impida, se espera hasta el plazo y luego se descarta
+    limiter.avg_latency = 0.001
+    with pytest.raises(LoadShedError) as exc:
+        await limiter.acquire(timeout=0.02)
+    assert exc.value.reason == "timeout"
+    assert limiter.stats()["queue_depth"] == 0
+
+
+@pytest.mark.asyncio
+async def test_chat_sheds_with_age_appropriate_message(chat_service_factory, ask):
+    """Las solicitudes descartadas reciben un aviso amable y no se guardan en caché."""
+    stub = create_app(delay_ms=50)
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_queue=0)
+    service = await chat_service_factory(stub, limiter=limiter)
+    responses = await asyncio.gather(*(service.process_chat(ask(f"Pregunta {i}")) for i in range(3)))
+
+    texts = [r.response for r in responses]
+    assert texts[0] == "[6-8] Respuesta a: Pregunta 0"
+    assert texts[1:] == [service.busy_responses["6-8"]] * 2
+    assert stub.state.calls == 1
+    assert service.stats()["concurrency"]["shed"]["queue_full"] == 2
+    assert service.response_cache.stats()["size"] == 1
+
+
+@pytest.mark.asyncio
+async def test_circuit_breaker_opens_and_recovers_with_probes():
+    """Se abre con muchos errores, rechaza al instante y se cierra tras las pruebas."""
+    breaker = CircuitBreaker(min_requests=4, failure_rate=0.5, open_seconds=0.05, half_open_probes=2)
+
+    for failed in (False, True, False, True):
+        breaker.record(0.01, failed, breaker.allow())
+    assert breaker.state == CircuitBreaker.OPEN
+    with pytest.raises(CircuitOpenError):
+        async with breaker.guard():
+            pass
+
+    # Semiabierto: solo pasan las pruebas, y una prueba fallida lo reabre
+    await asyncio.sleep(0.06)
+    assert breaker.allow() is True
+    breaker.record(0.01, True, probe=True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.06)
+    probes = [breaker.allow(), breaker.allow()]
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    for probe in probes:
+        breaker.record(0.01, False, probe)
+    assert breaker.state == CircuitBreaker.CLOSED
+    assert breaker.stats()["opened"] == 2
+
+    # Las excepciones excluidas no cuentan como fallo
+    breaker = CircuitBreaker(min_requests=1, excluded=(LoadShedError,))
+    with pytest.raises(LoadShedError):
+        async with breaker.guard():
+            raise LoadShedError("queue_full")
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_late_probe_from_an_earlier_cycle_is_ignored():
+    """Una prueba que termina tras reabrirse el circuito no libera huecos ni cuenta en el ciclo nuevo."""
+    breaker = CircuitBreaker(min_requests=1, failure_rate=0.5, open_seconds=0.05, half_open_probes=2)
+    breaker.record(0.01, True)
+    assert breaker.state == CircuitBreaker.OPEN
+
+    async def probe(release, fail=False):
+        async with breaker.guard():
+            await release.wait()
+            if fail:
+                raise RuntimeError("upstream caído")
+
+    await asyncio.sleep(0.06)
+    late, failing = asyncio.Event(), asyncio.Event()
+    late_probe = asyncio.create_task(probe(late))
+    failing_probe = asyncio.create_task(probe(failing, fail=True))
+    await asyncio.sleep(0)
+    failing.set()
+    with pytest.raises(RuntimeError):
+        await failing_probe
+    assert breaker.state == CircuitBreaker.OPEN
+
+    await asyncio.sleep(0.06)
+    current = asyncio.Event()
+    probes = [asyncio.create_task(probe(current)) for _ in range(2)]
+    await asyncio.sleep(0)
+    late.set()
+    await late_probe
+
+    assert breaker.state == CircuitBreaker.HALF_OPEN
+    with pytest.raises(CircuitOpenError):
+        breaker.allow()
+    current.set()
+    await asyncio.gather(*probes)
+    assert breaker.state == CircuitBreaker.CLOSED
+
+
+@pytest.mark.asyncio
+async def test_open_circuit_serves_fallback_without_calling_upstream(chat_service_factory, ask):
+    """Con n8n caído, tras abrir el circuito se responde sin tocar el upstream."""
+    calls = []
+
+    def failing(request):
+        calls.append(request)
+        return httpx.Response(500)
+
+    breaker = CircuitBreaker(min_requests=3, failure_rate=0.5, open_seconds=60, excluded=(LoadShedError,))
+    service = await chat_service_factory(transport=httpx.MockTransport(failing), breaker=breaker)
+    for i in range(6):
+        response = await service.process_chat(ask(f"Pregunta {i}", "9-12"))
+        assert response.response in service.age_group_responses["9-12"]
+    events = [event async for event in service.stream_chat(ask("Otra", "9-12"))]
+
+    assert len(calls) == 3
+    assert events[0][1]["text"] in service.age_group_responses["9-12"]
+    stats = service.stats()["circuit_breaker"]
+    assert stats["state"] == "open"
+    assert stats["rejected"] == 4
+
+
+async def drain(events):
+    return [event async for event in events]
+
+
+@pytest.mark.asyncio
+async def test_queue_wait_does_not_count_as_slow_upstream(chat_service_factory, ask):
+    """La espera en la cola local no abre el circuito contra un upstream sano."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=1, min_limit=1, max_limit=1)
+    breaker = CircuitBreaker(min_requests=2, slow_call_seconds=0.05, slow_call_rate=0.5, excluded=(LoadShedError,))
+    service = await chat_service_factory(limiter=limiter, breaker=breaker)
+    service.response_cache = None
+
+    await limiter.acquire()  # Otra generación ocupa el único hueco
+    pending = [
+        asyncio.ensure_future(service.process_chat(ask("Pregunta 1"))),
+        asyncio.ensure_future(drain(service.stream_chat(ask("Pregunta 2")))),
+    ]
+    await asyncio.sleep(0.15)
+    limiter.release(0.01)
+    await asyncio.gather(*pending)
+
+    stats = breaker.stats()
+    assert (stats["state"], stats["window_calls"], stats["slow_call_rate"]) == ("closed", 2, 0.0)
@@ -0,0 +1,116 @@
+"""
+Pruebas para la caché de respuestas del chat.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.text import fold_text
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService, ResponseCache
+from app.services.n8n_client import N8NClient
+from benchmarks.stub_n8n import create_app
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+def test_fold_text_normalizes_questions():
+    """Las variantes de tildes, mayúsculas, espacios y signos se igualan."""
+    assert fold_text("¿Qué es la  Fotosíntesis?") == fold_text("que es la fotosintesis")
+    assert fold_text("Cuéntame un cuento!!") == "cuentame un cuento"
+    assert fold_text("año") != fold_text("ano")
+
+
+@pytest.mark.asyncio
+async def test_repeated_question_skips_upstream(chat_service_factory, ask):
+    """Una pregunta repetida se responde desde la caché sin llamar a n8n."""
+    stub = create_app()
+    service = await chat_service_factory(stub, response_cache=ResponseCache(max_entries=10))
+    first = await service.process_chat(ask("¿Qué es la fotosíntesis?"))
+    second = await service.process_chat(ask("que es la  FOTOSINTESIS"))
+    other_age = await service.process_chat(ask("que es la fotosintesis", "9-12"))
+    streamed = [e async for e in service.stream_chat(ask("Que es la fotosintesis?"))]
+
+    assert first.response == "[6-8] Respuesta a: ¿Qué es la fotosíntesis?"
+    assert second.response == first.response
+    assert other_age.response.startswith("[9-12]")
+    assert streamed[0] == ("token", {"text": first.response})
+    assert stub.state.calls == 2
+    top = service.response_cache.top(1)[0]
+    assert (top["message"], top["age_group"], top["hits"]) == ("que es la fotosintesis", "6-8", 2)
+    assert "top" not in service.response_cache.stats()
+
+
+def test_response_cache_respects_byte_budget():
+    """Las respuestas se desalojan al superar el presupuesto de memoria."""
+    budget = 2 * (ResponseCache.ENTRY_OVERHEAD + 100)
+    cache = ResponseCache(max_entries=100, max_bytes=budget)
+    for i in range(5):
+        cache.set(ResponseCache.key(f"pregunta {i}", "6-8", "default"), "x" * 80)
+
+    stats = cache.stats()
+    assert stats["size"] == 2
+    assert stats["cost"] <= budget
+    assert cache.get(ResponseCache.key("pregunta 4", "6-8", "default")) == "x" * 80
+
+
+@pytest.mark.asyncio
+async def test_follow_ups_of_different_conversations_are_not_shared(chat_service_factory):
+    """Una misma pregunta de seguimiento con otro historial no reutiliza ni comparte la respuesta."""
+    stub = create_app(delay_ms=30)
+    service = await chat_service_factory(stub, response_cache=ResponseCache(max_entries=10))
+
+    def follow_up(topic):
+        return ChatRequest(messages=[
+            {"role": "user", "content": f"¿Qué es {topic}?"},
+            {"role": "assistant", "content": f"Te lo explico: {topic}."},
+            {"role": "user", "content": "¿Y por qué?"},
+        ], age_group="6-8")
+
+    await asyncio.gather(service.process_chat(follow_up("la luna")), service.process_chat(follow_up("un volcán")))
+    assert stub.state.calls == 2
+    assert service.stats()["coalescing"]["coalesced"] == 0
+
+    # La misma conversación sí se responde desde la caché
+    await service.process_chat(follow_up("la luna"))
+    assert stub.state.calls == 2
+    assert ResponseCache.fingerprint([]) == ""
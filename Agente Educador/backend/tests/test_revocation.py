@@ -0,0 +1,114 @@
+"""
+Pruebas para el índice en memoria de tokens revocados.
+"""
+import time
+
+import pytest
+from bson import ObjectId
+
+from app.core.revocation import BloomFilter, RevocationIndex
+
+
+class FakeCursor:
+    """Cursor asíncrono mínimo sobre una lista de documentos."""
+
+    def __init__(self, docs):
+        self.docs = docs
+
+    def sort(self, *args, **kwargs):
+        return self
+
+    def __aiter__(self):
+        self._iter = iter(self.docs)
+        return self
+
+    async def __anext__(self):
+        try:
+            return next(self._iter)
+        except StopIteration:
+            raise StopAsyncIteration
+
+
+class FakeCollection:
+    """Colección en memoria que solo implementa lo que usa el índice."""
+
+    def __init__(self):
+        self.docs = []
+
+    def insert(self, token, token_type="access"):
+        self.docs.append({"_id": ObjectId(), "token": token, "token_type": token_type})
+
+    async def estimated_document_count(self):
+        return len(self.docs)
+
+    def find(self, query, projection=None):
+        floor = query.get("_id", {}).get("$gt")
+        docs = [d for d in self.docs if floor is None or d["_id"] > floor]
+        return FakeCursor(docs)
+
+
+def test_bloom_filter_has_no_false_negatives():
+    """Todo elemento agregado se encuentra en el filtro."""
+    bloom = BloomFilter(capacity=1000, error_rate=0.01)
+    digests = [RevocationIndex._digest(f"token-{i}", "access") for i in range(1000)]
+    for digest in digests:
+        bloom.add(digest)
+
+    assert all(digest in bloom for digest in digests)
+    assert bloom.count == 1000
+
+
+@pytest.mark.asyncio
+async def test_lookup_after_load_and_poll():
+    """Los tokens cargados o leídos después se detectan sin ir a MongoDB."""
+    collection = FakeCollection()
+    collection.insert("revocado-1")
+    index = RevocationIndex(capacity=100, recent_size=100)
+    index._collection = collection
+
+    assert index.lookup("revocado-1") is None  # Aún sin cargar
+    await index.load()
+    assert index.lookup("revocado-1") is True
+    assert index.lookup("valido") is False
+    assert index.lookup("revocado-1", "refresh") is False
+
+    collection.insert("revocado-2", "refresh")
+    await index.poll()
+    assert index.lookup("revocado-2", "refresh") is True
+
+
+def test_filter_hit_outside_recent_set_falls_back():
+    """Una coincidencia del filtro fuera del conjunto exacto pide consultar MongoDB."""
+    index = RevocationIndex(capacity=100, recent_size=1)
+    index.loaded = True
+    index._synced_at = time.monotonic()
+    index.add("viejo")
+    index.add("nuevo")
+
+    assert index.lookup("nuevo") is True
+    assert index.lookup("viejo") is None
+    assert index.stats()["fallbacks"] == 1
+
+
+@pytest.mark.asyncio
+async def test_stale_index_falls_back_to_mongo(monkeypatch):
+    """Si las lecturas fallan demasiado tiempo, el índice deja de dar tokens por válidos."""
+    collection = FakeCollection()
+    index = RevocationIndex(capacity=100, recent_size=100, poll_interval=2.0)
+    index._collection = collection
+    await index.load()
+    index.add("local")
+    assert index.lookup("valido") is False
+
+    def broken_find(query, projection=None):
+        raise ConnectionError("MongoDB no responde")
+
+    monkeypatch.setattr(collection, "find", broken_find)
+    with pytest.raises(ConnectionError):
+        await index.poll()
+    synced_at = index._synced_at
+    monkeypatch.setattr("app.core.revocation.time.monotonic", lambda: synced_at + 7)
+
+    assert index.stale and index.lookup("valido") is None
+    assert index.lookup("local") is True
+    assert index.stats()["stale_lookups"] == 1
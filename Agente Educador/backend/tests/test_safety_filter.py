@@ -0,0 +1,188 @@
+"""
+Pruebas para el filtro de seguridad infantil del chat.
+"""
+import asyncio
+import json
+import os
+
+import httpx
+import pytest
+
+from app.models.chat_models import ChatRequest, Message
+from app.services.chat_service import ChatService
+from app.services.history_compactor import HistoryCompactor
+from app.services.n8n_client import N8NClient
+from app.services.safety_filter import SafetyFilter
+from benchmarks.stub_n8n import create_app
+from tests.test_chat_repository import make_repository
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+TERMS = {"insultos": ["idiota*", "hijo de puta"], "autolesion": ["quiero morir*"]}
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+@pytest.mark.parametrize("text, blocked", [
+    ("Eres un IDIOTAAA", True),
+    ("eres un 1d10t4", True),
+    ("hijo de p.u.t.@", True),
+    ("Idiotas todos", True),
+    ("A veces quiero morirme", True),
+    ("El idioma de los idiomas", False),
+    ("¿Cuánto es 1 + 3?", False),
+])
+def test_normalizes_accents_leetspeak_and_repeats(text, blocked):
+    """Las variantes escritas para esquivar la lista se bloquean; el resto no."""
+    assert SafetyFilter(terms=TERMS).check(text).blocked is blocked
+
+
+def test_stream_guard_catches_terms_split_across_chunks():
+    """El texto se libera por palabras revisadas, también las frases partidas."""
+    guard = SafetyFilter(terms=TERMS).guard()
+
+    released = [guard.feed(chunk) for chunk in ["Hola, ", "eres muy ", "lis", "to. El hijo de p", "uta"]]
+
+    assert released == ["Hola, ", "eres muy ", "", "listo. El hijo de ", ""]
+    assert guard.flush() is None
+    assert guard.verdict.categories == ("insultos",)
+    assert guard.feed(" y adiós") is None
+
+
+@pytest.mark.asyncio
+async def test_reloads_blocklist_when_file_changes(tmp_path):
+    """La lista se recarga sin reiniciar; una lista no válida conserva la anterior."""
+    path = tmp_path / "blocklist.txt"
+    path.write_text("[insultos]\nidiota\n", encoding="utf-8")
+    safety = SafetyFilter(path=str(path), reload_interval=0.01)
+    await safety.start()
+    try:
+        assert not safety.check("eres un tonto").blocked
+        path.write_text("# Nueva lista\n[insultos]\nidiota\ntonto*\n", encoding="utf-8")
+        os.utime(path, (1, 1))
+        await asyncio.sleep(0.1)
+        assert safety.check("eres unos tontos").blocked
+
+        path.write_text("tonto\n", encoding="utf-8")  # Sin [categoría]
+        os.utime(path, (2, 2))
+        await asyncio.sleep(0.1)
+        assert safety.check("eres unos tontos").blocked
+    finally:
+        await safety.stop()
+
+    assert safety.stats()["reloads"] == 2 and safety.stats()["reload_errors"] >= 1
+
+
+@pytest.mark.asyncio
+async def test_blocked_messages_never_reach_upstream(chat_service_factory, ask):
+    """Los mensajes bloqueados reciben la respuesta segura sin llamar a n8n."""
+    stub = create_app()
+    service = await chat_service_factory(stub, safety=SafetyFilter(terms=TERMS))
+    insult = await service.process_chat(ask("eres un 1d10t4"))
+    help_events = [event async for event in service.stream_chat(ask("quiero morirme", "9-12"))]
+
+    assert insult.response == service.safe_responses["6-8"]
+    assert insult.context["safety"] == {"blocked": "input", "categories": ["insultos"]}
+    assert help_events[0] == ("token", {"text": service.help_response})
+    assert stub.state.calls == 0
+    assert service.stats()["safety"]["blocked_inbound"] == 2
+
+
+@pytest.mark.asyncio
+async def test_blocked_replies_are_replaced_with_fallbacks(chat_service_factory, ask):
+    """Las respuestas bloqueadas de n8n se sustituyen y no se guardan en la caché."""
+    def upstream(request):
+        if json.loads(request.content)["stream"]:
+            lines = [json.dumps({"type": "item", "content": word}) for word in ["Hola ", "amigo, ", "eres ", "idiota"]]
+            return httpx.Response(200, content="\n".join(lines).encode(),
+                                  headers={"content-type": "application/x-ndjson"})
+        return httpx.Response(200, json={"response": "Eres un idiota"})
+
+    service = await chat_service_factory(transport=httpx.MockTransport(upstream), safety=SafetyFilter(terms=TERMS))
+    fallbacks = service.age_group_responses["9-12"]
+    response = await service.process_chat(ask("Hola", "9-12"))
+    events = [event async for event in service.stream_chat(ask("Hola", "9-12"))]
+
+    assert response.response in fallbacks
+    assert [name for name, _ in events] == ["token", "token", "token", "reset", "token", "done"]
+    assert events[4][1]["text"] in fallbacks
+    assert events[5][1]["context"]["safety"] == {"blocked": "output", "categories": ["insultos"]}
+    assert service.response_cache.stats()["size"] == 0
+    assert service.stats()["safety"]["blocked_outbound"] == 2
+
+
+@pytest.mark.asyncio
+async def test_blocked_messages_stay_out_of_later_turns(chat_service_factory):
+    """Un mensaje bloqueado se guarda marcado y no vuelve a n8n, ni en la cola ni en el resumen."""
+    payloads = []
+
+    def upstream(request):
+        payloads.append(json.loads(request.content))
+        return httpx.Response(200, json={"response": "Vale, sigamos."})
+
+    repository = make_repository()
+    service = await chat_service_factory(
+        transport=httpx.MockTransport(upstream), history=repository, safety=SafetyFilter(terms=TERMS),
+        compactor=HistoryCompactor(budgets={"6-8": 15})
+    )
+    service.response_cache = None
+    session_id = None
+    for text in ["Hola", "eres un 1d10t4", "Cuéntame algo de los volcanes", "Y de los planetas"]:
+        request = await service.prepare_request(
+            ChatRequest(session_id=session_id, message=text, age_group="6-8"), "ana"
+        )
+        session_id = request.session_id
+        await service.process_chat(request)
+
+    # Historial enviado por el cliente sin sesión
+    stateless = ChatRequest(messages=[
+        Message(role="user", content="eres un idiota"),
+        Message(role="assistant", content="Hablemos de otra cosa."),
+        Message(role="user", content="¿Qué es un volcán?"),
+    ], age_group="6-8")
+    await service.process_chat(await service.prepare_request(stateless, "ana"))
+
+    assert len(payloads) == 4
+    sent = json.dumps(payloads).lower()
+    assert "1d10t4" not in sent and "idiota" not in sent
+    assert "Cuéntame algo de los volcanes" in payloads[2]["messages"][0]["content"]
+    history = await repository.get_history(session_id, "ana")
+    assert [message.blocked for message in history[:3]] == [False, False, True]
+    await repository.flush()
+    stored = [doc for doc in repository.messages.docs if doc["session_id"] == session_id]
+    assert stored[2]["metadata"] == {"blocked": True}
@@ -0,0 +1,79 @@
+"""
+Pruebas para el servicio asíncrono de hashing de contraseñas.
+"""
+import asyncio
+import threading
+
+import pytest
+
+from app.core.security import HashingPoolSaturatedError, PasswordHasher
+
+
+@pytest.mark.asyncio
+async def test_hash_and_verify_roundtrip():
+    """El hash generado en el pool se verifica correctamente."""
+    hasher = PasswordHasher(workers=1, max_pending=4)
+    try:
+        hashed = await hasher.hash("Secreta123")
+        assert await hasher.verify("Secreta123", hashed)
+        assert not await hasher.verify("Otra123", hashed)
+    finally:
+        hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_rejects_when_saturated():
+    """Con la cola llena se rechaza de inmediato en vez de esperar."""
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    try:
+        results = await asyncio.gather(
+            hasher.hash("Secreta123"),
+            hasher.hash("Secreta456"),
+            return_exceptions=True,
+        )
+        assert isinstance(results[0], str)
+        assert isinstance(results[1], HashingPoolSaturatedError)
+        assert hasher.stats()["rejected"] == 1
+        assert hasher.pending == 0
+    finally:
+        hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_cancelled_wait_keeps_the_slot_until_the_work_ends():
+    """Cancelar la espera no libera el hueco mientras el worker sigue ocupado."""
+    hasher = PasswordHasher(workers=1, max_pending=1)
+    release = threading.Event()
+    try:
+        waiting = asyncio.create_task(hasher._run(release.wait))
+        await asyncio.sleep(0.05)
+        waiting.cancel()
+        with pytest.raises(asyncio.CancelledError):
+            await waiting
+
+        assert hasher.pending == 1
+        with pytest.raises(HashingPoolSaturatedError):
+            await hasher.hash("Secreta123")
+
+        release.set()
+        for _ in range(100):
+            if not hasher.pending:
+                break
+            await asyncio.sleep(0.01)
+        assert hasher.stats()["pending"] == 0 and hasher.stats()["completed"] == 1
+        await hasher.hash("Secreta123")
+    finally:
+        release.set()
+        hasher.shutdown()
+
+
+@pytest.mark.asyncio
+async def test_failed_runs_are_not_counted_as_completed():
+    """Solo las operaciones terminadas con éxito cuentan como completadas."""
+    hasher = PasswordHasher(workers=1, max_pending=4)
+    try:
+        with pytest.raises(ValueError):
+            await hasher.verify("Secreta123", "no-es-un-hash")
+        assert hasher.stats()["pending"] == 0 and hasher.stats()["completed"] == 0
+    finally:
+        hasher.shutdown()
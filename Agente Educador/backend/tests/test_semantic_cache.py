@@ -0,0 +1,117 @@
+"""
+Pruebas para la caché semántica de respuestas del chat.
+"""
+import httpx
+import numpy as np
+import pytest
+
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService, ResponseCache
+from app.services.n8n_client import N8NClient
+from app.services.semantic_cache import SemanticCache, embed, signature
+from benchmarks.stub_n8n import create_app
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+def similarity(a, b):
+    return float(embed(a) @ embed(b))
+
+
+def test_embeddings_match_paraphrases_but_not_other_numbers():
+    """Las paráfrasis quedan cerca; otra operación u otro tema, lejos."""
+    assert similarity("qué es fotosintesis", "Explícame la fotosíntesis") > 0.99
+    assert similarity("¿Cuántos planetas hay?", "cuantos planetas existen") > 0.6
+    assert similarity("suma 2 y 3", "suma 2 y 4") < 0.9
+    assert similarity("qué es la fotosíntesis", "qué es un volcán") < 0.3
+    assert embed("¿y qué es eso?") is None
+    assert embed("hola").dtype == np.float32 and embed("hola").shape == (512,)
+
+
+def test_operators_and_negations_are_never_confused():
+    """Otra operación o la pregunta negada no reutilizan la respuesta guardada."""
+    assert signature("¿Cuánto es 2 + 3?") == ("2", "+", "3")
+    assert signature("cuanto es 2 por 3") == ("2", "*", "3")
+    assert signature("¿No es seguro tocar un enchufe?") == ("no",)
+
+    cache = SemanticCache(threshold=0.9)
+    cache.set("¿Cuánto es 2 + 3?", "6-8", "default", "2 + 3 = 5")
+    cache.set("¿Es seguro tocar un enchufe?", "6-8", "default", "Sí …")
+    assert cache.get("¿Cuánto es 2 - 3?", "6-8", "default") is None
+    assert cache.get("cuanto es 2 por 3", "6-8", "default") is None
+    assert cache.get("¿No es seguro tocar un enchufe?", "6-8", "default") is None
+    assert cache.get("cuánto es 2 más 3", "6-8", "default").text == "2 + 3 = 5"
+    assert cache.get("es seguro tocar un enchufe", "6-8", "default").text == "Sí …"
+    assert similarity("¿Es seguro tocar un enchufe?", "¿No es seguro tocar un enchufe?") < 0.9
+
+
+def test_lookup_respects_threshold_partitions_and_capacity():
+    """Solo se reutilizan respuestas parecidas del mismo grupo; la menos usada se desaloja."""
+    cache = SemanticCache(threshold=0.9, capacity=2)
+    cache.set("qué es la fotosíntesis", "6-8", "default", "Las plantas fabrican su alimento.")
+    cache.set("qué es un volcán", "6-8", "default", "Una montaña que expulsa lava.")
+
+    match = cache.get("explícame la fotosintesis", "6-8", "default")
+    assert match.text == "Las plantas fabrican su alimento." and match.similarity > 0.9
+    assert cache.get("explícame la fotosintesis", "9-12", "default") is None
+    assert cache.get("explícame la fotosintesis", "6-8", "mentor_matematico") is None
+
+    cache.set("qué son los dinosaurios", "6-8", "default", "Reptiles de hace millones de años.")
+    assert cache.get("qué es un volcán", "6-8", "default") is None
+    assert cache.get("que es la fotosintesis", "6-8", "default") is not None
+    stats = cache.stats()
+    assert (stats["size"], stats["evictions"], stats["hits"]) == (2, 1, 2)
+
+
+@pytest.mark.asyncio
+async def test_paraphrased_question_skips_upstream(chat_service_factory, ask):
+    """Una pregunta reformulada se responde desde la caché semántica sin llamar a n8n."""
+    stub = create_app()
+    cache = ResponseCache(max_entries=10, semantic=SemanticCache())
+    service = await chat_service_factory(stub, response_cache=cache)
+    first = await service.process_chat(ask("¿Qué es la fotosíntesis?"))
+    second = await service.process_chat(ask("Explícame la fotosintesis"))
+    other = await service.process_chat(ask("¿Qué es un volcán?"))
+
+    assert second.response == first.response
+    assert other.response != first.response
+    assert stub.state.calls == 2
+    assert cache.stats()["semantic"]["hits"] == 1
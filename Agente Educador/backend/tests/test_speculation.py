@@ -0,0 +1,221 @@
+"""
+Pruebas para la generación especulativa de las respuestas de las sugerencias.
+"""
+import asyncio
+
+import httpx
+import pytest
+
+from app.core.resilience import AdaptiveConcurrencyLimiter, SingleFlight
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService, ResponseCache
+from app.services.history_compactor import HistoryCompactor
+from app.services.n8n_client import N8NClient
+from app.services.speculation import Speculator
+from benchmarks.stub_n8n import create_app
+from tests.test_chat_repository import make_repository
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+async def settle(speculator):
+    while len(speculator):
+        await asyncio.sleep(0.01)
+
+
+@pytest.mark.asyncio
+async def test_tapped_suggestion_is_answered_from_cache(chat_service_factory, ask):
+    """Las sugerencias se responden de antemano; pulsar una no llama a n8n."""
+    stub = create_app()
+    service = await chat_service_factory(stub, response_cache=ResponseCache(max_entries=10),
+                                         speculator=Speculator(max_per_response=2, enabled=True))
+    first = await service.process_chat(ask("Hola"))
+    await settle(service.speculator)
+    assert stub.state.calls == 3
+
+    # El cliente envía la conversación completa con la sugerencia como último mensaje
+    tapped = await service.process_chat(ChatRequest(
+        messages=[
+            {"role": "user", "content": "Hola"},
+            {"role": "assistant", "content": first.response},
+            {"role": "user", "content": first.suggestions[0]},
+        ],
+        age_group="6-8",
+        context=first.context
+    ))
+    assert tapped.response == f"[6-8] Respuesta a: {first.suggestions[0]}"
+    assert stub.state.calls == 3
+    # La respuesta recarga el presupuesto y se adelanta una sugerencia de la nueva conversación
+    await settle(service.speculator)
+
+    stats = service.stats()["speculation"]
+    assert (stats["scheduled"], stats["completed"], stats["hits"]) == (3, 3, 1)
+
+
+@pytest.mark.parametrize("budget, tail_size", [(30, 20), (1000, 4)])
+@pytest.mark.asyncio
+async def test_tapped_suggestion_hits_in_a_summarized_session(chat_service_factory, budget, tail_size):
+    """En una sesión con resumen (compactado o leído de MongoDB) la sugerencia pulsada también acierta."""
+    stub = create_app()
+    repository = make_repository(tail_size=tail_size)
+    service = await chat_service_factory(
+        stub, history=repository, response_cache=ResponseCache(max_entries=50),
+        compactor=HistoryCompactor(budgets={"6-8": budget}),
+        speculator=Speculator(max_per_response=1, enabled=True)
+    )
+    session_id = response = None
+    for i in range(6):
+        request = await service.prepare_request(
+            ChatRequest(session_id=session_id, message=f"Pregunta {i} sobre los océanos", age_group="6-8"), "ana"
+        )
+        session_id = request.session_id
+        response = await service.process_chat(request)
+        await settle(service.speculator)
+    assert repository.cached_session(session_id)["summary"]
+
+    calls = stub.state.calls
+    request = await service.prepare_request(
+        ChatRequest(session_id=session_id, message=response.suggestions[0], age_group="6-8",
+                    context=response.context), "ana"
+    )
+    tapped = await service.process_chat(request)
+    assert tapped.response == f"[6-8] Respuesta a: {response.suggestions[0]}"
+    assert stub.state.calls == calls
+    assert service.stats()["speculation"]["hits"] == 1
+    await settle(service.speculator)
+
+
+@pytest.mark.asyncio
+async def test_speculations_yield_to_real_traffic(chat_service_factory, ask):
+    """Cuando una solicitud real no tiene hueco, las especulaciones se cancelan."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=2, max_limit=2)
+    service = await chat_service_factory(create_app(delay_ms=200), response_cache=ResponseCache(max_entries=10),
+                                         limiter=limiter, speculator=Speculator(max_per_response=2, enabled=True))
+    service.speculation_max_load = 1.0
+    await service.process_chat(ask("Hola"))
+    await asyncio.sleep(0.05)
+    assert limiter.in_flight == 2
+
+    response = await service.process_chat(ask("¿Qué es un volcán?"))
+    await settle(service.speculator)
+
+    assert response.response == "[6-8] Respuesta a: ¿Qué es un volcán?"
+    stats = service.speculator.stats()
+    # La respuesta real recarga el presupuesto para una especulación nueva
+    assert (stats["scheduled"], stats["cancelled"], stats["completed"]) == (3, 2, 1)
+    assert limiter.stats()["in_flight"] == 0
+
+
+@pytest.mark.asyncio
+async def test_cancelling_speculations_spares_real_requests(chat_service_factory, ask):
+    """Una especulación no se une a una solicitud real en curso ni la cancela al ceder el hueco."""
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, min_limit=2, max_limit=2)
+    service = await chat_service_factory(create_app(delay_ms=300), response_cache=ResponseCache(max_entries=10),
+                                         limiter=limiter, speculator=Speculator(max_per_response=2, enabled=True))
+    service.speculation_max_load = 1.0
+    # Lo que enviará el niño al pulsar la sugerencia de la respuesta a "Hola"
+    tapped = ChatRequest(messages=[
+        {"role": "user", "content": "Hola"},
+        {"role": "assistant", "content": "[6-8] Respuesta a: Hola"},
+        {"role": "user", "content": "Matemáticas"},
+    ], age_group="6-8")
+
+    hello = asyncio.ensure_future(service.process_chat(ask("Hola")))
+    await asyncio.sleep(0.2)
+    real = asyncio.ensure_future(service.process_chat(tapped))
+    first = await hello
+    assert first.suggestions[0] == "Matemáticas"
+    assert len(service.speculator) == 1  # Solo "Ciencias": "Matemáticas" ya está en curso
+
+    # Una solicitud nueva sin hueco cancela las especulaciones
+    await asyncio.sleep(0.01)
+    assert limiter.in_flight == 2
+    other = await service.process_chat(ask("¿Qué es un volcán?"))
+    response = await real
+    await settle(service.speculator)
+
+    assert response.response == "[6-8] Respuesta a: Matemáticas"
+    assert other.response == "[6-8] Respuesta a: ¿Qué es un volcán?"
+    assert service.speculator.stats()["cancelled"] == 1
+
+
+@pytest.mark.asyncio
+async def test_single_flight_cancels_only_background_calls():
+    """Una ejecución que espera una llamada en primer plano no se cancela."""
+    flight = SingleFlight()
+    release = asyncio.Event()
+
+    async def work():
+        await release.wait()
+        return "resultado"
+
+    background = asyncio.ensure_future(flight.do("a", work, background=True))
+    real = asyncio.ensure_future(flight.do("a", work))
+    await asyncio.sleep(0.01)
+    assert "a" in flight and not flight.cancel("a")
+    release.set()
+    assert await asyncio.gather(background, real) == ["resultado", "resultado"]
+
+    release.clear()
+    alone = asyncio.ensure_future(flight.do("b", work, background=True))
+    await asyncio.sleep(0.01)
+    assert flight.cancel("b")
+    with pytest.raises(asyncio.CancelledError):
+        await alone
+
+
+@pytest.mark.asyncio
+async def test_budget_limits_speculations():
+    """Cada respuesta real solo aporta `budget` especulaciones."""
+    speculator = Speculator(budget=0.5, max_in_flight=10, enabled=True)
+
+    async def generate():
+        return "respuesta"
+
+    assert not speculator.schedule("a", generate)
+    speculator.credit()
+    assert speculator.schedule("a", generate)
+    assert not speculator.schedule("a", generate)  # Ya en curso
+    assert not speculator.schedule("b", generate)
+    await settle(speculator)
+
+    assert speculator.claim("a") and not speculator.claim("a")
+    assert speculator.stats()["skipped"]["budget"] == 2
@@ -0,0 +1,141 @@
+"""
+Pruebas para el webhook de n8n simulado.
+"""
+import random
+import statistics
+import time
+
+import httpx
+import pytest
+
+from app.models.chat_models import ChatRequest
+from app.services.chat_service import ChatService
+from app.services.n8n_client import N8NClient, N8NError
+from benchmarks.stub_n8n import Latency, StubTransport, create_app, from_env
+
+WEBHOOK_URL = "http://n8n.test/webhook/gemini"
+
+
+@pytest.fixture
+async def n8n_client():
+    """Crea clientes de n8n iniciados contra el webhook simulado (o `transport`) y los cierra al terminar."""
+    clients = []
+
+    async def make(stub=None, transport=None, **options):
+        if transport is None:
+            transport = httpx.ASGITransport(app=stub if stub is not None else create_app())
+        client = N8NClient(url=WEBHOOK_URL, transport=transport, **options)
+        await client.start()
+        clients.append(client)
+        return client
+
+    yield make
+    for client in clients:
+        await client.close()
+
+
+@pytest.fixture
+def chat_service_factory(n8n_client):
+    """Crea servicios de chat conectados al webhook simulado (`stub`) o a `transport`."""
+
+    async def make(stub=None, transport=None, **options):
+        return ChatService(n8n=await n8n_client(stub, transport), **options)
+
+    return make
+
+
+@pytest.fixture
+def ask():
+    """Crea una solicitud de chat de un solo mensaje."""
+
+    def make(text, age_group="6-8", context=None):
+        return ChatRequest(messages=[{"role": "user", "content": text}], age_group=age_group, context=context or {})
+
+    return make
+
+
+def payload(message, stream=False):
+    return {"message": message, "metadata": {"ageGroup": "6-8"}, "stream": stream}
+
+
+def test_latency_distributions():
+    """Las especificaciones se interpretan y los sorteos siguen su distribución."""
+    rng = random.Random(1)
+    assert Latency.parse("50").sample(rng) == Latency.parse("fixed:50").sample(rng) == 50.0
+
+    lognormal = [Latency.parse("lognormal:80,0.5").sample(rng) for _ in range(2000)]
+    assert 70 < statistics.median(lognormal) < 90
+    assert max(lognormal) > 200  # Cola larga
+
+    bimodal = [Latency.parse("bimodal:40,1500,0.1").sample(rng) for _ in range(2000)]
+    assert set(bimodal) == {40.0, 1500.0}
+    assert 0.07 < bimodal.count(1500.0) / len(bimodal) < 0.13
+
+    assert repr(Latency.parse("bimodal:40,1500,0.1")) == "bimodal:40,1500,0.1"
+    with pytest.raises(ValueError):
+        Latency.parse("normal:80")
+    with pytest.raises(ValueError):
+        Latency.parse("lognormal:80")
+
+
+@pytest.mark.asyncio
+async def test_same_seed_reproduces_errors_and_sizes(n8n_client):
+    """Con la misma semilla, la misma carga da los mismos errores y tamaños."""
+
+    async def run(seed):
+        stub = create_app(error_rate=0.3, error_status=500, response_words=30, seed=seed)
+        client = await n8n_client(transport=StubTransport(stub), max_retries=0)
+        outcomes = []
+        for i in range(40):
+            try:
+                outcomes.append(len((await client.post(payload(f"pregunta {i % 10}")))["response"].split()))
+            except N8NError:
+                outcomes.append(None)
+        return outcomes, stub.state.errors
+
+    first, errors = await run(seed=7)
+    assert (first, errors) == await run(seed=7)
+    assert first != (await run(seed=8))[0]
+    assert 4 < errors < 20
+    assert {size for size in first if size is not None} == {30}
+
+
+@pytest.mark.asyncio
+async def test_stream_keeps_chunk_cadence_in_process(n8n_client):
+    """El transporte en proceso entrega cada fragmento al enviarse, sin esperar al final."""
+    stub = create_app(chunk_latency=20, chunk_words=2, response_words=10)
+    client = await n8n_client(transport=StubTransport(stub))
+    start = time.perf_counter()
+    arrivals = []
+    async for chunk in client.stream(payload("Hola", stream=True)):
+        arrivals.append((time.perf_counter() - start, chunk))
+
+    assert len(arrivals) == 5
+    assert arrivals[0][0] < 0.015 and arrivals[-1][0] > 0.07
+    assert len("".join(chunk for _, chunk in arrivals).split()) == 10
+
+
+@pytest.mark.asyncio
+async def test_cut_stream_is_reported_as_incomplete(chat_service_factory, ask):
+    """Un flujo cortado a mitad llega al chat como respuesta incompleta."""
+    stub = create_app(stream_error_rate=1.0, response_words=8)
+    service = await chat_service_factory(transport=StubTransport(stub))
+    events = [event async for event in service.stream_chat(ask("Cuéntame algo"))]
+
+    text = "".join(data["text"] for event, data in events if event == "token")
+    assert text.split() == "[6-8] Respuesta a: Cuéntame".split()
+    assert events[-1][0] == "done" and events[-1][1]["complete"] is False
+    assert stub.state.aborts == 1
+
+
+def test_configuration_from_environment():
+    """El stub lanzado con uvicorn se configura con las variables `STUB_N8N_*`."""
+    stub = from_env({
+        "STUB_N8N_LATENCY": "bimodal:40,1500,0.1",
+        "STUB_N8N_CHUNK_DELAY_MS": "5",
+        "STUB_N8N_ERROR_RATE": "0.02",
+        "STUB_N8N_SEED": "3",
+    })
+    assert stub.state.config["latency"] == "bimodal:40,1500,0.1"
+    assert stub.state.config["chunk_latency"] == "fixed:5"
+    assert (stub.state.config["error_rate"], stub.state.config["seed"]) == (0.02, 3)